@@ -62,7 +62,8 @@ echo ""
 echo "📋 Следующие шаги:"
 echo "1. Распакуйте архив inback_complete_backup.tar.gz в эту директорию"
 echo "2. Восстановите базу данных: psql -d $DB_NAME -f database_export.sql"
-echo "3. Запустите приложение: source venv/bin/activate && python3 app.py"
+echo "3. Создайте недостающие таблицы: source venv/bin/activate && flask --app main init-db"
+echo "4. Запустите приложение: source venv/bin/activate && python3 app.py"
 echo ""
 echo "🔐 Созданные учетные данные:"
 echo "База данных: $DB_NAME"
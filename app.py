@@ -1,5 +1,4 @@
 import os
-import nearby_places
 import json
 import logging
 import requests
@@ -26,19 +25,15 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 import secrets
 import threading
 import time
-import atexit
 import glob
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
 from email_service import send_notification, send_email
-from services.geocoding import get_geocoding_service
-from services.dadata_client import get_dadata_client
 from flask_caching import Cache
-import qrcode
 import io
 import base64
-from PIL import Image
+# qrcode и PIL импортируются в функциях, которые их используют: они нужны
+# только страницам презентаций, а не каждому воркеру при старте
 
 # Models and repositories will be imported after db initialization to avoid circular imports
 
@@ -225,10 +220,22 @@ def msk_time_filter(utc_datetime, format='%d.%m.%Y в %H:%M'):
     return msk_datetime.strftime(format)
 
 # Настройка супер-производительного кэширования
-app.config['CACHE_TYPE'] = 'simple'
+# Общий для всех воркеров SQLite-файл (services/response_cache.py); Redis / memcached —
+# CACHE_TYPE=RedisCache + CACHE_REDIS_URL или CACHE_TYPE=MemcachedCache + CACHE_MEMCACHED_SERVERS
+app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'services.response_cache.SQLiteCache')
 app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 минут
+for _cache_option in ('CACHE_REDIS_URL', 'CACHE_SQLITE_PATH'):
+    if os.environ.get(_cache_option):
+        app.config[_cache_option] = os.environ[_cache_option]
+if os.environ.get('CACHE_MEMCACHED_SERVERS'):
+    app.config['CACHE_MEMCACHED_SERVERS'] = os.environ['CACHE_MEMCACHED_SERVERS'].split(',')
 cache = Cache(app)
 
+# Теги (property:<id>, complex:<id>, catalogue), stale-while-revalidate и склейка запросов
+from services.response_cache import (TAG_CATALOGUE, complex_tag, init_response_cache, property_tag,
+                                     setup_response_cache_tracking)
+response_cache = init_response_cache(cache.cache)
+
 # Session configuration for Replit iframe environment
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 # Session configuration for development
@@ -267,17 +274,60 @@ def uploaded_file(filename):
 db.init_app(app)
 
 # Import and register all models with SQLAlchemy after db initialization
-with app.app_context():
-    # Import all models explicitly to ensure they are registered with SQLAlchemy
-    from models import (User, Manager, SavedSearch, SentSearch, PropertyAlert, BlogPost, BlogArticle, Category, 
-                       Developer, ResidentialComplex, CashbackRecord, 
-                       Application, Favorite, Notification, District, Street, RoomType, 
-                       Admin, City, Region)
-    db.create_all()
+from models import (User, Manager, SavedSearch, SentSearch, PropertyAlert, BlogPost, BlogArticle, Category, 
+                   Developer, ResidentialComplex, CashbackRecord, 
+                   Application, Favorite, Notification, District, Street, RoomType, 
+                   Admin, City, Region)
+
+
+def init_schema():
+    """Создать недостающие таблицы (db.create_all) — явный шаг деплоя, а не побочный эффект импорта"""
+    from services.analytics_rollups import ensure_rollups
+    from services.complex_stats import ensure_complex_stats
+    from services.manager_dashboard import ensure_activity
+
+    with app.app_context():
+        db.create_all()
+        # Денормализованные таблицы на свежей БД собираются здесь, а не на первом GET
+        ensure_rollups()
+        ensure_complex_stats()
+        ensure_activity()
     print("Database tables created successfully!")
 
+
+@app.cli.command('init-db')
+def init_db_command():
+    """flask --app main init-db — создать таблицы перед первым запуском / после обновления моделей"""
+    init_schema()
+
+
+# Каждый воркер gunicorn и каждый скрипт, импортирующий app, раньше выполнял
+# create_all (десятки запросов к information_schema). Старое поведение
+# включается через SCHEMA_AUTO_CREATE=1
+if os.environ.get('SCHEMA_AUTO_CREATE', '0').lower() in ('1', 'true', 'yes'):
+    init_schema()
+
+# Статистика ЖК (complex_stats) пересчитывается при commit изменённых квартир
+from services.complex_stats import setup_complex_stats_tracking
+setup_complex_stats_tracking()
+
+# Свёртки дашбордов (analytics_rollups) получают приращения после commit заявок, звонков, подборок и клиентов
+from services.analytics_rollups import setup_analytics_rollups_tracking
+setup_analytics_rollups_tracking()
+
+# Лента активности менеджера и сброс снимков панели (manager_dashboard_snapshots) при flush
+from services.manager_dashboard import setup_manager_dashboard_tracking
+setup_manager_dashboard_tracking()
+
+# Реестр slug'ов SEO-страниц перестраивается после commit ЖК, застройщиков, районов и улиц
+from services.slug_registry import setup_slug_registry_tracking
+setup_slug_registry_tracking()
+
+# Теги кэша ответов сбрасываются после commit квартир, ЖК, корпусов и застройщиков
+setup_response_cache_tracking()
+
 # Import repositories after db initialization to avoid circular imports
-from repositories.property_repository import PropertyRepository, ResidentialComplexRepository, DeveloperRepository
+from repositories.property_repository import PropertyRepository, ResidentialComplexRepository, DeveloperRepository, InvalidCursor
 
 # Import Manager and Admin for isinstance checks throughout the file
 from models import Manager, Admin
@@ -293,6 +343,42 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 # Debug endpoint removed for security - exposed session data
 
+def _repo_filters_from_args(args):
+    """
+    build_property_filters(args) → (фильтры PropertyRepository / PropertyIndex, разобранные фильтры)
+    """
+    where_conditions, params, filters_parsed = build_property_filters(args)
+    
+    # Convert build_property_filters() output to PropertyRepository filter format
+    repo_filters = {
+        'min_price': params.get('price_min'),
+        'max_price': params.get('price_max'),
+        'min_area': params.get('area_min'),
+        'max_area': params.get('area_max'),
+        'floor_min': params.get('floor_min'),
+        'floor_max': params.get('floor_max'),
+        'building_floors_min': params.get('building_floors_min'),
+        'building_floors_max': params.get('building_floors_max'),
+        'rooms': filters_parsed.get('rooms', []),
+        'developer': filters_parsed.get('developer'),
+        'developers': filters_parsed.get('developers', []),
+        'district': filters_parsed.get('district'),
+        'districts': filters_parsed.get('districts', []),
+        'residential_complex': filters_parsed.get('residential_complex'),
+        'building': filters_parsed.get('building'),
+        'cashback_only': filters_parsed.get('cashback_only', False),
+        'renovation': filters_parsed.get('renovation', []),
+        'object_classes': filters_parsed.get('object_classes', []),
+        'building_types': filters_parsed.get('building_types', []),
+        'floor_options': filters_parsed.get('floor_options', []),
+        'deal_type': filters_parsed.get('deal_type'),
+        'search': filters_parsed.get('search')
+    }
+    
+    # Remove None values from filters
+    repo_filters = {k: v for k, v in repo_filters.items() if v is not None and v != [] and v != ''}
+    return repo_filters, filters_parsed
+
 @api_bp.route('/properties/filter')
 def api_properties_filter():
     """
@@ -305,6 +391,7 @@ def api_properties_filter():
         - page (int): Page number (default: 1)
         - per_page (int): Results per page (default: 20, max: 100)
         - sort (str): Sort type (price_asc, price_desc, area_asc, area_desc, date_desc)
+        - cursor (str): next_cursor from the previous response - keyset page instead of page/offset
     
     Returns:
         JSON with:
@@ -314,39 +401,10 @@ def api_properties_filter():
         - page (int): Current page
         - per_page (int): Results per page
         - total_pages (int): Total pages
+        - next_cursor (str|null): Cursor of the next page
     """
     try:
-        # Use unified filter function to parse request arguments
-        where_conditions, params, filters_parsed = build_property_filters(request.args)
-        
-        # Convert build_property_filters() output to PropertyRepository filter format
-        repo_filters = {
-            'min_price': params.get('price_min'),
-            'max_price': params.get('price_max'),
-            'min_area': params.get('area_min'),
-            'max_area': params.get('area_max'),
-            'floor_min': params.get('floor_min'),
-            'floor_max': params.get('floor_max'),
-            'building_floors_min': params.get('building_floors_min'),
-            'building_floors_max': params.get('building_floors_max'),
-            'rooms': filters_parsed.get('rooms', []),
-            'developer': filters_parsed.get('developer'),
-            'developers': filters_parsed.get('developers', []),
-            'district': filters_parsed.get('district'),
-            'districts': filters_parsed.get('districts', []),
-            'residential_complex': filters_parsed.get('residential_complex'),
-            'building': filters_parsed.get('building'),
-            'cashback_only': filters_parsed.get('cashback_only', False),
-            'renovation': filters_parsed.get('renovation', []),
-            'object_classes': filters_parsed.get('object_classes', []),
-            'building_types': filters_parsed.get('building_types', []),
-            'floor_options': filters_parsed.get('floor_options', []),
-            'deal_type': filters_parsed.get('deal_type'),
-            'search': filters_parsed.get('search')
-        }
-        
-        # Remove None values from filters
-        repo_filters = {k: v for k, v in repo_filters.items() if v is not None and v != [] and v != ''}
+        repo_filters, filters_parsed = _repo_filters_from_args(request.args)
         
         # Pagination parameters
         page = request.args.get('page', default=1, type=int)
@@ -374,14 +432,31 @@ def api_properties_filter():
         # Get total count using PropertyRepository
         total = PropertyRepository.count_active(filters=repo_filters)
         
-        # Get properties using PropertyRepository
-        properties_orm = PropertyRepository.get_all_active(
-            limit=per_page,
-            offset=offset,
-            filters=repo_filters,
-            sort_by=sort_by,
-            sort_order=sort_order
-        )
+        cursor = request.args.get('cursor')
+        if cursor:
+            # Keyset page: WHERE (sort column, id) > cursor, no OFFSET scan
+            try:
+                properties_orm, next_cursor = PropertyRepository.get_active_keyset(
+                    limit=per_page,
+                    cursor=cursor,
+                    filters=repo_filters,
+                    sort_by=sort_by,
+                    sort_order=sort_order
+                )
+            except InvalidCursor as e:
+                return jsonify({'success': False, 'error': str(e), 'properties': []}), 400
+        else:
+            # Get properties using PropertyRepository
+            properties_orm = PropertyRepository.get_all_active(
+                limit=per_page,
+                offset=offset,
+                filters=repo_filters,
+                sort_by=sort_by,
+                sort_order=sort_order
+            )
+            next_cursor = None
+            if properties_orm and offset + per_page < total:
+                next_cursor = PropertyRepository.cursor_for(properties_orm[-1], sort_by, sort_order)
         
         # Format properties for JSON response (maintain backward compatibility)
         properties = []
@@ -461,6 +536,7 @@ def api_properties_filter():
             'page': page,
             'per_page': per_page,
             'total_pages': total_pages,
+            'next_cursor': next_cursor,
             'filters_applied': filters_parsed
         })
         
@@ -475,6 +551,70 @@ def api_properties_filter():
             'total': 0
         }), 500
 
+@api_bp.route('/map/clusters')
+def api_map_clusters():
+    """
+    Кластеры / точки карты для окна просмотра (server-side clustering)
+
+    Query parameters:
+        - bbox (str): south,west,north,east
+        - zoom (int): зум Leaflet
+        - layer (str): properties | complexes
+        - все фильтры build_property_filters()
+
+    Returns:
+        mode=clusters: clusters [{lat, lng, count, min_price, bounds, complexes, id?}]
+        mode=points: properties (формат карты) или complexes
+        total, bounds (границы всей выборки без bbox)
+    """
+    from services.map_clusters import get_map_clusterer, parse_bbox, LAYERS
+    from services.property_index import is_property_index_enabled
+    
+    try:
+        repo_filters, _ = _repo_filters_from_args(request.args)
+        bbox = parse_bbox(request.args.get('bbox'))
+        zoom = request.args.get('zoom', default=10, type=int)
+        layer = request.args.get('layer', 'properties')
+        if layer not in LAYERS:
+            return jsonify({'success': False, 'error': f'Unknown layer: {layer}'}), 400
+        
+        clusterer = get_map_clusterer()
+        result, rows = None, None
+        if is_property_index_enabled():
+            try:
+                # Полнотекстовый поиск индекс не считает - ограничиваем выборку id из SQL
+                index_filters = dict(repo_filters)
+                search = index_filters.pop('search', None)
+                restrict_ids = PropertyRepository.search_ids(search) if search else None
+                clusterer.index.ensure_fresh()
+                result = clusterer.query(index_filters, bbox=bbox, zoom=zoom, layer=layer, restrict_ids=restrict_ids)
+            except Exception as e:
+                print(f"⚠️ Map index query failed, clustering SQL rows: {e}")
+                db.session.rollback()
+        if result is None:
+            # Индекс отключён, ещё не собран или не поддерживает фильтры - кластеризуем SQL-выборку
+            rows = PropertyRepository.get_properties_with_coordinates(filters=repo_filters)
+            result = clusterer.query_rows(rows, bbox=bbox, zoom=zoom, layer=layer)
+        
+        if result['mode'] == 'points' and layer == 'properties':
+            ids = result.pop('ids')
+            if rows is None:
+                rows = PropertyRepository.get_properties_with_coordinates(ids)
+            else:
+                by_id = {row.id: row for row in rows}
+                rows = [by_id[pid] for pid in ids]
+            result['properties'] = [_format_map_property(row) for row in rows]
+        
+        response = jsonify(dict(result, success=True))
+        response.headers['Cache-Control'] = 'public, max-age=30'
+        return response
+        
+    except Exception as e:
+        print(f"❌ Error in /api/map/clusters: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @api_bp.route('/property/<int:property_id>/cashback')
 def api_property_cashback(property_id):
     """✅ MIGRATED - Get cashback information using PropertyRepository"""
@@ -641,28 +781,26 @@ login_manager.login_message_category = 'info'
 
 
 
-# Property data loading functions with cache
-_properties_cache = None
-_cache_timestamp = None
-CACHE_TIMEOUT = 300  # 5 minutes
+# Property data loading: versioned read-only snapshot shared by all requests of the worker
+from services.property_snapshot import PropertySnapshotStore
 
 def load_properties():
-    """✅ MIGRATED TO NORMALIZED TABLES: Load properties from Property → ResidentialComplex → Developer"""
-    global _properties_cache, _cache_timestamp
-    import time
-    
-    # Check if we have valid cached data
-    if (_properties_cache is not None and _cache_timestamp is not None and 
-        time.time() - _cache_timestamp < CACHE_TIMEOUT):
-        # Cache hit - fast path
-        return _properties_cache
-    
+    """
+    ✅ MIGRATED TO NORMALIZED TABLES: Load properties from Property → ResidentialComplex → Developer
+    Возвращает общий PropertySnapshot (ведёт себя как list of dicts), пересобирается
+    только при изменении версии данных каталога
+    """
     # Ensure we have app context
     from flask import has_app_context
     if not has_app_context():
         with app.app_context():
             return load_properties()
     
+    # Ошибка БД: store отдаёт прежний снимок (пустой — только до первой удачной сборки)
+    return property_snapshots.get()
+
+def _build_property_records():
+    """Собрать список квартир в формате load_properties() (дорогая сборка из БД)"""
     try:
         # ✅ MIGRATED: Load from normalized tables using PropertyRepository
         properties = PropertyRepository.get_all_active(
@@ -836,22 +974,19 @@ def load_properties():
                 db_properties.append(formatted_prop)
             
             # Successfully loaded properties from database
-            # Cache the data
-            _properties_cache = db_properties  
-            _cache_timestamp = time.time()
             return db_properties
             
     except Exception as e:
-        # Database error logged  
-        print(f"CRITICAL: load_properties() database error: {e}")
-        import traceback
-        traceback.print_exc()
-        pass
+        # Let the snapshot store keep the previous snapshot
+        print(f"CRITICAL: _build_property_records() database error: {e}")
+        db.session.rollback()
+        raise
         
-    # No fallback - only database data from now on
     # No properties found
     return []
 
+property_snapshots = PropertySnapshotStore(_build_property_records)
+
 def load_residential_complexes():
     """Load residential complexes from database enriched with statistics from excel_properties"""
     try:
@@ -862,30 +997,14 @@ def load_residential_complexes():
         
         if complexes and len(complexes) > 0:
             # Convert database complexes to dictionary format
+            stats_by_complex = ResidentialComplexRepository.get_stats_by_ids()
             db_complexes = []
             for complex in complexes:
-                # ✅ MIGRATED: Enrich with statistics from normalized Property table
-                try:
-                    from models import Property
-                    stats_query = (
-                        db.session.query(
-                            func.min(Property.price).label('min_price'),
-                            func.max(Property.price).label('max_price'),
-                            func.count(Property.id).label('apartments_count')
-                        )
-                        .filter(Property.complex_id == complex.id, Property.is_active == True)
-                        .first()
-                    )
-                    
-                    min_price = stats_query.min_price if stats_query else None
-                    max_price = stats_query.max_price if stats_query else None
-                    apartments_count = int(stats_query.apartments_count) if stats_query and stats_query.apartments_count else 0
-                except Exception as e:
-                    print(f"Warning: Could not load stats for complex {complex.id}: {e}")
-                    db.session.rollback()  # Rollback failed transaction
-                    min_price = None
-                    max_price = None
-                    apartments_count = 0
+                # Статистика из материализованной таблицы complex_stats
+                stats = stats_by_complex.get(complex.id, {})
+                min_price = stats.get('min_price') or None
+                max_price = stats.get('max_price') or None
+                apartments_count = stats.get('total_count', 0)
                 
                 complex_dict = {
                     'id': complex.id,
@@ -1094,27 +1213,38 @@ def calculate_cashback(price, complex_id=None, complex_name=None):
         return 0
     
     try:
-        from models import ResidentialComplex
+        from services.complex_attributes import get_complex_attributes
         
-        # If complex_id provided, use its cashback rate from database (backwards compatibility)
-        if complex_id:
-            complex_obj = ResidentialComplex.query.filter_by(id=str(complex_id)).first()
-            if complex_obj and complex_obj.cashback_rate:
-                rate = float(complex_obj.cashback_rate) / 100  # Convert percentage to decimal
-                return int(price * rate)
-        
-        # If complex_name provided, look up by name
-        if complex_name:
-            complex_obj = ResidentialComplex.query.filter_by(name=complex_name).first()
-            if complex_obj and complex_obj.cashback_rate:
-                rate = float(complex_obj.cashback_rate) / 100  # Convert percentage to decimal
-                return int(price * rate)
+        # Rate by complex_id first, then by complex_name (shared in-memory table, no query per property)
+        rate = get_complex_attributes().cashback_rate(complex_id, complex_name)
+        if rate:
+            return int(price * (rate / 100))  # Convert percentage to decimal
     except Exception as e:
         print(f"Error getting complex cashback rate: {e}")
     
     # Fallback to default 5% calculation if no complex found or error
     return int(price * 0.05)  # 5% default cashback
 
+def apply_cashback(properties, complex_name_key='residential_complex'):
+    """Set prop['cashback'] for a list of property dicts in one vectorized pass"""
+    if not properties:
+        return properties
+    try:
+        from services.complex_attributes import get_complex_attributes, cashback_amounts
+        
+        rates = get_complex_attributes().rates_for(
+            [prop.get('complex_id') for prop in properties],
+            [prop.get(complex_name_key) for prop in properties],
+        )
+        amounts = cashback_amounts([prop.get('price') for prop in properties], rates)
+        for prop, amount in zip(properties, amounts.tolist()):
+            prop['cashback'] = amount
+    except Exception as e:
+        print(f"Error calculating cashback: {e}")
+        for prop in properties:
+            prop['cashback'] = calculate_cashback(prop.get('price'))
+    return properties
+
 def get_property_by_id(property_id):
     """✅ MIGRATED TO NORMALIZED TABLES: Get property from Property → ResidentialComplex → Developer"""
     try:
@@ -2237,13 +2367,9 @@ def index():
     except Exception as e:
         print(f"❌ Ошибка загрузки реальных объектов: {e}")
         # Fallback к старым данным
-        featured_properties = sorted(properties, key=lambda x: x.get('cashback_amount', 0), reverse=True)[:6]
-        for prop in featured_properties:
-            prop['cashback'] = calculate_cashback(
-                prop['price'],
-                complex_id=prop.get('complex_id'),
-                complex_name=prop.get('residential_complex')
-            )
+        # Записи снимка read-only — cashback дописываем в копии отобранных
+        featured_properties = [dict(p) for p in sorted(properties, key=lambda x: x.get('cashback_amount', 0), reverse=True)[:6]]
+        apply_cashback(featured_properties)
     
     # Get districts with statistics
     districts_data = {}
@@ -2523,6 +2649,11 @@ def properties():
         
         total_properties = PropertyRepository.count_active(filters=repo_filters)
         
+        # Курсор для бесконечной прокрутки: следующие страницы грузятся без OFFSET
+        next_cursor = None
+        if properties_list and offset + per_page < total_properties:
+            next_cursor = PropertyRepository.cursor_for(properties_list[-1], sort_by, sort_order)
+        
         # Convert to template format
         properties_data = []
         for prop in properties_list:
@@ -2658,6 +2789,7 @@ def properties():
                              manager=manager_data,
                              total_pages=total_pages,
                              total_properties=total_properties,
+                             next_cursor=next_cursor,
                              max_cashback=max_cashback,
                              user_authenticated=current_user.is_authenticated,
                              manager_authenticated=isinstance(current_user._get_current_object(), Manager) if current_user.is_authenticated else False,
@@ -2946,27 +3078,22 @@ def residential_complex_detail(complex_id=None, complex_name=None, slug=None):
     """Individual residential complex page - MIGRATED to normalized tables"""
     try:
         from repositories.property_repository import PropertyRepository, ResidentialComplexRepository
+        from services.slug_registry import KIND_COMPLEX, get_slug_registry
         
         # === STEP 1: Get ResidentialComplex using Repository ===
         complex = None
         
-        if slug:
-            # Try exact slug match first
-            complex = ResidentialComplexRepository.get_by_slug(slug)
-            
-            # If not found, try matching with create_slug() for transliteration support
-            if not complex:
-                all_complexes = ResidentialComplexRepository.get_all_active(limit=100)
-                for c in all_complexes:
-                    if create_slug(c.name) == slug:
-                        complex = c
-                        break
+        if slug or complex_name:
+            # Canonical slug, legacy transliterations and names resolve through the slug registry
+            resolved = get_slug_registry().resolve(KIND_COMPLEX, slug or complex_name)
+            if resolved:
+                resolved_id, canonical = resolved
+                if canonical != slug:
+                    return redirect(url_for('residential_complex_detail', slug=canonical), code=301)
+                complex = ResidentialComplexRepository.get_by_id(resolved_id)
         elif complex_id:
             # Search by ID in normalized table
             complex = ResidentialComplexRepository.get_by_id(complex_id)
-        elif complex_name:
-            # Search by name - fallback to database query
-            complex = db.session.query(ResidentialComplex).filter_by(name=complex_name).first()
         
         # If not found, redirect to properties page
         if not complex:
@@ -3264,13 +3391,26 @@ def residential_complex_detail(complex_id=None, complex_name=None, slug=None):
         # === STEP 7: Find similar complexes using normalized tables ===
         similar_complexes = []
         try:
-            # Get 3 other complexes sorted by price
-            other_complexes = (
-                db.session.query(ResidentialComplex)
-                .filter(ResidentialComplex.id != complex.id, ResidentialComplex.is_active == True)
-                .limit(10)
-                .all()
-            )
+            # Ближайшие ЖК по расстоянию (batch haversine), без координат - любые 3 активных
+            distances_by_id = {}
+            if complex.latitude and complex.longitude:
+                distances_by_id = dict(ResidentialComplexRepository.get_nearest(
+                    complex.latitude, complex.longitude, limit=3, exclude_id=complex.id
+                ))
+            if distances_by_id:
+                nearest = (
+                    db.session.query(ResidentialComplex)
+                    .filter(ResidentialComplex.id.in_(list(distances_by_id)))
+                    .all()
+                )
+                other_complexes = sorted(nearest, key=lambda c: distances_by_id[c.id])
+            else:
+                other_complexes = (
+                    db.session.query(ResidentialComplex)
+                    .filter(ResidentialComplex.id != complex.id, ResidentialComplex.is_active == True)
+                    .limit(10)
+                    .all()
+                )
             
             # Get property stats for each complex
             from repositories.property_repository import PropertyRepository
@@ -3334,6 +3474,7 @@ def residential_complex_detail(complex_id=None, complex_name=None, slug=None):
                     'image': image_url,
                     'completion_date': f"{other_complex.end_build_quarter or '3'} кв. {other_complex.end_build_year or '2025'}",
                     'cashback_percent': other_complex.cashback_rate or 5.0,
+                    'distance_km': round(distances_by_id[other_complex.id] / 1000, 1) if other_complex.id in distances_by_id else None,
                     'url': f'/zk/{other_complex.slug}'
                 }
                 similar_complexes.append(similar_complex)
@@ -3435,6 +3576,8 @@ def crop_watermark(image_url, crop_bottom_percent=8):
         PIL Image object with watermark cropped
     """
     try:
+        from PIL import Image
+
         # Download image
         response = requests.get(image_url, timeout=10)
         response.raise_for_status()
@@ -3458,6 +3601,8 @@ def crop_watermark(image_url, crop_bottom_percent=8):
 def generate_qr_code(url):
     """Generate QR code for given URL and return as base64 string"""
     try:
+        import qrcode
+
         # Create QR code instance
         qr = qrcode.QRCode(
             version=1,
@@ -3822,32 +3967,11 @@ def streets():
 def streets_redirect(street_name):
     """Редирект с /streets/ на /street/ для обратной совместимости"""
     import urllib.parse
+    from services.slug_registry import KIND_STREET, get_slug_registry
     
-    # Декодируем URL-encoded имя
-    decoded_name = urllib.parse.unquote(street_name)
-    
-    # Используем ту же логику что и street_slug() для создания slug
-    translit_map = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
-        'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
-    }
-    
-    # Очищаем имя
-    name = decoded_name.strip().lower()
-    name = re.sub(r'[«»"\(\)\.,:;]', '', name)
-    
-    # Транслитерация
-    result = ''
-    for char in name:
-        result += translit_map.get(char, char)
-    
-    # Заменяем пробелы на дефисы и чистим
-    result = re.sub(r'\s+', '-', result)
-    result = re.sub(r'-+', '-', result)
-    slug = result.strip('-')
+    # Улица из БД — сразу на канонический slug, иначе (улицы из JSON) — как фильтр street_slug
+    resolved = get_slug_registry().resolve(KIND_STREET, street_name)
+    slug = resolved[1] if resolved else street_slug(urllib.parse.unquote(street_name))
     
     # Редирект на правильный URL
     return redirect(url_for('street_detail', street_name=slug), code=301)
@@ -3856,6 +3980,13 @@ def streets_redirect(street_name):
 def street_detail(street_name):
     """Страница конкретной улицы с описанием и картой"""
     try:
+        from services.slug_registry import KIND_STREET, get_slug_registry
+        
+        # Старые варианты slug (кириллица, другая транслитерация) — 301 на канонический
+        resolved = get_slug_registry().resolve(KIND_STREET, street_name)
+        if resolved and resolved[1] != street_name:
+            return redirect(url_for('street_detail', street_name=resolved[1]), code=301)
+        
         # Сначала ищем улицу в базе данных по slug
         street_db = db.session.execute(text("""
             SELECT name, slug, latitude, longitude, zoom_level, geometry, geometry_source
@@ -3865,8 +3996,6 @@ def street_detail(street_name):
         
         if street_db:
             # Вычисление динамических переменных для SEO
-            import math
-            
             # Определяем тип улицы
             street_type = 'улице'
             street_type_nominative = 'улица'
@@ -3891,9 +4020,10 @@ def street_detail(street_name):
             distance_to_center = 0
             if street_db.latitude and street_db.longitude:
                 center_lat, center_lng = 45.0448, 38.9760
-                lat_diff = street_db.latitude - center_lat
-                lng_diff = street_db.longitude - center_lng
-                distance_to_center = round(math.sqrt(lat_diff**2 + lng_diff**2) * 111, 1)  # примерно в км
+                import nearby_places
+                distance_to_center = round(nearby_places.calculate_distance(
+                    float(street_db.latitude), float(street_db.longitude), center_lat, center_lng
+                ) / 1000, 1)
                 
                 coordinates = {
                     'lat': float(street_db.latitude),
@@ -4145,6 +4275,8 @@ def thank_you():
     return render_template('thank_you.html')
 
 @app.route('/api/property/<int:property_id>')
+# В ответе ЖК, кэшбек и застройщик — их правки сбрасывают catalogue, а не property:<id>
+@response_cache.cached_view(ttl=300, tags=lambda property_id: [property_tag(property_id), TAG_CATALOGUE])
 def api_property_detail(property_id):
     """API endpoint to get property data for comparison"""
     property_data = get_property_by_id(property_id)
@@ -4501,21 +4633,20 @@ def image_proxy():
     try:
         crop_percent = int(crop_percent)
         
-        # Crop watermark from image
-        cropped_img = crop_watermark(image_url, crop_bottom_percent=crop_percent)
+        # Обрезанная картинка рендерится один раз и дальше отдаётся с диска
+        from services.image_cache import get_image_cache
+        image_cache = get_image_cache()
+        image_format = image_cache.negotiate_format(request.headers.get('Accept'))
+        cached = image_cache.get(image_url, crop=crop_percent, fmt=image_format)
         
-        if cropped_img is None:
+        if cached is None:
             # If cropping failed, redirect to original image
             return redirect(image_url)
         
-        # Convert to bytes
-        img_io = io.BytesIO()
-        cropped_img.save(img_io, format='JPEG', quality=90, optimize=True)
-        img_io.seek(0)
-        
-        # Return image with caching headers
-        response = make_response(send_file(img_io, mimetype='image/jpeg'))
+        path, mimetype, key = cached
+        response = send_file(path, mimetype=mimetype, etag=key, conditional=True, max_age=2592000)
         response.headers['Cache-Control'] = 'public, max-age=2592000'  # Cache for 30 days
+        response.headers['Vary'] = 'Accept'
         response.headers['X-Content-Type-Options'] = 'nosniff'
         
         return response
@@ -4564,20 +4695,19 @@ def search_suggestions():
             'четыр': '4-комнатная'
         }
         
+        # Все счётчики и названия - из in-memory SuggestionIndex (без SQL на каждый символ)
+        from services.suggestion_index import get_suggestion_index
+        suggestion_index = get_suggestion_index()
+        suggestion_index.ensure_fresh()
+        
         for pattern, room_type in room_suggestions.items():
             if pattern in query:
-                # ✅ MIGRATED: Count properties by room type using PropertyRepository
-                if 'студ' in pattern:
-                    count = PropertyRepository.count_active(filters={'rooms': [0]})
-                else:
-                    room_num = room_type.split('-')[0] if '-' in room_type else '1'
-                    count = PropertyRepository.count_active(filters={'rooms': [int(room_num)]})
-                
                 # Создаем URL с тем же параметром что быстрые фильтры
                 if 'студ' in pattern:
                     room_param = '0'
                 else:
                     room_param = room_type.split('-')[0] if '-' in room_type else '1'
+                count = suggestion_index.room_counts.get(int(room_param), 0)
                 
                 suggestions.append({
                     'type': 'rooms', 
@@ -4587,77 +4717,54 @@ def search_suggestions():
                     'url': url_for('properties', rooms=room_param)  # rooms=1 как быстрые фильтры
                 })
         
-        # ✅ MIGRATED: Search in residential complexes using ORM
-        from models import ResidentialComplex, Property
-        complexes_query = (
-            db.session.query(ResidentialComplex.name, func.count(Property.id).label('count'))
-            .join(Property, Property.complex_id == ResidentialComplex.id, isouter=True)
-            .filter(
-                ResidentialComplex.name.ilike(f'%{query}%'),
-                Property.is_active == True
-            )
-            .group_by(ResidentialComplex.name)
-            .order_by(func.count(Property.id).desc())
-            .limit(5)
-            .all()
+        # Complexes, developers, districts, streets, buildings: prefix + trigram matching with typo tolerance
+        matches = suggestion_index.search(
+            query,
+            kinds=('complex', 'developer', 'district', 'street', 'building'),
+            limit=15,
+            per_kind={'complex': 5, 'developer': 3, 'district': 3, 'street': 2, 'building': 2}
         )
-        
-        for row in complexes_query:
-            if row[0] and len(row[0]) > 2:  # Skip empty/short names
+        for entry, _score in matches:
+            if not entry.count:
+                continue
+            if entry.kind == 'complex':
+                if len(entry.name) > 2:  # Skip empty/short names
+                    suggestions.append({
+                        'type': 'complex',
+                        'text': entry.name,
+                        'subtitle': f'{entry.count} квартир доступно',
+                        'url': url_for('properties', residential_complex=entry.name)
+                    })
+            elif entry.kind == 'developer':
+                if len(entry.name) > 2:
+                    suggestions.append({
+                        'type': 'developer',
+                        'text': entry.name,
+                        'subtitle': f'Застройщик • {entry.count} проектов',
+                        'url': url_for('properties', developer=entry.name)
+                    })
+            elif entry.kind == 'district' and 'Краснодарский' not in entry.name:  # Skip generic region name
+                clean_district = entry.name.replace('Россия, ', '').replace('Краснодарский край, ', '')
                 suggestions.append({
-                    'type': 'complex',
-                    'text': row[0],
-                    'subtitle': f'{row[1]} квартир доступно',
-                    'url': url_for('properties', residential_complex=row[0])
+                    'type': 'district',
+                    'text': clean_district,
+                    'subtitle': f'{entry.count} квартир в районе',
+                    'url': url_for('properties', district=clean_district)
                 })
-        
-        # ✅ MIGRATED: Search in developers using ORM
-        from models import Developer
-        developers_query = (
-            db.session.query(Developer.name, func.count(Property.id).label('count'))
-            .join(Property, Property.developer_id == Developer.id, isouter=True)
-            .filter(
-                Developer.name.ilike(f'%{query}%'),
-                Property.is_active == True
-            )
-            .group_by(Developer.name)
-            .order_by(func.count(Property.id).desc())
-            .limit(3)
-            .all()
-        )
-        
-        for row in developers_query:
-            if row[0] and len(row[0]) > 2:
+            elif entry.kind == 'street':
                 suggestions.append({
-                    'type': 'developer',
-                    'text': row[0],
-                    'subtitle': f'Застройщик • {row[1]} проектов',
-                    'url': url_for('properties', developer=row[0])
+                    'type': 'street',
+                    'text': entry.name,
+                    'subtitle': f'Улица • {entry.count} квартир',
+                    'url': url_for('properties', search=entry.name)
                 })
-        
-        # ✅ MIGRATED: Search in districts using ORM
-        from models import District
-        districts_query = (
-            db.session.query(District.name, func.count(Property.id).label('count'))
-            .join(Property, Property.district_id == District.id, isouter=True)
-            .filter(
-                District.name.ilike(f'%{query}%'),
-                Property.is_active == True
-            )
-            .group_by(District.name)
-            .order_by(func.count(Property.id).desc())
-            .limit(3)
-            .all()
-        )
-        
-        for row in districts_query:
-            if row[0] and 'Краснодарский' not in row[0]:  # Skip generic region name
-                clean_district = row[0].replace('Россия, ', '').replace('Краснодарский край, ', '')
+            elif entry.kind == 'building':
                 suggestions.append({
-                    'type': 'district',
-                    'text': clean_district,
-                    'subtitle': f'{row[1]} квартир в районе',
-                    'url': url_for('properties', district=clean_district)
+                    'type': 'building',
+                    'text': entry.name,
+                    'subtitle': f'Корпус • {entry.count} квартир',
+                    'url': url_for('properties', residential_complex=entry.extra['complex_name'],
+                                   building=entry.extra['building'])
                 })
         
         # Search by property types (квартира, пентхаус, таунхаус, дом)
@@ -4672,31 +4779,23 @@ def search_suggestions():
         
         for keyword, prop_type in property_type_keywords.items():
             if keyword in query:
-                # Count properties of this type
-                try:
-                    count_query = (
-                        db.session.query(func.count(Property.id))
-                        .filter(
-                            Property.property_type.ilike(f'%{prop_type}%'),
-                            Property.is_active == True
-                        )
-                    )
-                    count = count_query.scalar() or 0
-                    
-                    if count > 0:  # Only show if there are results
-                        suggestions.append({
-                            'type': 'property_type',
-                            'text': prop_type,
-                            'subtitle': f'Найдено {count} объектов',
-                            'url': url_for('properties', property_type=prop_type)
-                        })
-                except Exception as e:
-                    print(f"Property type search error: {e}")
-                    pass
+                count = sum(
+                    type_count for type_name, type_count in suggestion_index.property_type_counts.items()
+                    if prop_type.lower() in type_name.lower()
+                )
+                if count > 0:  # Only show if there are results
+                    suggestions.append({
+                        'type': 'property_type',
+                        'text': prop_type,
+                        'subtitle': f'Найдено {count} объектов',
+                        'url': url_for('properties', property_type=prop_type)
+                    })
         
-        # DaData address suggestions (cities, streets, districts)
+        # DaData address suggestions (cities, streets, districts) - only when the local index
+        # has too little to show, so typing does not wait on the external API
+        from services.dadata_client import get_dadata_client
         dadata = get_dadata_client()
-        if dadata.is_available():
+        if dadata.is_available() and len(suggestions) < 5 and len(query) >= 3:
             try:
                 dadata_suggestions = dadata.suggest_address(query, count=5)
                 for item in dadata_suggestions:
@@ -4724,7 +4823,7 @@ def search_suggestions():
         # 1. Room types (highest priority)
         # 2. Exact matches
         # 3. DaData addresses (cities, streets, districts)
-        # 4. DB results (complexes, developers, districts)
+        # 4. DB results (complexes, developers, districts, streets, buildings)
         suggestions.sort(key=lambda x: (
             0 if x['type'] == 'room_type' else 
             1 if x['text'].lower().startswith(query) else
@@ -4766,19 +4865,11 @@ def save_search_history():
         
         # Only save history for authenticated users
         if user_id or manager_id:
-            # Save to search history
-            history_entry = SearchHistory(
-                query=query,
-                user_id=user_id,
-                manager_id=manager_id,
-                result_count=result_count
-            )
-            db.session.add(history_entry)
-            
-            # Record in analytics
-            SearchAnalytics.record_search(query, result_count)
-            
-            db.session.commit()
+            # History row and analytics counters are written in bulk by the event buffer
+            from services.event_buffer import get_event_buffer
+            events = get_event_buffer()
+            events.record_search_history(query, user_id=user_id, manager_id=manager_id, result_count=result_count)
+            events.record_search(query, result_count)
             
             return jsonify({
                 'success': True,
@@ -5249,6 +5340,7 @@ def geocode_autocomplete():
         lon = 38.9753
     
     try:
+        from services.geocoding import get_geocoding_service
         geocoding_service = get_geocoding_service()
         suggestions = geocoding_service.autocomplete(
             query=query,
@@ -5289,6 +5381,7 @@ def geocode_reverse():
         }), 400
     
     try:
+        from services.geocoding import get_geocoding_service
         geocoding_service = get_geocoding_service()
         result = geocoding_service.enrich_property_address(lat, lon)
         
@@ -5327,6 +5420,7 @@ def geocode_forward():
         }), 400
     
     try:
+        from services.geocoding import get_geocoding_service
         geocoding_service = get_geocoding_service()
         result = geocoding_service.forward_geocode(address)
         
@@ -5365,6 +5459,7 @@ def enrich_properties():
     
     try:
         from models import Property
+        from services.geocoding import get_geocoding_service
         geocoding_service = get_geocoding_service()
         
         # Find properties with coordinates but missing parsed address data
@@ -5425,6 +5520,7 @@ def enrich_properties():
 def geocode_stats():
     """Get geocoding service statistics"""
     try:
+        from services.geocoding import get_geocoding_service
         geocoding_service = get_geocoding_service()
         stats = geocoding_service.get_stats()
         
@@ -5674,125 +5770,72 @@ def residential_complexes():
 
 
 
+def _format_map_property(prop_row):
+    """Строка get_properties_with_coordinates() → объект маркера карты"""
+    prop_id = prop_row.id
+    inner_id = prop_row.inner_id
+    title = prop_row.title
+    price = prop_row.price or 0
+    rooms = prop_row.rooms or 0
+    area = prop_row.area or 0
+    complex_name = prop_row.complex_name or ''
+    cashback_rate = prop_row.cashback_rate or 0
+    
+    # Calculate cashback
+    cashback_amount = int(price * (cashback_rate / 100)) if cashback_rate > 0 else 0
+    
+    # Format title
+    room_label = 'Студия' if rooms == 0 else f'{rooms}-комн'
+    formatted_title = f"{room_label}, {area} м²" if title else title
+    
+    return {
+        'id': inner_id or prop_id,
+        'price': price,
+        'area': area,
+        'rooms': rooms,
+        'title': formatted_title,
+        'address': '',
+        'residential_complex': complex_name,
+        'complex_name': complex_name,
+        'developer': prop_row.developer_name or '',
+        'district': 'Краснодарский край',
+        'coordinates': {
+            'lat': float(prop_row.latitude),
+            'lng': float(prop_row.longitude)
+        },
+        'url': f"/object/{inner_id or prop_id}",
+        'type': 'property',
+        'cashback': cashback_amount,
+        'cashback_rate': cashback_rate,
+        'cashback_available': cashback_rate > 0,
+        'status': 'available',
+        'property_type': 'Квартира',
+        'main_image': prop_row.main_image or '/static/images/no-photo.jpg',
+        'gallery_images': prop_row.gallery_images,
+        'floor': prop_row.floor,
+        'total_floors': prop_row.total_floors
+    }
+
+
 @app.route('/map')
 def map_view():
-    """Enhanced interactive map view page using real Excel data"""
-    # Map route processing
-    
+    """
+    Interactive map page
+    Данные не встраиваются в страницу: карта запрашивает /api/map/clusters
+    по текущему окну и зуму (кластеры при отдалении, точки при приближении)
+    """
     try:
-        # ✅ MIGRATED: Load properties with coordinates using repository
-        properties_data = PropertyRepository.get_properties_with_coordinates()
-        
-        properties = []
-        for prop_row in properties_data:
-            # Unpack RowProxy data
-            prop_id = prop_row.id
-            inner_id = prop_row.inner_id
-            title = prop_row.title
-            price = prop_row.price or 0
-            rooms = prop_row.rooms or 0
-            area = prop_row.area or 0
-            floor = prop_row.floor
-            total_floors = prop_row.total_floors
-            main_image = prop_row.main_image
-            gallery_images = prop_row.gallery_images
-            lat = prop_row.latitude
-            lng = prop_row.longitude
-            complex_name = prop_row.complex_name or ''
-            cashback_rate = prop_row.cashback_rate or 0
-            developer_name = prop_row.developer_name or ''
-            
-            # Calculate cashback
-            cashback_amount = int(price * (cashback_rate / 100)) if cashback_rate > 0 else 0
-            
-            # Format title
-            room_label = 'Студия' if rooms == 0 else f'{rooms}-комн'
-            formatted_title = f"{room_label}, {area} м²" if title else title
-            
-            # Format data for map
-            property_data = {
-                'id': inner_id or prop_id,
-                'price': price,
-                'area': area,
-                'rooms': rooms,
-                'title': formatted_title,
-                'address': '',  # Will be filled from Property model if available
-                'residential_complex': complex_name,
-                'complex_name': complex_name,
-                'developer': developer_name,
-                'district': 'Краснодарский край',
-                'coordinates': {
-                    'lat': float(lat),
-                    'lng': float(lng)
-                },
-                'url': f"/object/{inner_id or prop_id}",
-                'type': 'property',
-                'cashback': cashback_amount,
-                'cashback_rate': cashback_rate,
-                'cashback_available': cashback_rate > 0,
-                'status': 'available',
-                'property_type': 'Квартира',
-                'main_image': main_image or '/static/images/no-photo.jpg',
-                'gallery_images': gallery_images,
-                'floor': floor,
-                'total_floors': total_floors
-            }
-            
-            properties.append(property_data)
-        
-        # ✅ MIGRATED: Load residential complexes with coordinates
-        complexes_data = ResidentialComplexRepository.get_with_coordinates()
-        
-        residential_complexes = []
-        for idx, row in enumerate(complexes_data):
-            complex_data = {
-                'id': row.id,
-                'name': row.name or '',
-                'developer': row.developer_name or '',
-                'address': '',  # Not in the query result
-                'district': 'Краснодарский край',
-                'apartments_count': 0,  # Will be calculated if needed
-                'price_from': 0,  # Will be calculated if needed
-                'coordinates': {
-                    'lat': float(row.latitude) if row.latitude else 45.0448,
-                    'lng': float(row.longitude) if row.longitude else 38.9760
-                },
-                'url': f'/zk/{row.slug}' if hasattr(row, 'slug') and row.slug else f'/residential-complex/{row.id}',
-                'type': 'complex'
-            }
-            residential_complexes.append(complex_data)
-        
-        # ✅ Применяем фильтры к данным
-        developers_filter = request.args.get('developers', '')
-        if developers_filter:
-            developers_list = [d.strip() for d in developers_filter.split(',')]
-            properties = [p for p in properties if p.get('developer') in developers_list]
-            print(f"🔍 Фильтр по застройщикам: {developers_list}, найдено объектов: {len(properties)}")
-        
-        # Фильтры для интерфейса
-        all_districts = sorted(list(set(prop.get('district', 'Не указан') for prop in properties if prop.get('district'))))
-        all_developers = sorted(list(set(prop.get('developer', 'Не указан') for prop in properties if prop.get('developer'))))
-        all_complexes = sorted(list(set(prop.get('residential_complex', 'Не указан') for prop in properties if prop.get('residential_complex'))))
-        
         filters = {
             'rooms': request.args.getlist('rooms'),
             'price_min': request.args.get('price_min', ''),
             'price_max': request.args.get('price_max', ''),
             'district': request.args.get('district', ''),
             'developer': request.args.get('developer', ''),
-            'developers': developers_filter,
+            'developers': request.args.get('developers', ''),
             'residential_complex': request.args.get('residential_complex', ''),
         }
         
-        # Map data loaded
-        
-        return render_template('map.html', 
-                             properties=properties, 
-                             residential_complexes=residential_complexes,
-                             all_districts=all_districts,
-                             all_developers=all_developers,
-                             all_complexes=all_complexes,
-                             filters=filters)
+        return render_template('map.html', properties=[], filters=filters)
                              
     except Exception as e:
         print(f"ERROR in map route: {e}")
@@ -5927,7 +5970,7 @@ def complexes_map():
 
 # API Routes
 @app.route('/api/properties')
-@cache.cached(timeout=300, query_string=True)
+@response_cache.cached_view(ttl=300, tags=[TAG_CATALOGUE])
 def api_properties():
     """API endpoint for properties - NORMALIZED TABLES"""
     try:
@@ -6139,16 +6182,34 @@ def api_properties_list():
                 sort_by = parts[0]
                 sort_order = parts[1]
         
-        # Get properties with Repository
-        properties_list = PropertyRepository.get_all_active(
-            limit=per_page,
-            offset=offset,
-            filters=repo_filters,
-            sort_by=sort_by,
-            sort_order=sort_order
-        )
-        
-        total_properties = PropertyRepository.count_active(filters=repo_filters)
+        cursor = request.args.get('cursor')
+        if cursor:
+            # Keyset: бесконечная прокрутка продолжает после последней показанной квартиры,
+            # глубина прокрутки не влияет на стоимость запроса, общее количество не считается
+            try:
+                properties_list, next_cursor = PropertyRepository.get_active_keyset(
+                    limit=per_page,
+                    cursor=cursor,
+                    filters=repo_filters,
+                    sort_by=sort_by,
+                    sort_order=sort_order
+                )
+            except InvalidCursor as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            total_properties = None
+        else:
+            # Get properties with Repository (page + total in one pass via PropertyIndex)
+            properties_list, total_properties = PropertyRepository.get_active_page(
+                limit=per_page,
+                offset=offset,
+                filters=repo_filters,
+                sort_by=sort_by,
+                sort_order=sort_order
+            )
+            # Курсор после последней квартиры страницы — дальше можно листать без OFFSET
+            next_cursor = None
+            if properties_list and offset + per_page < total_properties:
+                next_cursor = PropertyRepository.cursor_for(properties_list[-1], sort_by, sort_order)
         
         # Convert to JSON format
         properties_data = []
@@ -6218,7 +6279,7 @@ def api_properties_list():
                 continue
         
         # Pagination info
-        total_pages = (total_properties + per_page - 1) // per_page
+        total_pages = (total_properties + per_page - 1) // per_page if total_properties is not None else None
         
         print(f"✅ API /api/properties/list: returned {len(properties_data)} properties, page {page}/{total_pages}, sort={sort_type}")
         
@@ -6231,7 +6292,8 @@ def api_properties_list():
                 'total': total_properties,
                 'total_pages': total_pages,
                 'has_prev': page > 1,
-                'has_next': page < total_pages
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor
             },
             'filters': filters,
             'sort': sort_type
@@ -6402,6 +6464,22 @@ def api_residential_complexes_map():
     """API endpoint for residential complexes with enhanced data for map"""
     complexes = load_residential_complexes()
     
+    # Количество корпусов всех ЖК одним запросом (вместо COUNT DISTINCT на каждый ЖК)
+    buildings_by_name = {}
+    try:
+        rows = db.session.execute(text("""
+            SELECT rc.name, COUNT(DISTINCT p.complex_building_name) as buildings_count
+            FROM properties p
+            JOIN residential_complexes rc ON p.complex_id = rc.id
+            WHERE p.is_active = true
+              AND p.complex_building_name IS NOT NULL
+            GROUP BY rc.name
+        """)).fetchall()
+        buildings_by_name = {row[0]: row[1] or 1 for row in rows}
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Buildings count query failed: {e}")
+    
     # Enhance complexes data for map
     for i, complex in enumerate(complexes):
         # Add coordinates if missing
@@ -6415,22 +6493,8 @@ def api_residential_complexes_map():
                 'lng': base_lng + lng_offset
             }
         
-        # ✅ ИСПРАВЛЕНО: Правильный подсчет корпусов из normalized tables
         if 'buildings_count' not in complex:
-            # Получаем реальное количество корпусов из normalized tables
-            try:
-                result = db.session.execute(text("""
-                    SELECT COUNT(DISTINCT p.complex_building_name) as buildings_count
-                    FROM properties p
-                    JOIN residential_complexes rc ON p.complex_id = rc.id
-                    WHERE rc.name = :complex_name 
-                      AND p.is_active = true 
-                      AND p.complex_building_name IS NOT NULL
-                """), {'complex_name': complex.get('name', '')})
-                row = result.fetchone()
-                complex['buildings_count'] = row[0] if row and row[0] else 1
-            except:
-                complex['buildings_count'] = 1  # По умолчанию 1 корпус
+            complex['buildings_count'] = buildings_by_name.get(complex.get('name', ''), 1)
         if 'apartments_count' not in complex:
             complex['apartments_count'] = 100 + (i % 300)
             
@@ -6478,6 +6542,7 @@ def _get_complex_data_normalized(complex_id):
 
 
 @app.route('/api/complex/<int:complex_id>')
+@response_cache.cached_view(ttl=300, tags=lambda complex_id: [complex_tag(complex_id)])
 def api_complex(complex_id):
     """API endpoint for single residential complex - MIGRATED TO NORMALIZED TABLES"""
     print(f"🔍 API /api/complex/{complex_id} called")
@@ -6707,7 +6772,7 @@ def download_property_pdf(property_id):
         return jsonify({'error': 'Failed to generate PDF'}), 500
 
 @app.route('/developers')
-@cache.cached(timeout=3600)  # Кэш на 1 час
+@response_cache.cached_view(ttl=3600, tags=[TAG_CATALOGUE])  # Кэш на 1 час
 def developers():
     """Developers listing page with real database data"""
     try:
@@ -6811,40 +6876,18 @@ def developers():
 def developer_page(developer_slug):
     """Individual developer page by slug"""
     try:
-        # Transliteration mapping for finding Cyrillic slugs from Latin input
-        translit_map = str.maketrans('abcdefghijklmnopqrstuvwxyz', 'абцдефгхийклмнопкрствухызгк-неометрия'[:26])
-        
-        # Create variations of the developer name to search for
-        developer_name_from_slug = developer_slug.replace('-', ' ')
-        
-        # Try to find developer in database using multiple search strategies
-        # First try exact match with original slug
-        developer = db.session.execute(
-            text("""
-            SELECT * FROM developers WHERE 
-            LOWER(slug) = LOWER(:slug)
-            OR LOWER(name) LIKE LOWER(:name_pattern)
-            OR LOWER(REPLACE(name, ' ', '-')) = LOWER(:slug)
-            LIMIT 1
-            """),
-            {
-                "slug": developer_slug, 
-                "name_pattern": f"%{developer_name_from_slug}%"
-            }
-        ).fetchone()
+        from services.slug_registry import KIND_DEVELOPER, get_slug_registry
         
-        # If not found, try searching by name matching (case insensitive)
-        if not developer:
-            # Try all developers and match by similarity
-            all_devs = db.session.execute(text("SELECT * FROM developers")).fetchall()
-            for dev in all_devs:
-                dev_slug = dev.slug.lower() if dev.slug else ''
-                dev_name = dev.name.lower().replace(' ', '-').replace('гк', 'gk')
-                dev_name = dev_name.replace('неометрия', 'neometriya')
-                
-                if developer_slug.lower() in [dev_slug, dev_name]:
-                    developer = dev
-                    break
+        # Canonical slug, names and legacy transliterations resolve through the slug registry
+        developer = None
+        resolved = get_slug_registry().resolve(KIND_DEVELOPER, developer_slug)
+        if resolved:
+            developer_id, canonical = resolved
+            if canonical != developer_slug:
+                return redirect(url_for('developer_page', developer_slug=canonical), code=301)
+            developer = db.session.execute(
+                text("SELECT * FROM developers WHERE id = :id"), {"id": developer_id}
+            ).fetchone()
         
         if not developer:
             print(f"Developer not found in database: {developer_slug}")
@@ -7177,7 +7220,6 @@ def admin_coordinates():
 def admin_update_coordinates():
     """API для обновления координат района"""
     from models import District
-    import math
     
     try:
         district_id = request.form.get('district_id')
@@ -7187,15 +7229,8 @@ def admin_update_coordinates():
         # Вычисляем расстояние до центра
         theater_lat, theater_lon = 45.035180, 38.977414
         
-        def haversine_distance(lat1, lon1, lat2, lon2):
-            R = 6371
-            dlat = math.radians(lat2 - lat1)
-            dlon = math.radians(lon2 - lon1)
-            a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-            c = 2 * math.asin(math.sqrt(a))
-            return R * c
-        
-        distance = haversine_distance(latitude, longitude, theater_lat, theater_lon)
+        import nearby_places
+        distance = nearby_places.calculate_distance(latitude, longitude, theater_lat, theater_lon) / 1000
         
         # Обновляем координаты
         district = District.query.get(district_id)
@@ -7244,22 +7279,23 @@ def district_detail(district):
     try:
         # Import District model
         from models import District
+        from services.slug_registry import KIND_DISTRICT, get_slug_registry
+        
+        # Старые варианты slug района — 301 на канонический из БД
+        resolved = get_slug_registry().resolve(KIND_DISTRICT, district)
+        if resolved and resolved[1] != district:
+            return redirect(url_for('district_detail', district=resolved[1]), code=301)
         
         # Get properties and complexes in this district
         properties = load_properties()
         complexes = load_residential_complexes()
         
         # Filter by district (simplified district matching)
-        district_properties = [p for p in properties if district.replace('-', ' ').lower() in p.get('address', '').lower()]
+        district_properties = [dict(p) for p in properties if district.replace('-', ' ').lower() in p.get('address', '').lower()]
         district_complexes = [c for c in complexes if district.replace('-', ' ').lower() in c.get('district', '').lower()]
         
         # Add cashback calculations
-        for prop in district_properties:
-            prop['cashback'] = calculate_cashback(
-                prop['price'],
-                complex_id=prop.get('complex_id'),
-                complex_name=prop.get('residential_complex')
-            )
+        apply_cashback(district_properties)
         
         # District info mapping - all 54 districts
         district_names = {
@@ -7337,6 +7373,16 @@ def district_detail(district):
                 print(f"Infrastructure parsing error: {e}")
                 infrastructure_data = None
         
+        # ЖК района - ближайшие к центру района первыми (batch haversine)
+        if district_db and district_db.latitude and district_db.longitude and district_complexes:
+            distances_by_id = dict(ResidentialComplexRepository.get_nearest(
+                district_db.latitude, district_db.longitude, limit=None
+            ))
+            for complex_item in district_complexes:
+                distance = distances_by_id.get(complex_item.get('id'))
+                complex_item['distance_km'] = round(distance / 1000, 1) if distance is not None else None
+            district_complexes.sort(key=lambda c: c['distance_km'] if c['distance_km'] is not None else float('inf'))
+        
         district_data = {
             'name': district_name,
             'slug': district,
@@ -8770,12 +8816,19 @@ def remove_from_favorites(property_id):
         return jsonify({'success': False, 'error': 'Favorite not found'}), 404
 
 def send_view_notification_to_manager(presentation, view):
-    """Отправляет уведомление менеджеру о новом просмотре презентации"""
+    """
+    Отправляет уведомление менеджеру о новом просмотре презентации
+    Ничего не пишет в БД: просмотр ещё в event buffer, вызывающий передаёт
+    результат в record_presentation_view(notification_sent=...)
+
+    Returns:
+        bool: уведомление отправлено
+    """
     try:
         manager = presentation.created_by
         if not manager:
             print(f"Manager not found for presentation {presentation.id}")
-            return
+            return False
             
         # Получаем информацию о просмотре
         client_info = "Неизвестный клиент"
@@ -8789,7 +8842,7 @@ def send_view_notification_to_manager(presentation, view):
 
 📋 "{presentation.title}"
 👤 Клиент: {client_info}
-🔢 Всего просмотров: {presentation.view_count}
+🔢 Всего просмотров: {(presentation.view_count or 0) + 1}
 ⏰ Время просмотра: {view.viewed_at.strftime('%d.%m.%Y %H:%M')}
 🌐 IP: {view.view_ip}
 📱 Устройство: {view.user_agent[:50] + '...' if view.user_agent and len(view.user_agent) > 50 else view.user_agent or 'Неизвестно'}
@@ -8809,13 +8862,11 @@ def send_view_notification_to_manager(presentation, view):
         print(f"📧 NOTIFICATION TO MANAGER {manager.email}:")
         print(notification_text)
         print("-" * 50)
-        
-        # Отмечаем что уведомление отправлено
-        view.notification_sent = True
-        db.session.commit()
+        return True
         
     except Exception as e:
         print(f"Error in send_view_notification_to_manager: {e}")
+        return False
 
 @app.route('/presentation/<string:unique_url>')
 def redirect_old_presentation_url(unique_url):
@@ -8841,26 +8892,29 @@ def view_presentation(unique_id):
                              error="Презентация не найдена", 
                              message="Возможно, ссылка устарела или была удалена"), 404
     
-    # Записываем просмотр
+    # Записываем просмотр (строка и счётчик пишутся пачкой через event buffer)
     try:
+        from services.event_buffer import get_event_buffer
+        # Не добавляется в сессию — только данные для уведомления и буфера
         view = PresentationView(
             collection_id=presentation.id,
             view_ip=request.remote_addr,
             user_agent=request.headers.get('User-Agent'),
-            referer=request.headers.get('Referer')
+            referer=request.headers.get('Referer'),
+            viewed_at=datetime.utcnow()
         )
-        db.session.add(view)
         
-        # Увеличиваем счетчик просмотров (без автокоммита)
-        presentation.increment_view_count()
-        db.session.commit()  # Контролируем транзакцию на уровне view
-        
-        # Отправляем уведомление менеджеру о новом просмотре
+        # Сначала уведомление менеджеру: его результат пишется вместе со строкой просмотра
+        notification_sent = False
         try:
-            send_view_notification_to_manager(presentation, view)
+            notification_sent = send_view_notification_to_manager(presentation, view)
         except Exception as e:
             print(f"Error sending view notification: {e}")
         
+        get_event_buffer().record_presentation_view(
+            presentation.id, view.view_ip, view.user_agent, view.referer, viewed_at=view.viewed_at,
+            notification_sent=notification_sent)
+        
     except Exception as e:
         db.session.rollback()
         print(f"Error recording presentation view: {e}")
@@ -8936,16 +8990,12 @@ def view_modern_presentation(unique_id):
         
         print(f"DEBUG: view_modern_presentation - Found presentation ID: {presentation.id}")
         
-        # Записываем просмотр
+        # Записываем просмотр (строка и счётчик пишутся пачкой через event buffer)
         try:
-            view = PresentationView(
-                collection_id=presentation.id,
-                view_ip=request.remote_addr,
-                user_agent=request.headers.get('User-Agent'),
-                referer=request.headers.get('Referer')
-            )
-            db.session.add(view)
-            presentation.increment_view_count()
+            from services.event_buffer import get_event_buffer
+            get_event_buffer().record_presentation_view(
+                presentation.id, request.remote_addr, request.headers.get('User-Agent'),
+                request.headers.get('Referer'))
             
             # Создаем уведомление для менеджера
             manager_id = presentation.created_by_manager_id
@@ -10722,15 +10772,10 @@ def api_search_properties():
             property_filters['area_max'] = filters['areaTo']
         
         # Get filtered properties
-        filtered_properties = get_filtered_properties(property_filters)
-        
-        # Add cashback to each property
-        for prop in filtered_properties:
-            prop['cashback'] = calculate_cashback(
-                prop['price'],
-                complex_id=prop.get('complex_id'),
-                complex_name=prop.get('residential_complex')
-            )
+        filtered_properties = [dict(p) for p in get_filtered_properties(property_filters)]
+        
+        # Add cashback to each property (копии: записи снимка read-only)
+        apply_cashback(filtered_properties)
         
         # Sort by price ascending
         filtered_properties = sort_properties(filtered_properties, 'price_asc')
@@ -11810,21 +11855,9 @@ def admin_dashboard():
     if not current_admin:
         return redirect(url_for('admin_login'))
     
-    # Analytics data
-    stats = {
-        'total_users': User.query.count(),
-        'total_managers': Manager.query.count(),
-        'total_applications': CashbackApplication.query.count(),
-        'pending_applications': CashbackApplication.query.filter_by(status='На рассмотрении').count(),
-        'approved_applications': CashbackApplication.query.filter_by(status='Одобрена').count(),
-        'paid_applications': CashbackApplication.query.filter_by(status='Выплачена').count(),
-        'total_cashback_approved': sum(app.cashback_amount for app in CashbackApplication.query.filter_by(status='Одобрена').all()),
-        'total_cashback_paid': sum(app.cashback_amount for app in CashbackApplication.query.filter_by(status='Выплачена').all()),
-        'active_users': User.query.filter_by(is_active=True).count(),
-        'active_managers': Manager.query.filter_by(is_active=True).count(),
-        'cashback_requests': CallbackRequest.query.filter(CallbackRequest.notes.contains('кешбек')).count(),
-        'new_requests': CallbackRequest.query.filter_by(status='Новая').count(),
-    }
+    # Analytics data: один запрос по analytics_rollups
+    from services.analytics_rollups import admin_dashboard_stats
+    stats = admin_dashboard_stats()
     
     # Recent activity
     recent_applications = CashbackApplication.query.order_by(CashbackApplication.created_at.desc()).limit(10).all()
@@ -14197,19 +14230,10 @@ def admin_cashback_analytics():
     # ИСПРАВЛЕНО: Используем Flask-Login current_user
     current_admin = current_user
     
-    # Monthly cashback stats
-    monthly_stats = db.session.query(
-        func.date_trunc('month', CashbackApplication.created_at).label('month'),
-        func.count(CashbackApplication.id).label('count'),
-        func.sum(CashbackApplication.cashback_amount).label('total_amount')
-    ).group_by(func.date_trunc('month', CashbackApplication.created_at)).order_by('month').all()
-    
-    # Status breakdown
-    status_stats = db.session.query(
-        CashbackApplication.status,
-        func.count(CashbackApplication.id).label('count'),
-        func.sum(CashbackApplication.cashback_amount).label('total_amount')
-    ).group_by(CashbackApplication.status).all()
+    # Monthly cashback stats и status breakdown из analytics_rollups
+    from services.analytics_rollups import monthly_series, status_breakdown
+    monthly_stats = monthly_series('applications')
+    status_stats = status_breakdown('applications')
     
     # Recent large cashbacks
     large_cashbacks = CashbackApplication.query.filter(
@@ -14408,6 +14432,10 @@ def update_complex_cashback(complex_id):
         
         db.session.commit()
         
+        # Cashback lookups use a shared table of complex rates
+        from services.complex_attributes import invalidate_complex_attributes
+        invalidate_complex_attributes()
+        
         return jsonify({
             'success': True, 
             'message': 'Кешбек успешно обновлен',
@@ -14598,13 +14626,19 @@ def admin_update_complex_nearby(complex_id):
                 'error': 'У ЖК не указаны координаты. Добавьте широту и долготу для автоматического поиска.'
             }), 400
         
-        # Получаем близлежащие объекты через Overpass API
+        # Близлежащие объекты: региональная выгрузка POI, иначе Overpass API
+        from services.poi_store import get_poi_store
         print(f"Fetching nearby places for {complex.name} at {complex.latitude}, {complex.longitude}")
-        nearby_data = nearby_places.fetch_nearby_places(
-            latitude=float(complex.latitude),
-            longitude=float(complex.longitude),
-            radius_meters=3000
-        )
+        poi_store = get_poi_store()
+        if poi_store is not None:
+            nearby_data = poi_store.nearby(float(complex.latitude), float(complex.longitude), 3000)
+        else:
+            import nearby_places
+            nearby_data = nearby_places.fetch_nearby_places(
+                latitude=float(complex.latitude),
+                longitude=float(complex.longitude),
+                radius_meters=3000
+            )
         
         # Сохраняем в БД
         complex.nearby = json.dumps(nearby_data, ensure_ascii=False)
@@ -15112,24 +15146,9 @@ def manager_analytics():
     
     current_manager = current_user
     
-    # Manager stats
-    clients_count = User.query.filter_by(assigned_manager_id=current_manager.id).count()
-    collections_count = Collection.query.filter_by(created_by_manager_id=current_manager.id).count()
-    sent_collections = Collection.query.filter_by(created_by_manager_id=current_manager.id, status='Отправлена').count()
-    
-    # Monthly collection stats
-    monthly_collections = db.session.query(
-        func.date_trunc('month', Collection.created_at).label('month'),
-        func.count(Collection.id).label('count')
-    ).filter_by(created_by_manager_id=current_manager.id).group_by(
-        func.date_trunc('month', Collection.created_at)
-    ).order_by('month').all()
-    
-    # Client activity stats
-    client_stats = db.session.query(
-        User.client_status,
-        func.count(User.id).label('count')
-    ).filter_by(assigned_manager_id=current_manager.id).group_by(User.client_status).all()
+    # Manager stats, monthly collections и client activity из analytics_rollups
+    from services.analytics_rollups import manager_dashboard_stats
+    stats = manager_dashboard_stats(current_manager.id)
     
     # Recent activity
     recent_collections = Collection.query.filter_by(
@@ -15138,11 +15157,11 @@ def manager_analytics():
     
     return render_template('manager/analytics.html',
                          manager=current_manager,
-                         clients_count=clients_count,
-                         collections_count=collections_count,
-                         sent_collections=sent_collections,
-                         monthly_collections=monthly_collections,
-                         client_stats=client_stats,
+                         clients_count=stats['clients_count'],
+                         collections_count=stats['collections_count'],
+                         sent_collections=stats['sent_collections'],
+                         monthly_collections=stats['monthly_collections'],
+                         client_stats=stats['client_stats'],
                          recent_collections=recent_collections)
 
 @app.route('/manager/search-properties', methods=['POST'])
@@ -15492,11 +15511,7 @@ def book_appointment():
     property_data = None
     property_id = request.args.get('property_id')
     if property_id:
-        properties = load_properties()
-        for prop in properties:
-            if str(prop.get('id')) == property_id:
-                property_data = prop
-                break
+        property_data = load_properties().get_by_id(property_id)
     
     return render_template('book_appointment.html', property_data=property_data)
 
@@ -17304,13 +17319,7 @@ def add_property_to_presentation(presentation_id):
     
     try:
         # Получаем информацию о квартире из JSON
-        properties = load_properties()
-        property_info = None
-        
-        for prop in properties:
-            if str(prop.get('id')) == str(property_id):
-                property_info = prop
-                break
+        property_info = load_properties().get_by_id(property_id)
         
         if not property_info:
             return jsonify({'success': False, 'error': 'Квартира не найдена'}), 404
@@ -17817,10 +17826,7 @@ def print_property(presentation_id, property_id):
 def download_presentation_property_pdf(presentation_id, property_id):
     """Скачать объект в PDF формате"""
     from models import Collection, CollectionProperty
-    from weasyprint import HTML, CSS
     from io import BytesIO
-    import tempfile
-    import os
     
     try:
         # Find presentation and property
@@ -17833,516 +17839,263 @@ def download_presentation_property_pdf(presentation_id, property_id):
         if not property_obj:
             return "Property not found in presentation", 404
         
-        # Get comprehensive context using new function
-        context = fetch_pdf_context(property_id, presentation_id)
+        # Готовый PDF берём из кэша, если не менялись квартира, ЖК, менеджер, заметка и шаблон
+        from services.pdf_cache import get_pdf_cache, fetch_pdf_inputs_version
         
-        if not context:
+        inputs_version = fetch_pdf_inputs_version(property_id, presentation_id)
+        if inputs_version is None:
             return "Property data not found", 404
         
-        # Render HTML for PDF with full context
-        html_content = render_template('print_property.html', 
-                                     property=context['property'],
-                                     property_images=context['property_images'],
-                                     complex=context['complex'],
-                                     complex_images=context['complex_images'],
-                                     manager=context['manager'],
-                                     presentation=presentation,
-                                     manager_note=property_obj.manager_note,
-                                     context=context,
-                                     for_pdf=True)
+        pdf_cache = get_pdf_cache()
+        cache_key = pdf_cache.make_key(
+            'print_property.html', pdf_cache.template_version('print_property.html'),
+            property_id, presentation_id, presentation.title, property_obj.manager_note,
+            inputs_version, request.host_url
+        )
+        
+        def render_pdf():
+            from weasyprint import HTML
+            
+            # Get comprehensive context using new function
+            context = fetch_pdf_context(property_id, presentation_id)
+            
+            if not context:
+                raise LookupError("Property data not found")
+            
+            # Render HTML for PDF with full context
+            html_content = render_template('print_property.html', 
+                                         property=context['property'],
+                                         property_images=context['property_images'],
+                                         complex=context['complex'],
+                                         complex_images=context['complex_images'],
+                                         manager=context['manager'],
+                                         presentation=presentation,
+                                         manager_note=property_obj.manager_note,
+                                         context=context,
+                                         for_pdf=True)
+            
+            # Generate PDF
+            pdf_buffer = BytesIO()
+            HTML(string=html_content, base_url=request.host_url).write_pdf(pdf_buffer)
+            return pdf_buffer.getvalue()
         
-        # Generate PDF
-        pdf_buffer = BytesIO()
-        HTML(string=html_content, base_url=request.host_url).write_pdf(pdf_buffer)
-        pdf_buffer.seek(0)
+        try:
+            pdf_path = pdf_cache.get_or_render(cache_key, render_pdf)
+        except LookupError:
+            return "Property data not found", 404
         
         return send_file(
-            pdf_buffer,
+            pdf_path,
             as_attachment=True,
             download_name=f'property_{property_id}.pdf',
-            mimetype='application/pdf'
+            mimetype='application/pdf',
+            etag=cache_key,
+            conditional=True
         )
         
     except Exception as e:
         print(f"Error generating PDF: {e}")
         return f"Error generating PDF: {str(e)}", 500
 
+def _presentation_pdf_items(presentation):
+    """Квартиры презентации в виде простых dict (передаются в фоновую задачу)"""
+    from models import CollectionProperty
+    
+    return [
+        {'property_id': cp.property_id, 'manager_note': cp.manager_note}
+        for cp in CollectionProperty.query.filter_by(collection_id=presentation.id).all()
+    ]
+
+def _render_presentation_property_html(presentation_id, item):
+    """HTML одной квартиры для PDF (вызывается координатором задачи внутри app context)"""
+    from models import Collection
+    
+    presentation = db.session.get(Collection, presentation_id)
+    context = fetch_pdf_context(item['property_id'], presentation_id)
+    if not context:
+        print(f"DEBUG: Failed to get context for property {item['property_id']}")
+        return None
+    
+    html_content = render_template('print_property.html', 
+                                 property=context['property'],
+                                 property_images=context['property_images'],
+                                 complex=context['complex'],
+                                 complex_images=context['complex_images'],
+                                 manager=context['manager'],
+                                 presentation=presentation,
+                                 manager_note=item['manager_note'],
+                                 context=context,
+                                 for_pdf=True)
+    return f"property_{item['property_id']}.pdf", html_content
+
+def _presentation_job_id(presentation):
+    return f"presentation_{presentation.id}"
+
+def _submit_presentation_job(presentation, base_url):
+    """Поставить (или переиспользовать) фоновую генерацию архива презентации"""
+    from functools import partial
+    from services.presentation_jobs import get_presentation_jobs, presentation_fingerprint
+    from services.property_snapshot import fetch_catalogue_version
+    
+    items = _presentation_pdf_items(presentation)
+    if not items:
+        return None
+    
+    fingerprint = presentation_fingerprint(items, fetch_catalogue_version(), base_url)
+    return get_presentation_jobs().submit(
+        _presentation_job_id(presentation),
+        fingerprint,
+        items,
+        partial(_render_presentation_property_html, presentation.id),
+        base_url,
+        download_name=f'presentation_{presentation.title.replace(" ", "_")}_all_properties.zip',
+        context_factory=app.app_context,
+    )
+
+def _send_presentation_archive(presentation, download_name=None):
+    """Отдать готовый архив презентации с диска"""
+    from services.presentation_jobs import get_presentation_jobs
+    
+    ready = get_presentation_jobs().artifact(_presentation_job_id(presentation))
+    if not ready:
+        return None
+    zip_path, status = ready
+    return send_file(
+        zip_path,
+        as_attachment=True,
+        download_name=download_name or status.get('download_name'),
+        mimetype='application/zip'
+    )
+
+def _find_public_presentation(unique_id):
+    from models import Collection
+    
+    return Collection.query.filter_by(
+        unique_url=unique_id,
+        collection_type='presentation'
+    ).first()
+
+# Сколько SSE /progress следит за фоновой задачей
+PRESENTATION_DOWNLOAD_WAIT = 600
+
+def _presentation_job_response(presentation, status, status_url, download_url):
+    """
+    Ответ на запуск / опрос архива: 202 пока задача идёт, 200 когда архив готов
+    Запрос не ждёт рендер — клиент опрашивает status_url (или SSE) и скачивает download_url
+    """
+    from services.presentation_jobs import STAGE_COMPLETE, STAGE_ERROR
+    
+    stage = status.get('stage')
+    payload = {key: status.get(key) for key in ('stage', 'progress', 'current', 'total', 'message') if key in status}
+    payload.update(
+        success=stage != STAGE_ERROR,
+        job_id=_presentation_job_id(presentation),
+        status_url=status_url,
+        download_url=download_url,
+    )
+    if stage == STAGE_ERROR:
+        payload['error'] = status.get('message')
+        return jsonify(payload), 500
+    if stage == STAGE_COMPLETE:
+        return jsonify(payload), 200
+    return jsonify(payload), 202, {'Location': status_url, 'Retry-After': '2'}
+
+def _find_manager_presentation(presentation_id):
+    """Презентация текущего менеджера: (presentation, None) или (None, ответ с ошибкой)"""
+    from models import Collection
+    
+    presentation = Collection.query.get_or_404(presentation_id)
+    if presentation.created_by_manager_id != current_user.id:
+        return None, (jsonify({'success': False, 'error': 'Access denied'}), 403)
+    return presentation, None
+
 @app.route('/api/manager/presentation/<int:presentation_id>/download-all')
 @manager_required
 def download_all_properties(presentation_id):
-    """Скачать все объекты презентации в ZIP архиве"""
-    from models import Collection, CollectionProperty
-    from weasyprint import HTML, CSS
-    import zipfile
-    from io import BytesIO
-    import tempfile
-    
+    """Запустить сборку ZIP со всеми объектами презентации (202 + адрес статуса)"""
     try:
-        # Find presentation
-        presentation = Collection.query.get_or_404(presentation_id)
+        presentation, error = _find_manager_presentation(presentation_id)
+        if error:
+            return error
         
-        # Check ownership
-        current_manager = current_user
-        if presentation.created_by_manager_id != current_manager.id:
-            return jsonify({'success': False, 'error': 'Access denied'}), 403
-        
-        # Get all properties in presentation
-        properties = CollectionProperty.query.filter_by(
-            collection_id=presentation_id
-        ).all()
-        
-        print(f"DEBUG: Found {len(properties)} properties in presentation {presentation_id}")
-        for prop in properties:
-            print(f"DEBUG: Property ID: {prop.property_id}")
-        
-        if not properties:
+        status = _submit_presentation_job(presentation, request.host_url)
+        if status is None:
             return jsonify({'success': False, 'error': 'No properties in presentation'}), 400
         
-        # Create ZIP archive
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for prop in properties:
-                # Get property details from database using raw SQL for compatibility
-                try:
-                    query = text("""
-                        SELECT 
-                            p.inner_id AS id,
-                            CAST(p.area AS FLOAT) AS area,
-                            CAST(p.price AS INTEGER) AS price,
-                            CAST(p.floor AS INTEGER) AS floor,
-                            CAST(p.total_floors AS INTEGER) AS total_floors,
-                            CAST(p.rooms AS INTEGER) AS rooms,
-                            'Квартира' AS property_type,
-                            p.address AS address_display_name,
-                            rc.name AS jk_name,
-                            d.name AS developer_name,
-                            NULL AS completion_date
-                        FROM properties p
-                        LEFT JOIN residential_complexes rc ON p.complex_id = rc.id
-                        LEFT JOIN developers d ON p.developer_id = d.id
-                        WHERE p.id = :prop_id
-                    """)
-                    
-                    # Convert property_id to int for inner_id lookup
-                    try:
-                        prop_id_int = int(prop.property_id)
-                    except ValueError:
-                        print(f"Invalid property ID format: {prop.property_id}")
-                        continue
-                        
-                    result = db.session.execute(query, {'prop_id': prop_id_int}).fetchone()
-                    
-                    if not result:
-                        print(f"Property {prop.property_id} not found in database")
-                        continue  # Skip if property not found
-                        
-                    # Convert row to object and compute safe values
-                    from types import SimpleNamespace
-                    row_dict = dict(result._mapping)
-                    
-                    # Ensure safe types and compute price per sqm
-                    row_dict['price'] = int(row_dict['price'] or 0)
-                    row_dict['area'] = float(row_dict['area'] or 0)
-                    row_dict['rooms'] = int(row_dict['rooms'] or 0)
-                    
-                    # Compute price per sqm safely
-                    if row_dict['area'] and row_dict['area'] > 0:
-                        row_dict['price_per_sqm'] = int(row_dict['price'] / row_dict['area'])
-                    else:
-                        row_dict['price_per_sqm'] = 0
-                        
-                    property_item = SimpleNamespace(**row_dict)
-                    property_data = [property_item]
-                except Exception as e:
-                    print(f"Database error for property {prop.property_id}: {e}")
-                    continue
-                
-                if property_data:
-                    property_item = property_data[0]
-                    
-                    # Use fetch_pdf_context to get all necessary data
-                    context = fetch_pdf_context(prop.property_id, presentation_id)
-                    if not context:
-                        print(f"Failed to get context for property {prop.property_id}")
-                        continue
-                    
-                    # Generate HTML for PDF with complete context
-                    html_content = render_template('print_property.html', 
-                                                 property=context['property'],
-                                                 property_images=context['property_images'],
-                                                 complex=context['complex'],
-                                                 complex_images=context['complex_images'],
-                                                 manager=context['manager'],
-                                                 presentation=presentation,
-                                                 manager_note=getattr(prop, 'manager_note', None),
-                                                 context=context,
-                                                 for_pdf=True)
-                    
-                    # Generate PDF
-                    pdf_buffer = BytesIO()
-                    HTML(string=html_content, base_url=request.host_url).write_pdf(pdf_buffer)
-                    
-                    # Add to ZIP
-                    filename = f'property_{prop.property_id}.pdf'
-                    zip_file.writestr(filename, pdf_buffer.getvalue())
-                    print(f"DEBUG: Added {filename} to ZIP (size: {len(pdf_buffer.getvalue())} bytes)")
-        
-        zip_buffer.seek(0)
-        print(f"DEBUG: ZIP created with total size: {len(zip_buffer.getvalue())} bytes")
-        
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=f'presentation_{presentation_id}_all_properties.zip',
-            mimetype='application/zip'
+        return _presentation_job_response(
+            presentation, status,
+            url_for('download_all_properties_status', presentation_id=presentation_id),
+            url_for('download_all_properties_file', presentation_id=presentation_id),
         )
         
     except Exception as e:
         print(f"Error creating ZIP: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-# REMOVED: This function runs in executor, NOT as a Flask route
-def generate_pdf_archive_background(unique_id, base_url):
-    """Background task to generate PDF archive"""
-    # CRITICAL: Must run within Flask application context to access database
-    with app.app_context():
-        try:
-            from models import Collection, CollectionProperty
-            import zipfile
-            from weasyprint import HTML
-            from io import BytesIO
-            
-            # Find presentation
-            presentation = Collection.query.filter_by(
-                unique_url=unique_id,
-                collection_type='presentation'
-            ).first()
-            
-            if not presentation:
-                progress_storage[f"presentation_{unique_id}"] = {
-                    'stage': 'error',
-                    'progress': 0,
-                    'message': 'Презентация не найдена'
-                }
-                return
-            
-            # Get properties with eager loading
-            properties_data = CollectionProperty.query.filter_by(
-                collection_id=presentation.id
-            ).all()
-            
-            if not properties_data:
-                progress_storage[f"presentation_{unique_id}"] = {
-                    'stage': 'error',
-                    'progress': 0,
-                    'message': 'Нет объектов в презентации'
-                }
-                return
-            
-            total = len(properties_data)
-            progress_storage[f"presentation_{unique_id}"] = {
-                'stage': 'starting',
-                'progress': 0,
-                'current': 0,
-                'total': total,
-                'message': f'Начинаем создание {total} PDF файлов...'
-            }
-            
-            print(f"DEBUG: Background task started for {total} properties")
-            
-            # Create temporary ZIP file
-            zip_filename = f"presentation_{unique_id}_{int(time.time())}.zip"
-            zip_path = os.path.join(TEMP_DOWNLOAD_DIR, zip_filename)
-            
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for idx, cp in enumerate(properties_data, 1):
-                    # Update progress
-                    progress_pct = int((idx / total) * 90)  # 0-90% for PDF generation
-                    progress_storage[f"presentation_{unique_id}"] = {
-                        'stage': 'processing',
-                        'progress': progress_pct,
-                        'current': idx,
-                        'total': total,
-                        'message': f'Создаю PDF {idx} из {total}'
-                    }
-                    
-                    # Use fetch_pdf_context to get all necessary data (same as download_all_properties_public)
-                    context = fetch_pdf_context(cp.property_id, presentation.id)
-                    if not context:
-                        print(f"DEBUG: Failed to get context for property {cp.property_id}")
-                        continue
-                    
-                    # Generate HTML for PDF with complete context (same template as download_all_properties_public)
-                    html_content = render_template('print_property.html', 
-                                                 property=context['property'],
-                                                 property_images=context['property_images'],
-                                                 complex=context['complex'],
-                                                 complex_images=context['complex_images'],
-                                                 manager=context['manager'],
-                                                 presentation=presentation,
-                                                 manager_note=getattr(cp, 'manager_note', None),
-                                                 context=context,
-                                                 for_pdf=True)
-                    
-                    # Generate PDF
-                    pdf_buffer = BytesIO()
-                    HTML(string=html_content, base_url=base_url).write_pdf(pdf_buffer)
-                    
-                    # Add to ZIP
-                    pdf_filename = f"property_{cp.property_id}.pdf"
-                    zipf.writestr(pdf_filename, pdf_buffer.getvalue())
-                    
-                    print(f"DEBUG: Added {pdf_filename} to ZIP (size: {len(pdf_buffer.getvalue())} bytes)")
-            
-            # Final progress
-            progress_storage[f"presentation_{unique_id}"] = {
-                'stage': 'complete',
-                'progress': 100,
-                'current': total,
-                'total': total,
-                'message': 'Архив готов!'
-            }
-            
-            # Store file path
-            file_storage[unique_id] = {
-                'path': zip_path,
-                'created_at': time.time()
-            }
-            
-            print(f"DEBUG: ZIP created successfully: {zip_path}")
-            
-        except Exception as e:
-            import traceback
-            print(f"ERROR in background task: {str(e)}")
-            traceback.print_exc()
-            progress_storage[f"presentation_{unique_id}"] = {
-                'stage': 'error',
-                'progress': 0,
-                'message': f'Ошибка: {str(e)}'
-            }
+@app.route('/api/manager/presentation/<int:presentation_id>/download-all/status')
+@manager_required
+def download_all_properties_status(presentation_id):
+    """Статус сборки архива презентации (без перезапуска)"""
+    from services.presentation_jobs import get_presentation_jobs
+    
+    presentation, error = _find_manager_presentation(presentation_id)
+    if error:
+        return error
+    
+    status = get_presentation_jobs().status(_presentation_job_id(presentation))
+    if not status:
+        return jsonify({'success': False, 'error': 'Архив не запрошен'}), 404
+    return _presentation_job_response(
+        presentation, status,
+        url_for('download_all_properties_status', presentation_id=presentation_id),
+        url_for('download_all_properties_file', presentation_id=presentation_id),
+    )
+
+@app.route('/api/manager/presentation/<int:presentation_id>/download-all/file')
+@manager_required
+def download_all_properties_file(presentation_id):
+    """Скачать готовый архив презентации"""
+    presentation, error = _find_manager_presentation(presentation_id)
+    if error:
+        return error
+    
+    response = _send_presentation_archive(
+        presentation, download_name=f'presentation_{presentation_id}_all_properties.zip'
+    )
+    if response is None:
+        return jsonify({'success': False, 'error': 'Архив ещё не готов'}), 404
+    return response
 
 @app.route('/presentation/view/<string:unique_id>/download-all')
 def download_all_properties_public(unique_id):
-    """Публичное скачивание всех объектов презентации в ZIP архиве"""
-    from models import Collection, CollectionProperty
-    from weasyprint import HTML, CSS
-    import zipfile
-    from io import BytesIO
-    import tempfile
-    
+    """Публичный запуск сборки ZIP: прогресс — /progress (SSE) и /progress-poll, файл — /download-result"""
     try:
-        # Find presentation by unique_id instead of presentation_id
-        presentation = Collection.query.filter_by(
-            unique_url=unique_id,
-            collection_type='presentation'
-        ).first()
-        
+        presentation = _find_public_presentation(unique_id)
         if not presentation:
-            return "Презентация не найдена", 404
-        
-        # Get all properties in presentation
-        properties = CollectionProperty.query.filter_by(
-            collection_id=presentation.id
-        ).all()
-        
-        print(f"DEBUG: Found {len(properties)} properties in presentation {presentation.id}")
-        for prop in properties:
-            print(f"DEBUG: Property ID: {prop.property_id}")
-        
-        if not properties:
-            return "Нет объектов в презентации", 400
-        
-        # Initialize progress tracking
-        progress_key = f"presentation_{unique_id}"
-        total_properties = len(properties)
-        
-        # Initialize progress at 0%
-        progress_storage[progress_key] = {
-            'stage': 'processing',
-            'progress': 0,
-            'current': 0,
-            'total': total_properties,
-            'message': f'Начинаю создание PDF файлов...'
-        }
-        print(f"DEBUG: Initialized progress for {total_properties} properties")
-        
-        # Create ZIP archive with real progress tracking
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for current_index, prop in enumerate(properties, 1):
-                # Update progress
-                # progress = int((current_index / total_properties) * 90)  # Reserve 90-100% for finalization
-                # progress_storage[progress_key] = {
-                # 'stage': 'processing',
-                # 'progress': progress,
-                # 'current': current_index,
-                # 'total': total_properties,
-                # 'message': f'Создаю PDF для квартиры {current_index} из {total_properties}...'
-                # }
-                
-                # Get property details from database using raw SQL for compatibility
-                try:
-                    query = text("""
-                        SELECT 
-                            p.inner_id AS id,
-                            CAST(p.area AS FLOAT) AS area,
-                            CAST(p.price AS INTEGER) AS price,
-                            CAST(p.floor AS INTEGER) AS floor,
-                            CAST(p.total_floors AS INTEGER) AS total_floors,
-                            CAST(p.rooms AS INTEGER) AS rooms,
-                            'Квартира' AS property_type,
-                            p.address AS address_display_name,
-                            rc.name AS jk_name,
-                            d.name AS developer_name,
-                            NULL AS completion_date
-                        FROM properties p
-                        LEFT JOIN residential_complexes rc ON p.complex_id = rc.id
-                        LEFT JOIN developers d ON p.developer_id = d.id
-                        WHERE p.id = :prop_id
-                    """)
-                    
-                    # Convert property_id to int for inner_id lookup
-                    try:
-                        prop_id_int = int(prop.property_id)
-                    except ValueError:
-                        print(f"Invalid property ID format: {prop.property_id}")
-                        continue
-                        
-                    result = db.session.execute(query, {'prop_id': prop_id_int}).fetchone()
-                    
-                    if not result:
-                        print(f"Property {prop.property_id} not found in database")
-                        continue  # Skip if property not found
-                        
-                    # Convert row to object and compute safe values
-                    from types import SimpleNamespace
-                    row_dict = dict(result._mapping)
-                    
-                    # Ensure safe types and compute price per sqm
-                    row_dict['price'] = int(row_dict['price'] or 0)
-                    row_dict['area'] = float(row_dict['area'] or 0)
-                    row_dict['rooms'] = int(row_dict['rooms'] or 0)
-                    
-                    # Compute price per sqm safely
-                    if row_dict['area'] and row_dict['area'] > 0:
-                        row_dict['price_per_sqm'] = int(row_dict['price'] / row_dict['area'])
-                    else:
-                        row_dict['price_per_sqm'] = 0
-                        
-                    property_item = SimpleNamespace(**row_dict)
-                    property_data = [property_item]
-                except Exception as e:
-                    print(f"Database error for property {prop.property_id}: {e}")
-                    continue
-                
-                if property_data:
-                    property_item = property_data[0]
-                    
-                    # Use fetch_pdf_context to get all necessary data
-                    context = fetch_pdf_context(prop.property_id, presentation.id)
-                    if not context:
-                        print(f"Failed to get context for property {prop.property_id}")
-                        continue
-                    
-                    # Generate HTML for PDF with complete context
-                    html_content = render_template('print_property.html', 
-                                                 property=context['property'],
-                                                 property_images=context['property_images'],
-                                                 complex=context['complex'],
-                                                 complex_images=context['complex_images'],
-                                                 manager=context['manager'],
-                                                 presentation=presentation,
-                                                 manager_note=getattr(prop, 'manager_note', None),
-                                                 context=context,
-                                                 for_pdf=True)
-                    
-                    # Generate PDF
-                    pdf_buffer = BytesIO()
-                    HTML(string=html_content, base_url=request.host_url).write_pdf(pdf_buffer)
-                    
-                    # Add to ZIP
-                    filename = f'property_{prop.property_id}.pdf'
-                    zip_file.writestr(filename, pdf_buffer.getvalue())
-                    print(f"DEBUG: Added {filename} to ZIP (size: {len(pdf_buffer.getvalue())} bytes)")
-                    
-                    # Update progress after each PDF is created
-                    progress_percent = int((current_index / total_properties) * 90)  # Reserve 90-100% for finalization
-                    progress_storage[progress_key] = {
-                        'stage': 'processing',
-                        'progress': progress_percent,
-                        'current': current_index,
-                        'total': total_properties,
-                        'message': f'Создаю PDF {current_index} из {total_properties}'
-                    }
-                    print(f"DEBUG: Progress update: {progress_percent}% ({current_index}/{total_properties})")
-        
-        # Final progress - creating archive
-        progress_storage[progress_key] = {
-            'stage': 'completing',
-            'progress': 90,
-            'message': 'Создаю архив...'
-        }
-        
-        zip_buffer.seek(0)
-        print(f"DEBUG: ZIP created with total size: {len(zip_buffer.getvalue())} bytes")
+            return jsonify({'success': False, 'error': 'Презентация не найдена'}), 404
         
-        # Mark as complete
-        progress_storage[progress_key] = {
-            'stage': 'complete',
-            'progress': 100,
-            'message': 'Готово! Скачивание началось.'
-        }
+        status = _submit_presentation_job(presentation, request.host_url)
+        if status is None:
+            return jsonify({'success': False, 'error': 'Нет объектов в презентации'}), 400
         
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=f'presentation_{presentation.title.replace(" ", "_")}_all_properties.zip',
-            mimetype='application/zip'
+        return _presentation_job_response(
+            presentation, status,
+            url_for('poll_pdf_progress', unique_id=unique_id),
+            url_for('download_pdf_result', unique_id=unique_id),
         )
         
     except Exception as e:
         print(f"Error creating ZIP: {e}")
-        
-        # Update progress with error
-        progress_key = f"presentation_{unique_id}"
-        progress_storage[progress_key] = {
-            'stage': 'error',
-            'progress': 0,
-            'message': f'Ошибка при создании архива: {str(e)}'
-        }
-        
-        return f"Ошибка при создании архива: {str(e)}", 500
-
-# Global progress storage for tracking real-time PDF generation
-progress_storage = {}
-
-# Temporary ZIP file storage system
-TEMP_DOWNLOAD_DIR = '/tmp/presentation_downloads'
-os.makedirs(TEMP_DOWNLOAD_DIR, exist_ok=True)
+        return jsonify({'success': False, 'error': f'Ошибка при создании архива: {str(e)}'}), 500
 
-# Storage for file paths keyed by unique_id
-file_storage = {}  # Format: {unique_id: {'path': '/tmp/...zip', 'created_at': timestamp}}
-
-# Thread pool for background PDF generation
-pdf_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='pdf_gen')
-
-def cleanup_old_files():
-    """Remove ZIP files older than 1 hour"""
-    try:
-        now = time.time()
-        for filepath in glob.glob(f"{TEMP_DOWNLOAD_DIR}/*.zip"):
-            if os.path.exists(filepath):
-                file_age = now - os.path.getmtime(filepath)
-                if file_age > 3600:  # 1 hour
-                    os.remove(filepath)
-                    print(f"Cleaned up old file: {filepath}")
-    except Exception as e:
-        print(f"Error during cleanup: {e}")
-
-# Schedule cleanup on startup and every 30 minutes
-atexit.register(cleanup_old_files)
+def _presentation_progress(job_id):
+    """Текущий прогресс задачи из общего хранилища (виден любому worker)"""
+    from services.presentation_jobs import get_presentation_jobs
+    
+    status = get_presentation_jobs().status(job_id)
+    if not status:
+        return None
+    return {key: status.get(key) for key in ('stage', 'progress', 'current', 'total', 'message') if key in status}
 
 @app.route('/presentation/view/<string:unique_id>/progress')
 def download_progress_stream(unique_id):
@@ -18350,14 +18103,9 @@ def download_progress_stream(unique_id):
     from flask import Response
     import json
     import time
-    from models import Collection, CollectionProperty
     
     try:
-        # Find presentation by unique_id
-        presentation = Collection.query.filter_by(
-            unique_url=unique_id,
-            collection_type='presentation'
-        ).first()
+        presentation = _find_public_presentation(unique_id)
         
         if not presentation:
             def error_stream():
@@ -18372,79 +18120,38 @@ def download_progress_stream(unique_id):
                 }
             )
         
-        # Get properties count
-        properties = CollectionProperty.query.filter_by(
-            collection_id=presentation.id
-        ).all()
+        job_id = _presentation_job_id(presentation)
         
-        if not properties:
-            def error_stream():
-                yield f"data: {json.dumps({'error': 'Нет объектов в презентации'})}\n\n"
-            return Response(
-                error_stream(),
-                content_type='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache, no-store, must-revalidate',
-                    'Connection': 'keep-alive',
-                    'X-Accel-Buffering': 'no'
-                }
-            )
-            
         def progress_generator():
             try:
-                total = len(properties)
-                progress_key = f"presentation_{unique_id}"
-                
-                # Initialize progress
-                progress_storage[progress_key] = {
-                    'stage': 'starting',
-                    'progress': 0,
-                    'current': 0,
-                    'total': total,
-                    'message': 'Начинаю создание PDF файлов...'
-                }
-                
-                # Начальное сообщение
-                yield f"data: {json.dumps(progress_storage[progress_key])}\n\n"
-                time.sleep(1)
-                
-                # Wait for real progress updates from download endpoint
-                last_progress = 0
-                timeout_counter = 0
+                last_sent = None
+                started = time.time()
                 
                 while True:
-                    if progress_key in progress_storage:
-                        current_progress = progress_storage[progress_key]
-                        
-                        # Only send updates when progress changes
-                        if current_progress['progress'] != last_progress or current_progress['stage'] != 'processing':
-                            yield f"data: {json.dumps(current_progress)}\n\n"
-                            last_progress = current_progress['progress']
-                        
-                        # Check if completed
-                        if current_progress['stage'] == 'complete':
-                            break
-                            
-                        # Check if error occurred
-                        if current_progress['stage'] == 'error':
-                            break
-                    
-                    time.sleep(0.5)
-                    timeout_counter += 1
+                    current_progress = _presentation_progress(job_id)
                     
-                    # Timeout after 2 minutes
-                    if timeout_counter > 240:
-                        progress_storage[progress_key] = {
-                            'stage': 'error',
-                            'message': 'Превышено время ожидания',
-                            'progress': 0
+                    if current_progress is None:
+                        current_progress = {
+                            'stage': 'starting',
+                            'progress': 0,
+                            'current': 0,
+                            'message': 'Начинаю создание PDF файлов...'
                         }
-                        yield f"data: {json.dumps(progress_storage[progress_key])}\n\n"
+                    
+                    # Only send updates when progress changes
+                    if current_progress != last_sent:
+                        yield f"data: {json.dumps(current_progress)}\n\n"
+                        last_sent = current_progress
+                    
+                    if current_progress['stage'] in ('complete', 'error'):
                         break
-                
-                # Cleanup
-                if progress_key in progress_storage:
-                    del progress_storage[progress_key]
+                    
+                    # Timeout после PRESENTATION_DOWNLOAD_WAIT секунд
+                    if time.time() - started > PRESENTATION_DOWNLOAD_WAIT:
+                        yield f"data: {json.dumps({'stage': 'error', 'message': 'Превышено время ожидания', 'progress': 0})}\n\n"
+                        break
+                    
+                    time.sleep(0.5)
                     
             except Exception as e:
                 yield f"data: {json.dumps({'error': f'Ошибка: {str(e)}'})}\n\n"
@@ -18475,10 +18182,11 @@ def download_progress_stream(unique_id):
 def poll_pdf_progress(unique_id):
     """Poll progress of background PDF generation"""
     try:
-        progress_key = f"presentation_{unique_id}"
+        presentation = _find_public_presentation(unique_id)
+        progress = _presentation_progress(_presentation_job_id(presentation)) if presentation else None
         
-        if progress_key in progress_storage:
-            return jsonify(progress_storage[progress_key])
+        if progress:
+            return jsonify(progress)
         else:
             # No progress yet - task might not be started
             return jsonify({
@@ -18497,24 +18205,20 @@ def poll_pdf_progress(unique_id):
 def start_pdf_generation(unique_id):
     """Start background PDF generation task"""
     try:
-        # Validate presentation exists
-        from models import Collection
-        presentation = Collection.query.filter_by(
-            unique_url=unique_id,
-            collection_type='presentation'
-        ).first()
+        presentation = _find_public_presentation(unique_id)
         
         if not presentation:
             return jsonify({'error': 'Презентация не найдена'}), 404
         
-        # Submit background task
-        # Capture base_url from request context before submitting to executor
-        base_url = request.url_root
-        pdf_executor.submit(generate_pdf_archive_background, unique_id, base_url)
+        # Capture base_url from request context before submitting the job
+        status = _submit_presentation_job(presentation, request.url_root)
+        if status is None:
+            return jsonify({'error': 'Нет объектов в презентации'}), 400
         
         return jsonify({
             'success': True,
-            'message': 'Генерация запущена'
+            'message': 'Генерация запущена',
+            'stage': status.get('stage')
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -18523,53 +18227,18 @@ def start_pdf_generation(unique_id):
 def download_pdf_result(unique_id):
     """Download the generated ZIP file"""
     try:
-        # Check if file exists in storage
-        if unique_id not in file_storage:
+        presentation = _find_public_presentation(unique_id)
+        if not presentation:
             return "Файл не найден или еще не готов", 404
         
-        file_info = file_storage[unique_id]
-        zip_path = file_info['path']
-        
-        if not os.path.exists(zip_path):
-            return "Файл был удален", 404
-        
-        # Send file and clean up
-        response = send_file(
-            zip_path,
-            as_attachment=True,
-            download_name=f'presentation_{unique_id}.zip',
-            mimetype='application/zip'
-        )
-        
-        # Schedule cleanup (remove from storage after sending)
-        def cleanup_after_send():
-            time.sleep(5)  # Wait for download to start
-            if unique_id in file_storage:
-                del file_storage[unique_id]
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
-        
-        threading.Thread(target=cleanup_after_send, daemon=True).start()
-        
+        # Архив остаётся на диске до истечения срока — повторное скачивание не пересчитывает PDF
+        response = _send_presentation_archive(presentation, download_name=f'presentation_{unique_id}.zip')
+        if response is None:
+            return "Файл не найден или еще не готов", 404
         return response
         
     except Exception as e:
         return f"Ошибка при скачивании: {str(e)}", 500
-def download_progress_poll(unique_id):
-    """Polling endpoint for PDF generation progress (replaces SSE)"""
-    from flask import jsonify
-    
-    progress_key = f"presentation_{unique_id}"
-    
-    if progress_key in progress_storage:
-        return jsonify(progress_storage[progress_key])
-    else:
-        # No progress yet or already completed
-        return jsonify({
-            'stage': 'waiting',
-            'progress': 0,
-            'message': 'Ожидание...'
-        })
 
 @app.route('/api/manager/presentation/<int:presentation_id>/send-email', methods=['POST'])
 @manager_required
@@ -18918,13 +18587,7 @@ def create_presentation_with_complex():
             abort(404)
         
         # Загрузить полные данные объекта
-        properties = load_properties()
-        property_data = None
-        
-        for prop in properties:
-            if str(prop.get('id')) == str(property_id) or str(prop.get('ID')) == str(property_id) or str(prop.get('inner_id')) == str(property_id):
-                property_data = prop
-                break
+        property_data = load_properties().get_by_id(property_id)
         
         if not property_data:
             abort(404)
@@ -19234,10 +18897,21 @@ Email: {manager.email}
 
 @app.route('/data/properties_expanded.json')
 def properties_json():
-    """Serve properties JSON data"""
+    """Serve properties JSON data (pre-encoded snapshot blob with ETag)"""
     try:
         properties = load_properties()
-        return jsonify(properties)
+        if not hasattr(properties, 'to_json_bytes'):
+            return jsonify(properties)
+        
+        etag = properties.etag
+        if request.if_none_match and etag in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            response = make_response(properties.to_json_bytes())
+            response.mimetype = 'application/json'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
     except Exception as e:
         print(f"Error serving properties JSON: {e}")
         return jsonify([]), 500
@@ -22041,35 +21715,19 @@ def api_manager_welcome_message():
 @manager_required
 def api_manager_dashboard_stats():
     """Get manager dashboard statistics"""
-    from models import User, Recommendation
-    from sqlalchemy import func
+    from services.manager_dashboard import get_snapshot
     
     current_manager = current_user
     
     try:
-        # Count clients assigned to this manager
-        clients_count = User.query.filter_by(assigned_manager_id=current_manager.id).count()
-        
-        # Count recommendations sent by this manager
-        recommendations_count = Recommendation.query.filter_by(manager_id=current_manager.id).count()
-        
-        # Count recommendations sent this month
-        from datetime import datetime
-        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_recommendations = Recommendation.query.filter(
-            Recommendation.manager_id == current_manager.id,
-            Recommendation.sent_at >= month_start
-        ).count()
-        
-        # Collections count (placeholder for now)
-        collections_count = 5
+        stats = get_snapshot(current_manager.id)['stats']
         
         return jsonify({
             'success': True,
-            'clients_count': clients_count,
-            'recommendations_count': monthly_recommendations,
-            'total_recommendations': recommendations_count,
-            'collections_count': collections_count
+            'clients_count': stats['total_clients'],
+            'recommendations_count': stats['monthly_recommendations'],
+            'total_recommendations': stats['total_recommendations'],
+            'collections_count': stats['collections_count']
         })
         
     except Exception as e:
@@ -22078,94 +21736,22 @@ def api_manager_dashboard_stats():
 @app.route('/api/manager/activity-feed', methods=['GET'])
 @manager_required
 def api_manager_activity_feed():
-    """Get manager activity feed"""
-    from models import Recommendation, User, ManagerNotification
-    from datetime import datetime, timedelta
+    """Get manager activity feed (keyset pagination: ?cursor=<next_cursor>&limit=10)"""
+    from services.manager_dashboard import activity_page, FEED_PAGE_SIZE
     
     current_manager = current_user
     
     try:
-        # Get recent activities (recommendations sent)
-        from sqlalchemy.orm import joinedload
-        recent_recommendations = Recommendation.query.filter_by(
-            manager_id=current_manager.id
-        ).options(joinedload(Recommendation.client)).order_by(Recommendation.sent_at.desc()).limit(10).all()
-        
-        # Получаем последние уведомления менеджера
-        recent_notifications = ManagerNotification.query.filter_by(
-            manager_id=current_manager.id
-        ).order_by(ManagerNotification.created_at.desc()).limit(15).all()
-        
-        # Функция для форматирования времени
-        def format_time_ago(timestamp):
-            time_diff = datetime.utcnow() - timestamp
-            if time_diff.days > 0:
-                return f"{time_diff.days} дн. назад"
-            elif time_diff.seconds > 3600:
-                return f"{time_diff.seconds // 3600} ч. назад"
-            else:
-                return f"{time_diff.seconds // 60} мин. назад"
-        
-        # Создаем общий список с временными метками для сортировки
-        all_activities = []
-        
-        # Добавляем уведомления
-        for notification in recent_notifications:
-            all_activities.append({
-                'timestamp': notification.created_at,
-                'activity': {
-                    'title': notification.title,
-                    'description': notification.message,
-                    'time_ago': format_time_ago(notification.created_at),
-                    'icon': 'eye' if notification.notification_type == 'presentation_view' else 'bell',
-                    'color': 'purple' if notification.notification_type == 'presentation_view' else 'gray',
-                    'is_read': notification.is_read,
-                    'notification_id': notification.id,
-                    'type': 'notification'
-                }
-            })
-        
-        # Добавляем рекомендации
-        for rec in recent_recommendations:
-            client_name = rec.client.full_name if rec.client and hasattr(rec.client, 'full_name') else 'Клиент'
-            all_activities.append({
-                'timestamp': rec.sent_at,
-                'activity': {
-                    'title': f'Отправлена рекомендация',
-                    'description': f'{rec.title} для {client_name}',
-                    'time_ago': format_time_ago(rec.sent_at),
-                    'icon': 'paper-plane',
-                    'color': 'blue',
-                    'type': 'recommendation'
-                }
-            })
-        
-        # Сортируем по времени и берем только активности
-        all_activities.sort(key=lambda x: x['timestamp'], reverse=True)
-        activities = [item['activity'] for item in all_activities[:10]]  # Берем топ 10
-        
-        # Добавляем демо активности только если реальных активностей мало
-        if len(activities) < 2:
-            activities.extend([
-                {
-                    'title': 'Новый клиент добавлен',
-                    'description': 'Демо Клиентов зарегистрировался в системе',
-                    'time_ago': '2 ч. назад',
-                    'icon': 'user-plus',
-                    'color': 'green'
-                },
-                {
-                    'title': 'Клиент просмотрел рекомендацию',
-                    'description': 'Демо Клиентов открыл рекомендацию по ЖК "Солнечный"',
-                    'time_ago': '4 ч. назад',
-                    'icon': 'eye',
-                    'color': 'purple'
-                }
-            ])
+        activities, next_cursor = activity_page(
+            current_manager.id,
+            cursor=request.args.get('cursor') or None,
+            limit=request.args.get('limit', FEED_PAGE_SIZE, type=int)
+        )
         
         return jsonify({
             'success': True,
-            'activities': activities
+            'activities': activities,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -22175,214 +21761,47 @@ def api_manager_activity_feed():
 @manager_required
 def api_manager_dashboard_all():
     """Агрегированный endpoint для быстрой загрузки панели менеджера - все данные за один запрос"""
-    from models import (User, Recommendation, ManagerSavedSearch, Deal, ManagerComparison, 
-                       ComparisonProperty, ComparisonComplex, ManagerFavoriteProperty, ManagerFavoriteComplex,
-                       ManagerNotification, Manager)
-    from sqlalchemy import func
-    from datetime import datetime, timedelta
+    from services.manager_dashboard import get_snapshot, activity_page, welcome_messages
     
     current_manager = current_user
     
     try:
-        # ===== 1. CLIENTS =====
-        clients = User.query.filter_by(assigned_manager_id=current_manager.id).all()
-        clients_data = [{
-            'id': client.id,
-            'full_name': client.full_name,
-            'email': client.email,
-            'phone': client.phone or '',
-            'status': client.status if hasattr(client, 'status') else 'active',
-            'search_preferences': client.search_preferences if hasattr(client, 'search_preferences') else None,
-            'created_at': client.created_at.isoformat() if client.created_at else None
-        } for client in clients]
-        
-        # ===== 2. WELCOME MESSAGE =====
-        import pytz
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        now_utc = datetime.utcnow()
-        now_moscow = now_utc.replace(tzinfo=pytz.UTC).astimezone(moscow_tz)
-        hour = now_moscow.hour
-        
-        if 5 <= hour < 12:
-            time_greeting = "Доброе утро"
-        elif 12 <= hour < 18:
-            time_greeting = "Добрый день"
-        else:
-            time_greeting = "Добрый вечер"
-        
-        first_name = current_manager.full_name.split()[0] if current_manager.full_name else 'Менеджер'
-        
-        today = datetime.utcnow().date()
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        
-        recent_recommendations = Recommendation.query.filter(
-            Recommendation.manager_id == current_manager.id,
-            Recommendation.sent_at >= week_ago
-        ).count()
-        
-        today_recommendations = Recommendation.query.filter(
-            Recommendation.manager_id == current_manager.id,
-            func.date(Recommendation.sent_at) == today
-        ).count()
-        
-        total_clients = len(clients_data)
-        new_clients_today = User.query.filter(
-            User.assigned_manager_id == current_manager.id,
-            func.date(User.created_at) == today
-        ).count()
-        
-        messages = [f"{time_greeting}, {first_name}! Рады видеть вас снова."]
-        
-        if new_clients_today > 0:
-            messages.append(f"У вас {new_clients_today} новых клиентов сегодня!")
-        elif recent_recommendations == 0:
-            messages.append("Готовы создать новую подборку для клиентов?")
-        elif today_recommendations > 0:
-            messages.append(f"Отлично! Сегодня отправлено {today_recommendations} рекомендаций.")
-        else:
-            messages.append(f"На этой неделе отправлено {recent_recommendations} рекомендаций.")
-        
-        # ===== 3. ACTIVITY FEED =====
-        from sqlalchemy.orm import joinedload
-        recent_recs = Recommendation.query.filter_by(
-            manager_id=current_manager.id
-        ).options(joinedload(Recommendation.client)).order_by(Recommendation.sent_at.desc()).limit(10).all()
-        
-        recent_notifications = ManagerNotification.query.filter_by(
-            manager_id=current_manager.id
-        ).order_by(ManagerNotification.created_at.desc()).limit(15).all()
-        
-        def format_time_ago(timestamp):
-            time_diff = datetime.utcnow() - timestamp
-            if time_diff.days > 0:
-                return f"{time_diff.days} дн. назад"
-            elif time_diff.seconds > 3600:
-                return f"{time_diff.seconds // 3600} ч. назад"
-            else:
-                return f"{time_diff.seconds // 60} мин. назад"
-        
-        all_activities = []
-        
-        for notification in recent_notifications:
-            all_activities.append({
-                'timestamp': notification.created_at,
-                'activity': {
-                    'title': notification.title,
-                    'description': notification.message,
-                    'time_ago': format_time_ago(notification.created_at),
-                    'icon': 'eye' if notification.notification_type == 'presentation_view' else 'bell',
-                    'color': 'purple' if notification.notification_type == 'presentation_view' else 'gray',
-                    'is_read': notification.is_read,
-                    'notification_id': notification.id,
-                    'type': 'notification'
-                }
-            })
-        
-        for rec in recent_recs:
-            client_name = rec.client.full_name if rec.client and hasattr(rec.client, 'full_name') else 'Клиент'
-            all_activities.append({
-                'timestamp': rec.sent_at,
-                'activity': {
-                    'title': 'Отправлена рекомендация',
-                    'description': f'{rec.title} для {client_name}',
-                    'time_ago': format_time_ago(rec.sent_at),
-                    'icon': 'paper-plane',
-                    'color': 'blue',
-                    'type': 'recommendation'
-                }
-            })
-        
-        all_activities.sort(key=lambda x: x['timestamp'], reverse=True)
-        activities = [item['activity'] for item in all_activities[:10]]
-        
-        if len(activities) < 2:
-            activities.extend([
-                {
-                    'title': 'Новый клиент добавлен',
-                    'description': 'Демо Клиентов зарегистрировался в системе',
-                    'time_ago': '2 ч. назад',
-                    'icon': 'user-plus',
-                    'color': 'green'
-                },
-                {
-                    'title': 'Клиент просмотрел рекомендацию',
-                    'description': 'Демо Клиентов открыл рекомендацию по ЖК "Солнечный"',
-                    'time_ago': '4 ч. назад',
-                    'icon': 'eye',
-                    'color': 'purple'
-                }
-            ])
-        
-        # ===== 4. FAVORITES COUNT =====
-        properties_count = ManagerFavoriteProperty.query.filter_by(manager_id=current_manager.id).count()
-        complexes_count = ManagerFavoriteComplex.query.filter_by(manager_id=current_manager.id).count()
-        
-        # ===== 5. SAVED SEARCHES =====
-        saved_searches = ManagerSavedSearch.query.filter_by(manager_id=current_manager.id).order_by(ManagerSavedSearch.created_at.desc()).all()
-        searches_data = [{
-            'id': search.id,
-            'name': search.name,
-            'filters': json.loads(search.additional_filters) if search.additional_filters else {},
-            'created_at': search.created_at.strftime('%d.%m.%Y')
-        } for search in saved_searches]
-        
-        # ===== 6. RECOMMENDATIONS =====
-        recommendations = Recommendation.query.filter_by(manager_id=current_manager.id).order_by(Recommendation.sent_at.desc()).limit(10).all()
-        recs_data = []
-        for rec in recommendations:
-            client = User.query.get(rec.client_id) if rec.client_id else None
-            recs_data.append({
-                'id': rec.id,
-                'title': rec.title,
-                'client_name': client.full_name if client else 'Клиент удален',
-                'sent_at': rec.sent_at.strftime('%d.%m.%Y в %H:%M'),
-                'status': rec.status,
-                'properties_count': len(rec.properties) if hasattr(rec, 'properties') else 0
-            })
-        
-        # ===== 7. DEALS COUNT =====
-        deals_count = Deal.query.filter_by(manager_id=current_manager.id).count()
-        
-        # ===== 8. COMPARISON COUNT =====
-        manager_comparison = ManagerComparison.query.filter_by(
-            manager_id=current_manager.id,
-            is_active=True
-        ).first()
-        
-        comparison_props = 0
-        comparison_complexes = 0
-        if manager_comparison:
-            comparison_props = ComparisonProperty.query.filter_by(manager_comparison_id=manager_comparison.id).count()
-            comparison_complexes = ComparisonComplex.query.filter_by(manager_comparison_id=manager_comparison.id).count()
+        # Снимок панели (manager_dashboard_snapshots) + первая страница ленты активности
+        snapshot = get_snapshot(current_manager.id)
+        stats = snapshot['stats']
+        activities, next_cursor = activity_page(current_manager.id)
+        favorites = snapshot['favorites']
+        comparison = snapshot['comparison']
         
         return jsonify({
             'success': True,
-            'clients': clients_data,
+            'clients': snapshot['clients'],
             'welcome': {
-                'messages': messages,
+                'messages': welcome_messages(current_manager, stats),
                 'stats': {
-                    'recent_recommendations': recent_recommendations,
-                    'today_recommendations': today_recommendations,
-                    'total_clients': total_clients,
-                    'new_clients_today': new_clients_today
+                    'recent_recommendations': stats['recent_recommendations'],
+                    'today_recommendations': stats['today_recommendations'],
+                    'total_clients': stats['total_clients'],
+                    'new_clients_today': stats['new_clients_today']
                 }
             },
             'activities': activities,
+            'activities_next_cursor': next_cursor,
             'favorites': {
-                'properties_count': properties_count,
-                'complexes_count': complexes_count,
-                'total_count': properties_count + complexes_count
+                'properties_count': favorites['properties_count'],
+                'complexes_count': favorites['complexes_count'],
+                'total_count': favorites['properties_count'] + favorites['complexes_count']
             },
             'saved_searches': {
-                'count': len(searches_data),
-                'searches': searches_data
+                'count': len(snapshot['saved_searches']),
+                'searches': snapshot['saved_searches']
             },
-            'recommendations': recs_data,
-            'deals_count': deals_count,
+            'recommendations': snapshot['recommendations'],
+            'deals_count': stats['deals_count'],
             'comparison': {
-                'properties_count': comparison_props,
-                'complexes_count': comparison_complexes,
-                'total_count': comparison_props + comparison_complexes
+                'properties_count': comparison['properties_count'],
+                'complexes_count': comparison['complexes_count'],
+                'total_count': comparison['properties_count'] + comparison['complexes_count']
             }
         })
         
@@ -22397,32 +21816,13 @@ def api_manager_dashboard_all():
 @manager_required
 def api_manager_top_clients():
     """Get top clients by interactions"""
-    from models import User, Recommendation
-    from sqlalchemy import func
+    from services.manager_dashboard import get_snapshot
     
     current_manager = current_user
     
     try:
         # Get clients with most interactions (recommendations received)
-        top_clients = db.session.query(
-            User,
-            func.count(Recommendation.id).label('interactions_count')
-        ).join(
-            Recommendation, User.id == Recommendation.client_id
-        ).filter(
-            Recommendation.manager_id == current_manager.id
-        ).group_by(User.id).order_by(
-            func.count(Recommendation.id).desc()
-        ).limit(5).all()
-        
-        clients_data = []
-        for user, count in top_clients:
-            clients_data.append({
-                'id': user.id,
-                'full_name': user.full_name,
-                'email': user.email,
-                'interactions_count': count
-            })
+        clients_data = [dict(client) for client in get_snapshot(current_manager.id)['top_clients']]
         
         # Add demo clients if not enough data
         if len(clients_data) < 3:
@@ -22814,9 +22214,9 @@ def blog_article_new(slug):
     try:
         article = BlogArticle.query.filter_by(slug=slug, status='published').first_or_404()
         
-        # Increment view count
-        article.views_count += 1
-        db.session.commit()
+        # Increment view count (buffered)
+        from services.event_buffer import get_event_buffer
+        get_event_buffer().increment('blog_articles', article.id)
         
         # Get related articles from same category
         related_articles = BlogArticle.query.filter_by(
@@ -22892,17 +22292,13 @@ def blog_post(slug):
             'author_name': result[9] or 'InBack'
         }
         
-        # Increment view count
+        # Increment view count (buffered)
         try:
-            db.session.execute(text("""
-                UPDATE blog_posts 
-                SET views_count = COALESCE(views_count, 0) + 1 
-                WHERE id = :id
-            """), {'id': post['id']})
-            db.session.commit()
+            from services.event_buffer import get_event_buffer
+            get_event_buffer().increment('blog_posts', post['id'])
             post['views_count'] += 1
         except Exception as e:
-            db.session.rollback()
+            app.logger.warning(f"Blog view counter skipped: {e}")
         
         # Get related posts from same category
         related_results = db.session.execute(text("""
@@ -23659,9 +23055,9 @@ def job_detail(job_slug):
     try:
         job = Job.query.filter(Job.slug == job_slug, Job.is_active == True, Job.status == 'active').first_or_404()
         
-        # Increment views count
-        job.views_count = (job.views_count or 0) + 1
-        db.session.commit()
+        # Increment views count (buffered)
+        from services.event_buffer import get_event_buffer
+        get_event_buffer().increment('jobs', job.id)
         
         return render_template('vacancy_details.html', vacancy=job)
         
@@ -24273,7 +23669,7 @@ def search_suggestions_fallback(query):
         return jsonify({'suggestions': [], 'error': str(e)})
 
 @app.route('/api/super-search')
-@cache.memoize(timeout=180)  # Кэш на 3 минуты
+@response_cache.cached_view(ttl=180, tags=[TAG_CATALOGUE])  # Кэш на 3 минуты, ключ учитывает ?q=
 def super_search_api():
     """Новый супер-быстрый поиск недвижимости"""
     query = request.args.get('q', '').strip()
@@ -25536,8 +24932,10 @@ def admin_upload_excel():
         if file.filename == '':
             return jsonify({'success': False, 'error': 'Файл не выбран'})
         
-        if not file.filename.endswith(('.xlsx', '.xls')):
-            return jsonify({'success': False, 'error': 'Поддерживаются только файлы Excel (.xlsx, .xls)'})
+        if not file.filename.lower().endswith('.xlsx'):
+            if file.filename.lower().endswith('.xls'):
+                return jsonify({'success': False, 'error': 'Формат .xls не поддерживается — сохраните файл как .xlsx'})
+            return jsonify({'success': False, 'error': 'Поддерживаются только файлы Excel (.xlsx)'})
         
         # Save file to attached_assets directory
         import os
@@ -25554,58 +24952,25 @@ def admin_upload_excel():
         # Save the file
         file.save(file_path)
         
-        # Запуск импорта в фоновом процессе для больших файлов
+        # Потоковый импорт в фоне (services/excel_import.py), статус — в таблице import_jobs
         try:
-            import threading
-            import time
-            
-            # Создаем уникальный ID задачи
-            task_id = unique_filename.replace('.', '_')
+            from services.excel_import import get_excel_importer
             
-            # Статус импорта (будем хранить в глобальной переменной)
-            global import_status
-            if 'import_status' not in globals():
-                import_status = {}
-            
-            import_status[task_id] = {
-                'status': 'processing',
-                'progress': 0,
-                'message': 'Обработка файла...',
-                'started_at': time.time()
-            }
-            
-            def background_import():
+            def on_import_complete(result):
+                # Остальные процессы увидят новую версию каталога (updated_at) сами,
+                # этот — пересобирает снимок сразу
+                property_snapshots.invalidate()
+                
+                # Прогреваем кэш обрезанных фото, чтобы первые посетители не ждали рендера
                 try:
+                    from services.image_cache import get_image_cache, collect_catalogue_image_urls
                     with app.app_context():
-                        result = import_excel_to_database(file_path)
-                    
-                    # Обновляем статус при успехе
-                    import_status[task_id] = {
-                        'status': 'completed',
-                        'progress': 100,
-                        'message': f'✅ {result["message"]} Импортировано: {result["imported"]} записей.',
-                        'result': result,
-                        'completed_at': time.time()
-                    }
-                    
-                    # Очищаем кеш
-                    global _properties_cache, _cache_timestamp
-                    _properties_cache = None
-                    _cache_timestamp = None
-                    
-                except Exception as import_error:
-                    # Обновляем статус при ошибке
-                    import_status[task_id] = {
-                        'status': 'error',
-                        'progress': 0,
-                        'message': f'❌ Ошибка импорта: {str(import_error)}',
-                        'error': str(import_error),
-                        'failed_at': time.time()
-                    }
+                        image_urls = collect_catalogue_image_urls()
+                    get_image_cache().prewarm(image_urls)
+                except Exception as prewarm_error:
+                    print(f"⚠️ Image cache prewarm failed: {prewarm_error}")
             
-            # Запускаем импорт в отдельном потоке
-            thread = threading.Thread(target=background_import, daemon=True)
-            thread.start()
+            task_id = get_excel_importer().submit(file_path, file.filename, on_complete=on_import_complete)
             
             # Сразу возвращаем ответ о начале обработки
             return jsonify({
@@ -25628,24 +24993,15 @@ def admin_upload_excel():
 def admin_check_import_status(task_id):
     """Проверка статуса фонового импорта"""
     try:
-        global import_status
-        if 'import_status' not in globals():
-            import_status = {}
+        from services.excel_import import get_excel_importer
         
-        if task_id not in import_status:
+        status_info = get_excel_importer().get_status(task_id)
+        if status_info is None:
             return jsonify({
                 'success': False,
                 'error': 'Задача не найдена'
             })
         
-        status_info = import_status[task_id]
-        
-        # Добавляем время обработки
-        import time
-        if 'started_at' in status_info:
-            elapsed = time.time() - status_info['started_at']
-            status_info['elapsed_time'] = f"{elapsed:.1f} сек"
-        
         return jsonify({
             'success': True,
             'status': status_info
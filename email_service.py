@@ -7,6 +7,11 @@ from email.mime.multipart import MIMEMultipart
 from flask import render_template, url_for, request
 from datetime import datetime
 
+from services.notification_dispatcher import (
+    CHANNEL_EMAIL, CHANNEL_TELEGRAM, build_email_message, get_notification_dispatcher,
+    get_sendgrid_client, get_smtp_pool, get_template_cache,
+)
+
 # SendGrid integration - from blueprint:python_sendgrid
 try:
     from sendgrid import SendGridAPIClient
@@ -29,8 +34,8 @@ except ImportError:
     print("SendGrid not available - falling back to SMTP")
 
 # Email configuration - using standard SMTP
-EMAIL_HOST = 'smtp.gmail.com'  # Gmail SMTP для реальной отправки
-EMAIL_PORT = 587
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')  # Gmail SMTP для реальной отправки
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '587'))
 EMAIL_USER = os.environ.get('EMAIL_USER', 'test.inback@gmail.com')  # Замените на реальный email
 EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD', '')  # App Password от Gmail
 
@@ -40,21 +45,25 @@ TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID')
 # For manager notifications (insurance applications, etc.)
 MANAGER_TELEGRAM_IDS = os.environ.get('MANAGER_TELEGRAM_IDS', '')
 
-try:
-    from telegram.ext import Application
-    from telegram import Bot
-    if TELEGRAM_BOT_TOKEN:
-        telegram_bot = Bot(token=TELEGRAM_BOT_TOKEN)
-        print("✅ Telegram bot initialized successfully")
-    else:
-        telegram_bot = None
-        print("TELEGRAM_BOT_TOKEN not found")
-except ImportError:
-    print("Telegram bot setup failed: ImportError with telegram package")
-    telegram_bot = None
-except Exception as e:
-    telegram_bot = None
-    print(f"Telegram bot setup failed: {e}")
+_telegram_bot = None
+
+
+def get_telegram_bot():
+    """
+    Bot из python-telegram-bot создаётся при первой отправке: telegram.ext
+    заметно удлиняет импорт email_service, а значит и старт каждого воркера
+    """
+    global _telegram_bot
+    if _telegram_bot is None and TELEGRAM_BOT_TOKEN:
+        try:
+            from telegram import Bot
+            _telegram_bot = Bot(token=TELEGRAM_BOT_TOKEN)
+            print("✅ Telegram bot initialized successfully")
+        except ImportError:
+            print("Telegram bot setup failed: ImportError with telegram package")
+        except Exception as e:
+            print(f"Telegram bot setup failed: {e}")
+    return _telegram_bot
 
 def send_email_sendgrid(to_email, subject, template_name, **template_data):
     """
@@ -79,10 +88,10 @@ def send_email_sendgrid(to_email, subject, template_name, **template_data):
             return send_email_smtp(to_email, subject, template_name, **template_data)
         
         # Render HTML template
-        html_content = render_template(template_name, **template_data)
+        html_content = get_template_cache().render(template_name, **template_data)
         
-        # Create SendGrid message
-        sg = SendGridAPIClient(sendgrid_key)
+        # Create SendGrid message (client is shared across calls)
+        sg = get_sendgrid_client()
         
         message = Mail(
             from_email=Email("testing@sendgrid.net", "InBack"),
@@ -120,24 +129,14 @@ def send_email_smtp(to_email, subject, template_name, **template_data):
     """
     try:
         # Render HTML template
-        html_content = render_template(template_name, **template_data)
+        html_content = get_template_cache().render(template_name, **template_data)
         
         # Create message
-        message = MIMEMultipart('alternative')
-        message['Subject'] = subject
-        message['From'] = f"InBack <{EMAIL_USER}>"
-        message['To'] = to_email
+        message = build_email_message(f"InBack <{EMAIL_USER}>", to_email, subject, html_content)
         
-        # Add HTML content
-        html_part = MIMEText(html_content, 'html', 'utf-8')
-        message.attach(html_part)
-        
-        # Send email via SMTP
+        # Send email via pooled SMTP connection (STARTTLS + login once per connection)
         if EMAIL_PASSWORD:
-            with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-                server.starttls()
-                server.login(EMAIL_USER, EMAIL_PASSWORD)
-                server.send_message(message)
+            get_smtp_pool().send(message)
             return True
         else:
             print(f"Email would be sent to {to_email}: {subject}")
@@ -150,9 +149,21 @@ def send_email_smtp(to_email, subject, template_name, **template_data):
 
 def send_email(to_email, subject, template_name, **template_data):
     """
-    Unified email sending function - tries SendGrid first, falls back to SMTP
+    Unified email sending function - renders the template and queues the message
+    
+    Delivery (SendGrid first, SMTP otherwise) happens in the notification
+    dispatcher, outside of the request.
     """
-    return send_email_sendgrid(to_email, subject, template_name, **template_data)
+    if not to_email:
+        return False
+    try:
+        html_content = get_template_cache().render(template_name, **template_data)
+        get_notification_dispatcher().enqueue(CHANNEL_EMAIL, to_email, html_content, subject=subject,
+                                              notification_type=template_name)
+        return True
+    except Exception as e:
+        print(f"❌ Error queueing email to {to_email}: {e}")
+        return False
 
 def send_recommendation_email(user, data):
     """
@@ -325,7 +336,7 @@ async def send_telegram_message(chat_id, message, parse_mode='HTML'):
             # Числовой ID
             actual_chat_id = int(chat_id) if str(chat_id).isdigit() else chat_id
         
-        await telegram_bot.send_message(
+        await get_telegram_bot().send_message(
             chat_id=actual_chat_id,
             text=message,
             parse_mode=parse_mode
@@ -448,10 +459,14 @@ def send_telegram_notification(user, notification_type, **data):
     message = messages.get(notification_type, f"Уведомление от InBack: {notification_type}")
     
     try:
-        asyncio.run(send_telegram_message(user.telegram_id, message))
+        if not TELEGRAM_BOT_TOKEN:
+            print("TELEGRAM_BOT_TOKEN not found")
+            return False
+        get_notification_dispatcher().enqueue(CHANNEL_TELEGRAM, user.telegram_id, message,
+                                              notification_type=notification_type)
         return True
     except Exception as e:
-        print(f"Error sending Telegram notification: {e}")
+        print(f"Error queueing Telegram notification: {e}")
         return False
 
 # Enhanced unified notification system
@@ -558,7 +573,7 @@ def send_telegram_insurance_notification(name, phone, bank, credit_amount, birth
             print("❌ Telegram not configured: missing TELEGRAM_BOT_TOKEN")
             return False
         
-        if not telegram_bot:
+        if not get_telegram_bot():
             print("❌ Telegram bot not initialized")
             return False
         
@@ -584,35 +599,13 @@ def send_telegram_insurance_notification(name, phone, bank, credit_amount, birth
 
 ⏰ Время подачи: {current_time}"""
         
-        # Send message using requests API (more reliable than async in this context)
-        import requests
-        
-        # Send to all manager chat IDs
-        success_count = 0
-        for chat_id in chat_ids:
-            try:
-                # Use Telegram HTTP API directly
-                telegram_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-                payload = {
-                    'chat_id': chat_id,
-                    'text': message,
-                    'parse_mode': 'HTML'
-                }
-                
-                response = requests.post(telegram_url, data=payload, timeout=30)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get('ok'):
-                        print(f"✅ Telegram insurance notification sent to {chat_id}")
-                        success_count += 1
-                    else:
-                        print(f"❌ Telegram API error for {chat_id}: {result.get('description', 'Unknown error')}")
-                else:
-                    print(f"❌ Telegram HTTP error for {chat_id}: {response.status_code}")
-            except Exception as e:
-                print(f"❌ Error sending to {chat_id}: {e}")
-                continue
+        # Queue one message per manager chat; the dispatcher keeps within Telegram rate limits
+        success_count = get_notification_dispatcher().enqueue_many([
+            {'channel': CHANNEL_TELEGRAM, 'recipient': chat_id, 'body': message,
+             'notification_type': 'insurance_application'}
+            for chat_id in chat_ids
+        ])
+        print(f"✅ Telegram insurance notification queued for {success_count} chats")
         
         # Return True if at least one message was sent successfully
         return success_count > 0
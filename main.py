@@ -1,5 +1,7 @@
-from app import app
+from app import app, init_schema
 
 if __name__ == '__main__':
+    # Dev server: create missing tables (in production run `flask --app main init-db`)
+    init_schema()
     # Run Flask development server
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
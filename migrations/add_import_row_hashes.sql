@@ -0,0 +1,19 @@
+-- =====================================================
+-- МИГРАЦИЯ: Хэши строк импорта
+-- Цель: services/import_engine.py пропускает строки, которые не менялись
+-- с прошлого импорта (import_row_hashes), и считает их в import_jobs.unchanged
+-- =====================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS import_row_hashes (
+    entity VARCHAR(30) NOT NULL,
+    key VARCHAR(50) NOT NULL,
+    row_hash VARCHAR(40) NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (entity, key)
+);
+
+ALTER TABLE import_jobs ADD COLUMN IF NOT EXISTS unchanged INTEGER NOT NULL DEFAULT 0;
+
+COMMIT;
@@ -0,0 +1,20 @@
+-- =====================================================
+-- МИГРАЦИЯ: Уникальный inner_id в properties
+-- Цель: ключ INSERT ... ON CONFLICT (inner_id) для services/excel_import.py
+-- Импорт сам создаёт индекс на чистой БД; на БД с дублями inner_id
+-- сначала выполните эту миграцию.
+-- =====================================================
+
+BEGIN;
+
+-- Дубли: оставляем inner_id у самой ранней строки, у остальных обнуляем
+-- (строки не удаляются — на них могут ссылаться избранное и подборки)
+UPDATE properties p
+SET inner_id = NULL
+FROM properties first
+WHERE p.inner_id = first.inner_id
+  AND p.id > first.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_properties_inner_id ON properties (inner_id);
+
+COMMIT;
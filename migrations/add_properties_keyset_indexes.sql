@@ -0,0 +1,18 @@
+-- =====================================================
+-- МИГРАЦИЯ: Индексы keyset-пагинации каталога квартир
+-- Цель: WHERE (price, id) > (:price, :id) ORDER BY price, id LIMIT n
+-- для /properties, /api/properties/list и /api/properties/filter.
+-- Один индекс (колонка, id) обслуживает ASC и DESC (обратный проход).
+-- CONCURRENTLY не работает внутри транзакции — без BEGIN / COMMIT.
+-- =====================================================
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_properties_active_price_id
+    ON properties (price, id) WHERE is_active;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_properties_active_area_id
+    ON properties (area, id) WHERE is_active;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_properties_active_created_id
+    ON properties (created_at, id) WHERE is_active;
+
+ANALYZE properties;
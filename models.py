@@ -541,36 +541,9 @@ class SearchAnalytics(db.Model):
     
     @staticmethod
     def record_search(query, result_count=0):
-        """Record a search or increment count if it exists"""
-        normalized_query = query.strip().lower()
-        if not normalized_query:
-            return
-        
-        analytics = db.session.query(SearchAnalytics).filter_by(query=normalized_query).first()
-        if analytics:
-            # Update existing record
-            analytics.search_count += 1
-            analytics.last_searched_at = datetime.utcnow()
-            # Update running average of result counts
-            analytics.result_count_avg = (
-                (analytics.result_count_avg * (analytics.search_count - 1) + result_count) / 
-                analytics.search_count
-            )
-        else:
-            # Create new record
-            analytics = SearchAnalytics(
-                query=normalized_query,
-                search_count=1,
-                result_count_avg=float(result_count),
-                last_searched_at=datetime.utcnow()
-            )
-            db.session.add(analytics)
-        
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error recording search analytics: {e}")
+        """Record a search; counts are aggregated in memory and written in bulk by services/event_buffer.py"""
+        from services.event_buffer import get_event_buffer
+        get_event_buffer().record_search(query, result_count)
     
     @staticmethod
     def get_popular_searches(limit=10, min_results=1):
@@ -777,6 +750,36 @@ class PresentationView(db.Model):
         return f'<PresentationView {self.collection_id} at {self.viewed_at}>'
 
 
+class NotificationOutbox(db.Model):
+    """Outgoing email / Telegram message, delivered by services/notification_dispatcher.py"""
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        db.Index('idx_notification_outbox_due', 'status', 'next_attempt_at'),
+        {"extend_existing": True}
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(20), nullable=False)  # email, telegram
+    recipient = db.Column(db.String(200), nullable=False)  # email address or Telegram chat_id
+    subject = db.Column(db.String(300), nullable=True)
+    body = db.Column(db.Text, nullable=False)  # Pre-rendered HTML (email) or message text (Telegram)
+    notification_type = db.Column(db.String(50), nullable=True)
+    
+    # Delivery state
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), nullable=True)  # Worker that took the message
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<NotificationOutbox {self.channel} to {self.recipient}: {self.status}>'
+
+
 class ManagerNotification(db.Model):
     """Модель для уведомлений менеджеров о просмотрах презентаций и других событиях"""
     __tablename__ = 'manager_notifications'
@@ -1095,9 +1098,9 @@ class BlogPost(db.Model):
         db.session.commit()
     
     def increment_views(self):
-        """Increment view count"""
-        self.views_count += 1
-        db.session.commit()
+        """Increment view count (buffered, see services/event_buffer.py)"""
+        from services.event_buffer import get_event_buffer
+        get_event_buffer().increment('blog_posts', self.id)
     
     def __repr__(self):
         return f'<BlogPost {self.title}>'
@@ -1599,6 +1602,36 @@ class PropertyAlert(db.Model):
         return f'<PropertyAlert {self.alert_type} for Property {self.property_id}>'
 
 
+class AlertMatcherRun(db.Model):
+    """Run of services/alert_matcher.py: watermark for changed properties"""
+    __tablename__ = 'alert_matcher_runs'
+    __table_args__ = {"extend_existing": True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)  # NULL - run failed / in progress
+    properties_checked = db.Column(db.Integer, default=0)
+    searches_indexed = db.Column(db.Integer, default=0)
+    alerts_created = db.Column(db.Integer, default=0)
+    
+    def __repr__(self):
+        return f'<AlertMatcherRun {self.started_at}: {self.alerts_created} alerts>'
+
+
+class AlertPriceMark(db.Model):
+    """Last property price seen by the alert matcher (for PRICE_DROP)"""
+    __tablename__ = 'alert_price_marks'
+    __table_args__ = {"extend_existing": True}
+    
+    # Без ForeignKey: как complex_stats, не мешает удалению квартир
+    property_id = db.Column(db.Integer, primary_key=True)
+    price = db.Column(db.BigInteger, nullable=True)
+    seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AlertPriceMark {self.property_id}: {self.price}>'
+
+
 class CashbackRecord(db.Model):
     """Cashback record model"""
     __tablename__ = 'cashback_records'
@@ -1859,6 +1892,168 @@ class ResidentialComplex(db.Model):
     buildings = db.relationship('Building', backref='residential_complex', cascade='all, delete-orphan')
 
 
+class ComplexStats(db.Model):
+    """
+    Materialized statistics of active properties per residential complex
+    Поддерживается services/complex_stats.py: пересчёт по изменённым ЖК при commit
+    """
+    __tablename__ = 'complex_stats'
+    __table_args__ = {"extend_existing": True}
+    
+    # Без ForeignKey: строка статистики не должна мешать удалению ЖК
+    complex_id = db.Column(db.Integer, primary_key=True)
+    
+    total_count = db.Column(db.Integer, nullable=False, default=0)
+    min_price = db.Column(db.BigInteger, nullable=True)
+    max_price = db.Column(db.BigInteger, nullable=True)
+    avg_price = db.Column(db.BigInteger, nullable=True)
+    min_area = db.Column(db.Float, nullable=True)
+    max_area = db.Column(db.Float, nullable=True)
+    sample_address = db.Column(db.String(300), nullable=True)
+    buildings_count = db.Column(db.Integer, nullable=False, default=1)
+    sample_photos = db.Column(db.Text, nullable=True)  # JSON array of image URLs (2-4 фото первой квартиры)
+    room_details = db.Column(db.Text, nullable=True)  # JSON: {"1-комн": {"count", "price_from", "price_to", "area_from", "area_to"}}
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Формат PropertyRepository.get_all_property_stats()"""
+        try:
+            room_details = json.loads(self.room_details) if self.room_details else {}
+        except (json.JSONDecodeError, TypeError):
+            room_details = {}
+        try:
+            sample_photos = json.loads(self.sample_photos) if self.sample_photos else []
+        except (json.JSONDecodeError, TypeError):
+            sample_photos = []
+        
+        return {
+            'total_count': self.total_count or 0,
+            'total_properties': self.total_count or 0,
+            'min_price': int(self.min_price) if self.min_price else 0,
+            'max_price': int(self.max_price) if self.max_price else 0,
+            'avg_price': int(self.avg_price) if self.avg_price else 0,
+            'min_area': float(self.min_area) if self.min_area else 0,
+            'max_area': float(self.max_area) if self.max_area else 0,
+            'sample_address': self.sample_address,
+            'buildings_count': self.buildings_count or 1,
+            'sample_photos': sample_photos,
+            'room_distribution': {room_type: details['count'] for room_type, details in room_details.items()},
+            'room_details': room_details,
+        }
+    
+    def __repr__(self):
+        return f'<ComplexStats {self.complex_id}: {self.total_count}>'
+
+
+class AnalyticsRollup(db.Model):
+    """
+    Daily / monthly counters for admin and manager dashboards
+    Поддерживается services/analytics_rollups.py: приращения после commit
+    """
+    __tablename__ = 'analytics_rollups'
+    __table_args__ = (
+        db.Index('idx_analytics_rollups_metric', 'metric', 'grain', 'dimension'),
+        {"extend_existing": True}
+    )
+
+    grain = db.Column(db.String(10), primary_key=True)  # day, month
+    metric = db.Column(db.String(50), primary_key=True)  # applications, callbacks, collections, clients
+    period_start = db.Column(db.Date, primary_key=True)
+    dimension = db.Column(db.String(50), primary_key=True, default='')  # manager id, 'cashback' for callbacks
+    status = db.Column(db.String(50), primary_key=True, default='')
+
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.BigInteger, nullable=False, default=0)  # sum of cashback_amount for applications
+
+    def __repr__(self):
+        return f'<AnalyticsRollup {self.grain} {self.metric} {self.period_start} {self.dimension}/{self.status}: {self.count}>'
+
+
+class ManagerActivity(db.Model):
+    """
+    Unified activity stream of a manager (notifications, recommendations, new clients)
+    Пишется services/manager_dashboard.py при flush; лента читается keyset-пагинацией
+    """
+    __tablename__ = 'manager_activity'
+    __table_args__ = (
+        db.Index('idx_manager_activity_feed', 'manager_id', 'created_at', 'id'),
+        db.UniqueConstraint('kind', 'source_id', name='uq_manager_activity_source'),
+        {"extend_existing": True}
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    manager_id = db.Column(db.Integer, db.ForeignKey('managers.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # notification, recommendation, client
+    source_id = db.Column(db.Integer, nullable=False)  # id in manager_notifications / recommendations / users
+    title = db.Column(db.String(255), nullable=False)
+    description = db.Column(db.Text)
+    icon = db.Column(db.String(30))
+    color = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ManagerActivity {self.manager_id} {self.kind}:{self.source_id}>'
+
+
+class ManagerDashboardSnapshot(db.Model):
+    """
+    Cached payload of the manager dashboard
+    Строка удаляется при изменении клиентов, рекомендаций, подборок, сделок и т.п. этого менеджера
+    """
+    __tablename__ = 'manager_dashboard_snapshots'
+    __table_args__ = {"extend_existing": True}
+
+    manager_id = db.Column(db.Integer, db.ForeignKey('managers.id'), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    built_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ManagerDashboardSnapshot {self.manager_id} {self.built_at}>'
+
+
+class ImportJob(db.Model):
+    """Excel catalogue import run by services/excel_import.py; progress is visible to every worker"""
+    __tablename__ = 'import_jobs'
+    __table_args__ = {"extend_existing": True}
+
+    id = db.Column(db.String(40), primary_key=True)  # task_id returned to the admin panel
+    filename = db.Column(db.String(300), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='processing')  # processing, completed, error
+    message = db.Column(db.Text, nullable=True)
+
+    # Progress
+    total_rows = db.Column(db.Integer, nullable=True)  # From the sheet dimensions, may be unknown
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.Integer, nullable=False, default=0)
+    unchanged = db.Column(db.Integer, nullable=False, default=0)  # Row hash matched, nothing written
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    error_samples = db.Column(db.Text, nullable=True)  # JSON: first rejected rows with reasons
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Heartbeat, bumped after every chunk
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}: {self.processed_rows}/{self.total_rows}>'
+
+
+class ImportRowHash(db.Model):
+    """Fingerprint of the last imported source row; services/import_engine.py skips rows that did not change"""
+    __tablename__ = 'import_row_hashes'
+    __table_args__ = {"extend_existing": True}
+
+    entity = db.Column(db.String(30), primary_key=True)  # 'property'
+    key = db.Column(db.String(50), primary_key=True)  # inner_id
+    row_hash = db.Column(db.String(40), nullable=False)  # sha1 of the normalized row
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImportRowHash {self.entity}:{self.key}>'
+
+
 class Building(db.Model):
     """Buildings/Korpus/Liter within residential complexes"""
     __tablename__ = 'buildings'
@@ -2286,7 +2481,14 @@ class BlogComment(db.Model):
 class Property(db.Model):
     """Property/Apartment model for real estate listings"""
     __tablename__ = 'properties'
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        db.Index('uq_properties_inner_id', 'inner_id', unique=True),  # upsert key of the Excel import
+        # Keyset-пагинация каталога: ORDER BY (колонка, id) по активным квартирам
+        db.Index('idx_properties_active_price_id', 'price', 'id', postgresql_where=db.text('is_active')),
+        db.Index('idx_properties_active_area_id', 'area', 'id', postgresql_where=db.text('is_active')),
+        db.Index('idx_properties_active_created_id', 'created_at', 'id', postgresql_where=db.text('is_active')),
+        {"extend_existing": True}
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -2714,26 +2916,26 @@ class UserActivity(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
+    @staticmethod
+    def activity_values(user_id, activity_type, description, **kwargs):
+        """Column values for a user_activities row (shared by log_activity and the event buffer)"""
+        return {
+            'user_id': user_id,
+            'activity_type': activity_type,
+            'description': description[:200],
+            'property_id': str(kwargs['property_id'])[:20] if kwargs.get('property_id') is not None else None,
+            'complex_id': kwargs.get('complex_id'),
+            'search_query': kwargs['search_query'][:200] if kwargs.get('search_query') else None,
+            'extra_data': json.dumps(kwargs.get('extra_data', {})) if kwargs.get('extra_data') else None,
+            'ip_address': kwargs.get('ip_address'),
+            'user_agent': kwargs['user_agent'][:500] if kwargs.get('user_agent') else None,
+        }
+    
     @staticmethod
     def log_activity(user_id, activity_type, description, **kwargs):
-        """Helper method to log user activity"""
-        activity = UserActivity(
-            user_id=user_id,
-            activity_type=activity_type,
-            description=description,
-            property_id=kwargs.get('property_id'),
-            complex_id=kwargs.get('complex_id'),
-            search_query=kwargs.get('search_query'),
-            extra_data=json.dumps(kwargs.get('extra_data', {})) if kwargs.get('extra_data') else None,
-            ip_address=kwargs.get('ip_address'),
-            user_agent=kwargs.get('user_agent')
-        )
-        db.session.add(activity)
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error logging activity: {e}")
+        """Log user activity; the row is written in bulk by services/event_buffer.py"""
+        from services.event_buffer import get_event_buffer
+        get_event_buffer().record_activity(user_id, activity_type, description, **kwargs)
     
     @staticmethod
     def get_recent_activities(user_id, limit=10):
@@ -1,11 +1,44 @@
 """
 Автоматическое обновление nearby данных для ЖК добавленных парсером
+
+Если есть региональная выгрузка POI (services/poi_store.py), nearby
+считаются локально для всех ЖК сразу; Overpass по каждому ЖК — только
+запасной путь, когда выгрузки ещё нет.
 """
+import os
 import json
 import time
 from datetime import datetime, timedelta
 from app import app, db, ResidentialComplex
 import nearby_places
+from services.poi_store import (
+    get_poi_store, poi_extract_path, poi_extract_age_days, region_bbox, download_region_extract
+)
+
+NEARBY_RADIUS_METERS = 3000
+NEARBY_CATEGORIES = ['transport', 'shopping', 'education', 'healthcare', 'sport', 'leisure']
+
+# Выгрузку региона обновляем не чаще, чем раз в N дней
+POI_EXTRACT_MAX_AGE_DAYS = float(os.environ.get('POI_EXTRACT_MAX_AGE_DAYS', '30'))
+
+
+def _complexes_needing_update_query():
+    """
+    Критерии для обновления:
+    1. Есть координаты (latitude и longitude)
+    2. Нет nearby данных ИЛИ данные старше 6 месяцев
+    """
+    six_months_ago = datetime.utcnow() - timedelta(days=180)
+    
+    return db.session.query(ResidentialComplex).filter(
+        ResidentialComplex.latitude.isnot(None),
+        ResidentialComplex.longitude.isnot(None),
+        db.or_(
+            ResidentialComplex.nearby.is_(None),  # Нет данных
+            ResidentialComplex.nearby_updated_at.is_(None),  # Нет даты обновления
+            ResidentialComplex.nearby_updated_at < six_months_ago  # Устаревшие данные
+        )
+    )
 
 
 def find_complexes_needing_update(limit=10):
@@ -16,23 +49,11 @@ def find_complexes_needing_update(limit=10):
         List[ResidentialComplex]: ЖК требующие обновления
     """
     with app.app_context():
-        # Критерии для обновления:
-        # 1. Есть координаты (latitude и longitude)
-        # 2. Нет nearby данных ИЛИ данные старше 6 месяцев
-        
-        six_months_ago = datetime.utcnow() - timedelta(days=180)
-        
-        complexes = db.session.query(ResidentialComplex).filter(
-            ResidentialComplex.latitude.isnot(None),
-            ResidentialComplex.longitude.isnot(None),
-            db.or_(
-                ResidentialComplex.nearby.is_(None),  # Нет данных
-                ResidentialComplex.nearby_updated_at.is_(None),  # Нет даты обновления
-                ResidentialComplex.nearby_updated_at < six_months_ago  # Устаревшие данные
-            )
-        ).limit(limit).all()
+        complexes = _complexes_needing_update_query()
+        if limit:
+            complexes = complexes.limit(limit)
         
-        return complexes
+        return complexes.all()
 
 
 def update_nearby_for_complex(complex):
@@ -57,18 +78,19 @@ def update_nearby_for_complex(complex):
         print(f"🔄 Обновление nearby для ЖК: {complex.name}")
         print(f"   Координаты: {complex.latitude}, {complex.longitude}")
         
-        # Получаем данные из OpenStreetMap
-        nearby_data = nearby_places.fetch_nearby_places(
-            latitude=float(complex.latitude),
-            longitude=float(complex.longitude),
-            radius_meters=3000  # 3 км для лучшего покрытия
-        )
+        # Локальная выгрузка POI, иначе - OpenStreetMap Overpass
+        store = get_poi_store()
+        if store is not None:
+            nearby_data = store.nearby(float(complex.latitude), float(complex.longitude), NEARBY_RADIUS_METERS)
+        else:
+            nearby_data = nearby_places.fetch_nearby_places(
+                latitude=float(complex.latitude),
+                longitude=float(complex.longitude),
+                radius_meters=NEARBY_RADIUS_METERS  # 3 км для лучшего покрытия
+            )
         
         # Подсчитываем найденные объекты
-        total_objects = sum(
-            len(nearby_data.get(cat, [])) 
-            for cat in ['transport', 'shopping', 'education', 'healthcare', 'sport', 'leisure']
-        )
+        total_objects = sum(len(nearby_data.get(cat, [])) for cat in NEARBY_CATEGORIES)
         
         if total_objects > 0:
             # Сохраняем в БД
@@ -159,8 +181,8 @@ def process_batch(batch_size=5, delay_between=2):
         else:
             stats['failed'] += 1
         
-        # Задержка между запросами чтобы не перегружать API
-        if i < len(complexes):
+        # Задержка между запросами чтобы не перегружать API (локальной выгрузке не нужна)
+        if i < len(complexes) and get_poi_store() is None:
             print(f"   ⏱️  Пауза {delay_between} сек...")
             time.sleep(delay_between)
         
@@ -178,6 +200,84 @@ def process_batch(batch_size=5, delay_between=2):
     return stats
 
 
+def refresh_region_extract(force=False):
+    """
+    Скачать выгрузку POI для bbox всех ЖК, если её нет или она устарела
+    
+    Returns:
+        bool: выгрузка обновлена
+    """
+    age = poi_extract_age_days()
+    if not force and age is not None and age < POI_EXTRACT_MAX_AGE_DAYS:
+        return False
+    
+    with app.app_context():
+        points = db.session.query(ResidentialComplex.latitude, ResidentialComplex.longitude).filter(
+            ResidentialComplex.latitude.isnot(None),
+            ResidentialComplex.longitude.isnot(None)
+        ).all()
+    bbox = region_bbox(((float(lat), float(lon)) for lat, lon in points), pad_meters=NEARBY_RADIUS_METERS)
+    if bbox is None:
+        return False
+    
+    print(f"🌍 Загружаем выгрузку POI для региона {bbox}...")
+    started = time.time()
+    elements = download_region_extract(bbox, poi_extract_path())
+    print(f"   ✅ {elements} объектов за {time.time() - started:.0f} сек")
+    return True
+
+
+def update_from_store(store=None, limit=None, force=False, commit_every=200):
+    """
+    Пересчитать nearby для всех ЖК по локальной выгрузке POI одним проходом
+    
+    Args:
+        store: PoiStore (по умолчанию - из файла выгрузки)
+        limit: максимум ЖК (None - все требующие обновления)
+        force: пересчитать все ЖК с координатами, а не только устаревшие
+        commit_every: размер пачки для commit
+    
+    Returns:
+        dict: Статистика обработки (как process_batch)
+    """
+    store = store or get_poi_store()
+    stats = {'total': 0, 'success': 0, 'failed': 0, 'objects_total': 0}
+    if store is None:
+        print("⚠️  Нет выгрузки POI - запустите refresh_region_extract()")
+        return stats
+    
+    started = time.time()
+    with app.app_context():
+        if force:
+            query = db.session.query(ResidentialComplex).filter(
+                ResidentialComplex.latitude.isnot(None),
+                ResidentialComplex.longitude.isnot(None)
+            )
+        else:
+            query = _complexes_needing_update_query()
+        complexes = (query.limit(limit) if limit else query).all()
+        
+        now = datetime.utcnow()
+        for i, complex in enumerate(complexes, 1):
+            nearby_data = store.nearby(float(complex.latitude), float(complex.longitude), NEARBY_RADIUS_METERS)
+            total_objects = sum(len(nearby_data.get(cat, [])) for cat in NEARBY_CATEGORIES)
+            stats['total'] += 1
+            if total_objects == 0:
+                stats['failed'] += 1
+                continue
+            complex.nearby = json.dumps(nearby_data, ensure_ascii=False)
+            complex.nearby_updated_at = now
+            stats['success'] += 1
+            stats['objects_total'] += total_objects
+            if i % commit_every == 0:
+                db.session.commit()
+        db.session.commit()
+    
+    print(f"✅ Nearby пересчитаны для {stats['success']} из {stats['total']} ЖК "
+          f"за {time.time() - started:.1f} сек (POI в выгрузке: {len(store)})")
+    return stats
+
+
 def update_all_outdated(max_complexes=100, batch_size=5):
     """
     Обновить все устаревшие ЖК порциями
@@ -193,6 +293,13 @@ def update_all_outdated(max_complexes=100, batch_size=5):
         'objects_total': 0
     }
     
+    # С локальной выгрузкой порции и паузы не нужны
+    if get_poi_store() is not None:
+        stats = update_from_store(limit=max_complexes)
+        total_stats.update(batches=1, success=stats['success'], failed=stats['failed'],
+                           objects_total=stats['objects_total'])
+        return total_stats
+    
     processed = 0
     
     while processed < max_complexes:
@@ -234,7 +341,12 @@ def update_all_outdated(max_complexes=100, batch_size=5):
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1 and sys.argv[1] == '--all':
+    if len(sys.argv) > 1 and sys.argv[1] == '--region':
+        # Выгрузка региона + локальный пересчёт всех ЖК
+        print("Режим: Региональная выгрузка POI и пересчёт всех ЖК")
+        refresh_region_extract(force='--force' in sys.argv)
+        update_from_store(force='--force' in sys.argv)
+    elif len(sys.argv) > 1 and sys.argv[1] == '--all':
         # Обновить все
         print("Режим: Обновление всех устаревших ЖК")
         update_all_outdated(max_complexes=100, batch_size=5)
@@ -20,7 +20,7 @@ def main():
     log("  🤖 Nearby Daemon - Автоматическое обновление nearby данных")
     log("="*70)
     log("Режим работы: проверка каждые 30 минут")
-    log("Обновление: 5 ЖК за раз")
+    log("Обновление: все устаревшие ЖК по региональной выгрузке POI")
     log("="*70)
     log("")
     
@@ -32,35 +32,49 @@ def main():
         try:
             log(f"🔄 Итерация #{iteration}: Поиск ЖК для обновления...")
             
-            with app.app_context():
-                # Найти ЖК требующие обновления
-                complexes = nearby_auto_updater.find_complexes_needing_update(limit=5)
-                
-                if len(complexes) == 0:
+            # Региональная выгрузка POI (раз в POI_EXTRACT_MAX_AGE_DAYS дней)
+            try:
+                if nearby_auto_updater.refresh_region_extract():
+                    log("🌍 Выгрузка POI региона обновлена")
+            except Exception as e:
+                log(f"⚠️  Не удалось обновить выгрузку POI: {e}")
+            
+            if nearby_auto_updater.get_poi_store() is not None:
+                stats = nearby_auto_updater.update_from_store()
+                if stats['total'] == 0:
                     log("✅ Все ЖК имеют актуальные nearby данные")
                 else:
-                    log(f"📍 Найдено ЖК для обновления: {len(complexes)}")
-                    
-                    success_count = 0
-                    error_count = 0
+                    log(f"📊 Результаты: успешно {stats['success']}, без объектов {stats['failed']}")
+            else:
+                # Выгрузки нет - по старинке, 5 ЖК через Overpass
+                with app.app_context():
+                    complexes = nearby_auto_updater.find_complexes_needing_update(limit=5)
                     
-                    for i, complex in enumerate(complexes, 1):
-                        log(f"   [{i}/{len(complexes)}] Обновляем: {complex.name}")
+                    if len(complexes) == 0:
+                        log("✅ Все ЖК имеют актуальные nearby данные")
+                    else:
+                        log(f"📍 Найдено ЖК для обновления: {len(complexes)}")
                         
-                        result = nearby_auto_updater.update_nearby_for_complex(complex)
+                        success_count = 0
+                        error_count = 0
                         
-                        if result['success']:
-                            success_count += 1
-                            log(f"      ✅ Найдено {result['objects_found']} объектов")
-                        else:
-                            error_count += 1
-                            log(f"      ❌ Ошибка: {result.get('error', 'Unknown')}")
+                        for i, complex in enumerate(complexes, 1):
+                            log(f"   [{i}/{len(complexes)}] Обновляем: {complex.name}")
+                            
+                            result = nearby_auto_updater.update_nearby_for_complex(complex)
+                            
+                            if result['success']:
+                                success_count += 1
+                                log(f"      ✅ Найдено {result['objects_found']} объектов")
+                            else:
+                                error_count += 1
+                                log(f"      ❌ Ошибка: {result.get('error', 'Unknown')}")
+                            
+                            # Пауза между ЖК
+                            if i < len(complexes):
+                                time.sleep(3)
                         
-                        # Пауза между ЖК
-                        if i < len(complexes):
-                            time.sleep(3)
-                    
-                    log(f"📊 Результаты: успешно {success_count}, ошибок {error_count}")
+                        log(f"📊 Результаты: успешно {success_count}, ошибок {error_count}")
             
             # Ждём 30 минут до следующей проверки
             log(f"⏳ Следующая проверка через 30 минут...")
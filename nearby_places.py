@@ -5,15 +5,74 @@ import requests
 import json
 import math
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Sequence
+
+import numpy as np
+
+
+# Используем альтернативный инстанс для лучшей стабильности
+OVERPASS_URL = "https://overpass.kumi.systems/api/interpreter"
+OVERPASS_USER_AGENT = 'InBack.ru Real Estate Service'
+
+# Категории для поиска с OSM тегами и русские названия
+CATEGORIES_CONFIG = {
+    'transport': [
+        ('highway', 'bus_stop', 'bus_stop', 'Остановка автобуса'),
+        ('railway', 'tram_stop', 'tram_stop', 'Остановка трамвая'),
+        ('railway', 'station', 'railway_station', 'Ж/д станция'),
+        ('station', 'subway', 'metro_station', 'Станция метро'),
+        ('amenity', 'bus_station', 'bus_station', 'Автовокзал'),
+    ],
+    'shopping': [
+        ('shop', 'mall', 'mall', 'Торговый центр'),
+        ('shop', 'supermarket', 'supermarket', 'Супермаркет'),
+        ('shop', 'department_store', 'department_store', 'Универмаг'),
+        ('shop', 'convenience', 'convenience', 'Магазин у дома'),
+        ('amenity', 'marketplace', 'marketplace', 'Рынок'),
+    ],
+    'education': [
+        ('amenity', 'kindergarten', 'kindergarten', 'Детский сад'),
+        ('amenity', 'school', 'school', 'Школа'),
+        ('amenity', 'university', 'university', 'Университет'),
+        ('amenity', 'college', 'college', 'Колледж'),
+    ],
+    'healthcare': [
+        ('amenity', 'hospital', 'hospital', 'Больница'),
+        ('amenity', 'clinic', 'clinic', 'Поликлиника'),
+        ('amenity', 'pharmacy', 'pharmacy', 'Аптека'),
+        ('amenity', 'doctors', 'doctors', 'Медцентр'),
+    ],
+    'sport': [
+        ('leisure', 'sports_centre', 'sports_centre', 'Спортивный центр'),
+        ('leisure', 'fitness_centre', 'fitness_centre', 'Фитнес-клуб'),
+        ('leisure', 'swimming_pool', 'swimming_pool', 'Бассейн'),
+        ('leisure', 'stadium', 'stadium', 'Стадион'),
+        ('sport', 'swimming', 'swimming_pool', 'Бассейн'),
+    ],
+    'leisure': [
+        ('leisure', 'park', 'park', 'Парк'),
+        ('leisure', 'playground', 'playground', 'Детская площадка'),
+        ('tourism', 'attraction', 'attraction', 'Достопримечательность'),
+        ('tourism', 'museum', 'museum', 'Музей'),
+        ('amenity', 'cinema', 'cinema', 'Кинотеатр'),
+        ('amenity', 'theatre', 'theatre', 'Театр'),
+        ('amenity', 'arts_centre', 'arts_centre', 'Культурный центр'),
+    ],
+}
+
+# Учреждения, которые не должны попадать в категорию "Досуг"
+LEISURE_EXCLUDED_AMENITIES = ('school', 'kindergarten', 'university', 'college', 'hospital', 'clinic', 'doctors')
+
+
+EARTH_RADIUS_M = 6371000  # Радиус Земли в метрах
 
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> int:
     """
     Вычислить расстояние между двумя точками (Haversine formula)
-    Возвращает расстояние в метрах
+    Возвращает расстояние в метрах. Для массивов точек - haversine_matrix()
     """
-    R = 6371000  # Радиус Земли в метрах
+    R = EARTH_RADIUS_M
     
     phi1 = math.radians(lat1)
     phi2 = math.radians(lat2)
@@ -27,6 +86,76 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> in
     return int(distance)
 
 
+def haversine_matrix(origin_lats, origin_lons, target_lats, target_lons) -> np.ndarray:
+    """
+    Расстояния (метры) от каждого origin до каждого target одним векторным проходом
+    
+    Args:
+        origin_lats, origin_lons: массивы координат начальных точек (N)
+        target_lats, target_lons: массивы координат целей (M)
+    
+    Returns:
+        np.ndarray формы (N, M)
+    """
+    return haversine_pairs(
+        np.asarray(origin_lats, dtype=np.float64)[:, None],
+        np.asarray(origin_lons, dtype=np.float64)[:, None],
+        np.asarray(target_lats, dtype=np.float64)[None, :],
+        np.asarray(target_lons, dtype=np.float64)[None, :],
+    )
+
+
+def haversine_pairs(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """
+    Поэлементные расстояния (метры) между парами точек (с broadcasting NumPy)
+    
+    Пары (ЖК, POI-кандидат) для всего каталога считаются одним проходом
+    без построения полной матрицы N×M
+    """
+    phi1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    lambda1 = np.radians(np.asarray(lons1, dtype=np.float64))
+    phi2 = np.radians(np.asarray(lats2, dtype=np.float64))
+    lambda2 = np.radians(np.asarray(lons2, dtype=np.float64))
+    
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distances_from(latitude: float, longitude: float, target_lats, target_lons) -> np.ndarray:
+    """Расстояния (метры) от одной точки до массива целей"""
+    return haversine_matrix([latitude], [longitude], target_lats, target_lons)[0]
+
+
+def select_nearest(names: Sequence, distances: np.ndarray, k: int = 5,
+                   radius_meters: Optional[float] = None) -> List[int]:
+    """
+    Индексы k ближайших объектов с уникальными именами (ближайший дубль побеждает)
+    
+    Args:
+        names: имена объектов (ключ дедупликации)
+        distances: расстояния в метрах, в том же порядке
+        k: сколько объектов вернуть
+        radius_meters: отбросить объекты дальше радиуса
+    
+    Returns:
+        Список индексов, отсортированных по расстоянию
+    """
+    order = np.argsort(distances, kind='stable')
+    selected = []
+    seen = set()
+    for i in order:
+        if radius_meters is not None and distances[i] > radius_meters:
+            break
+        name = names[i]
+        if name in seen:
+            continue
+        seen.add(name)
+        selected.append(int(i))
+        if len(selected) >= k:
+            break
+    return selected
+
+
 def fetch_nearby_places(latitude: float, longitude: float, radius_meters: int = 2000) -> Dict:
     """
     Получить близлежащие объекты через OpenStreetMap Overpass API
@@ -40,108 +169,57 @@ def fetch_nearby_places(latitude: float, longitude: float, radius_meters: int =
         Dict с категориями близлежащих объектов
     """
     
-    # Категории для поиска с OSM тегами и русские названия
-    categories_config = {
-        'transport': [
-            ('highway', 'bus_stop', 'bus_stop', 'Остановка автобуса'),
-            ('railway', 'tram_stop', 'tram_stop', 'Остановка трамвая'),
-            ('railway', 'station', 'railway_station', 'Ж/д станция'),
-            ('station', 'subway', 'metro_station', 'Станция метро'),
-            ('amenity', 'bus_station', 'bus_station', 'Автовокзал'),
-        ],
-        'shopping': [
-            ('shop', 'mall', 'mall', 'Торговый центр'),
-            ('shop', 'supermarket', 'supermarket', 'Супермаркет'),
-            ('shop', 'department_store', 'department_store', 'Универмаг'),
-            ('shop', 'convenience', 'convenience', 'Магазин у дома'),
-            ('amenity', 'marketplace', 'marketplace', 'Рынок'),
-        ],
-        'education': [
-            ('amenity', 'kindergarten', 'kindergarten', 'Детский сад'),
-            ('amenity', 'school', 'school', 'Школа'),
-            ('amenity', 'university', 'university', 'Университет'),
-            ('amenity', 'college', 'college', 'Колледж'),
-        ],
-        'healthcare': [
-            ('amenity', 'hospital', 'hospital', 'Больница'),
-            ('amenity', 'clinic', 'clinic', 'Поликлиника'),
-            ('amenity', 'pharmacy', 'pharmacy', 'Аптека'),
-            ('amenity', 'doctors', 'doctors', 'Медцентр'),
-        ],
-        'sport': [
-            ('leisure', 'sports_centre', 'sports_centre', 'Спортивный центр'),
-            ('leisure', 'fitness_centre', 'fitness_centre', 'Фитнес-клуб'),
-            ('leisure', 'swimming_pool', 'swimming_pool', 'Бассейн'),
-            ('leisure', 'stadium', 'stadium', 'Стадион'),
-            ('sport', 'swimming', 'swimming_pool', 'Бассейн'),
-        ],
-        'leisure': [
-            ('leisure', 'park', 'park', 'Парк'),
-            ('leisure', 'playground', 'playground', 'Детская площадка'),
-            ('tourism', 'attraction', 'attraction', 'Достопримечательность'),
-            ('tourism', 'museum', 'museum', 'Музей'),
-            ('amenity', 'cinema', 'cinema', 'Кинотеатр'),
-            ('amenity', 'theatre', 'theatre', 'Театр'),
-            ('amenity', 'arts_centre', 'arts_centre', 'Культурный центр'),
-        ],
-    }
-    
     result = {}
     
     # Используем батч-запросы для каждой категории (быстрее и меньше ошибок)
-    for category, tags_list in categories_config.items():
-        category_places = []
+    for category, tags_list in CATEGORIES_CONFIG.items():
+        candidates = []
         
         try:
             # Один батч-запрос для всей категории
             places = _query_overpass_batch(latitude, longitude, radius_meters, tags_list)
             
             for place in places:
-                distance = calculate_distance(latitude, longitude, place['lat'], place['lon'])
-                
                 # ВАЖНО: пропускаем объекты без названия
-                place_name = place.get('name')
-                if not place_name:
+                if not place.get('name'):
                     continue
                 
                 # Фильтруем неправильно категоризированные объекты
-                # Проверяем теги объекта для исключения образовательных/медицинских учреждений из досуга
-                place_tags = place.get('tags', {})
-                if category == 'leisure':
-                    # Исключаем школы, детские сады, больницы из категории "Досуг"
-                    amenity_tag = place_tags.get('amenity', '')
-                    if amenity_tag in ['school', 'kindergarten', 'university', 'college', 'hospital', 'clinic', 'doctors']:
-                        continue
+                # Исключаем школы, детские сады, больницы из категории "Досуг"
+                if category == 'leisure' and place.get('tags', {}).get('amenity', '') in LEISURE_EXCLUDED_AMENITIES:
+                    continue
                 
-                if distance <= radius_meters:
-                    category_places.append({
-                        'type': place['type'],
-                        'type_display': place['type_display'],
-                        'name': place_name,
-                        'distance': distance,
-                        'coordinates': [place['lat'], place['lon']]
-                    })
+                candidates.append(place)
                     
         except Exception as e:
             print(f"Error fetching {category}: {e}")
             import traceback
             traceback.print_exc()
         
-        # ДЕДУПЛИКАЦИЯ: удаляем дубли по имени (оставляем ближайший)
-        seen_names = {}
-        deduplicated_places = []
-        for place in category_places:
-            name = place['name']
-            if name not in seen_names or place['distance'] < seen_names[name]['distance']:
-                if name in seen_names:
-                    # Удаляем старый дубликат из списка
-                    deduplicated_places = [p for p in deduplicated_places if p['name'] != name]
-                seen_names[name] = place
-                deduplicated_places.append(place)
+        if not candidates:
+            result[category] = []
+            continue
+        
+        # Расстояния до всех кандидатов категории одним векторным вызовом
+        distances = distances_from(
+            latitude, longitude,
+            [place['lat'] for place in candidates],
+            [place['lon'] for place in candidates]
+        ).astype(np.int64)
         
-        # Сортируем по расстоянию и берем топ-5 ближайших
-        deduplicated_places.sort(key=lambda x: x['distance'])
-        result[category] = deduplicated_places[:5]
+        # ДЕДУПЛИКАЦИЯ по имени (оставляем ближайший) и топ-5 ближайших
+        nearest = select_nearest([place['name'] for place in candidates], distances, k=5,
+                                 radius_meters=radius_meters)
+        result[category] = [
+            {
+                'type': candidates[i]['type'],
+                'type_display': candidates[i]['type_display'],
+                'name': candidates[i]['name'],
+                'distance': int(distances[i]),
+                'coordinates': [candidates[i]['lat'], candidates[i]['lon']]
+            }
+            for i in nearest
+        ]
     
     # Добавляем метку времени обновления
     result['updated_at'] = datetime.utcnow().isoformat()
@@ -163,9 +241,6 @@ def _query_overpass_batch(lat: float, lon: float, radius: int, tags_list: List[T
         Список найденных объектов с типами
     """
     
-    # Используем альтернативный инстанс для лучшей стабильности
-    overpass_url = "https://overpass.kumi.systems/api/interpreter"
-    
     # Собираем все условия в один запрос
     node_conditions = []
     way_conditions = []
@@ -186,54 +261,15 @@ def _query_overpass_batch(lat: float, lon: float, radius: int, tags_list: List[T
     
     try:
         response = requests.post(
-            overpass_url,
+            OVERPASS_URL,
             data={'data': overpass_query},
             timeout=120,
-            headers={'User-Agent': 'InBack.ru Real Estate Service'}
+            headers={'User-Agent': OVERPASS_USER_AGENT}
         )
         
         if response.status_code == 200:
             data = response.json()
-            places = []
-            
-            # Создаем маппинг тегов для определения типа
-            tag_mapping = {(osm_key, osm_value): (place_type, type_display) 
-                          for osm_key, osm_value, place_type, type_display in tags_list}
-            
-            for element in data.get('elements', []):
-                # Получаем координаты
-                if element['type'] == 'node':
-                    place_lat = element.get('lat')
-                    place_lon = element.get('lon')
-                elif element['type'] == 'way' and 'center' in element:
-                    place_lat = element['center'].get('lat')
-                    place_lon = element['center'].get('lon')
-                else:
-                    continue
-                
-                # Определяем тип объекта по тегам
-                tags = element.get('tags', {})
-                place_type = None
-                type_display = None
-                
-                for osm_key, osm_value in tag_mapping.keys():
-                    if tags.get(osm_key) == osm_value:
-                        place_type, type_display = tag_mapping[(osm_key, osm_value)]
-                        break
-                
-                if not place_type:
-                    continue
-                
-                places.append({
-                    'lat': place_lat,
-                    'lon': place_lon,
-                    'name': element.get('tags', {}).get('name', element.get('tags', {}).get('name:ru')),
-                    'type': place_type,
-                    'type_display': type_display,
-                    'tags': element.get('tags', {})  # Сохраняем все теги для дополнительной фильтрации
-                })
-            
-            return places
+            return parse_overpass_elements(data.get('elements', []), tags_list)
         else:
             print(f"Overpass API error: {response.status_code}")
             return []
@@ -249,6 +285,59 @@ def _query_overpass_batch(lat: float, lon: float, radius: int, tags_list: List[T
         return []
 
 
+def parse_overpass_elements(elements: List[Dict], tags_list: List[Tuple]) -> List[Dict]:
+    """
+    Разобрать элементы ответа Overpass (node / way и relation с center) в места категории
+    
+    Args:
+        elements: Список элементов из ответа Overpass
+        tags_list: Список кортежей (osm_key, osm_value, place_type, type_display)
+    
+    Returns:
+        Список мест с координатами и типом (первый подходящий тег категории)
+    """
+    places = []
+    
+    # Создаем маппинг тегов для определения типа
+    tag_mapping = {(osm_key, osm_value): (place_type, type_display)
+                   for osm_key, osm_value, place_type, type_display in tags_list}
+    
+    for element in elements:
+        # Получаем координаты
+        if element['type'] == 'node':
+            place_lat = element.get('lat')
+            place_lon = element.get('lon')
+        elif element['type'] in ('way', 'relation') and 'center' in element:
+            place_lat = element['center'].get('lat')
+            place_lon = element['center'].get('lon')
+        else:
+            continue
+        
+        # Определяем тип объекта по тегам
+        tags = element.get('tags', {})
+        place_type = None
+        type_display = None
+        
+        for osm_key, osm_value in tag_mapping.keys():
+            if tags.get(osm_key) == osm_value:
+                place_type, type_display = tag_mapping[(osm_key, osm_value)]
+                break
+        
+        if not place_type:
+            continue
+        
+        places.append({
+            'lat': place_lat,
+            'lon': place_lon,
+            'name': tags.get('name', tags.get('name:ru')),
+            'type': place_type,
+            'type_display': type_display,
+            'tags': tags  # Сохраняем все теги для дополнительной фильтрации
+        })
+    
+    return places
+
+
 def format_nearby_display_name(place_type: str, lang: str = 'ru') -> str:
     """
     Получить читаемое название типа места
@@ -4,11 +4,66 @@ Property Repository - Professional data access layer
 """
 
 import json
-from sqlalchemy import func, and_, or_
+import base64
+import logging
+from datetime import datetime
+from sqlalchemy import func, and_, or_, tuple_
 from sqlalchemy.orm import joinedload
 from models import Property, ResidentialComplex, Developer, District
 from app import db
 
+logger = logging.getLogger(__name__)
+
+# Колонки сортировки списка квартир. Второй ключ — id в том же направлении:
+# порядок полный (нет «прыгающих» строк с одинаковой ценой), а один индекс
+# (колонка, id) обслуживает и ASC, и DESC обратным проходом
+SORT_COLUMNS = {
+    'price': Property.price,
+    'area': Property.area,
+    'date': Property.created_at,
+}
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или выдан для другой сортировки"""
+
+
+def normalize_sort(sort_by, sort_order):
+    """Неизвестная колонка → цена по возрастанию, как и раньше"""
+    if sort_by not in SORT_COLUMNS:
+        return 'price', 'asc'
+    return sort_by, 'desc' if sort_order == 'desc' else 'asc'
+
+
+def encode_cursor(sort_by, sort_order, value, property_id):
+    """Непрозрачный курсор: позиция (значение колонки, id) последней квартиры страницы"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort_by, sort_order, value, property_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_by, sort_order):
+    """
+    (значение, id) из курсора
+
+    Raises:
+        InvalidCursor: курсор не читается или выдан для другой сортировки
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, cursor_order, value, property_id = json.loads(raw)
+        if sort_by == 'date' and value is not None:
+            value = datetime.fromisoformat(value)
+        elif value is not None and not isinstance(value, (int, float)):
+            raise TypeError(value)
+        property_id = int(property_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}") from e
+    if (cursor_sort, cursor_order) != (sort_by, sort_order):
+        raise InvalidCursor(f"Cursor was issued for sort {cursor_sort}-{cursor_order}")
+    return value, property_id
+
 
 class PropertyRepository:
     """Repository для работы с квартирами через normalized структуру"""
@@ -46,13 +101,265 @@ class PropertyRepository:
         )
     
     @staticmethod
-    def get_all_active(limit=50, offset=0, filters=None, sort_by='price', sort_order='asc'):
+    def search_condition(term):
+        """Условие полнотекстового 'search' (ILIKE по квартире, ЖК, застройщику и адресу)"""
+        search_term = f"%{term}%"
+        return or_(
+            Property.title.ilike(search_term),
+            Property.address.ilike(search_term),
+            ResidentialComplex.name.ilike(search_term),
+            Developer.name.ilike(search_term),
+            District.name.ilike(search_term),
+            # Geocoded address components for smart search (legacy)
+            Property.parsed_city.ilike(search_term),
+            Property.parsed_district.ilike(search_term),
+            Property.parsed_street.ilike(search_term),
+            # Детальные адресные компоненты (новые поля)
+            Property.parsed_area.ilike(search_term),
+            Property.parsed_settlement.ilike(search_term),
+            Property.parsed_house.ilike(search_term),
+            Property.parsed_block.ilike(search_term)
+        )
+    
+    @staticmethod
+    def search_ids(term):
+        """ID активных квартир, подходящих под 'search' (остальные фильтры считает индекс)"""
+        rows = (
+            db.session.query(Property.id)
+            .join(ResidentialComplex, Property.complex_id == ResidentialComplex.id, isouter=True)
+            .join(Developer, Property.developer_id == Developer.id, isouter=True)
+            .join(District, Property.district_id == District.id, isouter=True)
+            .filter(Property.is_active == True, PropertyRepository.search_condition(term))
+            .all()
+        )
+        return [row[0] for row in rows]
+    
+    @staticmethod
+    def sort_clause(sort_by='price', sort_order='asc'):
+        """ORDER BY (колонка, id); NULL — в конце для ASC и в начале для DESC, как в PostgreSQL"""
+        sort_by, sort_order = normalize_sort(sort_by, sort_order)
+        column = SORT_COLUMNS[sort_by]
+        if sort_order == 'desc':
+            return [column.desc().nulls_first(), Property.id.desc()]
+        return [column.asc().nulls_last(), Property.id.asc()]
+    
+    @staticmethod
+    def keyset_condition(sort_by, sort_order, after):
+        """
+        Квартиры строго после after = (значение, id) в порядке sort_clause(), до конца
+        текущего сегмента (NULL или не-NULL) — чистый диапазон по индексу (колонка, id)
+        """
+        sort_by, sort_order = normalize_sort(sort_by, sort_order)
+        column = SORT_COLUMNS[sort_by]
+        value, last_id = after
+        if value is None:
+            id_after = Property.id > last_id if sort_order == 'asc' else Property.id < last_id
+            return and_(column.is_(None), id_after)
+        if sort_order == 'asc':
+            return tuple_(column, Property.id) > tuple_(value, last_id)
+        return tuple_(column, Property.id) < tuple_(value, last_id)
+    
+    @staticmethod
+    def keyset_tail_condition(sort_by, sort_order, after):
+        """
+        Сегмент, идущий после сегмента курсора: NULL-хвост для ASC, все значения после
+        NULL-головы для DESC. None — после сегмента курсора ничего нет
+        """
+        sort_by, sort_order = normalize_sort(sort_by, sort_order)
+        column = SORT_COLUMNS[sort_by]
+        value, _ = after
+        if sort_order == 'asc':
+            return column.is_(None) if value is not None else None
+        return column.isnot(None) if value is None else None
+    
+    @staticmethod
+    def keyset_page(query, sort_by, sort_order, after, limit):
+        """
+        Страница query (уже с ORDER BY sort_clause()) после курсора after
+        Условие (колонка, id) > курсор OR колонка IS NULL индекс как диапазон не использует
+        (SCAN с начала индекса), поэтому следующий сегмент — отдельный запрос и только
+        когда диапазон исчерпан
+        """
+        page = query.filter(PropertyRepository.keyset_condition(sort_by, sort_order, after)).limit(limit).all()
+        tail = PropertyRepository.keyset_tail_condition(sort_by, sort_order, after)
+        if tail is not None and len(page) < limit:
+            page += query.filter(tail).limit(limit - len(page)).all()
+        return page
+    
+    @staticmethod
+    def cursor_for(prop, sort_by='price', sort_order='asc'):
+        """Курсор, указывающий на квартиру prop — следующая страница начнётся после неё"""
+        sort_by, sort_order = normalize_sort(sort_by, sort_order)
+        value = getattr(prop, SORT_COLUMNS[sort_by].key)
+        return encode_cursor(sort_by, sort_order, value, prop.id)
+    
+    @staticmethod
+    def apply_filters(query, filters):
+        """
+        Фильтры build_property_filters() (формат — см. get_all_active)
+        query должен содержать JOIN ResidentialComplex, Developer и District
+        """
+        if not filters:
+            return query
+        
+        # Price filters
+        if filters.get('min_price'):
+            query = query.filter(Property.price >= filters['min_price'])
+        if filters.get('max_price'):
+            query = query.filter(Property.price <= filters['max_price'])
+        
+        # Area filters
+        if filters.get('min_area'):
+            query = query.filter(Property.area >= filters['min_area'])
+        if filters.get('max_area'):
+            query = query.filter(Property.area <= filters['max_area'])
+        
+        # Rooms filter
+        if filters.get('rooms'):
+            # Handle both int and string room values
+            room_values = []
+            for r in filters['rooms']:
+                try:
+                    room_values.append(int(r))
+                except (ValueError, TypeError):
+                    pass
+            if room_values:
+                query = query.filter(Property.rooms.in_(room_values))
+        
+        # Floor filters
+        if filters.get('floor_min'):
+            query = query.filter(Property.floor >= filters['floor_min'])
+        if filters.get('floor_max'):
+            query = query.filter(Property.floor <= filters['floor_max'])
+        
+        # Floor options (not first/not last)
+        if filters.get('floor_options'):
+            for option in filters['floor_options']:
+                if option == 'not_first':
+                    query = query.filter(Property.floor > 1)
+                elif option == 'not_last':
+                    # Not on last floor: floor < total_floors
+                    query = query.filter(Property.floor < Property.total_floors)
+        
+        # Complex filters
+        if filters.get('complex_id'):
+            query = query.filter(Property.complex_id == filters['complex_id'])
+        
+        if filters.get('residential_complex'):
+            query = query.filter(ResidentialComplex.name == filters['residential_complex'])
+        
+        # Developer filters
+        if filters.get('developer_id'):
+            query = query.filter(Property.developer_id == filters['developer_id'])
+        
+        if filters.get('developer'):
+            query = query.filter(Developer.name == filters['developer'])
+        
+        if filters.get('developers'):
+            # Filter by developer IDs or names
+            developer_ids = []
+            developer_names = []
+            for dev_value in filters['developers']:
+                if isinstance(dev_value, str) and dev_value.strip():
+                    # Check if it's numeric ID or text name
+                    if dev_value.strip().isdigit():
+                        developer_ids.append(int(dev_value.strip()))
+                    else:
+                        developer_names.append(dev_value.strip())
+                elif isinstance(dev_value, int):
+                    developer_ids.append(dev_value)
+            
+            # Apply filters
+            conditions = []
+            if developer_ids:
+                conditions.append(Property.developer_id.in_(developer_ids))
+            if developer_names:
+                conditions.append(Developer.name.in_(developer_names))
+            
+            if conditions:
+                query = query.filter(or_(*conditions))
+        
+        # District filters
+        if filters.get('district'):
+            query = query.filter(District.name == filters['district'])
+        
+        if filters.get('districts'):
+            query = query.filter(District.name.in_(filters['districts']))
+        
+        # Building name filter
+        if filters.get('building'):
+            query = query.filter(Property.complex_building_name == filters['building'])
+        
+        # Building floors range
+        if filters.get('building_floors_min'):
+            query = query.filter(Property.total_floors >= filters['building_floors_min'])
+        if filters.get('building_floors_max'):
+            query = query.filter(Property.total_floors <= filters['building_floors_max'])
+        
+        # Building types filter (if we had building_type field)
+        if filters.get('building_types'):
+            query = query.filter(Property.building_type.in_(filters['building_types']))
+        
+        # Delivery/completion years (через ResidentialComplex.end_build_year)
+        if filters.get('build_year_min'):
+            query = query.filter(ResidentialComplex.end_build_year >= filters['build_year_min'])
+        if filters.get('build_year_max'):
+            query = query.filter(ResidentialComplex.end_build_year <= filters['build_year_max'])
+        if filters.get('delivery_years'):
+            # Filter by list of years
+            query = query.filter(ResidentialComplex.end_build_year.in_(filters['delivery_years']))
+        
+        # Cashback filter
+        if filters.get('cashback_only'):
+            query = query.filter(ResidentialComplex.cashback_rate > 0)
+        
+        # Renovation types
+        if filters.get('renovation'):
+            query = query.filter(Property.renovation_type.in_(filters['renovation']))
+        
+        # Object classes (через ResidentialComplex.object_class_display_name)
+        if filters.get('object_classes'):
+            query = query.filter(ResidentialComplex.object_class_display_name.in_(filters['object_classes']))
+        
+        # Building released filter (сданный/строительство)
+        if filters.get('building_released'):
+            from datetime import datetime
+            current_year = datetime.now().year
+            
+            # Build conditions for each status
+            release_conditions = []
+            for status in filters['building_released']:
+                # Support both true/false (from HTML checkboxes) and Russian strings
+                if status in ['true', 'True', 'сданный']:
+                    # Already completed: end_build_year <= current_year
+                    release_conditions.append(ResidentialComplex.end_build_year <= current_year)
+                elif status in ['false', 'False', 'в строительстве']:
+                    # Under construction: end_build_year > current_year
+                    release_conditions.append(ResidentialComplex.end_build_year > current_year)
+            
+            # Apply OR condition if multiple statuses selected
+            if release_conditions:
+                query = query.filter(or_(*release_conditions))
+        
+        # Deal type
+        if filters.get('deal_type'):
+            query = query.filter(Property.deal_type == filters['deal_type'])
+        
+        # Search query (search in title, address, complex name, geocoded fields)
+        if filters.get('search'):
+            query = query.filter(PropertyRepository.search_condition(filters['search']))
+        
+        return query
+    
+    @staticmethod
+    def get_all_active(limit=50, offset=0, filters=None, sort_by='price', sort_order='asc', after=None):
         """
         Получить все активные квартиры с фильтрами - ПОЛНАЯ ПОДДЕРЖКА build_property_filters()
         
         Args:
             limit: Лимит записей
             offset: Смещение для пагинации
+            after: (значение, id) из decode_cursor() — keyset-страница вместо offset
             filters: Dict с фильтрами {
                 # Price and area
                 'min_price': int, 'max_price': int,
@@ -103,183 +410,14 @@ class PropertyRepository:
         query = PropertyRepository.get_base_query()
         query = query.filter(Property.is_active == True)
         
-        if filters:
-            # Price filters
-            if filters.get('min_price'):
-                query = query.filter(Property.price >= filters['min_price'])
-            if filters.get('max_price'):
-                query = query.filter(Property.price <= filters['max_price'])
-            
-            # Area filters
-            if filters.get('min_area'):
-                query = query.filter(Property.area >= filters['min_area'])
-            if filters.get('max_area'):
-                query = query.filter(Property.area <= filters['max_area'])
-            
-            # Rooms filter
-            if filters.get('rooms'):
-                # Handle both int and string room values
-                room_values = []
-                for r in filters['rooms']:
-                    try:
-                        room_values.append(int(r))
-                    except (ValueError, TypeError):
-                        pass
-                if room_values:
-                    query = query.filter(Property.rooms.in_(room_values))
-            
-            # Floor filters
-            if filters.get('floor_min'):
-                query = query.filter(Property.floor >= filters['floor_min'])
-            if filters.get('floor_max'):
-                query = query.filter(Property.floor <= filters['floor_max'])
-            
-            # Floor options (not first/not last)
-            if filters.get('floor_options'):
-                for option in filters['floor_options']:
-                    if option == 'not_first':
-                        query = query.filter(Property.floor > 1)
-                    elif option == 'not_last':
-                        # Not on last floor: floor < total_floors
-                        query = query.filter(Property.floor < Property.total_floors)
-            
-            # Complex filters
-            if filters.get('complex_id'):
-                query = query.filter(Property.complex_id == filters['complex_id'])
-            
-            if filters.get('residential_complex'):
-                query = query.filter(ResidentialComplex.name == filters['residential_complex'])
-            
-            # Developer filters
-            if filters.get('developer_id'):
-                query = query.filter(Property.developer_id == filters['developer_id'])
-            
-            if filters.get('developer'):
-                query = query.filter(Developer.name == filters['developer'])
-            
-            if filters.get('developers'):
-                # Filter by developer IDs or names
-                developer_ids = []
-                developer_names = []
-                for dev_value in filters['developers']:
-                    if isinstance(dev_value, str) and dev_value.strip():
-                        # Check if it's numeric ID or text name
-                        if dev_value.strip().isdigit():
-                            developer_ids.append(int(dev_value.strip()))
-                        else:
-                            developer_names.append(dev_value.strip())
-                    elif isinstance(dev_value, int):
-                        developer_ids.append(dev_value)
-                
-                # Apply filters
-                conditions = []
-                if developer_ids:
-                    conditions.append(Property.developer_id.in_(developer_ids))
-                if developer_names:
-                    conditions.append(Developer.name.in_(developer_names))
-                
-                if conditions:
-                    query = query.filter(or_(*conditions))
-            
-            # District filters
-            if filters.get('district'):
-                query = query.filter(District.name == filters['district'])
-            
-            if filters.get('districts'):
-                query = query.filter(District.name.in_(filters['districts']))
-            
-            # Building name filter
-            if filters.get('building'):
-                query = query.filter(Property.complex_building_name == filters['building'])
-            
-            # Building floors range
-            if filters.get('building_floors_min'):
-                query = query.filter(Property.total_floors >= filters['building_floors_min'])
-            if filters.get('building_floors_max'):
-                query = query.filter(Property.total_floors <= filters['building_floors_max'])
-            
-            # Building types filter (if we had building_type field)
-            if filters.get('building_types'):
-                query = query.filter(Property.building_type.in_(filters['building_types']))
-            
-            # Delivery/completion years (через ResidentialComplex.end_build_year)
-            if filters.get('build_year_min'):
-                query = query.filter(ResidentialComplex.end_build_year >= filters['build_year_min'])
-            if filters.get('build_year_max'):
-                query = query.filter(ResidentialComplex.end_build_year <= filters['build_year_max'])
-            if filters.get('delivery_years'):
-                # Filter by list of years
-                query = query.filter(ResidentialComplex.end_build_year.in_(filters['delivery_years']))
-            
-            # Cashback filter
-            if filters.get('cashback_only'):
-                query = query.filter(ResidentialComplex.cashback_rate > 0)
-            
-            # Renovation types
-            if filters.get('renovation'):
-                query = query.filter(Property.renovation_type.in_(filters['renovation']))
-            
-            # Object classes (через ResidentialComplex.object_class_display_name)
-            if filters.get('object_classes'):
-                query = query.filter(ResidentialComplex.object_class_display_name.in_(filters['object_classes']))
-            
-            # Building released filter (сданный/строительство)
-            if filters.get('building_released'):
-                from datetime import datetime
-                current_year = datetime.now().year
-                
-                # Build conditions for each status
-                release_conditions = []
-                for status in filters['building_released']:
-                    # Support both true/false (from HTML checkboxes) and Russian strings
-                    if status in ['true', 'True', 'сданный']:
-                        # Already completed: end_build_year <= current_year
-                        release_conditions.append(ResidentialComplex.end_build_year <= current_year)
-                    elif status in ['false', 'False', 'в строительстве']:
-                        # Under construction: end_build_year > current_year
-                        release_conditions.append(ResidentialComplex.end_build_year > current_year)
-                
-                # Apply OR condition if multiple statuses selected
-                if release_conditions:
-                    query = query.filter(or_(*release_conditions))
-            
-            # Deal type
-            if filters.get('deal_type'):
-                query = query.filter(Property.deal_type == filters['deal_type'])
-            
-            # Search query (search in title, address, complex name, geocoded fields)
-            if filters.get('search'):
-                search_term = f"%{filters['search']}%"
-                query = query.filter(
-                    or_(
-                        Property.title.ilike(search_term),
-                        Property.address.ilike(search_term),
-                        ResidentialComplex.name.ilike(search_term),
-                        Developer.name.ilike(search_term),
-                        District.name.ilike(search_term),
-                        # Geocoded address components for smart search (legacy)
-                        Property.parsed_city.ilike(search_term),
-                        Property.parsed_district.ilike(search_term),
-                        Property.parsed_street.ilike(search_term),
-                        # Детальные адресные компоненты (новые поля)
-                        Property.parsed_area.ilike(search_term),
-                        Property.parsed_settlement.ilike(search_term),
-                        Property.parsed_house.ilike(search_term),
-                        Property.parsed_block.ilike(search_term)
-                    )
-                )
+        query = PropertyRepository.apply_filters(query, filters)
         
-        # Apply sorting
-        if sort_by == 'price':
-            query = query.order_by(Property.price.desc() if sort_order == 'desc' else Property.price.asc())
-        elif sort_by == 'area':
-            query = query.order_by(Property.area.desc() if sort_order == 'desc' else Property.area.asc())
-        elif sort_by == 'date':
-            query = query.order_by(Property.created_at.desc() if sort_order == 'desc' else Property.created_at.asc())
-        else:
-            # Default sort by price ascending
-            query = query.order_by(Property.price.asc())
+        # Apply sorting: (колонка, id) — детерминированный порядок для offset и keyset
+        query = query.order_by(*PropertyRepository.sort_clause(sort_by, sort_order))
         
+        if after is not None:
+            # Keyset: страница 200 стоит как страница 1 — поиск по индексу (колонка, id)
+            return PropertyRepository.keyset_page(query, sort_by, sort_order, after, limit)
         return query.offset(offset).limit(limit).all()
     
     @staticmethod
@@ -414,31 +552,113 @@ class PropertyRepository:
             
             # Search
             if filters.get('search'):
-                search_term = f"%{filters['search']}%"
-                query = query.filter(
-                    or_(
-                        Property.title.ilike(search_term),
-                        Property.address.ilike(search_term),
-                        ResidentialComplex.name.ilike(search_term),
-                        Developer.name.ilike(search_term),
-                        District.name.ilike(search_term),
-                        Property.parsed_city.ilike(search_term),
-                        Property.parsed_district.ilike(search_term),
-                        Property.parsed_street.ilike(search_term),
-                        # Детальные адресные компоненты (новые поля)
-                        Property.parsed_area.ilike(search_term),
-                        Property.parsed_settlement.ilike(search_term),
-                        Property.parsed_house.ilike(search_term),
-                        Property.parsed_block.ilike(search_term)
-                    )
-                )
+                query = query.filter(PropertyRepository.search_condition(filters['search']))
         
         return query.scalar()
     
     @staticmethod
     def get_filtered_count(**filters):
-        """Алиас для count_active - для совместимости с API endpoint"""
+        """
+        Алиас для count_active - для совместимости с API endpoint
+        Считается по in-memory PropertyIndex, SQL только как fallback
+        """
+        from services.property_index import get_property_index, is_property_index_enabled
+        
+        if is_property_index_enabled():
+            try:
+                index = get_property_index()
+                index.ensure_fresh()
+                total = index.count(filters)
+                if total is not None:
+                    return total
+            except Exception as e:
+                logger.warning(f"PropertyIndex count failed, falling back to SQL: {e}")
+                db.session.rollback()
+        
         return PropertyRepository.count_active(filters=filters)
+    
+    @staticmethod
+    def get_active_page(limit=50, offset=0, filters=None, sort_by='price', sort_order='asc'):
+        """
+        Страница активных квартир и общее количество за один проход
+        Фильтрация и сортировка - в PropertyIndex, из БД грузятся только квартиры страницы
+        
+        Returns:
+            Tuple[List[Property], int]: (квартиры страницы, всего по фильтрам)
+        """
+        from services.property_index import get_property_index, is_property_index_enabled
+        
+        if is_property_index_enabled():
+            try:
+                index = get_property_index()
+                index.ensure_fresh()
+                result = index.query(filters, sort_by=sort_by, sort_order=sort_order, limit=limit, offset=offset)
+                if result is not None:
+                    page_ids, total = result
+                    return PropertyRepository.get_by_ids_ordered(page_ids), total
+            except Exception as e:
+                logger.warning(f"PropertyIndex query failed, falling back to SQL: {e}")
+                db.session.rollback()
+        
+        properties = PropertyRepository.get_all_active(
+            limit=limit, offset=offset, filters=filters, sort_by=sort_by, sort_order=sort_order
+        )
+        return properties, PropertyRepository.count_active(filters=filters)
+    
+    @staticmethod
+    def get_active_keyset(limit=20, cursor=None, filters=None, sort_by='price', sort_order='asc'):
+        """
+        Keyset-страница активных квартир по непрозрачному курсору
+        Фильтрация и сортировка - в PropertyIndex, SQL (WHERE (колонка, id) > курсор) как fallback
+        
+        Returns:
+            Tuple[List[Property], Optional[str]]: (квартиры страницы, курсор следующей страницы или None)
+        
+        Raises:
+            InvalidCursor: курсор повреждён или выдан для другой сортировки
+        """
+        from services.property_index import get_property_index, is_property_index_enabled
+        
+        sort_by, sort_order = normalize_sort(sort_by, sort_order)
+        after = decode_cursor(cursor, sort_by, sort_order) if cursor else None
+        
+        properties = None
+        if is_property_index_enabled():
+            try:
+                index = get_property_index()
+                index.ensure_fresh()
+                page_ids = index.query_after(filters, sort_by=sort_by, sort_order=sort_order,
+                                             limit=limit + 1, after=after)
+                if page_ids is not None:
+                    properties = PropertyRepository.get_by_ids_ordered(page_ids)
+            except Exception as e:
+                logger.warning(f"PropertyIndex keyset query failed, falling back to SQL: {e}")
+                db.session.rollback()
+        
+        if properties is None:
+            properties = PropertyRepository.get_all_active(
+                limit=limit + 1, filters=filters, sort_by=sort_by, sort_order=sort_order, after=after
+            )
+        
+        # Лишняя (limit + 1)-я строка только говорит, что есть следующая страница
+        has_more = len(properties) > limit
+        properties = properties[:limit]
+        next_cursor = PropertyRepository.cursor_for(properties[-1], sort_by, sort_order) if has_more else None
+        return properties, next_cursor
+    
+    @staticmethod
+    def get_by_ids_ordered(property_ids):
+        """Загрузить квартиры по списку ID с сохранением порядка списка"""
+        if not property_ids:
+            return []
+        
+        properties = (
+            PropertyRepository.get_base_query()
+            .filter(Property.id.in_(property_ids))
+            .all()
+        )
+        by_id = {prop.id: prop for prop in properties}
+        return [by_id[pid] for pid in property_ids if pid in by_id]
 
 
     @staticmethod
@@ -486,12 +706,18 @@ class PropertyRepository:
         }
     
     @staticmethod
-    def get_properties_with_coordinates():
-        """Получить все квартиры с координатами для карты"""
+    def get_properties_with_coordinates(property_ids=None, filters=None):
+        """
+        Квартиры с координатами для карты
+        property_ids — только эти квартиры в порядке списка (точки окна карты)
+        filters — фильтры apply_filters() (SQL fallback карты без PropertyIndex)
+        """
         from models import Developer
-        return (
+        query = (
             db.session.query(
                 Property.id,
+                Property.complex_id,
+                Property.complex_building_name,
                 Property.inner_id,
                 Property.title,
                 Property.price,
@@ -514,8 +740,23 @@ class PropertyRepository:
                 Property.latitude.isnot(None),
                 Property.longitude.isnot(None)
             )
-            .all()
         )
+        if filters:
+            matching = PropertyRepository.apply_filters(
+                db.session.query(Property.id)
+                .join(ResidentialComplex, Property.complex_id == ResidentialComplex.id, isouter=True)
+                .join(Developer, Property.developer_id == Developer.id, isouter=True)
+                .join(District, Property.district_id == District.id, isouter=True)
+                .filter(Property.is_active == True),
+                filters,
+            )
+            query = query.filter(Property.id.in_(matching.subquery().select()))
+        if property_ids is None:
+            return query.all()
+        if not property_ids:
+            return []
+        by_id = {row.id: row for row in query.filter(Property.id.in_(property_ids)).all()}
+        return [by_id[pid] for pid in property_ids if pid in by_id]
     
     @staticmethod
     def get_featured_properties(limit=6):
@@ -543,120 +784,12 @@ class PropertyRepository:
     
     @staticmethod
     def get_all_property_stats():
-        """Получить статистику квартир для всех ЖК одним запросом (избегает N+1)"""
-        # Основная статистика (цены, площади, адреса)
-        stats_query = (
-            db.session.query(
-                Property.complex_id,
-                func.count(Property.id).label('total'),
-                func.min(Property.price).label('min_price'),
-                func.max(Property.price).label('max_price'),
-                func.avg(Property.price).label('avg_price'),
-                func.min(Property.area).label('min_area'),
-                func.max(Property.area).label('max_area'),
-                func.max(Property.address).label('sample_address')
-            )
-            .filter(Property.is_active == True)
-            .group_by(Property.complex_id)
-            .all()
-        )
-        
-        # Подсчет уникальных корпусов по complex_building_name для каждого ЖК
-        buildings_query = (
-            db.session.query(
-                Property.complex_id,
-                func.count(func.distinct(Property.complex_building_name)).label('buildings_count')
-            )
-            .filter(
-                Property.is_active == True,
-                Property.complex_building_name.isnot(None)
-            )
-            .group_by(Property.complex_id)
-            .all()
-        )
-        
-        buildings_dict = {row.complex_id: max(row.buildings_count, 1) for row in buildings_query}
-        
-        # Получаем первое фото из свойств для каждого ЖК (fallback если у ЖК нет собственных фото)
-        photos_query = (
-            db.session.query(
-                Property.complex_id,
-                func.min(Property.gallery_images).label('sample_photos')
-            )
-            .filter(
-                Property.is_active == True,
-                Property.gallery_images.isnot(None),
-                Property.gallery_images != '[]'
-            )
-            .group_by(Property.complex_id)
-            .all()
-        )
-        
-        photos_dict = {}
-        for row in photos_query:
-            try:
-                photos_raw = json.loads(row.sample_photos) if isinstance(row.sample_photos, str) else row.sample_photos
-                if photos_raw and isinstance(photos_raw, list) and len(photos_raw) > 1:
-                    # Пропускаем первое фото (индекс 0), берем со 2-го по 4-е (индексы 1,2,3)
-                    photos_dict[row.complex_id] = photos_raw[1:4]
-            except:
-                pass
-        
-        stats_dict = {}
-        for row in stats_query:
-            stats_dict[row.complex_id] = {
-                'total_count': row.total or 0,
-                'total_properties': row.total or 0,
-                'min_price': int(row.min_price) if row.min_price else 0,
-                'max_price': int(row.max_price) if row.max_price else 0,
-                'avg_price': int(row.avg_price) if row.avg_price else 0,
-                'min_area': float(row.min_area) if row.min_area else 0,
-                'max_area': float(row.max_area) if row.max_area else 0,
-                'sample_address': row.sample_address if hasattr(row, 'sample_address') else None,
-                'buildings_count': buildings_dict.get(row.complex_id, 1),  # Default 1 if no buildings
-                'sample_photos': photos_dict.get(row.complex_id, []),  # Photos from properties
-                'room_distribution': {},
-                'room_details': {}  # Детальная статистика по типам комнат
-            }
-        
-        # Детальная статистика по комнатам для каждого ЖК (с ценами и площадями)
-        room_query = (
-            db.session.query(
-                Property.complex_id,
-                Property.rooms,
-                func.count(Property.id).label('count'),
-                func.min(Property.price).label('min_price'),
-                func.max(Property.price).label('max_price'),
-                func.min(Property.area).label('min_area'),
-                func.max(Property.area).label('max_area')
-            )
-            .filter(Property.is_active == True)
-            .group_by(Property.complex_id, Property.rooms)
-            .all()
-        )
-        
-        # Добавляем room distribution и room_details к статистике
-        for row in room_query:
-            complex_id = row.complex_id
-            rooms = row.rooms or 0
-            count = row.count
-            
-            if complex_id in stats_dict:
-                room_type = f"{rooms}-комн" if rooms and rooms > 0 else "Студия"
-                
-                # Простой подсчет количества
-                stats_dict[complex_id]['room_distribution'][room_type] = count
-                
-                # Детальная статистика с ценами и площадями
-                stats_dict[complex_id]['room_details'][room_type] = {
-                    'count': count,
-                    'price_from': int(row.min_price) if row.min_price else 0,
-                    'price_to': int(row.max_price) if row.max_price else 0,
-                    'area_from': round(float(row.min_area), 1) if row.min_area else 0,
-                    'area_to': round(float(row.max_area), 1) if row.max_area else 0
-                }
-        
-        return stats_dict
+        """
+        Статистика квартир для всех ЖК: {complex_id: {...}}
+        Читается из материализованной таблицы complex_stats одним запросом
+        """
+        from services.complex_stats import load_complex_stats
+        return load_complex_stats()
 
 
 class ResidentialComplexRepository:
@@ -724,29 +857,59 @@ class ResidentialComplexRepository:
         )
     
     @staticmethod
-    def get_property_stats(complex_id):
-        """Получить статистику квартир в ЖК"""
-        stats = (
-            db.session.query(
-                func.count(Property.id).label('total'),
-                func.min(Property.price).label('min_price'),
-                func.max(Property.price).label('max_price'),
-                func.avg(Property.price).label('avg_price')
-            )
+    def get_nearest(latitude, longitude, limit=3, exclude_id=None, radius_meters=None):
+        """
+        Ближайшие активные ЖК к точке
+        
+        Returns:
+            List[Tuple[int, int]]: (id ЖК, расстояние в метрах), по возрастанию расстояния
+        """
+        from nearby_places import distances_from
+        
+        rows = (
+            db.session.query(ResidentialComplex.id, ResidentialComplex.latitude, ResidentialComplex.longitude)
             .filter(
-                Property.complex_id == complex_id,
-                Property.is_active == True
+                ResidentialComplex.is_active == True,
+                ResidentialComplex.latitude.isnot(None),
+                ResidentialComplex.longitude.isnot(None)
             )
-            .first()
+            .all()
         )
+        rows = [row for row in rows if row.id != exclude_id]
+        if not rows:
+            return []
+        
+        distances = distances_from(
+            float(latitude), float(longitude),
+            [float(row.latitude) for row in rows],
+            [float(row.longitude) for row in rows]
+        )
+        order = distances.argsort(kind='stable')
+        if radius_meters is not None:
+            order = order[distances[order] <= radius_meters]
+        if limit is not None:
+            order = order[:limit]
+        return [(rows[i].id, int(distances[i])) for i in order]
+    
+    @staticmethod
+    def get_property_stats(complex_id):
+        """Получить статистику квартир в ЖК (из complex_stats)"""
+        from services.complex_stats import load_complex_stats
+        stats = load_complex_stats([complex_id]).get(complex_id, {})
         
         return {
-            'total_properties': stats.total or 0,
-            'min_price': int(stats.min_price) if stats.min_price else 0,
-            'max_price': int(stats.max_price) if stats.max_price else 0,
-            'avg_price': int(stats.avg_price) if stats.avg_price else 0
+            'total_properties': stats.get('total_properties', 0),
+            'min_price': stats.get('min_price', 0),
+            'max_price': stats.get('max_price', 0),
+            'avg_price': stats.get('avg_price', 0)
         }
     
+    @staticmethod
+    def get_stats_by_ids(complex_ids=None):
+        """Статистика квартир для списка ЖК (None — все) одним запросом по complex_stats"""
+        from services.complex_stats import load_complex_stats
+        return load_complex_stats(complex_ids)
+    
 
 
 class DeveloperRepository:
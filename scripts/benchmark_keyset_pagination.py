@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк пагинации каталога: OFFSET против курсора (колонка, id)
+Заполняет таблицу properties синтетическими квартирами (повторяющиеся цены,
+NULL) и меряет страницу 1 и глубокую страницу для обоих способов в ASC и DESC с тем же
+ORDER BY и индексами, что у PropertyRepository.
+
+Usage: python scripts/benchmark_keyset_pagination.py [--rows 200000] [--page 200] [--per-page 20]
+                                                     [--sort price] [--database-url sqlite:///...]
+"""
+
+import os
+import sys
+import random
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def fill(session, rows):
+    from models import Property
+
+    random.seed(42)
+    started = datetime(2024, 1, 1)
+    batch = []
+    for pid in range(1, rows + 1):
+        batch.append({
+            'id': pid, 'title': f'Квартира {pid}', 'is_active': pid % 25 != 0,
+            # ~500 различных цен — много одинаковых значений, как в реальном каталоге
+            'price': None if pid % 97 == 0 else random.randrange(3_000_000, 28_000_000, 50_000),
+            'area': None if pid % 89 == 0 else round(random.uniform(18, 140), 1),
+            'created_at': started + timedelta(minutes=random.randrange(0, 500_000)),
+        })
+        if len(batch) == 10_000:
+            session.bulk_insert_mappings(Property, batch)
+            batch.clear()
+    if batch:
+        session.bulk_insert_mappings(Property, batch)
+    session.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OFFSET vs keyset пагинация каталога квартир')
+    parser.add_argument('--rows', type=int, default=200_000, help='Квартир в синтетическом каталоге')
+    parser.add_argument('--page', type=int, default=200, help='Глубокая страница для сравнения')
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--sort', default='price', help='price, area или date (меряются ASC и DESC)')
+    parser.add_argument('--repeat', type=int, default=15, help='Повторов каждого замера (берётся медиана)')
+    parser.add_argument('--database-url', default=None,
+                        help='Пустая БД для теста (по умолчанию временный SQLite-файл)')
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    import app  # noqa: F401 — репозиторий берёт db из app
+    from models import db
+    from repositories.property_repository import normalize_sort
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/keyset_benchmark.db"
+    engine = create_engine(database_url)
+    table = db.metadata.tables['properties']
+    table.drop(engine, checkfirst=True)
+    table.create(engine)  # вместе с индексами (price, id), (area, id), (created_at, id)
+
+    sort_by, _ = normalize_sort(args.sort.replace('_', '-').split('-', 1)[0], 'asc')
+    per_page = args.per_page
+
+    with Session(engine) as session:
+        logger.info(f"📦 Filling {args.rows} properties into {engine.url.render_as_string(hide_password=True)}")
+        fill(session, args.rows)
+
+        # ASC и DESC меряются оба: у ASC NULL в конце, и OR с NULL-хвостом ломал диапазон по индексу
+        for sort_order in ('asc', 'desc'):
+            measure(session, sort_by, sort_order, per_page, args.page, args.repeat)
+
+
+def measure(session, sort_by, sort_order, per_page, deep_page, repeat):
+    from models import Property
+    from repositories.property_repository import PropertyRepository, decode_cursor
+
+    def base():
+        return session.query(Property).filter(Property.is_active == True).order_by(
+            *PropertyRepository.sort_clause(sort_by, sort_order))
+
+    def offset_page(page):
+        return [p.id for p in base().offset((page - 1) * per_page).limit(per_page)]
+
+    def keyset_page(after):
+        if after is None:
+            return [p.id for p in base().limit(per_page)]
+        return [p.id for p in PropertyRepository.keyset_page(base(), sort_by, sort_order, after, per_page)]
+
+    # Курсор конца предыдущей страницы — как его вернул бы прошлый запрос (не замеряется)
+    previous_last = base().offset((deep_page - 1) * per_page - 1).limit(1).one()
+    deep_after = decode_cursor(PropertyRepository.cursor_for(previous_last, sort_by, sort_order),
+                               sort_by, sort_order)
+
+    offset_first_ms, first_ids = timed(lambda: offset_page(1), repeat)
+    offset_deep_ms, offset_deep_ids = timed(lambda: offset_page(deep_page), repeat)
+    keyset_first_ms, keyset_first_ids = timed(lambda: keyset_page(None), repeat)
+    keyset_deep_ms, keyset_deep_ids = timed(lambda: keyset_page(deep_after), repeat)
+
+    assert first_ids == keyset_first_ids and offset_deep_ids == keyset_deep_ids, 'pages differ'
+
+    logger.info(f"📊 sort={sort_by}-{sort_order}, per_page={per_page}, median of {repeat}")
+    logger.info(f"   OFFSET  page 1: {offset_first_ms:7.2f} ms   page {deep_page}: {offset_deep_ms:7.2f} ms"
+                f"   (x{offset_deep_ms / max(offset_first_ms, 1e-6):.1f})")
+    logger.info(f"   keyset  page 1: {keyset_first_ms:7.2f} ms   page {deep_page}: {keyset_deep_ms:7.2f} ms"
+                f"   (x{keyset_deep_ms / max(keyset_first_ms, 1e-6):.1f})")
+
+
+if __name__ == '__main__':
+    main()
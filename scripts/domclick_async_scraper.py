@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Новостройки Domclick (через inpars.ru API) на общем асинхронном движке
+services/scraping.py: постраничный обход с лимитом запросов к inpars,
+условные запросы, продолжение после обрыва и запись сразу в БД через
+services/import_engine.py — без промежуточного Excel.
+
+Токен: INPARS_API_TOKEN. Без сети (по записанному кэшу): --offline.
+
+Usage: python scripts/domclick_async_scraper.py [--city-id 23] [--pages N] [--offline]
+                                                [--dry-run] [--reset] [--output file.json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+from typing import Dict, Iterator, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.scraping import (AsyncScraper, Checkpoint, HostPolicy, ImportSink, ScrapeRequest,
+                               ScrapeResponse, default_cache)
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+API_URL = 'https://inpars.ru/api/v2/estate'
+PAGE_SIZE = 500
+DOMCLICK_SOURCE_ID = 22
+MIN_PRICE = 500_000
+MIN_AREA = 10
+CHECKPOINT_PATH = os.path.join('instance', 'scraper_checkpoints', 'domclick_inpars.json')
+
+
+def page_request(city_id: int, last_id: Optional[int] = None, page: int = 1) -> ScrapeRequest:
+    """Страница выдачи: новостройки Domclick, продажа, по возрастанию id (lastId — курсор)"""
+    return ScrapeRequest(API_URL, {
+        'sourceId': DOMCLICK_SOURCE_ID, 'isNew': 1, 'typeAd': 2,
+        'cityId': city_id, 'limit': PAGE_SIZE, 'sortBy': 'id_asc', 'lastId': last_id,
+    }, meta={'page': page})
+
+
+def _floors(value) -> tuple:
+    """'5 из 16' → (5, 16)"""
+    parts = [part.strip() for part in str(value).split('из')]
+    if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+        return int(parts[0]), int(parts[1])
+    return None, None
+
+
+def to_record(item: Dict) -> Optional[Dict]:
+    """Объявление inpars → строка в колонках парсера (как в Excel-выгрузке)"""
+    params = item.get('params2') or {}
+    house = params.get('О доме') or {}
+    developer = params.get('О застройщике') or {}
+    floor, total_floors = _floors((params.get('О квартире') or {}).get('Этаж', ''))
+    record = {
+        'inner_id': f"domclick_{item['id']}",
+        'price': item.get('cost'),
+        'object_area': item.get('sq'),
+        'object_rooms': item.get('rooms'),
+        'object_min_floor': floor or item.get('floor'),
+        'object_max_floor': total_floors or item.get('floors'),
+        'address_display_name': ', '.join(part for part in (item.get('city'), item.get('street')) if part) or None,
+        'address_position_lat': item.get('lat'),
+        'address_position_lon': item.get('lng'),
+        'complex_name': (house.get('Названи новостройки') or '').replace('ЖК «', '').replace('»', '') or None,
+        'developer_name': developer.get('Группа компаний') or developer.get('Застройщик') or None,
+        'photos': item.get('images') or None,
+        'url': item.get('url'),
+        'description': item.get('text'),
+        'deal_type': 'Продажа',
+    }
+    try:
+        if float(record['price'] or 0) <= MIN_PRICE or float(record['object_area'] or 0) <= MIN_AREA:
+            return None
+    except (TypeError, ValueError):
+        return None
+    return record
+
+
+def make_parser(city_id: int, max_pages: Optional[int]):
+    def parse(request: ScrapeRequest, response: ScrapeResponse) -> Iterator:
+        data = response.json()
+        items = data.get('data') or []
+        for item in items:
+            record = to_record(item)
+            if record:
+                yield record
+        page = request.meta.get('page', 1)
+        if len(items) == PAGE_SIZE and (max_pages is None or page < max_pages):
+            yield page_request(city_id, last_id=items[-1]['id'], page=page + 1)
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Domclick через inpars.ru → каталог')
+    parser.add_argument('--city-id', type=int, default=23, help='ID города в inpars (23 — Краснодар)')
+    parser.add_argument('--pages', type=int, default=None, help='Не больше N страниц')
+    parser.add_argument('--offline', action='store_true', help='Только из кэша ответов (без сети)')
+    parser.add_argument('--dry-run', action='store_true', help='Не писать в БД, только отчёт импорта')
+    parser.add_argument('--reset', action='store_true', help='Начать проход заново, забыв контрольную точку')
+    parser.add_argument('--output', help='Сохранить записи в JSON вместо импорта в БД')
+    args = parser.parse_args()
+
+    token = os.environ.get('INPARS_API_TOKEN')
+    if not token and not args.offline:
+        logging.error("❌ INPARS_API_TOKEN не задан")
+        sys.exit(1)
+
+    checkpoint = Checkpoint(CHECKPOINT_PATH)
+    if args.reset or args.offline:
+        checkpoint.reset()
+    scraper_options = dict(
+        parse=make_parser(args.city_id, args.pages),
+        params={'access-token': token} if token else None,
+        cache=default_cache(),
+        checkpoint=checkpoint,
+        # inpars: не больше 1 запроса в секунду на ключ
+        policies={'inpars.ru': HostPolicy(concurrency=1, rate=1.0, burst=1)},
+        offline=args.offline,
+    )
+
+    if args.output:
+        scraper = AsyncScraper(**scraper_options)
+        stats = scraper.run_sync([page_request(args.city_id)])
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(scraper.records, f, ensure_ascii=False, indent=2)
+        logging.info(f"💾 {len(scraper.records)} записей сохранено в {args.output}")
+    else:
+        from app import app
+
+        with app.app_context():
+            sink = ImportSink(dry_run=args.dry_run)
+            stats = AsyncScraper(sink=sink, **scraper_options).run_sync([page_request(args.city_id)])
+            logging.info(f"✅ Импорт: {sink.totals}")
+    logging.info(f"📊 {stats}")
+    sys.exit(1 if stats['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бюджет времени импорта app.py
+Запускает `python -X importtime -c "import app"` в чистом процессе, печатает
+самые медленные модули и завершается с кодом 1, если суммарное время больше
+бюджета или при старте загрузился модуль, который должен импортироваться
+лениво (openai, telegram, qrcode, PIL, pandas).
+
+Usage: python scripts/import_budget.py [--module app] [--budget-ms 2500] [--top 25] [--runs 3]
+"""
+
+import os
+import re
+import sys
+import argparse
+import logging
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = int(os.environ.get('IMPORT_BUDGET_MS', '2500'))
+# Нужны только отдельным страницам / фоновым задачам — при старте воркера не грузятся
+LAZY_MODULES = ('openai', 'telegram', 'qrcode', 'PIL.Image', 'pandas', 'numpy', 'dadata',
+                'nearby_places', 'services.geocoding', 'services.dadata_client')
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def profile(module='app'):
+    """
+    (строки importtime, загруженные модули) для `import <module>` в новом процессе
+    Строка: (self_us, cumulative_us, depth, name)
+    """
+    code = f"import sys, {module}; print('\\n'.join(sorted(sys.modules)))"
+    env = dict(os.environ)
+    env.setdefault('SESSION_SECRET', 'import-budget')
+    env.pop('SCHEMA_AUTO_CREATE', None)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), (len(indent) - 1) // 2, name))
+    return rows, set(result.stdout.split())
+
+
+def check(module='app', budget_ms=DEFAULT_BUDGET_MS, top=25, runs=3):
+    """Лучший из runs замеров против бюджета; список нарушений (пустой — бюджет соблюдён)"""
+    best_ms, best_rows, loaded = None, [], set()
+    for _ in range(max(runs, 1)):
+        rows, loaded = profile(module)
+        total_ms = next((row[1] for row in rows if row[3] == module and row[2] == 0), 0) / 1000
+        if best_ms is None or total_ms < best_ms:
+            best_ms, best_rows = total_ms, rows
+
+    logger.info(f"⏱️ import {module}: {best_ms:.0f} ms (budget {budget_ms} ms), {len(best_rows)} modules")
+    for self_us, cumulative_us, depth, name in sorted(best_rows, key=lambda row: -row[1])[:top]:
+        logger.info(f"   {cumulative_us / 1000:8.1f} ms  {self_us / 1000:7.1f} ms self  {'  ' * depth}{name}")
+
+    violations = []
+    if best_ms > budget_ms:
+        violations.append(f"import {module} took {best_ms:.0f} ms > {budget_ms} ms")
+    for name in LAZY_MODULES:
+        if name in loaded:
+            violations.append(f"{name} is imported at startup, expected lazy import")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка времени импорта приложения')
+    parser.add_argument('--module', default='app', help='Модуль для замера')
+    parser.add_argument('--budget-ms', type=int, default=DEFAULT_BUDGET_MS, help='Бюджет, мс (IMPORT_BUDGET_MS)')
+    parser.add_argument('--top', type=int, default=25, help='Сколько самых медленных модулей показать')
+    parser.add_argument('--runs', type=int, default=3, help='Замеров; берётся лучший')
+    args = parser.parse_args()
+
+    violations = check(args.module, args.budget_ms, args.top, args.runs)
+    for violation in violations:
+        logger.error(f"❌ {violation}")
+    if violations:
+        sys.exit(1)
+    logger.info("✅ Import budget OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Импорт каталога квартир из Excel / CSV / JSON через services/import_engine.py
+Заменяет одноразовые импортёры: повторный запуск на том же файле ничего не
+пишет, --dry-run показывает, что изменится.
+
+Usage: python scripts/import_catalogue.py <file> [--dry-run] [--map id=inner_id ...] [--chunk-size N]
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Импорт каталога квартир')
+    parser.add_argument('file', help='.xlsx, .csv, .tsv, .json или .jsonl')
+    parser.add_argument('--dry-run', action='store_true', help='Ничего не писать, только отчёт об изменениях')
+    parser.add_argument('--map', action='append', default=[], metavar='FROM=TO',
+                        help='Переименовать колонку источника в колонку парсера (можно несколько)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Строк на одну транзакцию')
+    args = parser.parse_args()
+
+    column_map = dict(item.split('=', 1) for item in args.map)
+
+    from app import app
+    from services.import_engine import CHUNK_SIZE, import_catalogue, open_source
+
+    with app.app_context():
+        report = import_catalogue(open_source(args.file, column_map=column_map), dry_run=args.dry_run,
+                                  chunk_size=args.chunk_size or CHUNK_SIZE)
+        print(json.dumps(report.as_dict(), ensure_ascii=False, indent=2, default=str))
+    sys.exit(1 if report.skipped and not (report.inserted or report.updated or report.unchanged) else 0)
+
+
+if __name__ == '__main__':
+    main()
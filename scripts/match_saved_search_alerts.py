@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Подбор уведомлений по сохранённым поискам
+Берёт квартиры, изменённые после прошлого запуска, и создаёт PropertyAlert
+(NEW_LISTING / PRICE_DROP) со статусом 'pending'. Запускать по cron, например
+каждые 10 минут.
+
+Usage: python scripts/match_saved_search_alerts.py [--pending]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Подбор уведомлений по сохранённым поискам')
+    parser.add_argument('--pending', action='store_true', help='Показать алерты, которые пора отправить')
+    args = parser.parse_args()
+
+    from app import app
+    from services.alert_matcher import get_alert_matcher
+
+    with app.app_context():
+        matcher = get_alert_matcher()
+        result = matcher.run()
+        logging.info(f"✅ Готово: {result}")
+
+        if args.pending:
+            batches = matcher.pending_alert_batches()
+            logging.info(f"📬 К отправке: {sum(len(b) for b in batches.values())} алертов по {len(batches)} поискам")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Воркер отправки уведомлений из notification_outbox
+Для деплоя с несколькими gunicorn-воркерами: запустить отдельным процессом
+и выставить NOTIFICATION_WORKER_THREAD=0, чтобы веб-процессы только ставили
+сообщения в очередь.
+
+Usage: python scripts/notification_worker.py [--once] [--stats]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Отправка уведомлений из outbox')
+    parser.add_argument('--once', action='store_true', help='Отправить всё готовое и выйти')
+    parser.add_argument('--stats', action='store_true', help='Показать статистику после отправки')
+    args = parser.parse_args()
+
+    os.environ['NOTIFICATION_WORKER_THREAD'] = '0'
+
+    from app import app
+    from services.notification_dispatcher import get_notification_dispatcher
+
+    with app.app_context():
+        dispatcher = get_notification_dispatcher()
+        if args.once:
+            result = dispatcher.drain()
+            logging.info(f"✅ Готово: {result}")
+        else:
+            logging.info("📨 Notification worker started")
+            dispatcher.start()
+            try:
+                dispatcher._thread.join()
+            except KeyboardInterrupt:
+                dispatcher.stop()
+
+        if args.stats:
+            logging.info(f"📊 {dispatcher.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Прогрев дискового кэша /api/image-proxy
+Рендерит обрезанные фото всех активных квартир и ЖК (WebP + JPEG).
+
+Usage: python scripts/prewarm_image_cache.py [--crop 8] [--workers 4] [--limit N]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Прогрев кэша обрезанных изображений')
+    parser.add_argument('--crop', type=int, default=8, help='Процент обрезки снизу')
+    parser.add_argument('--workers', type=int, default=4, help='Количество потоков')
+    parser.add_argument('--limit', type=int, default=None, help='Ограничить количество URL')
+    args = parser.parse_args()
+
+    from app import app
+    from services.image_cache import get_image_cache, collect_catalogue_image_urls
+
+    with app.app_context():
+        urls = collect_catalogue_image_urls()
+
+    if args.limit:
+        urls = urls[:args.limit]
+
+    logging.info(f"🖼️ Найдено {len(urls)} изображений для прогрева")
+    result = get_image_cache().prewarm(urls, crop=args.crop, workers=args.workers)
+    logging.info(f"✅ Готово: {result}")
+    return result['failed'] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
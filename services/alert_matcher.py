@@ -0,0 +1,540 @@
+"""
+Подбор уведомлений по сохранённым поискам (SavedSearch → PropertyAlert)
+
+Вместо «каждый поиск × каждая квартира» запросами:
+
+1. Все активные SavedSearch компилируются в SavedSearchIndex: диапазоны
+   (цена, площадь, этаж, кэшбек) — колонки NumPy, точечные условия
+   (комнаты, застройщик, ЖК, район) — инвертированные списки
+   «значение → позиции поисков» плюс список поисков без условия.
+2. Берутся только квартиры, созданные / изменённые после прошлого запуска
+   (AlertMatcherRun); прошлая цена — из AlertPriceMark. Отсюда события
+   NEW_LISTING и PRICE_DROP.
+3. Для квартиры кандидаты берутся из самого узкого инвертированного списка,
+   остальные условия проверяются векторно только по кандидатам.
+4. Алерты вставляются пачкой со статусом 'pending'; дубли отсекает
+   проверка по (saved_search_id, property_id, alert_type) одним запросом.
+   instant-поиски сверх дневного лимита уходят в ежедневную сводку.
+
+Отправка — pending_alert_batches(): instant сразу, daily/weekly не чаще
+раза в сутки / неделю на поиск.
+"""
+
+import json
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ALERT_NEW_LISTING = 'NEW_LISTING'
+ALERT_PRICE_DROP = 'PRICE_DROP'
+
+# Лимит instant-уведомлений на поиск в сутки (остальное — в daily-сводку)
+INSTANT_DAILY_CAP = 15
+
+FREQUENCY_INTERVALS = {
+    'instant': timedelta(0),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+}
+
+TERM_DIMENSIONS = ('rooms', 'developer', 'complex', 'district')
+RANGE_DIMENSIONS = ('price', 'area', 'floor')
+
+# Ключи additional_filters (как в URL каталога и в форме сохранения поиска)
+_RANGE_KEYS = {
+    'price': (('price_min', 'priceFrom', 'price_from'), ('price_max', 'priceTo', 'price_to')),
+    'area': (('area_min', 'areaFrom', 'area_from', 'size_min'), ('area_max', 'areaTo', 'area_to', 'size_max')),
+    'floor': (('floor_min', 'floorFrom', 'floor_from'), ('floor_max', 'floorTo', 'floor_to')),
+}
+_TERM_KEYS = {
+    'rooms': ('rooms', 'property_type'),
+    'developer': ('developer', 'developers', 'developer_id'),
+    'complex': ('residential_complex', 'complex_name', 'complex', 'complexes', 'complex_id'),
+    'district': ('district', 'districts', 'district_id', 'location'),
+}
+
+CHUNK_SIZE = 1000
+
+
+def normalize_name(value: Any) -> str:
+    return str(value).strip().lower().replace('ё', 'е')
+
+
+def _term(value: Any) -> Optional[str]:
+    """Значение фильтра → ключ терма: 'id:5' для чисел, иначе 'name:...'"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()):
+        return f'id:{int(value)}'
+    return f'name:{normalize_name(value)}'
+
+
+def _room_term(value: Any) -> Optional[str]:
+    """'2-комн' → '2', 'студия' → '0', '4+' → '4+' (как parse_room_filter в каталоге)"""
+    if value is None or value == '':
+        return None
+    room_str = str(value).lower().strip()
+    if room_str in ('студия', 'studio'):
+        return '0'
+    if room_str.startswith('4+'):
+        return '4+'
+    if '-комн' in room_str:
+        room_str = room_str.split('-')[0]
+    try:
+        return str(int(room_str))
+    except ValueError:
+        return None
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    if isinstance(value, str) and ',' in value:
+        return [part for part in value.split(',') if part.strip()]
+    return [value]
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(str(value).replace(' ', '').replace(',', '.')) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def compile_search(search: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    SavedSearch (dict колонок) → условия для индекса
+
+    Колонки модели приоритетнее одноимённых ключей additional_filters.
+    Цена меньше 1000 трактуется как миллионы — как в фильтре каталога.
+    """
+    filters = search.get('additional_filters') or {}
+    if isinstance(filters, str):
+        try:
+            filters = json.loads(filters)
+        except ValueError:
+            filters = {}
+    if not isinstance(filters, dict):
+        filters = {}
+
+    columns = {
+        'price': (search.get('price_min'), search.get('price_max')),
+        'area': (search.get('size_min'), search.get('size_max')),
+        'floor': (search.get('floor_min'), search.get('floor_max')),
+    }
+
+    compiled: Dict[str, Any] = {}
+    for dim, (min_keys, max_keys) in _RANGE_KEYS.items():
+        column_lo, column_hi = columns[dim]
+        lo = _number(column_lo) if column_lo is not None else next(
+            (_number(filters[k]) for k in min_keys if filters.get(k) not in (None, '')), None)
+        hi = _number(column_hi) if column_hi is not None else next(
+            (_number(filters[k]) for k in max_keys if filters.get(k) not in (None, '')), None)
+        if dim == 'price':
+            lo = lo * 1_000_000 if lo is not None and 0 < lo < 1000 else lo
+            hi = hi * 1_000_000 if hi is not None and 0 < hi < 1000 else hi
+        compiled[dim] = (-np.inf if lo is None else lo, np.inf if hi is None else hi)
+
+    cashback = search.get('cashback_min')
+    if cashback is None:
+        cashback = filters.get('cashback_min')
+    compiled['cashback'] = _number(cashback) or -np.inf
+
+    column_terms = {
+        'rooms': search.get('property_type'),
+        'developer': search.get('developer'),
+        'complex': search.get('complex_name'),
+        'district': search.get('location'),
+    }
+    for dim, keys in _TERM_KEYS.items():
+        values = _as_list(column_terms[dim]) or [v for key in keys for v in _as_list(filters.get(key))]
+        parse = _room_term if dim == 'rooms' else _term
+        terms = {term for term in (parse(v) for v in values) if term}
+        compiled[dim] = terms or None
+
+    return compiled
+
+
+def property_terms(prop: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Ключи квартиры для инвертированных списков"""
+    terms: Dict[str, List[str]] = {}
+    rooms = prop.get('rooms')
+    terms['rooms'] = [] if rooms is None else [str(int(rooms))] + (['4+'] if rooms >= 4 else [])
+    for dim in ('developer', 'complex', 'district'):
+        keys = []
+        if prop.get(f'{dim}_id') is not None:
+            keys.append(f"id:{int(prop[f'{dim}_id'])}")
+        if prop.get(f'{dim}_name'):
+            keys.append(f"name:{normalize_name(prop[f'{dim}_name'])}")
+        terms[dim] = keys
+    return terms
+
+
+class SavedSearchIndex:
+    """
+    Инвертированный индекс сохранённых поисков
+
+    Использование:
+        index = SavedSearchIndex([(search_id, compile_search(row), created_at), ...])
+        search_ids = index.match({'price': ..., 'rooms': 2, 'developer_id': 1, ...})
+    """
+
+    def __init__(self, entries: Iterable[Tuple[int, Dict[str, Any], Optional[datetime]]]):
+        entries = list(entries)
+        size = len(entries)
+        self.search_ids = np.array([search_id for search_id, _, _ in entries], dtype=np.int64)
+        self.created_at = np.array([_to_epoch(created_at) for _, _, created_at in entries], dtype=np.float64)
+
+        self.lo = {dim: np.array([c[dim][0] for _, c, _ in entries], dtype=np.float64) for dim in RANGE_DIMENSIONS}
+        self.hi = {dim: np.array([c[dim][1] for _, c, _ in entries], dtype=np.float64) for dim in RANGE_DIMENSIONS}
+        self.cashback_min = np.array([c['cashback'] for _, c, _ in entries], dtype=np.float64)
+
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {}
+        self.wildcard: Dict[str, np.ndarray] = {}
+        self.wildcard_mask: Dict[str, np.ndarray] = {}
+        for dim in TERM_DIMENSIONS:
+            postings = defaultdict(list)
+            wildcard = []
+            for position, (_, compiled, _) in enumerate(entries):
+                if compiled[dim] is None:
+                    wildcard.append(position)
+                else:
+                    for term in compiled[dim]:
+                        postings[term].append(position)
+            self.postings[dim] = {term: np.array(positions, dtype=np.int64) for term, positions in postings.items()}
+            self.wildcard[dim] = np.array(wildcard, dtype=np.int64)
+            self.wildcard_mask[dim] = np.zeros(size, dtype=bool)
+            self.wildcard_mask[dim][self.wildcard[dim]] = True
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def _accepts(self, dim: str, keys: List[str]) -> np.ndarray:
+        """Маска по всем поискам: без условия по измерению или значение квартиры в их списке"""
+        accepts = self.wildcard_mask[dim].copy()
+        for key in keys:
+            posting = self.postings[dim].get(key)
+            if posting is not None:
+                accepts[posting] = True
+        return accepts
+
+    def match(self, prop: Dict[str, Any], created_after: Optional[datetime] = None) -> np.ndarray:
+        """
+        id поисков, под которые подходит квартира
+
+        Args:
+            prop: price, area, floor, rooms, cashback_rate, {developer,complex,district}_{id,name}
+            created_after: только поиски, созданные не позже этого момента (NEW_LISTING)
+        """
+        if self.size == 0:
+            return self.search_ids[:0]
+        terms = property_terms(prop)
+
+        # Кандидаты — из самого узкого измерения: wildcard + списки значений квартиры
+        sizes = {
+            dim: self.wildcard[dim].size + sum(self.postings[dim][k].size for k in terms[dim] if k in self.postings[dim])
+            for dim in TERM_DIMENSIONS
+        }
+        narrowest = min(sizes, key=sizes.get)
+        positions = np.flatnonzero(self._accepts(narrowest, terms[narrowest]))
+
+        for dim in TERM_DIMENSIONS:
+            if dim != narrowest and positions.size:
+                positions = positions[self._accepts(dim, terms[dim])[positions]]
+
+        if positions.size:
+            mask = np.ones(positions.size, dtype=bool)
+            for dim in RANGE_DIMENSIONS:
+                lo = self.lo[dim][positions]
+                hi = self.hi[dim][positions]
+                value = prop.get(dim)
+                if value is None:
+                    # Без значения подходят только поиски без ограничения
+                    mask &= np.isneginf(lo) & np.isposinf(hi)
+                else:
+                    mask &= (lo <= value) & (value <= hi)
+            cashback = prop.get('cashback_rate')
+            mask &= self.cashback_min[positions] <= (cashback if cashback is not None else -np.inf)
+            if created_after is not None:
+                mask &= self.created_at[positions] <= _to_epoch(created_after)
+            positions = positions[mask]
+
+        return self.search_ids[positions]
+
+
+def _to_epoch(value: Optional[datetime]) -> float:
+    return value.timestamp() if isinstance(value, datetime) else -np.inf
+
+
+def _chunks(items: List[Any], size: int = CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class AlertMatcher:
+    """Инкрементальный подбор алертов по изменённым квартирам"""
+
+    def __init__(self, session=None):
+        self._session = session
+        self.stats = {'runs': 0, 'alerts_created': 0, 'last_run_ms': 0}
+
+    @property
+    def session(self):
+        if self._session is not None:
+            return self._session
+        from app import db
+        return db.session
+
+    # ------------------------------------------------------------------
+    # Загрузка
+    # ------------------------------------------------------------------
+
+    def load_searches(self) -> Tuple[SavedSearchIndex, Dict[int, Dict[str, Any]]]:
+        """Активные поиски квартир → индекс и настройки отправки"""
+        from models import SavedSearch
+
+        rows = (
+            self.session.query(
+                SavedSearch.id, SavedSearch.user_id, SavedSearch.created_at,
+                SavedSearch.price_min, SavedSearch.price_max, SavedSearch.size_min, SavedSearch.size_max,
+                SavedSearch.floor_min, SavedSearch.floor_max, SavedSearch.cashback_min,
+                SavedSearch.property_type, SavedSearch.developer, SavedSearch.complex_name,
+                SavedSearch.location, SavedSearch.additional_filters,
+                SavedSearch.alert_frequency, SavedSearch.alert_channels,
+                SavedSearch.alert_count_today, SavedSearch.alert_count_reset_date,
+            )
+            .filter(
+                SavedSearch.alert_enabled == True,
+                SavedSearch.alert_frequency.in_(list(FREQUENCY_INTERVALS)),
+                (SavedSearch.search_type == 'properties') | (SavedSearch.search_type.is_(None)),
+            )
+            .all()
+        )
+
+        entries = []
+        settings = {}
+        for row in rows:
+            entries.append((row.id, compile_search(row._asdict()), row.created_at))
+            try:
+                channels = json.loads(row.alert_channels) if row.alert_channels else ['email']
+            except ValueError:
+                channels = ['email']
+            settings[row.id] = {
+                'user_id': row.user_id,
+                'frequency': row.alert_frequency,
+                'channel': (channels or ['email'])[0],
+                'count_today': row.alert_count_today or 0,
+                'reset_date': row.alert_count_reset_date,
+            }
+        return SavedSearchIndex(entries), settings
+
+    def changed_properties(self, since: datetime) -> List[Dict[str, Any]]:
+        """Активные квартиры, созданные или изменённые после since, с прошлой ценой"""
+        from models import Property, ResidentialComplex, Developer, District, AlertPriceMark
+
+        rows = (
+            self.session.query(
+                Property.id, Property.price, Property.area, Property.floor, Property.rooms,
+                Property.created_at, Property.developer_id, Property.complex_id, Property.district_id,
+                Developer.name.label('developer_name'),
+                ResidentialComplex.name.label('complex_name'),
+                ResidentialComplex.cashback_rate,
+                District.name.label('district_name'),
+                AlertPriceMark.price.label('previous_price'),
+                AlertPriceMark.property_id.label('seen'),
+            )
+            .outerjoin(Developer, Developer.id == Property.developer_id)
+            .outerjoin(ResidentialComplex, ResidentialComplex.id == Property.complex_id)
+            .outerjoin(District, District.id == Property.district_id)
+            .outerjoin(AlertPriceMark, AlertPriceMark.property_id == Property.id)
+            .filter(
+                Property.is_active == True,
+                (Property.created_at > since) | (Property.updated_at > since),
+            )
+            .all()
+        )
+        return [row._asdict() for row in rows]
+
+    def _existing_alerts(self, property_ids: List[int]) -> set:
+        from models import PropertyAlert
+
+        existing = set()
+        for chunk in _chunks(property_ids):
+            existing.update(
+                self.session.query(PropertyAlert.saved_search_id, PropertyAlert.property_id, PropertyAlert.alert_type)
+                .filter(PropertyAlert.property_id.in_(chunk))
+                .all()
+            )
+        return {tuple(row) for row in existing}
+
+    # ------------------------------------------------------------------
+    # Запуск
+    # ------------------------------------------------------------------
+
+    def last_run(self):
+        from models import AlertMatcherRun
+        return (
+            self.session.query(AlertMatcherRun)
+            .filter(AlertMatcherRun.finished_at.isnot(None))
+            .order_by(AlertMatcherRun.started_at.desc())
+            .first()
+        )
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Один проход: изменённые квартиры → события → алерты (commit)
+
+        Первый запуск только запоминает цены, иначе весь каталог
+        пришёл бы пользователям как «новые объекты».
+        """
+        from models import AlertMatcherRun, AlertPriceMark, Property, PropertyAlert, SavedSearch
+
+        started = time.time()
+        now = now or datetime.utcnow()
+        session = self.session
+        previous = self.last_run()
+        current = AlertMatcherRun(started_at=now)
+        session.add(current)
+
+        if previous is None:
+            marks = session.query(Property.id, Property.price).filter(Property.is_active == True).all()
+            session.query(AlertPriceMark).delete(synchronize_session=False)
+            session.bulk_insert_mappings(AlertPriceMark, [
+                {'property_id': pid, 'price': price, 'seen_at': now} for pid, price in marks
+            ])
+            current.properties_checked = len(marks)
+            current.finished_at = datetime.utcnow()
+            session.commit()
+            logger.info(f"📬 Alert matcher initialised: {len(marks)} price marks")
+            return {'properties': len(marks), 'events': 0, 'alerts': 0, 'searches': 0}
+
+        changed = self.changed_properties(previous.started_at)
+        events = []
+        for prop in changed:
+            if prop['seen'] is None:
+                events.append((ALERT_NEW_LISTING, prop))
+            elif prop['price'] and prop['previous_price'] and prop['price'] < prop['previous_price']:
+                events.append((ALERT_PRICE_DROP, prop))
+
+        index, settings = self.load_searches() if events else (SavedSearchIndex([]), {})
+        existing = self._existing_alerts([prop['id'] for _, prop in events]) if events else set()
+
+        today = now.date()
+        counters = {}
+        alerts = []
+        for alert_type, prop in events:
+            created_after = prop['created_at'] if alert_type == ALERT_NEW_LISTING else None
+            for search_id in index.match(prop, created_after=created_after):
+                search_id = int(search_id)
+                if (search_id, prop['id'], alert_type) in existing:
+                    continue
+                existing.add((search_id, prop['id'], alert_type))
+                search = settings[search_id]
+
+                frequency = search['frequency']
+                if frequency == 'instant':
+                    count = counters.get(search_id)
+                    if count is None:
+                        count = search['count_today'] if search['reset_date'] == today else 0
+                    if count >= INSTANT_DAILY_CAP:
+                        frequency = 'daily'
+                    else:
+                        counters[search_id] = count + 1
+
+                alert = {
+                    'saved_search_id': search_id,
+                    'property_id': prop['id'],
+                    'user_id': search['user_id'],
+                    'alert_type': alert_type,
+                    'alert_frequency': frequency,
+                    'property_price_at_send': prop['price'],
+                    'delivery_channel': search['channel'],
+                    'delivery_status': 'pending',
+                    'sent_at': None,
+                }
+                if alert_type == ALERT_PRICE_DROP:
+                    drop = prop['previous_price'] - prop['price']
+                    alert['price_drop_amount'] = drop
+                    alert['price_drop_percentage'] = round(drop / prop['previous_price'] * 100, 2)
+                alerts.append(alert)
+
+        for chunk in _chunks(alerts):
+            session.bulk_insert_mappings(PropertyAlert, chunk)
+        if counters:
+            session.bulk_update_mappings(SavedSearch, [
+                {'id': search_id, 'alert_count_today': count, 'alert_count_reset_date': today}
+                for search_id, count in counters.items()
+            ])
+
+        # Запоминаем текущие цены изменённых квартир
+        session.bulk_insert_mappings(AlertPriceMark, [
+            {'property_id': prop['id'], 'price': prop['price'], 'seen_at': now}
+            for prop in changed if prop['seen'] is None
+        ])
+        session.bulk_update_mappings(AlertPriceMark, [
+            {'property_id': prop['id'], 'price': prop['price'], 'seen_at': now}
+            for prop in changed if prop['seen'] is not None and prop['price'] != prop['previous_price']
+        ])
+
+        current.properties_checked = len(changed)
+        current.searches_indexed = len(index)
+        current.alerts_created = len(alerts)
+        current.finished_at = datetime.utcnow()
+        session.commit()
+
+        elapsed_ms = (time.time() - started) * 1000
+        self.stats['runs'] += 1
+        self.stats['alerts_created'] += len(alerts)
+        self.stats['last_run_ms'] = round(elapsed_ms)
+        logger.info(f"📬 Alert matcher: {len(changed)} changed properties, {len(events)} events, "
+                    f"{len(index)} searches → {len(alerts)} alerts in {elapsed_ms:.0f} ms")
+        return {'properties': len(changed), 'events': len(events), 'alerts': len(alerts), 'searches': len(index)}
+
+    def pending_alert_batches(self, now: Optional[datetime] = None) -> Dict[int, List[Any]]:
+        """
+        Алерты 'pending', которые пора отправить: {saved_search_id: [PropertyAlert]}
+        instant — сразу; daily / weekly — если с last_alert_sent прошли сутки / неделя
+        """
+        from models import PropertyAlert, SavedSearch
+
+        now = now or datetime.utcnow()
+        rows = (
+            self.session.query(PropertyAlert, SavedSearch.last_alert_sent)
+            .join(SavedSearch, SavedSearch.id == PropertyAlert.saved_search_id)
+            .filter(PropertyAlert.delivery_status == 'pending', SavedSearch.alert_enabled == True)
+            .order_by(PropertyAlert.saved_search_id, PropertyAlert.id)
+            .all()
+        )
+        batches: Dict[int, List[Any]] = defaultdict(list)
+        for alert, last_sent in rows:
+            interval = FREQUENCY_INTERVALS.get(alert.alert_frequency)
+            if interval is None:
+                continue
+            if interval and last_sent and now - last_sent < interval:
+                continue
+            batches[alert.saved_search_id].append(alert)
+        return dict(batches)
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+# Глобальный экземпляр
+_alert_matcher = None
+
+
+def get_alert_matcher() -> AlertMatcher:
+    """Получить singleton экземпляр AlertMatcher"""
+    global _alert_matcher
+    if _alert_matcher is None:
+        _alert_matcher = AlertMatcher()
+    return _alert_matcher
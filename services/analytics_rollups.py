@@ -0,0 +1,443 @@
+"""
+Свёртки для дашбордов админки и менеджера (таблица analytics_rollups)
+
+Раньше /admin/dashboard делал десяток отдельных count() и суммировал
+кешбек, загружая все одобренные и выплаченные заявки в Python, а
+/admin/analytics/cashback и /manager/analytics на каждый показ гоняли
+date_trunc GROUP BY по всей истории. Теперь:
+
+1. Счётчики хранятся по дням и месяцам: (метрика, период, измерение, статус)
+   → количество и сумма. Метрики — заявки на кешбек, обратные звонки,
+   подборки и клиенты.
+2. При flush изменённых строк их вклад (день, измерение, статус, сумма)
+   читается до и после записи; разница копится в session.info и после
+   commit отдельной транзакцией прибавляется к дневным и месячным строкам
+   через INSERT … ON CONFLICT DO UPDATE SET count = count + excluded.count.
+   Транзакция пользователя свёртки не трогает, параллельные commit одного
+   дня не конфликтуют.
+3. Дашборд читает месячные строки одним запросом — время не зависит
+   от объёма истории и ничего не пишет.
+4. Первичная сборка — ensure_rollups() из `flask init-db`; полная пересборка —
+   rebuild_rollups() или `python -m services.analytics_rollups --rebuild`
+   (по расписанию или после правок мимо ORM).
+"""
+
+import logging
+import time
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import String, and_, case, cast, delete, event, func, insert, inspect, literal, or_, select
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+GRAIN_DAY = 'day'
+GRAIN_MONTH = 'month'
+
+# Модель → метрика и поля, от которых зависят её счётчики
+TRACKED_MODELS = {
+    'CashbackApplication': ('applications', ('status', 'cashback_amount', 'created_at')),
+    'CallbackRequest': ('callbacks', ('status', 'notes', 'created_at')),
+    'Collection': ('collections', ('status', 'created_by_manager_id', 'created_at')),
+    'User': ('clients', ('client_status', 'assigned_manager_id', 'created_at')),
+}
+METRICS = tuple(metric for metric, _ in TRACKED_MODELS.values())
+
+CASHBACK_DIMENSION = 'cashback'  # обратные звонки по кешбеку (notes содержит «кешбек»)
+
+MonthlyStat = namedtuple('MonthlyStat', ['month', 'count', 'total_amount'])
+StatusStat = namedtuple('StatusStat', ['status', 'count', 'total_amount'])
+# Шаблон менеджера распаковывает пары (month, count) и берёт map(attribute='count')
+MonthlyCount = namedtuple('MonthlyCount', ['month', 'count'])
+StatusCount = namedtuple('StatusCount', ['status', 'count'])
+
+_PENDING_KEY = 'analytics_rollups_pending'  # {(метрика, день, измерение, статус): [count, amount]}
+
+
+def _default_session():
+    from app import db
+    return db.session
+
+
+def _metric_source(metric: str):
+    """(модель, измерение, статус, сумма) — SQL-выражения для группировки"""
+    import models
+
+    if metric == 'applications':
+        model = models.CashbackApplication
+        return model, literal(''), model.status, model.cashback_amount
+    if metric == 'callbacks':
+        model = models.CallbackRequest
+        dimension = case((model.notes.contains('кешбек'), CASHBACK_DIMENSION), else_='')
+        return model, dimension, model.status, literal(0)
+    if metric == 'collections':
+        model = models.Collection
+        return model, cast(model.created_by_manager_id, String), model.status, literal(0)
+    if metric == 'clients':
+        model = models.User
+        return model, cast(model.assigned_manager_id, String), model.client_status, literal(0)
+    raise ValueError(f"Unknown metric: {metric}")
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def compute_daily(metric: str, days: Optional[Iterable[date]] = None, session=None) -> List[Dict]:
+    """
+    Посчитать дневные счётчики метрики из исходной таблицы
+
+    Args:
+        days: только эти дни; None — вся история
+    """
+    session = session or _default_session()
+    model, dimension, status, amount = _metric_source(metric)
+    day = func.date(model.created_at)
+    query = select(
+        day.label('day'),
+        dimension.label('dimension'),
+        status.label('status'),
+        func.count(model.id).label('count'),
+        func.coalesce(func.sum(amount), 0).label('amount'),
+    ).where(model.created_at.isnot(None))
+    if days is not None:
+        days = sorted(set(days))
+        if not days:
+            return []
+        query = query.where(or_(*[
+            and_(model.created_at >= datetime.combine(d, datetime.min.time()),
+                 model.created_at < datetime.combine(d + timedelta(days=1), datetime.min.time()))
+            for d in days
+        ]))
+    query = query.group_by(day, dimension, status)
+
+    return [{
+        'grain': GRAIN_DAY,
+        'metric': metric,
+        'period_start': _as_date(row.day),
+        'dimension': row.dimension or '',
+        'status': row.status or '',
+        'count': row.count,
+        'amount': int(row.amount or 0),
+    } for row in session.execute(query)]
+
+
+def _replace(session, grain: str, metric: str, periods: Optional[Set[date]], rows: List[Dict]):
+    from models import AnalyticsRollup
+
+    table = AnalyticsRollup.__table__
+    statement = delete(table).where(table.c.grain == grain, table.c.metric == metric)
+    if periods is not None:
+        statement = statement.where(table.c.period_start.in_(sorted(periods)))
+    session.execute(statement)
+    if rows:
+        session.execute(insert(table), rows)
+
+
+def _refresh_months(session, metric: str, months: Set[date]):
+    """Месячные строки = сумма дневных строк этих месяцев"""
+    from models import AnalyticsRollup
+
+    table = AnalyticsRollup.__table__
+    totals = defaultdict(lambda: [0, 0])
+    if months:
+        ranges = [and_(table.c.period_start >= m, table.c.period_start < _next_month(m)) for m in months]
+        for row in session.execute(
+            select(table.c.period_start, table.c.dimension, table.c.status, table.c.count, table.c.amount)
+            .where(table.c.grain == GRAIN_DAY, table.c.metric == metric, or_(*ranges))
+        ):
+            bucket = totals[(_month_start(_as_date(row.period_start)), row.dimension, row.status)]
+            bucket[0] += row.count
+            bucket[1] += row.amount
+
+    rows = [{
+        'grain': GRAIN_MONTH, 'metric': metric, 'period_start': month,
+        'dimension': dimension, 'status': status, 'count': count, 'amount': amount,
+    } for (month, dimension, status), (count, amount) in totals.items()]
+    _replace(session, GRAIN_MONTH, metric, months, rows)
+
+
+def rebuild_rollups(session=None) -> int:
+    """Полная пересборка analytics_rollups с commit; возвращает количество дневных строк"""
+    session = session or _default_session()
+    started = time.time()
+    total = 0
+    for metric in METRICS:
+        rows = compute_daily(metric, session=session)
+        _replace(session, GRAIN_DAY, metric, None, rows)
+        months = {_month_start(row['period_start']) for row in rows}
+        _replace(session, GRAIN_MONTH, metric, None, [])
+        _refresh_months(session, metric, months)
+        total += len(rows)
+    session.commit()
+    logger.info(f"✅ analytics_rollups rebuilt: {total} daily rows in {(time.time() - started) * 1000:.0f} ms")
+    return total
+
+
+def ensure_rollups(session=None) -> bool:
+    """Собрать пустую analytics_rollups из истории (`flask init-db`, первый деплой); True — если собирали"""
+    from models import AnalyticsRollup
+
+    session = session or _default_session()
+    if session.query(AnalyticsRollup.metric).first() is not None:
+        return False
+    logger.info("📊 analytics_rollups is empty, building from history")
+    rebuild_rollups(session=session)
+    return True
+
+
+# ----------------------------------------------------------------------
+# Чтение
+# ----------------------------------------------------------------------
+
+def admin_dashboard_stats(session=None) -> Dict[str, int]:
+    """Все счётчики /admin/dashboard одним запросом"""
+    from models import AnalyticsRollup as R, User, Manager
+
+    session = session or _default_session()
+
+    def total(condition, column=R.count):
+        return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+    applications = R.metric == 'applications'
+    callbacks = R.metric == 'callbacks'
+    rollups = select(
+        total(applications).label('total_applications'),
+        total(and_(applications, R.status == 'На рассмотрении')).label('pending_applications'),
+        total(and_(applications, R.status == 'Одобрена')).label('approved_applications'),
+        total(and_(applications, R.status == 'Выплачена')).label('paid_applications'),
+        total(and_(applications, R.status == 'Одобрена'), R.amount).label('total_cashback_approved'),
+        total(and_(applications, R.status == 'Выплачена'), R.amount).label('total_cashback_paid'),
+        total(and_(callbacks, R.dimension == CASHBACK_DIMENSION)).label('cashback_requests'),
+        total(and_(callbacks, R.status == 'Новая')).label('new_requests'),
+    ).where(R.grain == GRAIN_MONTH, R.metric.in_(('applications', 'callbacks'))).subquery()
+
+    row = session.execute(select(
+        select(func.count(User.id)).scalar_subquery().label('total_users'),
+        select(func.count(User.id)).where(User.is_active == True).scalar_subquery().label('active_users'),
+        select(func.count(Manager.id)).scalar_subquery().label('total_managers'),
+        select(func.count(Manager.id)).where(Manager.is_active == True).scalar_subquery().label('active_managers'),
+        *rollups.c,
+    )).mappings().first()
+    return {key: int(value or 0) for key, value in row.items()}
+
+
+def _month_rows(metric: str, dimension: Optional[str] = None, session=None):
+    from models import AnalyticsRollup as R
+
+    session = session or _default_session()
+    query = select(R.period_start, R.dimension, R.status, R.count, R.amount).where(
+        R.grain == GRAIN_MONTH, R.metric == metric)
+    if dimension is not None:
+        query = query.where(R.dimension == dimension)
+    return session.execute(query).all()
+
+
+def _monthly(rows) -> List[MonthlyStat]:
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        totals[_as_date(row.period_start)][0] += row.count
+        totals[_as_date(row.period_start)][1] += row.amount
+    return [MonthlyStat(month, count, amount) for month, (count, amount) in sorted(totals.items())]
+
+
+def _by_status(rows) -> List[StatusStat]:
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        totals[row.status][0] += row.count
+        totals[row.status][1] += row.amount
+    return [StatusStat(status or None, count, amount) for status, (count, amount) in sorted(totals.items())]
+
+
+def monthly_series(metric: str, dimension: Optional[str] = None, session=None) -> List[MonthlyStat]:
+    """[(month, count, total_amount)] по возрастанию месяца"""
+    return _monthly(_month_rows(metric, dimension, session))
+
+
+def status_breakdown(metric: str, dimension: Optional[str] = None, session=None) -> List[StatusStat]:
+    """[(status, count, total_amount)] за всю историю"""
+    return _by_status(_month_rows(metric, dimension, session))
+
+
+def manager_dashboard_stats(manager_id: int, session=None) -> Dict:
+    """Счётчики /manager/analytics одним запросом по месячным строкам менеджера"""
+    from models import AnalyticsRollup as R
+
+    session = session or _default_session()
+    rows = session.execute(
+        select(R.metric, R.period_start, R.dimension, R.status, R.count, R.amount)
+        .where(R.grain == GRAIN_MONTH, R.metric.in_(('clients', 'collections')), R.dimension == str(manager_id))
+    ).all()
+    clients = [row for row in rows if row.metric == 'clients']
+    collections = [row for row in rows if row.metric == 'collections']
+    return {
+        'clients_count': sum(row.count for row in clients),
+        'collections_count': sum(row.count for row in collections),
+        'sent_collections': sum(row.count for row in collections if row.status == 'Отправлена'),
+        'monthly_collections': [MonthlyCount(stat.month, stat.count) for stat in _monthly(collections)],
+        'client_stats': [StatusCount(stat.status, stat.count) for stat in _by_status(clients)],
+    }
+
+
+# ----------------------------------------------------------------------
+# Отслеживание изменений
+# ----------------------------------------------------------------------
+
+def _dialect_insert(connection):
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise RuntimeError(f"Upsert is not supported for {dialect}")
+    return dialect_insert
+
+
+def apply_increments(bind, deltas: Dict[tuple, List[int]]) -> int:
+    """
+    Прибавить дельты к дневным и месячным строкам отдельной транзакцией
+
+    Args:
+        bind: engine (не сессия пользователя — её транзакция уже закрыта)
+        deltas: {(метрика, день, измерение, статус): [count, amount]}
+
+    Returns:
+        Количество изменённых строк analytics_rollups
+    """
+    from models import AnalyticsRollup
+
+    totals = defaultdict(lambda: [0, 0])
+    for (metric, day, dimension, status), (count, amount) in deltas.items():
+        for grain, period in ((GRAIN_DAY, day), (GRAIN_MONTH, _month_start(day))):
+            bucket = totals[(grain, metric, period, dimension, status)]
+            bucket[0] += count
+            bucket[1] += amount
+    # Постоянный порядок ключей — параллельные транзакции блокируют строки в одной последовательности
+    rows = [{
+        'grain': grain, 'metric': metric, 'period_start': period,
+        'dimension': dimension, 'status': status, 'count': count, 'amount': amount,
+    } for (grain, metric, period, dimension, status), (count, amount) in sorted(totals.items()) if count or amount]
+    if not rows:
+        return 0
+
+    table = AnalyticsRollup.__table__
+    with bind.begin() as connection:
+        statement = _dialect_insert(connection)(table)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=list(table.primary_key),
+            set_={'count': table.c.count + statement.excluded.count,
+                  'amount': table.c.amount + statement.excluded.amount},
+        ), rows)
+        # Группа опустела (заявку удалили, сменили статус) — строки как после rebuild_rollups() нет
+        connection.execute(delete(table).where(
+            table.c.count == 0, table.c.metric.in_(sorted({row['metric'] for row in rows}))))
+    return len(rows)
+
+
+def _counted_ids(session, objects) -> Dict[str, Set[int]]:
+    """{метрика: id} объектов, чей вклад в счётчики мог измениться"""
+    ids = defaultdict(set)
+    for obj in objects:
+        tracked = TRACKED_MODELS.get(type(obj).__name__)
+        if not tracked or obj.id is None:
+            continue
+        metric, fields = tracked
+        state = inspect(obj)
+        if state.persistent and obj not in session.deleted and \
+                not any(state.attrs[field].history.has_changes() for field in fields):
+            continue
+        ids[metric].add(obj.id)
+    return ids
+
+
+def _add_contributions(session, ids: Dict[str, Set[int]], sign: int):
+    """Прочитать вклад строк (теми же выражениями, что compute_daily) и добавить его в дельты со знаком sign"""
+    deltas = session.info.setdefault(_PENDING_KEY, defaultdict(lambda: [0, 0]))
+    for metric, metric_ids in ids.items():
+        model, dimension, status, amount = _metric_source(metric)
+        query = select(
+            func.date(model.created_at).label('day'),
+            dimension.label('dimension'),
+            status.label('status'),
+            func.coalesce(amount, 0).label('amount'),
+        ).where(model.id.in_(sorted(metric_ids)), model.created_at.isnot(None))
+        for row in session.execute(query):
+            bucket = deltas[(metric, _as_date(row.day), row.dimension or '', row.status or '')]
+            bucket[0] += sign
+            bucket[1] += sign * int(row.amount or 0)
+
+
+def _before_flush(session, flush_context, instances):
+    # Состояние в БД до записи: вычитаем вклад изменяемых и удаляемых строк
+    ids = _counted_ids(session, list(session.dirty) + list(session.deleted))
+    if ids:
+        _add_contributions(session, ids, -1)
+
+
+def _after_flush(session, flush_context):
+    # new/dirty ещё содержат записанные объекты, id и default уже проставлены
+    ids = _counted_ids(session, list(session.new) + [obj for obj in session.dirty if obj not in session.deleted])
+    if ids:
+        _add_contributions(session, ids, +1)
+
+
+def _after_commit(session):
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if not deltas:
+        return
+    from models import AnalyticsRollup
+
+    try:
+        apply_increments(session.get_bind(mapper=inspect(AnalyticsRollup)), deltas)
+    except Exception as e:
+        logger.error(f"❌ analytics_rollups increment failed, run --rebuild: {e}")
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+_tracking_enabled = False
+
+
+def setup_analytics_rollups_tracking():
+    """
+    Подписаться на события Session: дельты счётчиков при flush, upsert после commit
+    Вызывается один раз при инициализации приложения
+    """
+    global _tracking_enabled
+    if _tracking_enabled:
+        return
+    event.listen(Session, 'before_flush', _before_flush)
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _tracking_enabled = True
+    logger.info("✅ analytics_rollups tracking registered")
+
+
+if __name__ == '__main__':
+    import sys
+    from app import app
+
+    if '--rebuild' not in sys.argv:
+        print("Использование: python -m services.analytics_rollups --rebuild")
+        sys.exit(1)
+    with app.app_context():
+        count = rebuild_rollups()
+    print(f"✅ analytics_rollups: {count} дневных строк")
@@ -4,11 +4,25 @@
 1. Автоматический - при создании каждого объекта (через SQLAlchemy events)
 2. Batch - массовое обогащение пакетами (оптимизировано для импорта)
 3. Асинхронный - фоновая обработка без блокировки (для тысяч объектов)
+
+Автоматический режим отложенный: события SQLAlchemy только запоминают id
+квартир, а после commit их забирает DeferredEnrichmentWorker — HTTP-запросы
+к DaData / Yandex больше не выполняются внутри session.flush() и не держат
+транзакцию импорта открытой.
 """
 
-from sqlalchemy import event
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, bindparam, case, event, or_, select, update
+from sqlalchemy.orm import Session, object_session
 from services.geocoding import get_geocoding_service
 from services.dadata_client import get_dadata_client
+from services.geocode_cache import get_geocode_cache, normalize_address
+from services.response_cache import TAG_CATALOGUE, invalidate_tags, property_tag
 import logging
 
 logger = logging.getLogger(__name__)
@@ -233,36 +247,268 @@ def get_auto_geocoding_service():
     return _auto_geocoding_service
 
 
+# ----------------------------------------------------------------------
+# Отложенное обогащение
+# ----------------------------------------------------------------------
+
+ENRICHED_FIELDS = (
+    'parsed_city', 'parsed_district', 'parsed_street', 'parsed_area',
+    'parsed_settlement', 'parsed_house', 'parsed_block',
+)
+
+
+class DeferredEnrichmentWorker:
+    """
+    Фоновое обогащение квартир по id
+
+    1. Читает адрес / координаты одним запросом на пачку
+    2. Одинаковые адреса (и координаты для квартир без адреса) геокодирует один раз
+    3. Запросы к DaData / Yandex — параллельно в ограниченном пуле,
+       результаты — в постоянном кэше (services/geocode_cache.py)
+    4. Записывает результат одним executemany UPDATE
+
+    Args:
+        engine: SQLAlchemy engine (свои короткие транзакции)
+        max_workers: одновременных запросов к API
+        autostart: запускать фоновый поток при первом submit()
+    """
+
+    def __init__(self, engine, dadata_client=None, geocoding_service=None, cache=None,
+                 max_workers: int = 4, batch_size: int = 200, autostart: bool = True):
+        from models import Property
+
+        self.engine = engine
+        self.table = Property.__table__
+        self.dadata_client = dadata_client or get_dadata_client()
+        self.geocoding_service = geocoding_service or get_geocoding_service()
+        self.cache = cache if cache is not None else get_geocode_cache()
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.autostart = autostart
+        self._queue: 'queue.Queue[List[int]]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'queued': 0, 'processed': 0, 'enriched': 0, 'skipped': 0,
+            'errors': 0, 'lookups': 0, 'cache_hits': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Очередь
+    # ------------------------------------------------------------------
+
+    def submit(self, property_ids: Iterable[int]):
+        ids = sorted({int(pid) for pid in property_ids if pid is not None})
+        if not ids:
+            return
+        self.stats['queued'] += len(ids)
+        self._queue.put(ids)
+        if self.autostart:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='auto_geocoding', daemon=True)
+            self._thread.start()
+
+    def wait(self):
+        """Дождаться обработки всего, что уже в очереди"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            ids = set(self._queue.get())
+            taken = 1
+            # Забираем всё накопленное: импорт присылает id пачками по commit
+            while True:
+                try:
+                    ids.update(self._queue.get_nowait())
+                    taken += 1
+                except queue.Empty:
+                    break
+            try:
+                self.process(ids)
+            except Exception as e:
+                logger.error(f"❌ Deferred geocoding failed: {e}")
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    # ------------------------------------------------------------------
+    # Обработка
+    # ------------------------------------------------------------------
+
+    def _resolve(self, key: tuple) -> Optional[Dict]:
+        """Геокодировать один уникальный адрес / точку (с постоянным кэшем)"""
+        cache_key = f"enrich:{key[0]}:{key[1]}"
+        found, value = self.cache.lookup(cache_key)
+        if found:
+            self.stats['cache_hits'] += 1
+            return value
+
+        self.stats['lookups'] += 1
+        if key[0] == 'address':
+            result = self.dadata_client.enrich_property_address(key[1])
+        else:
+            lat, lon = (float(v) for v in key[1].split(','))
+            result = self.geocoding_service.enrich_property_address(lat, lon)
+        if result:
+            self.cache.set(cache_key, result)
+        return result
+
+    def process(self, property_ids: Iterable[int]) -> Dict[str, int]:
+        """Обогатить квартиры синхронно; возвращает статистику этого вызова"""
+        ids = sorted({int(pid) for pid in property_ids})
+        result = {'processed': 0, 'enriched': 0, 'skipped': 0, 'errors': 0}
+        for start in range(0, len(ids), self.batch_size):
+            chunk_result = self._process_chunk(ids[start:start + self.batch_size])
+            for key in result:
+                result[key] += chunk_result[key]
+        for key in result:
+            self.stats[key] += result[key]
+        return result
+
+    def _process_chunk(self, ids: List[int]) -> Dict[str, int]:
+        t = self.table
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(t.c.id, t.c.address, t.c.latitude, t.c.longitude, t.c.parsed_city, t.c.parsed_area)
+                .where(t.c.id.in_(ids))
+            ).all()
+
+        groups: Dict[tuple, List[int]] = {}
+        skipped = 0
+        for row in rows:
+            if row.parsed_city and row.parsed_area:
+                skipped += 1
+            elif row.address:
+                groups.setdefault(('address', normalize_address(row.address)), []).append(row.id)
+            elif row.latitude and row.longitude:
+                point = f"{round(float(row.latitude), 5)},{round(float(row.longitude), 5)}"
+                groups.setdefault(('point', point), []).append(row.id)
+            else:
+                skipped += 1
+
+        keys = list(groups)
+        # Одним запросом поднимаем из кэша всё, что уже геокодировали
+        self.cache.prefetch(f"enrich:{key[0]}:{key[1]}" for key in keys)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._resolve, key) for key in keys]
+        resolved = {}
+        errors = 0
+        for key, future in zip(keys, futures):
+            try:
+                resolved[key] = future.result()
+            except Exception as e:
+                logger.error(f"❌ Ошибка геокодирования {key[1][:50]}: {e}")
+                resolved[key] = None
+
+        now = datetime.utcnow()
+        params = []
+        for key, property_ids in groups.items():
+            data = resolved[key]
+            if not data:
+                errors += len(property_ids)
+                continue
+            for property_id in property_ids:
+                values = {f'_{field}': data.get(field, '') or '' for field in ENRICHED_FIELDS}
+                values.update(_id=property_id, _lat=data.get('latitude'), _lon=data.get('longitude'), _now=now)
+                params.append(values)
+
+        if params:
+            # Координаты заполняем только если их не было (как enrich_property)
+            missing_coords = and_(or_(t.c.latitude.is_(None), t.c.latitude == 0), bindparam('_lat').isnot(None))
+            with self.engine.begin() as conn:
+                conn.execute(
+                    update(t).where(t.c.id == bindparam('_id')).values(
+                        **{field: bindparam(f'_{field}') for field in ENRICHED_FIELDS},
+                        latitude=case((missing_coords, bindparam('_lat')), else_=t.c.latitude),
+                        longitude=case((missing_coords, bindparam('_lon')), else_=t.c.longitude),
+                        updated_at=bindparam('_now'),
+                    ),
+                    params,
+                )
+            # UPDATE мимо ORM — карточки квартир в кэше ответов сбрасываем сами
+            invalidate_tags({TAG_CATALOGUE} | {property_tag(values['_id']) for values in params})
+            logger.info(f"✅ Deferred geocoding: {len(params)} properties from {len(groups)} unique addresses")
+
+        return {'processed': len(rows), 'enriched': len(params), 'skipped': skipped, 'errors': errors}
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, pending=self._queue.unfinished_tasks)
+
+
+_enrichment_worker = None
+
+
+def get_enrichment_worker(engine=None) -> DeferredEnrichmentWorker:
+    """Получить singleton DeferredEnrichmentWorker (engine нужен при первом вызове)"""
+    global _enrichment_worker
+    if _enrichment_worker is None:
+        if engine is None:
+            from app import db
+            engine = db.engine
+        _enrichment_worker = DeferredEnrichmentWorker(engine)
+    return _enrichment_worker
+
+
+_PENDING_KEY = 'auto_geocoding_pending'
+_events_registered = False
+
+
+def _remember(target):
+    session = object_session(target)
+    if session is not None and target.id is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(target.id)
+
+
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        get_enrichment_worker(session.get_bind()).submit(pending)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
 def setup_auto_geocoding(db):
     """
     Настроить автоматическое обогащение через SQLAlchemy events
     Вызывается один раз при инициализации приложения
+
+    События только запоминают id квартир; геокодирование выполняет
+    DeferredEnrichmentWorker после commit.
     
     Args:
         db: SQLAlchemy database instance
     """
+    global _events_registered
     from models import Property
     
+    if _events_registered:
+        return
     auto_service = get_auto_geocoding_service()
     
-    @event.listens_for(Property, 'before_insert')
-    def enrich_before_insert(mapper, connection, target):
-        """Обогащаем адрес перед созданием объекта"""
+    @event.listens_for(Property, 'after_insert')
+    def enrich_after_insert(mapper, connection, target):
+        """Ставим в очередь новый объект с координатами"""
         # Только если есть координаты и ещё не обогащён
-        if target.latitude and target.longitude and not target.parsed_city:
-            logger.debug(f"🔍 Auto-geocoding: {target.title[:50]}")
-            auto_service.enrich_property(target)
+        if not auto_service.batch_mode and target.latitude and target.longitude and not target.parsed_city:
+            _remember(target)
     
-    @event.listens_for(Property, 'before_update')
-    def enrich_before_update(mapper, connection, target):
-        """Обогащаем адрес если координаты изменились"""
-        # Проверяем что координаты изменились
+    @event.listens_for(Property, 'after_update')
+    def enrich_after_update(mapper, connection, target):
+        """Ставим в очередь объект, если координаты изменились"""
+        if auto_service.batch_mode or not (target.latitude and target.longitude):
+            return
         state = db.inspect(target)
-        lat_changed = state.attrs.latitude.history.has_changes()
-        lon_changed = state.attrs.longitude.history.has_changes()
-        
-        if (lat_changed or lon_changed) and target.latitude and target.longitude:
-            logger.debug(f"🔄 Coordinates changed, re-geocoding: {target.title[:50]}")
-            auto_service.enrich_property(target)
+        if state.attrs.latitude.history.has_changes() or state.attrs.longitude.history.has_changes():
+            _remember(target)
     
-    logger.info("✅ Auto-geocoding events registered for Property model")
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _events_registered = True
+    logger.info("✅ Auto-geocoding events registered for Property model (deferred)")
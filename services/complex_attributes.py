@@ -0,0 +1,215 @@
+"""
+Таблица атрибутов ЖК для расчёта кешбека
+
+calculate_cashback() раньше на каждую квартиру делал один-два запроса
+ResidentialComplex.query...first(), а списки (страница района, подборки,
+главная) вызывают его в цикле по сотням квартир. Теперь:
+
+1. Один запрос собирает ComplexAttributeTable: id / название ЖК →
+   cashback_rate, класс объекта, год сдачи.
+2. Таблица версионирована (количество + max(updated_at) по ЖК) и сверяется
+   с БД не чаще check_interval; правка кешбека в админке сбрасывает её сразу.
+3. cashback_amounts() считает кешбек сразу для массива цен (numpy).
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CASHBACK_RATE = 5.0  # %, если у ЖК ставка не задана
+
+
+class ComplexAttributeTable:
+    """Неизменяемый снимок атрибутов ЖК"""
+
+    __slots__ = ('version', 'built_at', 'by_id', 'by_name', '_ids', '_rates')
+
+    def __init__(self, rows: Iterable[Dict[str, Any]], version: Any = None):
+        self.version = version
+        self.built_at = time.time()
+        self.by_id: Dict[int, Dict[str, Any]] = {}
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        for row in sorted(rows, key=lambda r: r['id']):
+            self.by_id[row['id']] = row
+            # Дубли названий: как .first() — берём ЖК с меньшим id
+            if row.get('name'):
+                self.by_name.setdefault(row['name'], row)
+
+        # Отсортированные id и ставки для векторного поиска (0 — ставка не задана)
+        self._ids = np.array(sorted(self.by_id), dtype=np.int64)
+        self._rates = np.array([self.by_id[cid]['cashback_rate'] or 0.0 for cid in self._ids], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def get(self, complex_id=None, complex_name=None) -> Optional[Dict[str, Any]]:
+        if complex_id:
+            try:
+                row = self.by_id.get(int(complex_id))
+            except (TypeError, ValueError):
+                row = None
+            if row is not None:
+                return row
+        if complex_name:
+            return self.by_name.get(complex_name)
+        return None
+
+    def cashback_rate(self, complex_id=None, complex_name=None) -> Optional[float]:
+        """
+        Ставка кешбека в процентах или None
+
+        Как и прежний calculate_cashback: сначала по id, если там ставка
+        не задана — по названию.
+        """
+        if complex_id:
+            try:
+                row = self.by_id.get(int(complex_id))
+            except (TypeError, ValueError):
+                row = None
+            if row is not None and row['cashback_rate']:
+                return row['cashback_rate']
+        if complex_name:
+            row = self.by_name.get(complex_name)
+            if row is not None and row['cashback_rate']:
+                return row['cashback_rate']
+        return None
+
+    def rates_for(self, complex_ids: Optional[Sequence] = None,
+                  complex_names: Optional[Sequence] = None, size: Optional[int] = None) -> np.ndarray:
+        """Ставки (%) для массива квартир; DEFAULT_CASHBACK_RATE, где ЖК не найден"""
+        if size is None:
+            size = len(complex_ids if complex_ids is not None else complex_names)
+        rates = np.zeros(size, dtype=np.float64)
+
+        if complex_ids is not None and len(self._ids):
+            ids = np.array([_to_int(cid) for cid in complex_ids], dtype=np.int64)
+            positions = np.clip(np.searchsorted(self._ids, ids), 0, len(self._ids) - 1)
+            found = (self._ids[positions] == ids) & (ids > 0)
+            rates[found] = self._rates[positions[found]]
+
+        if complex_names is not None:
+            for index in np.flatnonzero(rates == 0):
+                name = complex_names[index]
+                row = self.by_name.get(name) if name else None
+                if row is not None and row['cashback_rate']:
+                    rates[index] = row['cashback_rate']
+
+        rates[rates == 0] = DEFAULT_CASHBACK_RATE
+        return rates
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value) if value else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def cashback_amounts(prices: Sequence, rates: np.ndarray) -> np.ndarray:
+    """Кешбек в рублях для массива цен и ставок (%); пустая цена → 0"""
+    prices = np.array([price or 0 for price in prices], dtype=np.float64)
+    # Та же арифметика, что int(price * rate / 100) в calculate_cashback
+    return (prices * (rates / 100)).astype(np.int64)
+
+
+def fetch_complex_attributes() -> list:
+    """Все ЖК одним запросом (только нужные колонки)"""
+    from app import db
+    from models import ResidentialComplex
+
+    rows = db.session.query(
+        ResidentialComplex.id,
+        ResidentialComplex.name,
+        ResidentialComplex.cashback_rate,
+        ResidentialComplex.object_class_display_name,
+        ResidentialComplex.end_build_year,
+    ).all()
+    return [{
+        'id': row.id,
+        'name': row.name,
+        'cashback_rate': float(row.cashback_rate) if row.cashback_rate else None,
+        'object_class': row.object_class_display_name,
+        'end_build_year': row.end_build_year,
+    } for row in rows]
+
+
+def fetch_complex_attributes_version() -> Tuple:
+    """Версия таблицы ЖК: количество и max(updated_at) одним запросом"""
+    from app import db
+    from sqlalchemy import func
+    from models import ResidentialComplex
+
+    row = db.session.query(func.count(ResidentialComplex.id), func.max(ResidentialComplex.updated_at)).first()
+    return tuple(row)
+
+
+class ComplexAttributeStore:
+    """
+    Хранилище таблицы атрибутов ЖК с проверкой версии
+
+    Args:
+        loader: функция, возвращающая строки ЖК
+        version_fetcher: функция, возвращающая версию данных (дешёвый запрос)
+        check_interval: как часто (сек) сверять версию с БД
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[Dict[str, Any]]] = fetch_complex_attributes,
+                 version_fetcher: Callable[[], Any] = fetch_complex_attributes_version,
+                 check_interval: float = 30.0):
+        self.loader = loader
+        self.version_fetcher = version_fetcher
+        self.check_interval = check_interval
+        self._table: Optional[ComplexAttributeTable] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'builds': 0, 'version_checks': 0}
+
+    def get(self) -> ComplexAttributeTable:
+        table = self._table
+        if table is not None and time.time() - self._last_check < self.check_interval:
+            return table
+
+        with self._lock:
+            table = self._table
+            if table is not None and time.time() - self._last_check < self.check_interval:
+                return table
+
+            version = self.version_fetcher()
+            self.stats['version_checks'] += 1
+            if table is None or table.version != version:
+                table = ComplexAttributeTable(self.loader(), version=version)
+                self._table = table
+                self.stats['builds'] += 1
+                logger.info(f"✅ Complex attribute table loaded: {len(table)} complexes")
+            self._last_check = time.time()
+            return table
+
+    def invalidate(self):
+        """Перечитать таблицу при следующем обращении (после правки ЖК)"""
+        with self._lock:
+            self._table = None
+            self._last_check = 0.0
+
+
+_complex_attribute_store = None
+
+
+def get_complex_attribute_store() -> ComplexAttributeStore:
+    """Получить singleton ComplexAttributeStore"""
+    global _complex_attribute_store
+    if _complex_attribute_store is None:
+        _complex_attribute_store = ComplexAttributeStore()
+    return _complex_attribute_store
+
+
+def get_complex_attributes() -> ComplexAttributeTable:
+    return get_complex_attribute_store().get()
+
+
+def invalidate_complex_attributes():
+    get_complex_attribute_store().invalidate()
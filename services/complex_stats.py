@@ -0,0 +1,339 @@
+"""
+Материализованная статистика ЖК (таблица complex_stats)
+
+Раньше PropertyRepository.get_all_property_stats() на каждый рендер списка ЖК,
+страниц застройщиков и карты делал четыре GROUP BY по всей таблице квартир
+и разбирал JSON gallery_images. Теперь:
+
+1. Статистика по каждому ЖК хранится строкой ComplexStats (цены, площади,
+   разбивка по комнатам, корпуса, фото) и читается одним запросом по PK.
+2. Изменения квартир (insert / update значимых полей / delete) собираются
+   в before_flush; при commit той же транзакцией пересчитываются только
+   затронутые ЖК.
+3. Первичная сборка — ensure_complex_stats() из `flask init-db`; пока
+   таблица пуста, load_complex_stats() считает статистику на лету, ничего
+   не записывая. Полная пересборка — rebuild_complex_stats() или
+   `python -m services.complex_stats --rebuild` (после массовых правок SQL).
+"""
+
+import json
+import logging
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Поля квартиры, от которых зависит статистика ЖК
+TRACKED_FIELDS = (
+    'complex_id', 'is_active', 'price', 'area', 'rooms',
+    'complex_building_name', 'gallery_images', 'address',
+)
+
+_PENDING_KEY = 'complex_stats_pending'
+
+
+def _default_session():
+    from app import db
+    return db.session
+
+
+def _room_type(rooms) -> str:
+    return f"{rooms}-комн" if rooms and rooms > 0 else "Студия"
+
+
+def compute_complex_stats(complex_ids: Optional[Iterable[int]] = None, session=None) -> Dict[int, Dict]:
+    """
+    Посчитать статистику активных квартир по ЖК
+
+    Args:
+        complex_ids: только эти ЖК; None — все
+
+    Returns:
+        {complex_id: {...}} в формате ComplexStats.to_dict() (без room_distribution)
+    """
+    from models import Property
+
+    session = session or _default_session()
+    ids = None if complex_ids is None else sorted({int(cid) for cid in complex_ids if cid is not None})
+    if ids == []:
+        return {}
+
+    def scoped(query, *conditions):
+        query = query.filter(Property.is_active == True, *conditions)
+        if ids is not None:
+            query = query.filter(Property.complex_id.in_(ids))
+        return query
+
+    stats_query = scoped(session.query(
+        Property.complex_id,
+        func.count(Property.id).label('total'),
+        func.min(Property.price).label('min_price'),
+        func.max(Property.price).label('max_price'),
+        func.avg(Property.price).label('avg_price'),
+        func.min(Property.area).label('min_area'),
+        func.max(Property.area).label('max_area'),
+        func.max(Property.address).label('sample_address'),
+    )).group_by(Property.complex_id).all()
+
+    # Уникальные корпуса по complex_building_name
+    buildings_query = scoped(session.query(
+        Property.complex_id,
+        func.count(func.distinct(Property.complex_building_name)).label('buildings_count'),
+    ), Property.complex_building_name.isnot(None)).group_by(Property.complex_id).all()
+    buildings_dict = {row.complex_id: max(row.buildings_count, 1) for row in buildings_query}
+
+    # Фото из квартир (fallback, если у ЖК нет собственных фото)
+    photos_query = scoped(session.query(
+        Property.complex_id,
+        func.min(Property.gallery_images).label('sample_photos'),
+    ), Property.gallery_images.isnot(None), Property.gallery_images != '[]').group_by(Property.complex_id).all()
+
+    photos_dict = {}
+    for row in photos_query:
+        try:
+            photos_raw = json.loads(row.sample_photos) if isinstance(row.sample_photos, str) else row.sample_photos
+            if photos_raw and isinstance(photos_raw, list) and len(photos_raw) > 1:
+                # Пропускаем первое фото (индекс 0), берем со 2-го по 4-е (индексы 1,2,3)
+                photos_dict[row.complex_id] = photos_raw[1:4]
+        except (ValueError, TypeError):
+            pass
+
+    stats_dict = {}
+    for row in stats_query:
+        if row.complex_id is None:
+            continue
+        stats_dict[row.complex_id] = {
+            'total_count': row.total or 0,
+            'min_price': int(row.min_price) if row.min_price else 0,
+            'max_price': int(row.max_price) if row.max_price else 0,
+            'avg_price': int(row.avg_price) if row.avg_price else 0,
+            'min_area': float(row.min_area) if row.min_area else 0,
+            'max_area': float(row.max_area) if row.max_area else 0,
+            'sample_address': row.sample_address,
+            'buildings_count': buildings_dict.get(row.complex_id, 1),
+            'sample_photos': photos_dict.get(row.complex_id, []),
+            'room_details': {},
+        }
+
+    # Детальная статистика по комнатам (с ценами и площадями)
+    room_query = scoped(session.query(
+        Property.complex_id,
+        Property.rooms,
+        func.count(Property.id).label('count'),
+        func.min(Property.price).label('min_price'),
+        func.max(Property.price).label('max_price'),
+        func.min(Property.area).label('min_area'),
+        func.max(Property.area).label('max_area'),
+    )).group_by(Property.complex_id, Property.rooms).all()
+
+    for row in sorted(room_query, key=lambda r: (r.rooms or 0)):
+        if row.complex_id not in stats_dict:
+            continue
+        room_details = stats_dict[row.complex_id]['room_details']
+        room_type = _room_type(row.rooms)
+        details = room_details.setdefault(room_type, {
+            'count': 0, 'price_from': 0, 'price_to': 0, 'area_from': 0, 'area_to': 0,
+        })
+        # rooms NULL и 0 — оба «Студия»: сливаем, а не затираем
+        details['count'] += row.count
+        for key, value, pick in (('price_from', row.min_price, min), ('price_to', row.max_price, max)):
+            if value:
+                details[key] = pick(details[key], int(value)) if details[key] else int(value)
+        for key, value, pick in (('area_from', row.min_area, min), ('area_to', row.max_area, max)):
+            if value:
+                value = round(float(value), 1)
+                details[key] = pick(details[key], value) if details[key] else value
+
+    return stats_dict
+
+
+def _apply(session, stats: Dict[int, Dict], complex_ids: Optional[Iterable[int]] = None):
+    """Заменить строки complex_stats: удалить старые (по complex_ids или все) и вставить новые"""
+    from models import ComplexStats
+
+    delete_query = session.query(ComplexStats)
+    if complex_ids is not None:
+        delete_query = delete_query.filter(ComplexStats.complex_id.in_(list(complex_ids)))
+    delete_query.delete(synchronize_session=False)
+    # Удалённые строки могли остаться в identity map — иначе add() конфликтует по PK
+    for obj in [obj for obj in session.identity_map.values() if isinstance(obj, ComplexStats)]:
+        if complex_ids is None or obj.complex_id in complex_ids:
+            session.expunge(obj)
+
+    for complex_id, values in stats.items():
+        session.add(ComplexStats(
+            complex_id=complex_id,
+            total_count=values['total_count'],
+            min_price=values['min_price'] or None,
+            max_price=values['max_price'] or None,
+            avg_price=values['avg_price'] or None,
+            min_area=values['min_area'] or None,
+            max_area=values['max_area'] or None,
+            sample_address=values['sample_address'],
+            buildings_count=values['buildings_count'],
+            sample_photos=json.dumps(values['sample_photos'], ensure_ascii=False) if values['sample_photos'] else None,
+            room_details=json.dumps(values['room_details'], ensure_ascii=False),
+        ))
+
+
+def refresh_complex_stats(complex_ids: Iterable[int], session=None):
+    """
+    Пересчитать статистику указанных ЖК в текущей транзакции (без commit)
+    ЖК без активных квартир остаются без строки
+    """
+    session = session or _default_session()
+    ids = {int(cid) for cid in complex_ids if cid is not None}
+    if not ids:
+        return
+    _apply(session, compute_complex_stats(ids, session=session), ids)
+    session.flush()
+
+
+def rebuild_complex_stats(session=None) -> int:
+    """Полная пересборка complex_stats с commit; возвращает количество ЖК"""
+    session = session or _default_session()
+    started = time.time()
+    stats = compute_complex_stats(session=session)
+    _apply(session, stats)
+    session.commit()
+    logger.info(f"✅ complex_stats rebuilt: {len(stats)} complexes in {(time.time() - started) * 1000:.0f} ms")
+    return len(stats)
+
+
+def ensure_complex_stats(session=None) -> bool:
+    """Собрать пустую complex_stats из квартир (`flask init-db`, первый деплой); True — если собирали"""
+    from models import ComplexStats, Property
+
+    session = session or _default_session()
+    if session.query(ComplexStats.complex_id).first() is not None or \
+            session.query(Property.id).filter(Property.is_active == True).first() is None:
+        return False
+    logger.info("📊 complex_stats is empty, building from properties")
+    rebuild_complex_stats(session=session)
+    return True
+
+
+def _as_loaded(values: Dict) -> Dict:
+    """Результат compute_complex_stats() в формате ComplexStats.to_dict()"""
+    return dict(
+        values,
+        total_properties=values['total_count'],
+        room_distribution={room_type: details['count'] for room_type, details in values['room_details'].items()},
+    )
+
+
+_empty_warned = False
+
+
+def load_complex_stats(complex_ids: Optional[Iterable[int]] = None, session=None) -> Dict[int, Dict]:
+    """
+    Прочитать материализованную статистику: {complex_id: dict}
+
+    Пустая таблица (свежая БД без `flask init-db`) — статистика считается
+    на лету без записи: чтение не коммитит сессию запроса.
+    """
+    global _empty_warned
+    from models import ComplexStats
+
+    session = session or _default_session()
+    query = session.query(ComplexStats)
+    if complex_ids is not None:
+        complex_ids = [int(cid) for cid in complex_ids if cid is not None]
+        if not complex_ids:
+            return {}
+        query = query.filter(ComplexStats.complex_id.in_(complex_ids))
+    rows = query.all()
+    if rows or session.query(ComplexStats.complex_id).first() is not None:
+        return {row.complex_id: row.to_dict() for row in rows}
+
+    if not _empty_warned:
+        _empty_warned = True
+        logger.warning("⚠️ complex_stats is empty, computing on the fly — run `flask init-db`")
+    return {complex_id: _as_loaded(values)
+            for complex_id, values in compute_complex_stats(complex_ids, session=session).items()}
+
+
+def mark_complexes_changed(session, complex_ids: Iterable[int]):
+    """Отметить ЖК для пересчёта при commit (для правок мимо ORM, например bulk UPDATE)"""
+    session.info.setdefault(_PENDING_KEY, set()).update(int(cid) for cid in complex_ids if cid is not None)
+
+
+def _changed_complex_ids(session) -> Set[int]:
+    """ЖК, статистику которых меняют квартиры в session.new / dirty / deleted"""
+    from models import Property
+
+    changed = set()
+    for obj in session.new:
+        if isinstance(obj, Property):
+            changed.add(obj.complex_id)
+    for obj in session.deleted:
+        if isinstance(obj, Property):
+            changed.add(obj.complex_id)
+    for obj in session.dirty:
+        if not isinstance(obj, Property):
+            continue
+        state = inspect(obj)
+        for field in TRACKED_FIELDS:
+            history = state.attrs[field].history
+            if history.has_changes():
+                changed.add(obj.complex_id)
+                if field == 'complex_id':
+                    # Квартира переехала: старый ЖК тоже пересчитываем
+                    changed.update(history.deleted)
+    changed.discard(None)
+    return changed
+
+
+def _before_flush(session, flush_context, instances):
+    changed = _changed_complex_ids(session)
+    if changed:
+        mark_complexes_changed(session, changed)
+
+
+def _before_commit(session):
+    # commit() сбрасывает изменения уже после before_commit — делаем это сами,
+    # чтобы before_flush успел отметить ЖК
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    # Та же транзакция: статистика не может разойтись с квартирами
+    refresh_complex_stats(pending, session=session)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+_tracking_enabled = False
+
+
+def setup_complex_stats_tracking():
+    """
+    Подписаться на события Session: пересчёт статистики изменённых ЖК при commit
+    Вызывается один раз при инициализации приложения
+    """
+    global _tracking_enabled
+    if _tracking_enabled:
+        return
+    event.listen(Session, 'before_flush', _before_flush)
+    event.listen(Session, 'before_commit', _before_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _tracking_enabled = True
+    logger.info("✅ complex_stats tracking registered")
+
+
+if __name__ == '__main__':
+    import sys
+    from app import app
+
+    if '--rebuild' not in sys.argv:
+        print("Использование: python -m services.complex_stats --rebuild")
+        sys.exit(1)
+    with app.app_context():
+        count = rebuild_complex_stats()
+    print(f"✅ complex_stats: {count} ЖК")
@@ -9,19 +9,22 @@ import logging
 from typing import Optional, List, Dict, Any
 from dadata import Dadata
 
+from services.geocode_cache import NamespacedGeocodeCache, normalize_address
+
 logger = logging.getLogger(__name__)
 
 
-class DaDataCache:
-    """Simple in-memory cache with configurable TTL per key type"""
+class DaDataCache(NamespacedGeocodeCache):
+    """DaData responses in the shared persistent cache with TTL per key type"""
     
-    def __init__(self):
-        self.cache = {}
+    def __init__(self, store=None):
+        super().__init__('dadata', store=store)
         # Default TTLs in seconds
         self.ttls = {
             'city': 12 * 3600,      # 12 hours for cities/regions
             'district': 12 * 3600,  # 12 hours for districts
             'street': 1 * 3600,     # 1 hour for streets
+            'negative': 15 * 60,    # 15 minutes for "nothing found"
             'default': 1 * 3600     # 1 hour default
         }
     
@@ -30,26 +33,20 @@ class DaDataCache:
         return self.ttls.get(key_type, self.ttls['default'])
     
     def get(self, key: str, key_type: str = 'default') -> Optional[Any]:
-        """Get cached value if not expired"""
-        if key in self.cache:
-            value, timestamp, cached_type = self.cache[key]
-            ttl = self._get_ttl(cached_type)
-            if time.time() - timestamp < ttl:
-                logger.debug(f"Cache HIT for '{key}' (type: {cached_type})")
-                return value
-            else:
-                logger.debug(f"Cache EXPIRED for '{key}' (type: {cached_type})")
-                del self.cache[key]
-        return None
+        """Get cached value if not expired (TTL is fixed when the value is stored)"""
+        found, value = self.lookup(key)
+        if found:
+            logger.debug(f"Cache HIT for '{key}'")
+        return value
     
     def set(self, key: str, value: Any, key_type: str = 'default'):
-        """Set value in cache with current timestamp and type"""
-        self.cache[key] = (value, time.time(), key_type)
+        """Set value in cache with TTL of its type"""
+        super().set(key, value, ttl=self._get_ttl(key_type))
         logger.debug(f"Cache SET for '{key}' (type: {key_type}, TTL: {self._get_ttl(key_type)}s)")
     
     def clear(self):
         """Clear all cached values"""
-        self.cache.clear()
+        super().clear()
         logger.info("DaData cache cleared")
 
 
@@ -111,8 +108,8 @@ class DaDataClient:
         if not query or len(query) < 2:
             return []
         
-        # Normalize query for cache key
-        cache_key = f"address:{query.lower()}:{count}"
+        # Normalize query for cache key (bounds change the answer: cities vs streets)
+        cache_key = f"address:{normalize_address(query)}:{count}:{self._bounds_key(locations, from_bound, to_bound)}"
         
         # Check cache
         cached = self.cache.get(cache_key, 'street')
@@ -185,9 +182,11 @@ class DaDataClient:
                     logger.warning(f"Failed to parse DaData suggestion: {e}")
                     continue
             
-            # Cache results (determine type from first suggestion)
-            cache_type = suggestions[0]['type'] if suggestions else 'default'
-            self.cache.set(cache_key, suggestions, cache_type)
+            # Cache results (determine type from first suggestion); empty answer - short negative TTL
+            if suggestions:
+                self.cache.set(cache_key, suggestions, suggestions[0]['type'])
+            else:
+                self.cache.set(cache_key, [], 'negative')
             
             logger.info(f"✅ DaData returned {len(suggestions)} suggestions for '{query}'")
             return suggestions
@@ -196,6 +195,27 @@ class DaDataClient:
             logger.error(f"DaData API error for query '{query}': {e}")
             return []
     
+    @staticmethod
+    def _bounds_key(locations, from_bound, to_bound) -> str:
+        parts = [
+            (from_bound or {}).get('value', ''),
+            (to_bound or {}).get('value', ''),
+            ';'.join(sorted(f"{k}={v}" for loc in (locations or []) for k, v in loc.items())),
+        ]
+        return '|'.join(parts)
+    
+    def prefetch_addresses(self, queries: List[str], count: int = 1) -> List[str]:
+        """
+        Warm the cache for a batch of address queries with one lookup (for import runs)
+        
+        Returns:
+            Queries that are not cached yet and need an API request
+        """
+        bounds = self._bounds_key(None, None, None)
+        keys = {f"address:{normalize_address(q)}:{count}:{bounds}": q for q in queries if q and len(q) >= 2}
+        missing = self.cache.prefetch(keys)
+        return [keys[key] for key in keys if key in missing]
+    
     def _determine_type(self, data: Dict) -> str:
         """
         Determine address type from DaData response
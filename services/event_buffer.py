@@ -0,0 +1,346 @@
+"""
+Write-behind буфер счётчиков и журналов (поиск, история, активность, просмотры)
+
+Раньше каждая запись шла отдельным commit прямо в обработчике запроса:
+SearchAnalytics.record_search — SELECT + UPDATE/INSERT, SearchHistory и
+UserActivity — по строке, просмотры презентаций, статей и вакансий —
+views_count += 1. Популярные запросы и презентации превращались в горячие
+строки, на которых запросы выстраивались в очередь. Теперь:
+
+1. Обработчик только кладёт событие в память процесса (EventBuffer.record_*),
+   счётчики сразу агрегируются: N поисков «однушка» = одно событие с n=N.
+2. Фоновый поток раз в FLUSH_INTERVAL (или при заполнении на FLUSH_THRESHOLD)
+   пишет всё одной транзакцией: многострочный INSERT для журналов и
+   UPDATE ... SET x = x + n на каждую различную строку счётчика.
+3. Буфер ограничен MAX_PENDING событиями: при переполнении новые события
+   отбрасываются (stats['dropped']), запрос пользователя не ждёт БД.
+4. При остановке процесса (atexit) оставшиеся события записываются.
+
+EVENT_BUFFER_ENABLED=0 — писать сразу (write-through), например в скриптах.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, insert, select, update
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 5.0  # сек
+FLUSH_THRESHOLD = 1000  # событий — записать раньше срока
+MAX_PENDING = 20000  # событий в памяти; сверх — отбрасываем
+INSERT_CHUNK = 500  # строк в одном многострочном INSERT
+
+# Счётчики, которые можно увеличивать через буфер: таблица → (колонка счётчика, колонка «последний просмотр»)
+COUNTERS = {
+    'blog_posts': ('views_count', None),
+    'blog_articles': ('views_count', None),
+    'jobs': ('views_count', None),
+    'collections': ('view_count', 'last_viewed_at'),
+}
+
+
+class EventBuffer:
+    """
+    Args:
+        engine: SQLAlchemy engine (запись отдельной транзакцией, без сессии запроса)
+        flush_interval: период фоновой записи, сек
+        max_pending: предел событий в памяти
+        autostart: запустить фоновый поток при первом событии; False — только flush() вручную
+        write_through: записывать каждое событие сразу (без буферизации)
+    """
+
+    def __init__(self, engine, flush_interval: float = FLUSH_INTERVAL, flush_threshold: int = FLUSH_THRESHOLD,
+                 max_pending: int = MAX_PENDING, autostart: bool = True, write_through: bool = False):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_pending = max_pending
+        self.autostart = autostart
+        self.write_through = write_through
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_drop_log = 0.0
+        self._reset()
+        self.stats = {'recorded': 0, 'dropped': 0, 'flushed': 0, 'failed': 0, 'flushes': 0}
+
+    def _reset(self):
+        self._pending = 0
+        self._searches: Dict[str, List] = {}  # query → [n, сумма результатов, последний раз]
+        self._rows: Dict[str, List[Dict]] = defaultdict(list)  # таблица → строки для INSERT
+        self._counters: Dict[Tuple[str, int], List] = {}  # (таблица, id) → [n, последний раз]
+
+    # ------------------------------------------------------------------
+    # Запись событий
+    # ------------------------------------------------------------------
+
+    def _admit(self) -> bool:
+        """Под self._lock: есть ли место для ещё одного события"""
+        if self._pending >= self.max_pending:
+            self.stats['dropped'] += 1
+            now = time.time()
+            if now - self._last_drop_log > 60:
+                self._last_drop_log = now
+                logger.warning(f"⚠️ Event buffer full ({self.max_pending}), dropping events")
+            return False
+        self._pending += 1
+        self.stats['recorded'] += 1
+        return True
+
+    def _after_record(self):
+        if self.write_through:
+            self.flush()
+            return
+        if self._pending >= self.flush_threshold:
+            self._wake.set()
+        if self.autostart and (self._thread is None or not self._thread.is_alive()):
+            self.start()
+
+    def record_search(self, query: str, result_count: int = 0):
+        """Поиск для подсказок и популярных запросов (search_analytics)"""
+        normalized = (query or '').strip().lower()[:500]
+        if not normalized:
+            return
+        with self._lock:
+            entry = self._searches.get(normalized)
+            if entry is None:
+                if not self._admit():
+                    return
+                self._searches[normalized] = [1, result_count or 0, datetime.utcnow()]
+            else:
+                entry[0] += 1
+                entry[1] += result_count or 0
+                entry[2] = datetime.utcnow()
+        self._after_record()
+
+    def _append(self, table: str, row: Dict[str, Any]):
+        with self._lock:
+            if not self._admit():
+                return
+            self._rows[table].append(row)
+        self._after_record()
+
+    def record_search_history(self, query: str, user_id: Optional[int] = None, manager_id: Optional[int] = None,
+                              result_count: int = 0, filters_used: Optional[str] = None):
+        self._append('search_history', {
+            'query': query[:500], 'user_id': user_id, 'manager_id': manager_id,
+            'result_count': result_count or 0, 'filters_used': filters_used, 'created_at': datetime.utcnow(),
+        })
+
+    def record_activity(self, user_id: int, activity_type: str, description: str, **kwargs):
+        """Те же аргументы, что у UserActivity.log_activity"""
+        from models import UserActivity
+
+        self._append('user_activities', dict(UserActivity.activity_values(
+            user_id, activity_type, description, **kwargs), created_at=datetime.utcnow()))
+
+    def record_presentation_view(self, collection_id: int, view_ip: Optional[str] = None,
+                                 user_agent: Optional[str] = None, referer: Optional[str] = None,
+                                 viewed_at: Optional[datetime] = None, notification_sent: bool = False):
+        """Строка presentation_views + collections.view_count += 1"""
+        viewed_at = viewed_at or datetime.utcnow()
+        self._append('presentation_views', {
+            'collection_id': collection_id, 'view_ip': view_ip, 'user_agent': user_agent,
+            'referer': (referer or '')[:500] or None, 'viewed_at': viewed_at,
+            'notification_sent': bool(notification_sent),
+        })
+        self.increment('collections', collection_id, at=viewed_at)
+
+    def increment(self, table: str, row_id: int, n: int = 1, at: Optional[datetime] = None):
+        """Счётчик просмотров из COUNTERS: views_count = views_count + n"""
+        if table not in COUNTERS:
+            raise ValueError(f"Unknown counter table: {table}")
+        key = (table, int(row_id))
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None:
+                if not self._admit():
+                    return
+                self._counters[key] = [n, at or datetime.utcnow()]
+            else:
+                entry[0] += n
+                entry[1] = at or datetime.utcnow()
+        self._after_record()
+
+    # ------------------------------------------------------------------
+    # Запись в БД
+    # ------------------------------------------------------------------
+
+    def flush(self) -> int:
+        """
+        Записать накопленное; возвращает число записанных событий
+        Журналы, поиски и счётчики пишутся отдельными транзакциями — ошибка
+        в одной группе (например, удалённый пользователь) не теряет остальные
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                searches, rows, counters = self._searches, self._rows, self._counters
+                self._reset()
+            if not pending:
+                return 0
+            groups = [(f'{table} rows', self._write_rows, {table: table_rows}, len(table_rows))
+                      for table, table_rows in rows.items()]
+            groups.append(('searches', self._write_searches, searches, len(searches)))
+            groups.append(('counters', self._write_counters, counters, len(counters)))
+            written = 0
+            for name, write, data, size in groups:
+                if not size:
+                    continue
+                try:
+                    with self.engine.begin() as connection:
+                        write(connection, data)
+                except Exception:
+                    self.stats['failed'] += size
+                    logger.exception(f"❌ Event buffer flush failed: {size} {name} lost")
+                    continue
+                written += size
+            self.stats['flushed'] += written
+            self.stats['flushes'] += 1
+            return written
+
+    @staticmethod
+    def _write_rows(connection, rows: Dict[str, List[Dict]]):
+        from models import db
+
+        for table_name, table_rows in rows.items():
+            table = db.metadata.tables[table_name]
+            for start in range(0, len(table_rows), INSERT_CHUNK):
+                connection.execute(insert(table).values(table_rows[start:start + INSERT_CHUNK]))
+
+    @staticmethod
+    def _write_searches(connection, searches: Dict[str, List]):
+        from models import SearchAnalytics
+
+        if not searches:
+            return
+        table = SearchAnalytics.__table__
+        existing = set()
+        queries = list(searches)
+        for start in range(0, len(queries), INSERT_CHUNK):
+            existing.update(connection.execute(select(table.c.query).where(
+                table.c.query.in_(queries[start:start + INSERT_CHUNK]))).scalars())
+
+        updates = [{'q': query, 'n': n, 'total': total, 'at': at}
+                   for query, (n, total, at) in searches.items() if query in existing]
+        if updates:
+            count = func.coalesce(table.c.search_count, 0)
+            connection.execute(update(table).where(table.c.query == bindparam('q')).values(
+                search_count=count + bindparam('n'),
+                result_count_avg=(func.coalesce(table.c.result_count_avg, 0) * count + bindparam('total'))
+                / (count + bindparam('n')),
+                last_searched_at=bindparam('at'),
+                updated_at=bindparam('at'),
+            ), updates)
+
+        new = [{'query': query, 'search_count': n, 'result_count_avg': total / n, 'last_searched_at': at,
+                'created_at': at, 'updated_at': at}
+               for query, (n, total, at) in searches.items() if query not in existing]
+        if new:
+            statement = _upsert(connection, table)
+            if statement is not None:
+                excluded = statement.excluded
+                count = func.coalesce(table.c.search_count, 0)
+                statement = statement.on_conflict_do_update(index_elements=[table.c.query], set_={
+                    'search_count': count + excluded.search_count,
+                    'result_count_avg': (func.coalesce(table.c.result_count_avg, 0) * count
+                                         + excluded.result_count_avg * excluded.search_count)
+                    / (count + excluded.search_count),
+                    'last_searched_at': excluded.last_searched_at,
+                    'updated_at': excluded.updated_at,
+                })
+            else:
+                statement = insert(table)
+            connection.execute(statement, new)
+
+    @staticmethod
+    def _write_counters(connection, counters: Dict[Tuple[str, int], List]):
+        from models import db
+
+        grouped = defaultdict(list)
+        for (table_name, row_id), (n, at) in counters.items():
+            grouped[table_name].append({'row_id': row_id, 'n': n, 'at': at})
+        for table_name, params in grouped.items():
+            table = db.metadata.tables[table_name]
+            column, seen_column = COUNTERS[table_name]
+            values = {column: func.coalesce(table.c[column], 0) + bindparam('n')}
+            if seen_column:
+                values[seen_column] = bindparam('at')
+            connection.execute(update(table).where(table.c.id == bindparam('row_id')).values(**values), params)
+
+    # ------------------------------------------------------------------
+    # Фоновый поток
+    # ------------------------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='event_buffer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить поток и записать остаток"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("❌ Event buffer iteration failed")
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats['pending'] = self._pending
+        return stats
+
+
+def _upsert(connection, table):
+    """INSERT ... ON CONFLICT для PostgreSQL / SQLite; None — диалект без upsert"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table)
+
+
+_event_buffer: Optional[EventBuffer] = None
+_init_lock = threading.Lock()
+
+
+def get_event_buffer() -> EventBuffer:
+    """Singleton буфера процесса (первый вызов — в app context); остаток пишется при выходе"""
+    global _event_buffer
+    with _init_lock:
+        if _event_buffer is None:
+            from app import db
+
+            enabled = os.environ.get('EVENT_BUFFER_ENABLED', '1') != '0'
+            _event_buffer = EventBuffer(
+                db.engine,
+                flush_interval=float(os.environ.get('EVENT_BUFFER_FLUSH_SECONDS', FLUSH_INTERVAL)),
+                autostart=enabled,
+                write_through=not enabled,
+            )
+            atexit.register(_event_buffer.stop)
+    return _event_buffer
@@ -0,0 +1,212 @@
+"""
+Потоковый импорт каталога из Excel (/admin/upload-excel)
+
+Раньше загрузка запускала неуправляемый threading.Thread, статус жил в
+глобальном dict import_status (его видел только принявший файл worker),
+а по окончании сбрасывался кэш только этого процесса. Теперь:
+
+1. Книга читается построчно (ExcelSource, openpyxl read_only) и пишется
+   через services/import_engine.py пачками по CHUNK_SIZE — память не растёт
+   с размером файла, строки без изменений не трогают properties.
+2. Каждая пачка — один INSERT ... ON CONFLICT (inner_id) DO UPDATE и commit;
+   пустые ячейки не затирают уже заполненные поля (координаты после
+   геокодинга, описание и т.п.).
+3. Прогресс пишется в import_jobs после каждой пачки — статус видят все
+   worker-процессы; задача без heartbeat дольше HEARTBEAT_TIMEOUT считается
+   прерванной.
+4. Обновлённые строки получают новый updated_at, поэтому версия каталога
+   (fetch_catalogue_version) меняется и снимки всех процессов пересобираются;
+   статистика затронутых ЖК пересчитывается в конце импорта.
+
+CLI: python -m services.excel_import <file.xlsx>
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from services.import_engine import (  # noqa: F401 — normalize_row / RowError импортируются отсюда
+    CHUNK_SIZE, ExcelSource, ImportEngine, ImportReport, RowError, normalize_row,
+)
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_TIMEOUT = 600  # сек без обновления прогресса — процесс импорта умер
+
+STATUS_PROCESSING = 'processing'
+STATUS_COMPLETED = 'completed'
+STATUS_ERROR = 'error'
+
+
+# ----------------------------------------------------------------------
+# Задачи
+# ----------------------------------------------------------------------
+
+class ExcelImporter:
+    """
+    Импорт файлов в фоне: одна задача за раз на процесс, состояние в import_jobs
+
+    Args:
+        engine: движок БД (по умолчанию db.engine приложения)
+        chunk_size: строк на одну транзакцию upsert
+    """
+
+    def __init__(self, engine=None, chunk_size: int = CHUNK_SIZE):
+        self._engine = engine
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='excel-import')
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from app import db
+            self._engine = db.engine
+        return self._engine
+
+    def create_job(self, file_path: str, filename: Optional[str] = None) -> str:
+        from models import ImportJob
+
+        job_id = uuid.uuid4().hex
+        with Session(self.engine) as session:
+            session.add(ImportJob(id=job_id, filename=filename or os.path.basename(file_path),
+                                  file_path=file_path, status=STATUS_PROCESSING, message='Обработка файла...'))
+            session.commit()
+        return job_id
+
+    def submit(self, file_path: str, filename: Optional[str] = None,
+               on_complete: Optional[Callable[[Dict], None]] = None) -> str:
+        """Поставить файл в очередь; возвращает id задачи для get_status()"""
+        job_id = self.create_job(file_path, filename)
+        self._executor.submit(self.run, job_id, on_complete)
+        return job_id
+
+    def run(self, job_id: str, on_complete: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Выполнить импорт синхронно (в потоке executor или из CLI)"""
+        from models import ImportJob
+
+        started = time.time()
+        with Session(self.engine) as session:
+            job = session.get(ImportJob, job_id)
+            try:
+                result = self._import(session, job)
+            except Exception as e:
+                logger.exception(f"❌ Excel import {job_id} failed")
+                session.rollback()
+                job = session.get(ImportJob, job_id)
+                job.status = STATUS_ERROR
+                job.message = f'❌ Ошибка импорта: {e}'
+                job.finished_at = job.updated_at = datetime.utcnow()
+                session.commit()
+                return {'success': False, 'error': str(e)}
+
+        logger.info(f"✅ Excel import {job_id}: {result['inserted']} new, {result['updated']} updated, "
+                    f"{result['unchanged']} unchanged, {result['skipped']} skipped in {time.time() - started:.1f} s")
+        if on_complete:
+            try:
+                on_complete(result)
+            except Exception as e:
+                logger.warning(f"⚠️ Excel import {job_id} completion hook failed: {e}")
+        return result
+
+    def _import(self, session, job) -> Dict:
+        source = ExcelSource(job.file_path)
+        job.total_rows = source.total
+        session.commit()
+
+        def progress(report: ImportReport):
+            job.processed_rows = report.processed
+            job.inserted, job.updated = report.inserted, report.updated
+            job.unchanged, job.skipped = report.unchanged, report.skipped
+            job.error_samples = json.dumps(report.errors, ensure_ascii=False) if report.errors else None
+            job.updated_at = datetime.utcnow()
+
+        report = ImportEngine(session, chunk_size=self.chunk_size).run(source, progress=progress)
+        result = {
+            'success': True,
+            'message': f"Файл {job.filename} обработан.",
+            'imported': report.inserted + report.updated,
+            'inserted': report.inserted,
+            'updated': report.updated,
+            'unchanged': report.unchanged,
+            'skipped': report.skipped,
+            'developers_created': len(report.created.get('developers', ())),
+            'complexes_created': len(report.created.get('complexes', ())),
+            'buildings_created': len(report.created.get('buildings', ())),
+            'errors': report.errors,
+        }
+        job.status = STATUS_COMPLETED
+        job.message = f"✅ {result['message']} Импортировано: {result['imported']} записей " \
+                      f"(новых {report.inserted}, обновлено {report.updated}, без изменений {report.unchanged}, " \
+                      f"пропущено {report.skipped})."
+        job.finished_at = job.updated_at = datetime.utcnow()
+        session.commit()
+        return result
+
+    def get_status(self, job_id: str) -> Optional[Dict]:
+        """Статус задачи в формате /admin/check-import-status; None — задачи нет"""
+        from models import ImportJob
+
+        with Session(self.engine) as session:
+            job = session.get(ImportJob, job_id)
+            if job is None:
+                return None
+            now = datetime.utcnow()
+            status, message = job.status, job.message
+            if status == STATUS_PROCESSING and job.updated_at < now - timedelta(seconds=HEARTBEAT_TIMEOUT):
+                status, message = STATUS_ERROR, '❌ Импорт прерван: процесс обработки остановился'
+
+            if status == STATUS_COMPLETED:
+                progress = 100
+            elif job.total_rows:
+                progress = min(99, int(job.processed_rows * 100 / job.total_rows))
+            else:
+                progress = 0
+            finished = job.finished_at or now
+            return {
+                'status': status,
+                'progress': progress,
+                'message': message,
+                'processed_rows': job.processed_rows,
+                'total_rows': job.total_rows,
+                'result': {
+                    'imported': job.inserted + job.updated,
+                    'inserted': job.inserted,
+                    'updated': job.updated,
+                    'unchanged': job.unchanged,
+                    'skipped': job.skipped,
+                    'errors': json.loads(job.error_samples) if job.error_samples else [],
+                },
+                'elapsed_time': f"{(finished - job.created_at).total_seconds():.1f} сек",
+            }
+
+
+_excel_importer: Optional[ExcelImporter] = None
+
+
+def get_excel_importer() -> ExcelImporter:
+    global _excel_importer
+    if _excel_importer is None:
+        _excel_importer = ExcelImporter()
+    return _excel_importer
+
+
+if __name__ == '__main__':
+    import sys
+    from app import app
+
+    if len(sys.argv) != 2:
+        print("Использование: python -m services.excel_import <file.xlsx>")
+        sys.exit(1)
+    with app.app_context():
+        importer = get_excel_importer()
+        job_id = importer.create_job(sys.argv[1])
+        result = importer.run(job_id)
+        print(json.dumps(importer.get_status(job_id), ensure_ascii=False, indent=2))
+    sys.exit(0 if result.get('success') else 1)
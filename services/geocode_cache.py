@@ -0,0 +1,319 @@
+"""
+Постоянный кэш результатов геокодирования (SQLite-файл)
+
+Общий уровень кэша для Yandex Geocoder, DaData и фонового обогащения:
+результаты переживают перезапуск и общие для всех процессов на сервере
+(воркеры gunicorn, скрипты импорта), поэтому никто не начинает «с холода».
+
+- размер ограничен: LRU-вытеснение по last_used
+- отрицательные ответы («адрес не найден») кэшируются с коротким TTL
+- ключи нормализуются: адрес — регистр / пунктуация / ё, координаты
+  обратного геокодирования округляются до ~1 м
+- горячие ключи дополнительно держатся в памяти процесса
+- prefetch() одним запросом прогревает пачку ключей перед импортом
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+DEFAULT_TTL = 30 * 24 * 3600  # адреса меняются редко
+NEGATIVE_TTL = 6 * 3600  # «не найдено» перепроверяем чаще
+COORD_PRECISION = 5  # знаков после запятой, ~1 м
+EVICT_EVERY = 500  # проверять размер раз в N записей
+
+_SEPARATORS = re.compile(r'[\s,.;]+')
+
+
+def normalize_address(address: str) -> str:
+    """«г. Краснодар,  ул.Красная, 1» и «г краснодар ул красная 1» — один ключ"""
+    return _SEPARATORS.sub(' ', (address or '').lower().replace('ё', 'е')).strip()
+
+
+def forward_key(namespace: str, address: str, *extra) -> str:
+    return ':'.join([namespace, 'fwd', normalize_address(address), *(str(e) for e in extra)])
+
+
+def reverse_key(namespace: str, latitude: float, longitude: float, *extra) -> str:
+    point = f"{float(latitude):.{COORD_PRECISION}f},{float(longitude):.{COORD_PRECISION}f}"
+    return ':'.join([namespace, 'rev', point, *(str(e) for e in extra)])
+
+
+class PersistentGeocodeCache:
+    """
+    key → JSON-значение с TTL в SQLite, LRU по размеру
+
+    Args:
+        path: файл базы (':memory:' — для тестов)
+        ttl: время жизни записи по умолчанию, сек
+        negative_ttl: время жизни отрицательного ответа (значение None)
+        max_entries: предел записей в файле
+        memory_entries: сколько записей держать в памяти процесса
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, negative_ttl: float = NEGATIVE_TTL,
+                 max_entries: int = 200_000, memory_entries: int = 2048):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._memory_conn = sqlite3.connect(':memory:', check_same_thread=False) if path == ':memory:' else None
+        self._lock = threading.RLock()
+        self._hot: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._writes = 0
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        with self._lock:
+            self._init_schema(self._conn())
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._memory_conn is not None:
+            return self._memory_conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Несколько процессов пишут в один файл: WAL + ожидание блокировки
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _init_schema(conn: sqlite3.Connection):
+        if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            # Кэш можно просто пересоздать
+            conn.execute('DROP TABLE IF EXISTS geocode_cache')
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_cache_last_used ON geocode_cache (last_used)")
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+
+    # ------------------------------------------------------------------
+    # Память процесса
+    # ------------------------------------------------------------------
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self._hot[key] = (expires_at, value)
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.memory_entries:
+            self._hot.popitem(last=False)
+
+    def _count(self, value: Any):
+        self.stats['hits' if value is not None else 'negative_hits'] += 1
+
+    # ------------------------------------------------------------------
+    # Чтение
+    # ------------------------------------------------------------------
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """
+        (найдено, значение)
+
+        Отрицательный ответ — (True, None): API уже спрашивали, результата нет.
+        """
+        now = time.time()
+        with self._lock:
+            hot = self._hot.get(key)
+            if hot is not None and hot[0] > now:
+                self._hot.move_to_end(key)
+                self._count(hot[1])
+                return True, hot[1]
+
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at FROM geocode_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.stats['misses'] += 1
+                return False, None
+
+            conn.execute("UPDATE geocode_cache SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            value = json.loads(row[0]) if row[0] is not None else None
+            self._remember(key, row[1], value)
+            self._count(value)
+            return True, value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        found, value = self.lookup(key)
+        return value if found and value is not None else default
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Найденные записи (включая отрицательные) одним запросом на 500 ключей"""
+        now = time.time()
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        with self._lock:
+            conn = self._conn()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value, expires_at FROM geocode_cache WHERE key IN ({placeholders}) AND expires_at > ?",
+                    (*chunk, now),
+                ).fetchall()
+                for key, raw, expires_at in rows:
+                    value = json.loads(raw) if raw is not None else None
+                    found[key] = value
+                    self._remember(key, expires_at, value)
+                if rows:
+                    conn.executemany("UPDATE geocode_cache SET last_used = ? WHERE key = ?",
+                                     [(now, row[0]) for row in rows])
+            conn.commit()
+        return found
+
+    def prefetch(self, keys: Iterable[str]) -> Set[str]:
+        """
+        Прогреть кэш процесса пачкой ключей (перед импортом)
+
+        Returns:
+            ключи, которых нет в кэше — только их нужно запрашивать у API
+        """
+        keys = set(keys)
+        return keys - set(self.get_many(keys))
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Сохранить значение; None — отрицательный ответ (negative_ttl)"""
+        now = time.time()
+        if ttl is None:
+            ttl = self.ttl if value is not None else self.negative_ttl
+        raw = json.dumps(value, ensure_ascii=False) if value is not None else None
+        with self._lock:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, raw, now + ttl, now),
+            )
+            conn.commit()
+            self._remember(key, now + ttl, value)
+            self.stats['writes'] += 1
+            self._writes += 1
+            if self._writes >= EVICT_EVERY:
+                self._writes = 0
+                self.evict()
+
+    def set_negative(self, key: str):
+        self.set(key, None)
+
+    def evict(self) -> int:
+        """Удалить просроченные записи и самые давно использованные сверх max_entries"""
+        with self._lock:
+            conn = self._conn()
+            removed = conn.execute("DELETE FROM geocode_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            overflow = conn.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                # Удаляем с запасом 10%, чтобы не вытеснять на каждой записи
+                overflow += self.max_entries // 10
+                removed += conn.execute(
+                    "DELETE FROM geocode_cache WHERE key IN "
+                    "(SELECT key FROM geocode_cache ORDER BY last_used LIMIT ?)", (overflow,)
+                ).rowcount
+                self._hot.clear()
+            conn.commit()
+            self.stats['evictions'] += removed
+        if removed:
+            logger.info(f"🧹 Geocode cache: evicted {removed} entries")
+        return removed
+
+    def clear(self, namespace: Optional[str] = None):
+        """Очистить весь кэш или записи одного источника ('yandex', 'dadata', ...)"""
+        with self._lock:
+            conn = self._conn()
+            if namespace:
+                conn.execute("DELETE FROM geocode_cache WHERE key >= ? AND key < ?", (f"{namespace}:", f"{namespace};"))
+                for key in [k for k in self._hot if k.startswith(f"{namespace}:")]:
+                    del self._hot[key]
+            else:
+                conn.execute("DELETE FROM geocode_cache")
+                self._hot.clear()
+            conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn().execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0]
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return self._conn().execute(
+                "SELECT COUNT(*) FROM geocode_cache WHERE key >= ? AND key < ?", (f"{namespace}:", f"{namespace};")
+            ).fetchone()[0]
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats['hits'] + self.stats['negative_hits'] + self.stats['misses']
+        hit_rate = (self.stats['hits'] + self.stats['negative_hits']) / lookups * 100 if lookups else 0.0
+        return dict(self.stats, size=len(self), hit_rate=round(hit_rate, 1))
+
+
+class NamespacedGeocodeCache:
+    """Кэш одного источника (Yandex / DaData) внутри общего PersistentGeocodeCache"""
+
+    def __init__(self, namespace: str, ttl: float = DEFAULT_TTL, store: Optional[PersistentGeocodeCache] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._store = store
+
+    @property
+    def store(self) -> PersistentGeocodeCache:
+        if self._store is None:
+            self._store = get_geocode_cache()
+        return self._store
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        return self.store.lookup(self._key(key))
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.store.get(self._key(key))
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.store.set(self._key(key), value, ttl=ttl if ttl is not None or value is None else self.ttl)
+
+    def set_negative(self, key: str):
+        self.store.set_negative(self._key(key))
+
+    def prefetch(self, keys: Iterable[str]) -> Set[str]:
+        """Ключи (без namespace), которых нет в кэше"""
+        prefix = len(self.namespace) + 1
+        return {key[prefix:] for key in self.store.prefetch(self._key(k) for k in keys)}
+
+    def clear(self):
+        self.store.clear(self.namespace)
+
+    def __len__(self) -> int:
+        return self.store.count(self.namespace)
+
+
+_geocode_cache = None
+_geocode_cache_lock = threading.Lock()
+
+
+def get_geocode_cache() -> PersistentGeocodeCache:
+    """Получить singleton PersistentGeocodeCache"""
+    global _geocode_cache
+    with _geocode_cache_lock:
+        if _geocode_cache is None:
+            path = os.environ.get('GEOCODE_CACHE_PATH', os.path.join('instance', 'geocode_cache.sqlite'))
+            max_entries = int(os.environ.get('GEOCODE_CACHE_MAX_ENTRIES', '200000'))
+            _geocode_cache = PersistentGeocodeCache(path, max_entries=max_entries)
+    return _geocode_cache
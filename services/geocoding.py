@@ -11,33 +11,16 @@ import requests
 from typing import Dict, List, Optional, Tuple, Any, Union
 from datetime import datetime, timedelta
 
+from services.geocode_cache import NamespacedGeocodeCache, normalize_address
+
 logger = logging.getLogger(__name__)
 
 
-class GeocodingCache:
-    """Simple in-memory cache with TTL for geocoding results"""
-    
-    def __init__(self, ttl_hours: int = 24):
-        self.cache = {}
-        self.ttl_seconds = ttl_hours * 3600
-    
-    def get(self, key: str) -> Optional[Any]:
-        """Get cached value if not expired"""
-        if key in self.cache:
-            value, timestamp = self.cache[key]
-            if time.time() - timestamp < self.ttl_seconds:
-                return value
-            else:
-                del self.cache[key]
-        return None
-    
-    def set(self, key: str, value: Any):
-        """Set value in cache with current timestamp"""
-        self.cache[key] = (value, time.time())
+class GeocodingCache(NamespacedGeocodeCache):
+    """Geocoding results in the shared persistent cache (services/geocode_cache.py)"""
     
-    def clear(self):
-        """Clear all cached values"""
-        self.cache.clear()
+    def __init__(self, ttl_hours: int = 24, store=None):
+        super().__init__('yandex', ttl=ttl_hours * 3600, store=store)
 
 
 class YandexGeocodingService:
@@ -54,7 +37,7 @@ class YandexGeocodingService:
         if not self.api_key:
             logger.warning("YANDEX_MAPS_API_KEY not found in environment")
         
-        self.cache = GeocodingCache(ttl_hours=24)
+        self.cache = GeocodingCache(ttl_hours=24 * 7)
         self.request_count = 0
         self.cache_hits = 0
     
@@ -81,9 +64,10 @@ class YandexGeocodingService:
         Returns:
             Dict with address components or None if error
         """
-        cache_key = f"reverse:{latitude},{longitude}:{kind or 'all'}"
-        cached = self.cache.get(cache_key)
-        if cached:
+        # ~1 м: соседние квартиры одного дома дают один ключ
+        cache_key = f"reverse:{float(latitude):.5f},{float(longitude):.5f}:{kind or 'all'}"
+        found, cached = self.cache.lookup(cache_key)
+        if found:
             self.cache_hits += 1
             logger.debug(f"Cache hit for reverse geocoding: {cache_key}")
             return cached
@@ -106,6 +90,8 @@ class YandexGeocodingService:
         result = self._parse_geocode_response(data)
         if result:
             self.cache.set(cache_key, result)
+        else:
+            self.cache.set_negative(cache_key)  # Nothing found - don't ask again for a while
         
         return result
     
@@ -119,9 +105,9 @@ class YandexGeocodingService:
         Returns:
             Dict with coordinates and parsed address components
         """
-        cache_key = f"forward:{address.lower().strip()}"
-        cached = self.cache.get(cache_key)
-        if cached:
+        cache_key = f"forward:{normalize_address(address)}"
+        found, cached = self.cache.lookup(cache_key)
+        if found:
             self.cache_hits += 1
             logger.debug(f"Cache hit for forward geocoding: {cache_key}")
             return cached
@@ -141,6 +127,8 @@ class YandexGeocodingService:
         result = self._parse_geocode_response(data)
         if result:
             self.cache.set(cache_key, result)
+        else:
+            self.cache.set_negative(cache_key)  # Nothing found - don't ask again for a while
         
         return result
     
@@ -161,7 +149,8 @@ class YandexGeocodingService:
         if not query or len(query) < 2:
             return []
         
-        cache_key = f"autocomplete:{query.lower().strip()}:{latitude},{longitude}"
+        point = f"{float(latitude):.3f},{float(longitude):.3f}" if latitude and longitude else 'none'
+        cache_key = f"autocomplete:{normalize_address(query)}:{point}"
         cached = self.cache.get(cache_key)
         if cached:
             self.cache_hits += 1
@@ -315,14 +304,26 @@ class YandexGeocodingService:
             'longitude': result.get('longitude')
         }
     
+    def prefetch_forward(self, addresses: List[str]) -> List[str]:
+        """
+        Warm the cache for a batch of addresses with one query (for import runs)
+        
+        Returns:
+            Addresses that are not cached yet and need an API request
+        """
+        keys = {f"forward:{normalize_address(address)}": address for address in addresses if address}
+        missing = self.cache.prefetch(keys)
+        return [keys[key] for key in keys if key in missing]
+    
     def get_stats(self) -> Dict:
         """Get service statistics"""
-        cache_size = len(self.cache.cache)
+        cache_size = len(self.cache)
         return {
             'api_requests': self.request_count,
             'cache_hits': self.cache_hits,
             'cache_size': cache_size,
-            'cache_hit_rate': f"{(self.cache_hits / max(1, self.request_count + self.cache_hits) * 100):.1f}%"
+            'cache_hit_rate': f"{(self.cache_hits / max(1, self.request_count + self.cache_hits) * 100):.1f}%",
+            'persistent_cache': self.cache.store.get_stats()
         }
 
 
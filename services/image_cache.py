@@ -0,0 +1,352 @@
+"""
+Дисковый кэш для /api/image-proxy
+Картинка скачивается, обрезается (водяной знак) и кодируется один раз;
+дальше отдаётся файл с диска.
+
+- ключ — хэш URL + процент обрезки + формат (content-addressed);
+- размер кэша ограничен, вытесняются самые давно использованные файлы (LRU по mtime);
+- параллельные промахи по одному ключу ждут один рендер (single-flight),
+  между процессами — через lock-файл;
+- формат выбирается по заголовку Accept: AVIF → WebP → JPEG;
+- prewarm() прогревает кэш пачкой после импорта.
+"""
+
+import io
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+import requests
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 60}),
+    'webp': ('WEBP', 'image/webp', {'quality': 82, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 90, 'optimize': True}),
+}
+
+# Увеличивать при изменении алгоритма обрезки/кодирования — старые файлы просто не найдутся
+RENDER_VERSION = 1
+
+
+def crop_image_bytes(content: bytes, crop_bottom_percent: int = 8) -> Image.Image:
+    """Обрезать нижнюю часть изображения (водяной знак)"""
+    img = Image.open(io.BytesIO(content))
+    width, height = img.size
+    crop_height = int(height * (crop_bottom_percent / 100))
+    return img.crop((0, 0, width, height - crop_height))
+
+
+class ImageProxyCache:
+    """Content-addressed LRU-кэш обрезанных картинок на диске"""
+
+    LOCK_TIMEOUT = 30  # сек — сколько ждать чужой рендер
+    FAILURE_TTL = 600  # сек — не долбить источник, который только что упал
+    MAX_FAILURES = 10_000  # адресов в отрицательном кэше процесса
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3, download_timeout: int = 10):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.download_timeout = download_timeout
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._session = requests.Session()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._inflight_lock = threading.Lock()
+        self._failures: 'OrderedDict[str, float]' = OrderedDict()  # url → время ошибки, старые в начале
+        self._failures_lock = threading.Lock()
+        self._approx_size: Optional[int] = None
+        self._evict_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'renders': 0, 'errors': 0, 'evicted': 0}
+
+    # ------------------------------------------------------------------
+    # Ключи и форматы
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def supported_formats() -> Tuple[str, ...]:
+        available = []
+        if features.check('avif'):
+            available.append('avif')
+        if features.check('webp'):
+            available.append('webp')
+        available.append('jpeg')
+        return tuple(available)
+
+    def negotiate_format(self, accept_header: Optional[str]) -> str:
+        """Выбрать лучший формат, который принимает браузер"""
+        accept = (accept_header or '').lower()
+        supported = self.supported_formats()
+        if 'image/avif' in accept and 'avif' in supported:
+            return 'avif'
+        if 'image/webp' in accept and 'webp' in supported:
+            return 'webp'
+        return 'jpeg'
+
+    @staticmethod
+    def make_key(url: str, crop: int, fmt: str) -> str:
+        raw = f"{RENDER_VERSION}|{url}|{int(crop)}|{fmt}".encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    def _path_for(self, key: str, fmt: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key[2:4], f"{key}.{fmt}")
+
+    # ------------------------------------------------------------------
+    # Чтение / рендер
+    # ------------------------------------------------------------------
+
+    def get(self, url: str, crop: int = 8, fmt: str = 'jpeg') -> Optional[Tuple[str, str, str]]:
+        """
+        Вернуть (путь к файлу, mimetype, ключ) из кэша, отрендерив при промахе.
+        None — если исходную картинку получить не удалось.
+        """
+        key = self.make_key(url, crop, fmt)
+        path = self._path_for(key, fmt)
+        mimetype = FORMATS[fmt][1]
+
+        if self._touch(path):
+            self.stats['hits'] += 1
+            return path, mimetype, key
+
+        failed_at = self._failures.get(url)
+        if failed_at and time.time() - failed_at < self.FAILURE_TTL:
+            return None
+
+        self.stats['misses'] += 1
+        if self._single_flight(key, path, lambda: self._render_to_disk(url, crop, fmt, path)):
+            return path, mimetype, key
+        return None
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Есть ли файл; обновить mtime для LRU"""
+        try:
+            os.utime(path, None)
+            return True
+        except OSError:
+            return False
+
+    def _single_flight(self, key: str, path: str, render) -> bool:
+        """Один рендер на ключ внутри процесса, остальные ждут его результата"""
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[key] = event
+
+        if not leader:
+            event.wait(self.LOCK_TIMEOUT)
+            return os.path.exists(path)
+
+        try:
+            # Предыдущий лидер мог дорендерить между нашим промахом и захватом ключа
+            if self._touch(path):
+                return True
+            return render()
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _render_to_disk(self, url: str, crop: int, fmt: str, path: str) -> bool:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock_path = path + '.lock'
+
+        # Межпроцессный single-flight: lock-файл создаёт только один worker
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+        except FileExistsError:
+            if time.time() - self._mtime(lock_path) > self.LOCK_TIMEOUT:
+                # Зависший lock от упавшего процесса
+                self._remove(lock_path)
+                return self._render_to_disk(url, crop, fmt, path)
+            return self._wait_for(path)
+
+        try:
+            response = self._session.get(url, timeout=self.download_timeout)
+            response.raise_for_status()
+            img = crop_image_bytes(response.content, crop)
+
+            pil_format, _mimetype, options = FORMATS[fmt]
+            if img.mode not in ('RGB', 'L') and pil_format == 'JPEG':
+                img = img.convert('RGB')
+            elif img.mode not in ('RGB', 'RGBA', 'L'):
+                img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+            buffer = io.BytesIO()
+            img.save(buffer, format=pil_format, **options)
+            data = buffer.getvalue()
+
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            self.stats['renders'] += 1
+            self._account(len(data))
+            return True
+        except Exception as e:
+            self.stats['errors'] += 1
+            self._remember_failure(url)
+            logger.warning(f"Image proxy render failed for {url}: {e}")
+            return False
+        finally:
+            self._remove(lock_path)
+
+    def _remember_failure(self, url: str):
+        """Запомнить ошибку; истёкшие записи и всё сверх MAX_FAILURES выбрасываются с начала"""
+        now = time.time()
+        with self._failures_lock:
+            self._failures[url] = now
+            self._failures.move_to_end(url)
+            while self._failures:
+                oldest = next(iter(self._failures.values()))
+                if len(self._failures) <= self.MAX_FAILURES and now - oldest < self.FAILURE_TTL:
+                    break
+                self._failures.popitem(last=False)
+
+    def _wait_for(self, path: str) -> bool:
+        deadline = time.time() + self.LOCK_TIMEOUT
+        while time.time() < deadline:
+            if os.path.exists(path):
+                return True
+            if not os.path.exists(path + '.lock'):
+                return os.path.exists(path)
+            time.sleep(0.05)
+        return False
+
+    @staticmethod
+    def _mtime(path: str) -> float:
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Вытеснение (LRU по mtime)
+    # ------------------------------------------------------------------
+
+    def _scan(self):
+        files = []
+        for root, _dirs, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith('.lock') or name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _account(self, added: int):
+        if self._approx_size is None:
+            self._approx_size = sum(size for _, size, _ in self._scan())
+        else:
+            self._approx_size += added
+        if self._approx_size > self.max_bytes:
+            self.evict()
+
+    def evict(self, target_ratio: float = 0.9) -> int:
+        """Удалить самые старые файлы, пока кэш не станет меньше target_ratio * max_bytes"""
+        if not self._evict_lock.acquire(blocking=False):
+            return 0
+        try:
+            files = sorted(self._scan())
+            total = sum(size for _, size, _ in files)
+            target = int(self.max_bytes * target_ratio)
+            removed = 0
+            for _mtime, size, path in files:
+                if total <= target:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+            self._approx_size = total
+            self.stats['evicted'] += removed
+            if removed:
+                logger.info(f"🧹 Image cache evicted {removed} files, size now {total / 1024 ** 2:.1f} MB")
+            return removed
+        finally:
+            self._evict_lock.release()
+
+    # ------------------------------------------------------------------
+    # Прогрев
+    # ------------------------------------------------------------------
+
+    def prewarm(self, urls: Iterable[str], crop: int = 8, formats: Iterable[str] = ('webp', 'jpeg'),
+                workers: int = 4) -> Dict[str, int]:
+        """Отрендерить пачку картинок заранее (уже закэшированные пропускаются)"""
+        formats = [fmt for fmt in formats if fmt in self.supported_formats()]
+        tasks = [(url, fmt) for url in dict.fromkeys(u for u in urls if u) for fmt in formats]
+        result = {'total': len(tasks), 'cached': 0, 'rendered': 0, 'failed': 0}
+
+        def warm(task):
+            url, fmt = task
+            key = self.make_key(url, crop, fmt)
+            if os.path.exists(self._path_for(key, fmt)):
+                return 'cached'
+            return 'rendered' if self.get(url, crop, fmt) else 'failed'
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='img_prewarm') as executor:
+            for outcome in executor.map(warm, tasks):
+                result[outcome] += 1
+        logger.info(f"🔥 Image cache prewarm: {result}")
+        return result
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, approx_size=self._approx_size, max_bytes=self.max_bytes)
+
+
+def collect_catalogue_image_urls():
+    """Все main_image / gallery_images активных квартир и ЖК"""
+    import json
+    from app import db
+    from models import Property, ResidentialComplex
+
+    urls = []
+    for model in (Property, ResidentialComplex):
+        rows = db.session.query(model.main_image, model.gallery_images).filter(model.is_active == True).all()
+        for main_image, gallery_images in rows:
+            if main_image:
+                urls.append(main_image)
+            if gallery_images:
+                try:
+                    gallery = json.loads(gallery_images) if isinstance(gallery_images, str) else gallery_images
+                except (TypeError, ValueError):
+                    continue
+                if isinstance(gallery, list):
+                    urls.extend(url for url in gallery if isinstance(url, str) and url.startswith('http'))
+    return list(dict.fromkeys(urls))
+
+
+# Глобальный экземпляр кэша
+_image_cache = None
+
+
+def get_image_cache() -> ImageProxyCache:
+    """Получить singleton экземпляр ImageProxyCache"""
+    global _image_cache
+    if _image_cache is None:
+        cache_dir = os.environ.get('IMAGE_CACHE_DIR', os.path.join('instance', 'image_cache'))
+        max_mb = int(os.environ.get('IMAGE_CACHE_MAX_MB', '2048'))
+        _image_cache = ImageProxyCache(cache_dir, max_bytes=max_mb * 1024 ** 2)
+    return _image_cache
@@ -0,0 +1,660 @@
+"""
+Единый движок импорта каталога (Excel / CSV / JSON / вывод парсеров)
+
+В scripts/ десятки одноразовых импортёров: каждый заново описывает
+сопоставление колонок, делает add() по одной квартире и ищет
+Developer / ResidentialComplex по имени на каждой строке. Здесь:
+
+1. Источник (ExcelSource, CsvSource, JsonSource, RecordsSource) отдаёт
+   строки потоком как {колонка парсера: значение}; column_map переименовывает
+   чужие колонки (например {'id': 'inner_id'}).
+2. normalize_row() проверяет и приводит строку к полям Property.
+3. ReferenceResolver держит name → id для застройщиков, ЖК, районов и
+   корпусов на всё время импорта: один запрос на таблицу вместо запроса
+   на строку; недостающие застройщики, ЖК и корпуса создаются один раз.
+4. Хэш нормализованной строки хранится в import_row_hashes: строки без
+   изменений пропускаются, не трогая properties.
+5. Новые и изменённые строки пишутся пачкой: INSERT ... ON CONFLICT
+   (inner_id) DO UPDATE через executemany, commit на пачку.
+6. dry_run=True ничего не пишет и возвращает отчёт: сколько строк будет
+   добавлено / изменено / пропущено и примеры изменений по полям.
+
+CLI: python scripts/import_catalogue.py <file> [--dry-run]
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+MAX_ERROR_SAMPLES = 20
+MAX_DIFF_SAMPLES = 20
+HASH_ENTITY = 'property'
+
+# Поля Property, которые обновляет повторный импорт того же inner_id
+UPSERT_COLUMNS = (
+    'title', 'rooms', 'area', 'floor', 'total_floors', 'price', 'price_per_sqm',
+    'developer_id', 'complex_id', 'building_id', 'district_id', 'complex_building_name',
+    'address', 'latitude', 'longitude', 'main_image', 'gallery_images', 'renovation_type', 'url',
+    'is_apartment', 'mortgage_price', 'min_rate', 'deal_type', 'description',
+)
+REFERENCE_FIELDS = ('_developer_name', '_complex_name', '_building_name', '_district_name')
+
+
+class RowError(ValueError):
+    """Строка не прошла проверку — пропускается, причина попадает в отчёт"""
+
+
+# ----------------------------------------------------------------------
+# Нормализация
+# ----------------------------------------------------------------------
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def _number(value, kind, field: str):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        if isinstance(value, str):
+            value = value.replace('\xa0', '').replace(' ', '').replace(',', '.')
+        return kind(float(value))
+    except (TypeError, ValueError):
+        raise RowError(f"{field}: не число ({value!r})")
+
+
+def _flag(value, default=None) -> Optional[bool]:
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'да', 'yes')
+    return bool(value)
+
+
+def _photos(value) -> List[str]:
+    """JSON-массив, массив PostgreSQL {a,b} или список через запятую / перевод строки"""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(url).strip() for url in value if url]
+    text = str(value).strip()
+    if not text:
+        return []
+    if text.startswith('['):
+        try:
+            return [str(url).strip() for url in json.loads(text) if url]
+        except ValueError:
+            pass
+    if text.startswith('{') and text.endswith('}'):
+        text = text[1:-1]
+    return [url.strip().strip('"') for url in text.replace('\n', ',').split(',') if url.strip().strip('"')]
+
+
+def _title(rooms: Optional[int], area: Optional[float]) -> str:
+    kind = 'Студия' if rooms == 0 else f'{rooms}-комн. квартира' if rooms else 'Квартира'
+    return f'{kind}, {area:g} м²' if area else kind
+
+
+def normalize_row(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Строка с колонками парсера (inner_id, price, object_area, ...) → значения Property
+
+    Имена застройщика, ЖК, корпуса и района возвращаются в полях REFERENCE_FIELDS,
+    id подставляет ReferenceResolver. RowError — строку нужно пропустить.
+    """
+    inner_id = _text(raw.get('inner_id'))
+    if not inner_id:
+        raise RowError("нет inner_id")
+    if len(inner_id) > 50:
+        raise RowError("inner_id длиннее 50 символов")
+
+    price = _number(raw.get('price'), int, 'price')
+    if not price or price <= 0:
+        raise RowError("нет цены")
+    area = _number(raw.get('object_area'), float, 'object_area')
+    if area is not None and area <= 0:
+        area = None
+    rooms = _number(raw.get('object_rooms'), int, 'object_rooms')
+
+    latitude = _number(raw.get('address_position_lat'), float, 'address_position_lat')
+    longitude = _number(raw.get('address_position_lon'), float, 'address_position_lon')
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        latitude = longitude = None
+
+    price_per_sqm = _number(raw.get('square_price'), int, 'square_price')
+    if not price_per_sqm and area:
+        price_per_sqm = int(price / area)
+
+    photos = _photos(raw.get('photos'))
+    building_name = (_text(raw.get('complex_building_name')) or '')[:100] or None
+    return {
+        'inner_id': inner_id,
+        'title': _title(rooms, area),
+        'rooms': rooms,
+        'area': area,
+        'floor': _number(raw.get('object_min_floor'), int, 'object_min_floor'),
+        'total_floors': _number(raw.get('object_max_floor'), int, 'object_max_floor'),
+        'price': price,
+        'price_per_sqm': price_per_sqm,
+        'complex_building_name': building_name,
+        'address': (_text(raw.get('address_display_name')) or '')[:300] or None,
+        'latitude': latitude,
+        'longitude': longitude,
+        'main_image': photos[0][:300] if photos else None,
+        'gallery_images': json.dumps(photos, ensure_ascii=False) if photos else None,
+        'renovation_type': _text(raw.get('renovation_type')),
+        'url': (_text(raw.get('url')) or '')[:500] or None,
+        'is_apartment': _flag(raw.get('object_is_apartment'), True),
+        'mortgage_price': _number(raw.get('mortgage_price'), float, 'mortgage_price'),
+        'min_rate': _number(raw.get('min_rate'), float, 'min_rate'),
+        'deal_type': _text(raw.get('deal_type')),
+        'description': _text(raw.get('description')),
+        '_developer_name': _text(raw.get('developer_name')),
+        '_complex_name': _text(raw.get('complex_name')),
+        '_building_name': building_name,
+        '_district_name': _text(raw.get('district') or raw.get('parsed_district')),
+    }
+
+
+def row_hash(values: Dict[str, Any]) -> str:
+    """Отпечаток нормализованной строки (по именам связей, не по id)"""
+    payload = json.dumps(values, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+# ----------------------------------------------------------------------
+# Источники
+# ----------------------------------------------------------------------
+
+class _Source:
+    """Итерация (номер строки, {колонка: значение}); total — число строк, если известно заранее"""
+
+    total: Optional[int] = None
+
+    def __init__(self, column_map: Optional[Dict[str, str]] = None):
+        self.column_map = column_map or {}
+
+    def _rename(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.column_map:
+            return row
+        return {self.column_map.get(key, key): value for key, value in row.items()}
+
+    def rows(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def __iter__(self):
+        for number, row in self.rows():
+            yield number, self._rename(row)
+
+
+class ExcelSource(_Source):
+    """Первый лист .xlsx в режиме read_only — строки не держатся в памяти целиком"""
+
+    def __init__(self, path: str, column_map: Optional[Dict[str, str]] = None):
+        import openpyxl
+
+        super().__init__(column_map)
+        self._workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        self._sheet = self._workbook.active
+        self.total = self._sheet.max_row - 1 if self._sheet.max_row else None
+
+    def rows(self):
+        try:
+            values = self._sheet.iter_rows(values_only=True)
+            header = next(values, None)
+            if not header:
+                return
+            columns = [str(name).strip() if name is not None else None for name in header]
+            for number, row in enumerate(values, start=2):
+                if row is None or all(value is None for value in row):
+                    continue
+                yield number, {column: value for column, value in zip(columns, row) if column}
+        finally:
+            self._workbook.close()
+
+
+class CsvSource(_Source):
+    """CSV с заголовком; разделитель определяется по первой строке"""
+
+    def __init__(self, path: str, delimiter: Optional[str] = None, encoding: str = 'utf-8-sig',
+                 column_map: Optional[Dict[str, str]] = None):
+        super().__init__(column_map)
+        self.path = path
+        self.delimiter = delimiter
+        self.encoding = encoding
+
+    def rows(self):
+        with open(self.path, newline='', encoding=self.encoding) as f:
+            delimiter = self.delimiter
+            if delimiter is None:
+                first = f.readline()
+                delimiter = max(';,\t', key=first.count)
+                f.seek(0)
+            for number, row in enumerate(csv.DictReader(f, delimiter=delimiter), start=2):
+                yield number, {key.strip(): (value if value != '' else None)
+                               for key, value in row.items() if key}
+
+
+class JsonSource(_Source):
+    """
+    JSON-массив объектов (или {"properties" | "items" | "data": [...]}) либо JSON Lines (.jsonl)
+    JSON Lines читается построчно; обычный JSON загружается целиком
+    """
+
+    def __init__(self, path: str, column_map: Optional[Dict[str, str]] = None):
+        super().__init__(column_map)
+        self.path = path
+
+    def rows(self):
+        if self.path.endswith('.jsonl'):
+            with open(self.path, encoding='utf-8') as f:
+                for number, line in enumerate(f, start=1):
+                    if line.strip():
+                        yield number, json.loads(line)
+            return
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = next((data[key] for key in ('properties', 'items', 'data') if isinstance(data.get(key), list)), [])
+        self.total = len(data)
+        for number, row in enumerate(data, start=1):
+            yield number, row
+
+
+class RecordsSource(_Source):
+    """Готовые словари в памяти — вывод парсеров (domclick и т.п.)"""
+
+    def __init__(self, records: Iterable[Dict[str, Any]], total: Optional[int] = None,
+                 column_map: Optional[Dict[str, str]] = None):
+        super().__init__(column_map)
+        self.records = records
+        self.total = total if total is not None else (len(records) if hasattr(records, '__len__') else None)
+
+    def rows(self):
+        for number, row in enumerate(self.records, start=1):
+            yield number, row
+
+
+def open_source(path: str, column_map: Optional[Dict[str, str]] = None) -> _Source:
+    """Источник по расширению файла"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.xlsx':
+        return ExcelSource(path, column_map=column_map)
+    if extension in ('.csv', '.tsv'):
+        return CsvSource(path, delimiter='\t' if extension == '.tsv' else None, column_map=column_map)
+    if extension in ('.json', '.jsonl'):
+        return JsonSource(path, column_map=column_map)
+    raise ValueError(f"Неподдерживаемый формат: {extension or path}")
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ----------------------------------------------------------------------
+# Связи
+# ----------------------------------------------------------------------
+
+class ReferenceResolver:
+    """
+    Имя → id для застройщиков, ЖК, корпусов и районов на время импорта
+
+    Недостающие застройщики, ЖК и корпуса создаются один раз (кроме dry_run —
+    тогда только считаются); районы не создаются: у них геометрия и SEO-страницы.
+    """
+
+    def __init__(self, session, dry_run: bool = False):
+        from models import Building, Developer, District, ResidentialComplex
+
+        self.session = session
+        self.dry_run = dry_run
+        self.developers = {name.lower(): did for did, name in session.query(Developer.id, Developer.name)}
+        self.complexes = {}
+        for cid, name in session.query(ResidentialComplex.id, ResidentialComplex.name).order_by(
+                ResidentialComplex.id.desc()):
+            self.complexes[name.lower()] = cid  # при дублях имени — меньший id
+        self.districts = {}
+        for did, name in session.query(District.id, District.name).order_by(District.id.desc()):
+            self.districts[name.lower()] = did
+        self.buildings = {(complex_id, name.lower()): bid for bid, complex_id, name
+                          in session.query(Building.id, Building.complex_id, Building.name)}
+        self.slugs = {
+            'developers': set(session.execute(select(Developer.slug)).scalars()),
+            'complexes': set(session.execute(select(ResidentialComplex.slug)).scalars()),
+        }
+        self.created = {'developers': set(), 'complexes': set(), 'buildings': set()}
+
+    def _slug(self, kind: Optional[str], name: str) -> str:
+        from app import create_slug
+
+        base = (create_slug(name) or 'item').lower()[:90]
+        if kind is None:
+            return base
+        slug, n = base, 2
+        while slug in self.slugs[kind]:
+            slug, n = f'{base}-{n}', n + 1
+        self.slugs[kind].add(slug)
+        return slug
+
+    def _create(self, kind: str, key, label: str, factory: Callable[[], Any]) -> Optional[int]:
+        self.created[kind].add(label)
+        if self.dry_run:
+            return None
+        obj = factory()
+        self.session.add(obj)
+        self.session.flush()
+        getattr(self, kind)[key] = obj.id
+        return obj.id
+
+    def developer_id(self, name: Optional[str]) -> Optional[int]:
+        from models import Developer
+
+        if not name:
+            return None
+        key = name.lower()
+        if key in self.developers:
+            return self.developers[key]
+        return self._create('developers', key, name, lambda: Developer(
+            name=name[:200], slug=self._slug('developers', name)))
+
+    def complex_id(self, name: Optional[str], developer_id: Optional[int]) -> Optional[int]:
+        from models import ResidentialComplex
+
+        if not name:
+            return None
+        key = name.lower()
+        if key in self.complexes:
+            return self.complexes[key]
+        return self._create('complexes', key, name, lambda: ResidentialComplex(
+            name=name[:100], slug=self._slug('complexes', name), developer_id=developer_id))
+
+    def building_id(self, name: Optional[str], complex_id: Optional[int]) -> Optional[int]:
+        from models import Building
+
+        if not name or complex_id is None:
+            return None
+        key = (complex_id, name.lower())
+        if key in self.buildings:
+            return self.buildings[key]
+        return self._create('buildings', key, name, lambda: Building(
+            name=name, slug=self._slug(None, name), complex_id=complex_id))
+
+    def district_id(self, name: Optional[str]) -> Optional[int]:
+        return self.districts.get(name.lower()) if name else None
+
+    def resolve(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Заменить имена связей (REFERENCE_FIELDS) на id"""
+        developer_id = self.developer_id(values.pop('_developer_name'))
+        complex_id = self.complex_id(values.pop('_complex_name'), developer_id)
+        values['developer_id'] = developer_id
+        values['complex_id'] = complex_id
+        values['building_id'] = self.building_id(values.pop('_building_name'), complex_id)
+        values['district_id'] = self.district_id(values.pop('_district_name'))
+        return values
+
+
+# ----------------------------------------------------------------------
+# Запись
+# ----------------------------------------------------------------------
+
+def ensure_upsert_index(engine):
+    """Уникальный индекс по inner_id нужен для ON CONFLICT; на старых БД создаём при первом импорте"""
+    from models import Property
+
+    index = next(index for index in Property.__table__.indexes if index.name == 'uq_properties_inner_id')
+    index.create(bind=engine, checkfirst=True)
+
+
+def _dialect_insert(connection):
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Upsert is not supported for {dialect}")
+    return insert
+
+
+def upsert_properties(connection, rows: List[Dict[str, Any]]):
+    """
+    INSERT ... ON CONFLICT (inner_id) DO UPDATE пачкой (executemany)
+    Значение NULL из файла не затирает уже заполненное поле
+    """
+    from models import Property
+
+    if not rows:
+        return
+    table = Property.__table__
+    statement = _dialect_insert(connection)(table)
+    update = {column: func.coalesce(statement.excluded[column], table.c[column]) for column in UPSERT_COLUMNS}
+    update['is_active'] = True
+    update['updated_at'] = statement.excluded.updated_at
+    connection.execute(statement.on_conflict_do_update(index_elements=[table.c.inner_id], set_=update), rows)
+
+
+def _store_hashes(connection, hashes: Dict[str, str], now: datetime):
+    from models import ImportRowHash
+
+    if not hashes:
+        return
+    table = ImportRowHash.__table__
+    statement = _dialect_insert(connection)(table)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.entity, table.c.key],
+        set_={'row_hash': statement.excluded.row_hash, 'updated_at': statement.excluded.updated_at},
+    ), [{'entity': HASH_ENTITY, 'key': key, 'row_hash': digest, 'updated_at': now}
+        for key, digest in hashes.items()])
+
+
+# ----------------------------------------------------------------------
+# Движок
+# ----------------------------------------------------------------------
+
+class ImportReport:
+    """Итог импорта (или прогноз при dry_run)"""
+
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.total_rows: Optional[int] = None
+        self.processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.errors: List[Dict] = []
+        self.diffs: List[Dict] = []
+        self.created: Dict[str, List[str]] = {}
+        self.complex_ids = set()
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'dry_run': self.dry_run,
+            'total_rows': self.total_rows,
+            'processed': self.processed,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'diffs': self.diffs,
+            'created': self.created,
+            'elapsed': round(self.elapsed, 2),
+        }
+
+
+class ImportEngine:
+    """
+    Потоковый импорт квартир из любого источника
+
+    Args:
+        session: сессия SQLAlchemy (commit на каждую пачку, кроме dry_run)
+        normalizer: строка источника → значения Property (RowError — пропустить)
+        dry_run: ничего не писать, только отчёт
+    """
+
+    def __init__(self, session, normalizer: Callable[[Dict], Dict] = normalize_row,
+                 chunk_size: int = CHUNK_SIZE, dry_run: bool = False):
+        self.session = session
+        self.normalizer = normalizer
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+
+    def run(self, source: Iterable, progress: Optional[Callable[[ImportReport], None]] = None) -> ImportReport:
+        """
+        Args:
+            progress: вызывается после каждой пачки до её commit — можно
+                      дописать в ту же транзакцию состояние задачи
+        """
+        from services.complex_stats import refresh_complex_stats
+        from services.response_cache import invalidate_tags
+
+        report = ImportReport(dry_run=self.dry_run)
+        report.total_rows = getattr(source, 'total', None)
+        if not self.dry_run:
+            ensure_upsert_index(self.session.get_bind())
+        resolver = ReferenceResolver(self.session, dry_run=self.dry_run)
+        try:
+            for chunk in chunked(source, self.chunk_size):
+                tags = self._process_chunk(chunk, resolver, report)
+                report.elapsed = time.time() - report.started
+                if progress:
+                    progress(report)
+                if not self.dry_run:
+                    self.session.commit()
+                    # upsert идёт мимо ORM — трекер кэша ответов его не видит
+                    invalidate_tags(tags)
+
+            report.created = {kind: sorted(names) for kind, names in resolver.created.items() if names}
+            if not self.dry_run:
+                refresh_complex_stats(report.complex_ids, session=self.session)
+                self.session.commit()
+        finally:
+            if self.dry_run:
+                self.session.rollback()
+        report.elapsed = time.time() - report.started
+        return report
+
+    def _process_chunk(self, chunk: List[Tuple[int, Dict]], resolver: ReferenceResolver,
+                       report: ImportReport) -> Set[str]:
+        """Обработать пачку; возвращает теги кэша ответов, которые надо сбросить после commit"""
+        from models import ImportRowHash, Property
+        from services.response_cache import TAG_CATALOGUE, complex_tag, property_tag
+
+        batch: Dict[str, Dict] = {}
+        hashes: Dict[str, str] = {}
+        for number, raw in chunk:
+            report.processed += 1
+            try:
+                values = self.normalizer(raw)
+            except RowError as e:
+                report.skipped += 1
+                if len(report.errors) < MAX_ERROR_SAMPLES:
+                    report.errors.append({'row': number, 'error': str(e)})
+                continue
+            batch[values['inner_id']] = values  # повтор inner_id в пачке — берём последний
+            hashes[values['inner_id']] = row_hash(values)
+        if not batch:
+            return set()
+
+        connection = self.session.connection()
+        keys = list(batch)
+        properties = Property.__table__
+        existing = {row.inner_id: row for row in connection.execute(
+            select(properties.c.inner_id, properties.c.is_active, properties.c.complex_id).where(
+                properties.c.inner_id.in_(keys)))}
+        active = {key: row.is_active for key, row in existing.items()}
+        hash_table = ImportRowHash.__table__
+        known = dict(connection.execute(select(hash_table.c.key, hash_table.c.row_hash).where(
+            hash_table.c.entity == HASH_ENTITY, hash_table.c.key.in_(keys))).all())
+
+        changed = []
+        for key in keys:
+            if key in active and active[key] and known.get(key) == hashes[key]:
+                report.unchanged += 1
+            else:
+                changed.append(key)
+        updated = [key for key in changed if key in active]
+        report.inserted += len(changed) - len(updated)
+        report.updated += len(updated)
+        if not changed:
+            return set()
+
+        now = datetime.utcnow()
+        rows = []
+        for key in changed:
+            values = resolver.resolve(batch[key])
+            values.update(is_active=True, created_at=now, updated_at=now)
+            rows.append(values)
+            report.complex_ids.add(values['complex_id'])
+        # Квартира могла переехать в другой ЖК — статистику и кэш прежнего тоже обновляем
+        moved_from = {existing[key].complex_id for key in updated}
+        report.complex_ids.update(moved_from)
+        report.complex_ids.discard(None)
+        self._collect_diffs(connection, [row for row in rows if row['inner_id'] in active], report)
+
+        if self.dry_run:
+            return set()
+        upsert_properties(connection, rows)
+        _store_hashes(connection, {key: hashes[key] for key in changed}, now)
+
+        complex_ids = {row['complex_id'] for row in rows} | moved_from
+        property_ids = connection.execute(select(properties.c.id).where(properties.c.inner_id.in_(changed))).scalars()
+        return ({TAG_CATALOGUE} | {complex_tag(cid) for cid in complex_ids if cid is not None}
+                | {property_tag(pid) for pid in property_ids})
+
+    def _collect_diffs(self, connection, rows: List[Dict], report: ImportReport):
+        """Примеры изменений по полям (old → new) для отчёта"""
+        from models import Property
+
+        room = MAX_DIFF_SAMPLES - len(report.diffs)
+        if room <= 0 or not rows:
+            return
+        rows = rows[:room]
+        table = Property.__table__
+        columns = [table.c.inner_id] + [table.c[column] for column in UPSERT_COLUMNS]
+        current = {row.inner_id: row for row in connection.execute(
+            select(*columns).where(table.c.inner_id.in_([row['inner_id'] for row in rows])))}
+        for values in rows:
+            old = current.get(values['inner_id'])
+            if old is None:
+                continue
+            fields = {column: [getattr(old, column), values[column]] for column in UPSERT_COLUMNS
+                      if values.get(column) is not None and getattr(old, column) != values[column]}
+            if fields:
+                report.diffs.append({'inner_id': values['inner_id'], 'fields': fields})
+
+
+def import_catalogue(source: Iterable, session=None, dry_run: bool = False,
+                     chunk_size: int = CHUNK_SIZE) -> ImportReport:
+    """Импорт из источника в сессию приложения (для scripts/ и консоли)"""
+    if session is None:
+        from app import db
+        session = db.session
+    report = ImportEngine(session, chunk_size=chunk_size, dry_run=dry_run).run(source)
+    logger.info(f"{'🔍 Dry run' if dry_run else '✅ Import'}: {report.inserted} new, {report.updated} changed, "
+                f"{report.unchanged} unchanged, {report.skipped} skipped in {report.elapsed:.1f} s")
+    return report
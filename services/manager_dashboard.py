@@ -0,0 +1,519 @@
+"""
+Снимок панели менеджера и единая лента активности
+
+/api/manager/dashboard/all на каждый показ загружал всех клиентов менеджера,
+делал десяток count() и склеивал уведомления с рекомендациями в Python;
+dashboard-stats, activity-feed и top-clients повторяли ту же работу. Теперь:
+
+1. Всё, что зависит только от данных менеджера (клиенты, счётчики, последние
+   рекомендации, избранное, сохранённые поиски, сравнение, топ клиентов),
+   лежит в manager_dashboard_snapshots — одно чтение по первичному ключу.
+2. Снимок удаляется в той же транзакции, что меняет User / Recommendation /
+   Collection / Deal / избранное / поиски / сравнение этого менеджера,
+   и пересобирается при следующем открытии; новый снимок пишется отдельной
+   транзакцией, сессия GET-запроса только читает. Счётчики «за
+   сегодня» и «за неделю» дополнительно ограничены SNAPSHOT_TTL и датой сборки.
+3. Уведомления, рекомендации и новые клиенты пишутся при flush в manager_activity;
+   лента читается keyset-пагинацией по индексу (manager_id, created_at, id),
+   is_read уведомлений — одним IN-запросом на страницу, поэтому
+   ManagerNotification снимок не сбрасывает. Заполнение из истории —
+   ensure_activity() из `flask init-db`.
+"""
+
+import base64
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL = 900  # сек — ограничивает дрейф счётчиков «за неделю» / «в этом месяце»
+FEED_PAGE_SIZE = 10
+FEED_MAX_PAGE_SIZE = 50
+
+# Модель → поле с id менеджера, чьи снимки зависят от объекта
+MANAGER_FIELDS = {
+    'User': 'assigned_manager_id',
+    'Recommendation': 'manager_id',
+    'Collection': 'created_by_manager_id',
+    'Deal': 'manager_id',
+    'ManagerFavoriteProperty': 'manager_id',
+    'ManagerFavoriteComplex': 'manager_id',
+    'ManagerSavedSearch': 'manager_id',
+    'ManagerComparison': 'manager_id',
+}
+COMPARISON_ITEMS = ('ComparisonProperty', 'ComparisonComplex')
+
+# У клиента в снимке только эти поля — вход в кабинет (last_login) снимок не сбрасывает
+USER_SNAPSHOT_FIELDS = ('assigned_manager_id', 'full_name', 'email', 'phone', 'created_at')
+
+DEMO_ACTIVITIES = [
+    {
+        'title': 'Новый клиент добавлен',
+        'description': 'Демо Клиентов зарегистрировался в системе',
+        'time_ago': '2 ч. назад',
+        'icon': 'user-plus',
+        'color': 'green'
+    },
+    {
+        'title': 'Клиент просмотрел рекомендацию',
+        'description': 'Демо Клиентов открыл рекомендацию по ЖК "Солнечный"',
+        'time_ago': '4 ч. назад',
+        'icon': 'eye',
+        'color': 'purple'
+    }
+]
+
+
+def _default_session():
+    from app import db
+    return db.session
+
+
+def format_time_ago(timestamp: datetime, now: Optional[datetime] = None) -> str:
+    time_diff = (now or datetime.utcnow()) - timestamp
+    if time_diff.days > 0:
+        return f"{time_diff.days} дн. назад"
+    elif time_diff.seconds > 3600:
+        return f"{time_diff.seconds // 3600} ч. назад"
+    else:
+        return f"{time_diff.seconds // 60} мин. назад"
+
+
+# ----------------------------------------------------------------------
+# Снимок
+# ----------------------------------------------------------------------
+
+def build_snapshot(manager_id: int, session=None) -> Dict:
+    """Собрать данные панели менеджера из исходных таблиц"""
+    from models import (User, Recommendation, ManagerSavedSearch, Deal, Collection, ManagerComparison,
+                        ComparisonProperty, ComparisonComplex, ManagerFavoriteProperty, ManagerFavoriteComplex)
+
+    session = session or _default_session()
+    now = datetime.utcnow()
+    today = now.date()
+    week_ago = now - timedelta(days=7)
+    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    def count(model, *criteria):
+        return session.query(func.count(model.id)).filter(*criteria).scalar() or 0
+
+    clients = session.query(User.id, User.full_name, User.email, User.phone, User.created_at).filter(
+        User.assigned_manager_id == manager_id).order_by(User.id).all()
+
+    by_manager = Recommendation.manager_id == manager_id
+    recommendations = session.query(Recommendation, User.full_name).outerjoin(
+        User, User.id == Recommendation.client_id
+    ).filter(by_manager).order_by(Recommendation.sent_at.desc()).limit(10).all()
+
+    top_clients = session.query(
+        User.id, User.full_name, User.email, func.count(Recommendation.id).label('interactions_count')
+    ).join(Recommendation, User.id == Recommendation.client_id).filter(by_manager).group_by(
+        User.id, User.full_name, User.email
+    ).order_by(func.count(Recommendation.id).desc()).limit(5).all()
+
+    saved_searches = session.query(ManagerSavedSearch).filter_by(manager_id=manager_id).order_by(
+        ManagerSavedSearch.created_at.desc()).all()
+
+    comparison = session.query(ManagerComparison.id).filter_by(manager_id=manager_id, is_active=True).first()
+    comparison_props = comparison_complexes = 0
+    if comparison:
+        comparison_props = count(ComparisonProperty, ComparisonProperty.manager_comparison_id == comparison.id)
+        comparison_complexes = count(ComparisonComplex, ComparisonComplex.manager_comparison_id == comparison.id)
+
+    return {
+        'clients': [{
+            'id': client.id,
+            'full_name': client.full_name,
+            'email': client.email,
+            'phone': client.phone or '',
+            'status': 'active',
+            'search_preferences': None,
+            'created_at': client.created_at.isoformat() if client.created_at else None
+        } for client in clients],
+        'stats': {
+            'total_clients': len(clients),
+            'new_clients_today': sum(1 for c in clients if c.created_at and c.created_at.date() == today),
+            'total_recommendations': count(Recommendation, by_manager),
+            'monthly_recommendations': count(Recommendation, by_manager, Recommendation.sent_at >= month_start),
+            'recent_recommendations': count(Recommendation, by_manager, Recommendation.sent_at >= week_ago),
+            'today_recommendations': count(Recommendation, by_manager, func.date(Recommendation.sent_at) == today),
+            'collections_count': count(Collection, Collection.created_by_manager_id == manager_id),
+            'deals_count': count(Deal, Deal.manager_id == manager_id),
+        },
+        'favorites': {
+            'properties_count': count(ManagerFavoriteProperty, ManagerFavoriteProperty.manager_id == manager_id),
+            'complexes_count': count(ManagerFavoriteComplex, ManagerFavoriteComplex.manager_id == manager_id),
+        },
+        'saved_searches': [{
+            'id': search.id,
+            'name': search.name,
+            'filters': json.loads(search.additional_filters) if search.additional_filters else {},
+            'created_at': search.created_at.strftime('%d.%m.%Y')
+        } for search in saved_searches],
+        'recommendations': [{
+            'id': rec.id,
+            'title': rec.title,
+            'client_name': client_name or 'Клиент удален',
+            'sent_at': rec.sent_at.strftime('%d.%m.%Y в %H:%M'),
+            'status': rec.status,
+            'properties_count': 0
+        } for rec, client_name in recommendations],
+        'comparison': {
+            'properties_count': comparison_props,
+            'complexes_count': comparison_complexes,
+        },
+        'top_clients': [{
+            'id': row.id,
+            'full_name': row.full_name,
+            'email': row.email,
+            'interactions_count': row.interactions_count
+        } for row in top_clients],
+    }
+
+
+def get_snapshot(manager_id: int, session=None) -> Dict:
+    """
+    Снимок панели менеджера: одно чтение по первичному ключу,
+    пересборка только после инвалидации, по TTL или при смене дня.
+    Сессия запроса только читает — снимок сохраняется отдельной транзакцией
+    """
+    from models import ManagerDashboardSnapshot
+
+    session = session or _default_session()
+    now = datetime.utcnow()
+    row = session.get(ManagerDashboardSnapshot, manager_id)
+    previous_built_at = None
+    if row is not None:
+        if now - row.built_at < timedelta(seconds=SNAPSHOT_TTL) and row.built_at.date() == now.date():
+            return json.loads(row.payload)
+        previous_built_at = row.built_at
+        session.expire(row)
+
+    started = time.time()
+    snapshot = build_snapshot(manager_id, session=session)
+    try:
+        _store_snapshot(session.get_bind(mapper=inspect(ManagerDashboardSnapshot)), manager_id,
+                        json.dumps(snapshot, ensure_ascii=False), now, previous_built_at)
+    except Exception as e:
+        # Не сохранили — соберём при следующем открытии, ответ всё равно актуален
+        logger.error(f"❌ Manager {manager_id} dashboard snapshot not stored: {e}")
+    logger.debug(f"📊 Manager {manager_id} dashboard snapshot built in {(time.time() - started) * 1000:.0f} ms")
+    return snapshot
+
+
+def _store_snapshot(bind, manager_id: int, payload: str, built_at: datetime,
+                    previous_built_at: Optional[datetime] = None):
+    """
+    Записать снимок своей транзакцией. Если снимок успели сбросить или
+    пересобрать параллельно (built_at уже другой) — ничего не пишем
+    """
+    from models import ManagerDashboardSnapshot
+
+    table = ManagerDashboardSnapshot.__table__
+    try:
+        with bind.begin() as connection:
+            if previous_built_at is None:
+                connection.execute(insert(table).values(manager_id=manager_id, payload=payload, built_at=built_at))
+            else:
+                connection.execute(update(table).where(
+                    table.c.manager_id == manager_id, table.c.built_at == previous_built_at,
+                ).values(payload=payload, built_at=built_at))
+    except IntegrityError:
+        # Параллельный запрос уже сохранил снимок
+        pass
+
+
+def welcome_messages(manager, stats: Dict, now: Optional[datetime] = None) -> List[str]:
+    import pytz
+
+    now_moscow = (now or datetime.utcnow()).replace(tzinfo=pytz.UTC).astimezone(pytz.timezone('Europe/Moscow'))
+    hour = now_moscow.hour
+    if 5 <= hour < 12:
+        time_greeting = "Доброе утро"
+    elif 12 <= hour < 18:
+        time_greeting = "Добрый день"
+    else:
+        time_greeting = "Добрый вечер"
+
+    first_name = manager.full_name.split()[0] if manager.full_name else 'Менеджер'
+    messages = [f"{time_greeting}, {first_name}! Рады видеть вас снова."]
+    if stats['new_clients_today'] > 0:
+        messages.append(f"У вас {stats['new_clients_today']} новых клиентов сегодня!")
+    elif stats['recent_recommendations'] == 0:
+        messages.append("Готовы создать новую подборку для клиентов?")
+    elif stats['today_recommendations'] > 0:
+        messages.append(f"Отлично! Сегодня отправлено {stats['today_recommendations']} рекомендаций.")
+    else:
+        messages.append(f"На этой неделе отправлено {stats['recent_recommendations']} рекомендаций.")
+    return messages
+
+
+def invalidate_snapshots(manager_ids: Iterable[int], session=None):
+    """Удалить снимки менеджеров в текущей транзакции (для правок мимо ORM)"""
+    from models import ManagerDashboardSnapshot
+
+    manager_ids = sorted({int(mid) for mid in manager_ids if mid is not None})
+    if not manager_ids:
+        return
+    session = session or _default_session()
+    table = ManagerDashboardSnapshot.__table__
+    session.connection().execute(delete(table).where(table.c.manager_id.in_(manager_ids)))
+
+
+# ----------------------------------------------------------------------
+# Лента активности
+# ----------------------------------------------------------------------
+
+def encode_cursor(created_at: datetime, activity_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{activity_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """ValueError для некорректного курсора"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, activity_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(activity_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def activity_page(manager_id: int, cursor: Optional[str] = None, limit: int = FEED_PAGE_SIZE,
+                  session=None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Страница ленты (новые сверху) и курсор следующей страницы
+
+    Args:
+        cursor: next_cursor предыдущей страницы; None — первая страница
+    """
+    from models import ManagerActivity, ManagerNotification
+
+    session = session or _default_session()
+    limit = max(1, min(int(limit), FEED_MAX_PAGE_SIZE))
+
+    query = session.query(ManagerActivity).filter(ManagerActivity.manager_id == manager_id)
+    if cursor:
+        created_at, activity_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            ManagerActivity.created_at < created_at,
+            and_(ManagerActivity.created_at == created_at, ManagerActivity.id < activity_id),
+        ))
+    rows = query.order_by(ManagerActivity.created_at.desc(), ManagerActivity.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    notification_ids = [row.source_id for row in rows if row.kind == 'notification']
+    read_state = dict(session.query(ManagerNotification.id, ManagerNotification.is_read).filter(
+        ManagerNotification.id.in_(notification_ids)).all()) if notification_ids else {}
+
+    now = datetime.utcnow()
+    activities = []
+    for row in rows:
+        activity = {
+            'title': row.title,
+            'description': row.description,
+            'time_ago': format_time_ago(row.created_at, now),
+            'icon': row.icon,
+            'color': row.color,
+            'type': row.kind,
+        }
+        if row.kind == 'notification':
+            activity['is_read'] = bool(read_state.get(row.source_id))
+            activity['notification_id'] = row.source_id
+        activities.append(activity)
+
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    # Демо-активности только на пустой первой странице, как и раньше
+    if not cursor and len(activities) < 2:
+        activities.extend(dict(item) for item in DEMO_ACTIVITIES)
+    return activities, next_cursor
+
+
+def _notification_activity(notification) -> Dict:
+    is_view = notification.notification_type == 'presentation_view'
+    return {
+        'manager_id': notification.manager_id,
+        'kind': 'notification',
+        'source_id': notification.id,
+        'title': notification.title,
+        'description': notification.message,
+        'icon': 'eye' if is_view else 'bell',
+        'color': 'purple' if is_view else 'gray',
+        'created_at': notification.created_at or datetime.utcnow(),
+    }
+
+
+def _recommendation_activity(recommendation, client_name: Optional[str]) -> Dict:
+    return {
+        'manager_id': recommendation.manager_id,
+        'kind': 'recommendation',
+        'source_id': recommendation.id,
+        'title': 'Отправлена рекомендация',
+        'description': f'{recommendation.title} для {client_name or "Клиент"}',
+        'icon': 'paper-plane',
+        'color': 'blue',
+        'created_at': recommendation.sent_at or datetime.utcnow(),
+    }
+
+
+def _client_activity(user, assigned_at: Optional[datetime] = None) -> Dict:
+    return {
+        'manager_id': user.assigned_manager_id,
+        'kind': 'client',
+        'source_id': user.id,
+        'title': 'Новый клиент добавлен',
+        'description': f'{user.full_name} закреплён за вами',
+        'icon': 'user-plus',
+        'color': 'green',
+        'created_at': assigned_at or user.created_at or datetime.utcnow(),
+    }
+
+
+def rebuild_activity(session=None) -> int:
+    """Заполнить manager_activity из истории (с commit); возвращает количество строк"""
+    from models import ManagerActivity, ManagerNotification, Recommendation, User
+
+    session = session or _default_session()
+    rows = [_notification_activity(n) for n in session.query(ManagerNotification).yield_per(1000)]
+    rows += [_recommendation_activity(rec, name) for rec, name in session.query(Recommendation, User.full_name)
+             .outerjoin(User, User.id == Recommendation.client_id).yield_per(1000)]
+    rows += [_client_activity(user) for user in session.query(User).filter(
+        User.assigned_manager_id.isnot(None)).yield_per(1000)]
+
+    table = ManagerActivity.__table__
+    session.execute(delete(table))
+    if rows:
+        session.execute(insert(table), rows)
+    session.commit()
+    logger.info(f"✅ manager_activity rebuilt: {len(rows)} rows")
+    return len(rows)
+
+
+def ensure_activity(session=None) -> bool:
+    """Заполнить пустую ленту из истории (`flask init-db`, первый деплой); True — если заполняли"""
+    from models import ManagerActivity
+
+    session = session or _default_session()
+    if session.query(ManagerActivity.id).first() is not None:
+        return False
+    rebuild_activity(session=session)
+    return True
+
+
+# ----------------------------------------------------------------------
+# Отслеживание изменений
+# ----------------------------------------------------------------------
+
+def _field_values(obj, field: str) -> Set:
+    history = inspect(obj).attrs[field].history
+    values = set(history.deleted or ())
+    values.add(getattr(obj, field))
+    return values
+
+
+def _touches_snapshot(session, obj) -> bool:
+    if obj in session.new or obj in session.deleted:
+        return True
+    if type(obj).__name__ == 'User':
+        state = inspect(obj)
+        return any(state.attrs[field].history.has_changes() for field in USER_SNAPSHOT_FIELDS)
+    return session.is_modified(obj, include_collections=False)
+
+
+def _after_flush(session, flush_context):
+    from models import ManagerActivity, ManagerComparison
+
+    managers = set()
+    comparisons = set()
+    new_rows = []
+    stale_sources = []  # (kind, source_id) — удалить перед вставкой / при удалении источника
+    client_names = {}
+
+    objects = list(session.new) + list(session.dirty) + list(session.deleted)
+    for obj in objects:
+        name = type(obj).__name__
+        if name in COMPARISON_ITEMS:
+            comparisons |= _field_values(obj, 'manager_comparison_id')
+        elif name in MANAGER_FIELDS and _touches_snapshot(session, obj):
+            managers |= _field_values(obj, MANAGER_FIELDS[name])
+
+    for obj in session.new:
+        name = type(obj).__name__
+        if name == 'ManagerNotification':
+            new_rows.append(_notification_activity(obj))
+        elif name == 'Recommendation':
+            client_names[obj.client_id] = None
+        elif name == 'User' and obj.assigned_manager_id:
+            new_rows.append(_client_activity(obj))
+    for obj in session.dirty:
+        if type(obj).__name__ == 'User':
+            history = inspect(obj).attrs['assigned_manager_id'].history
+            if history.has_changes():
+                stale_sources.append(('client', obj.id))
+                if obj.assigned_manager_id:
+                    new_rows.append(_client_activity(obj, datetime.utcnow()))
+    for obj in session.deleted:
+        kind = {'ManagerNotification': 'notification', 'Recommendation': 'recommendation', 'User': 'client'}.get(
+            type(obj).__name__)
+        if kind:
+            stale_sources.append((kind, obj.id))
+
+    if not (managers or comparisons or new_rows or stale_sources or client_names):
+        return
+
+    from models import User
+
+    connection = session.connection()
+    comparisons.discard(None)
+    if comparisons:
+        managers.update(connection.execute(select(ManagerComparison.manager_id).where(
+            ManagerComparison.id.in_(comparisons))).scalars())
+    if client_names:
+        client_names.update(connection.execute(select(User.id, User.full_name).where(
+            User.id.in_([cid for cid in client_names if cid is not None]))).all())
+        new_rows += [_recommendation_activity(obj, client_names.get(obj.client_id))
+                     for obj in session.new if type(obj).__name__ == 'Recommendation']
+
+    table = ManagerActivity.__table__
+    for kind in {kind for kind, _ in stale_sources}:
+        ids = [source_id for k, source_id in stale_sources if k == kind]
+        connection.execute(delete(table).where(table.c.kind == kind, table.c.source_id.in_(ids)))
+    if new_rows:
+        connection.execute(insert(table), new_rows)
+    invalidate_snapshots(managers, session=session)
+
+
+_tracking_enabled = False
+
+
+def setup_manager_dashboard_tracking():
+    """
+    Подписаться на after_flush: запись ленты активности и сброс снимков
+    Вызывается один раз при инициализации приложения
+    """
+    global _tracking_enabled
+    if _tracking_enabled:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    _tracking_enabled = True
+    logger.info("✅ manager dashboard tracking registered")
+
+
+if __name__ == '__main__':
+    import sys
+    from app import app
+
+    if '--rebuild-activity' not in sys.argv:
+        print("Использование: python -m services.manager_dashboard --rebuild-activity")
+        sys.exit(1)
+    with app.app_context():
+        count = rebuild_activity()
+    print(f"✅ manager_activity: {count} строк")
@@ -0,0 +1,308 @@
+"""
+Серверная кластеризация карты поверх PropertyIndex
+
+Карта больше не получает весь каталог: клиент присылает bbox и zoom,
+сервер отвечает либо кластерами (количество, минимальная цена, границы),
+либо — при достаточном приближении — id отдельных квартир.
+
+Сетка — Web Mercator с GRID_BITS бит на ось, координаты квантуются один раз
+при построении индекса (PropertyIndex.grid_x / grid_y). Ячейка на зуме z —
+это просто сдвиг вправо, поэтому кластеризация = np.unique по ключу ячейки
+и bincount-агрегаты, без дерева и без SQL. Размер ответа ограничен числом
+ячеек в окне (≈ (ширина/CELL_PX) × (высота/CELL_PX)), а не размером каталога.
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from services.property_index import GRID_BITS, PropertyIndex, get_property_index, project_to_grid
+
+logger = logging.getLogger(__name__)
+
+# Размер ячейки кластера в пикселях экрана (тайл Leaflet = 256 px)
+TILE_PX = 256
+CELL_PX = 64
+MAX_ZOOM = 20
+
+# Начиная с этого зума (или если в окне мало объектов) отдаём отдельные точки
+POINTS_ZOOM = 16
+MAX_POINTS = 300
+
+LAYERS = ('properties', 'complexes')
+
+
+def parse_bbox(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """'south,west,north,east' → кортеж float или None"""
+    if not value:
+        return None
+    try:
+        south, west, north, east = (float(part) for part in value.split(','))
+    except ValueError:
+        return None
+    if south > north:
+        south, north = north, south
+    return south, west, north, east
+
+
+class _RowsSnapshot:
+    """Колонки снимка PropertyIndex, нужные карте, из строк SQL"""
+
+    __slots__ = ('ids', 'lat', 'lng', 'price', 'complex_id', 'complex_building_name', 'grid_x', 'grid_y')
+
+    def __init__(self, rows: List):
+        def column(name, missing=np.nan):
+            return np.array([missing if getattr(row, name) is None else getattr(row, name) for row in rows],
+                            dtype=np.float64)
+
+        self.ids = np.array([row.id for row in rows], dtype=np.int64)
+        self.lat = column('latitude')
+        self.lng = column('longitude')
+        self.price = column('price')
+        self.complex_id = column('complex_id', missing=-1).astype(np.int64)
+        names = [row.complex_building_name or '' for row in rows]
+        _, codes = np.unique(np.array(names, dtype=object), return_inverse=True)
+        self.complex_building_name = np.where(np.array([bool(name) for name in names], dtype=bool),
+                                              codes, -1).astype(np.int64)
+        self.grid_x, self.grid_y = project_to_grid(self.lat, self.lng)
+
+
+class MapClusterer:
+    """Кластеры и точки карты для окна просмотра"""
+
+    def __init__(self, index: Optional[PropertyIndex] = None):
+        self.index = index or get_property_index()
+        self.stats = {'queries': 0, 'cluster_responses': 0, 'point_responses': 0}
+
+    @staticmethod
+    def cell_shift(zoom: int) -> int:
+        """Сдвиг координат сетки, дающий ячейку CELL_PX на данном зуме"""
+        cells_per_tile_bits = (TILE_PX // CELL_PX).bit_length() - 1
+        return max(GRID_BITS - (int(zoom) + cells_per_tile_bits), 0)
+
+    def query(self, filters: Optional[Dict[str, Any]] = None,
+              bbox: Optional[Tuple[float, float, float, float]] = None,
+              zoom: int = 10, layer: str = 'properties',
+              restrict_ids: Optional[Iterable[int]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Args:
+            filters: фильтры PropertyRepository (без 'search')
+            bbox: (south, west, north, east); None — весь мир
+            zoom: зум Leaflet
+            layer: 'properties' или 'complexes'
+            restrict_ids: дополнительное ограничение по id (результат SQL-поиска)
+
+        Returns:
+            {'mode': 'clusters'|'points', 'total', 'clusters' | 'ids', 'bounds'}
+            или None, если фильтры не поддерживаются индексом
+        """
+        selected = self.index.select(filters)
+        if selected is None:
+            return None
+        snapshot, mask = selected
+        return self._cluster(snapshot, mask, bbox, zoom, layer, restrict_ids)
+
+    def query_rows(self, rows: Iterable, bbox: Optional[Tuple[float, float, float, float]] = None,
+                   zoom: int = 10, layer: str = 'properties') -> Dict[str, Any]:
+        """
+        Те же кластеры по строкам PropertyRepository.get_properties_with_coordinates()
+        (уже отфильтрованным в SQL) — когда индекс отключён или ещё не собран
+        """
+        snapshot = _RowsSnapshot(list(rows))
+        return self._cluster(snapshot, np.ones(len(snapshot.ids), dtype=bool), bbox, zoom, layer)
+
+    def _cluster(self, snapshot, mask: np.ndarray, bbox, zoom: int, layer: str,
+                 restrict_ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+        self.stats['queries'] += 1
+
+        zoom = min(max(int(zoom), 0), MAX_ZOOM)
+        shift = self.cell_shift(zoom)
+
+        # Как get_properties_with_coordinates(): только с координатами и с ЖК
+        mask = mask & ~np.isnan(snapshot.lat) & ~np.isnan(snapshot.lng) & (snapshot.complex_id >= 0)
+        if restrict_ids is not None:
+            mask &= np.isin(snapshot.ids, np.fromiter(restrict_ids, dtype=np.int64))
+
+        # Границы всей выборки — чтобы клиент мог подогнать карту при первой загрузке
+        everything = np.flatnonzero(mask)
+        bounds = self._bounds(snapshot.lat[everything], snapshot.lng[everything])
+
+        if bbox is not None:
+            mask &= self._bbox_mask(snapshot, bbox, shift)
+        positions = np.flatnonzero(mask)
+
+        if layer == 'complexes':
+            result = self._complexes(snapshot, positions, zoom, shift)
+        else:
+            result = self._properties(snapshot, positions, zoom, shift)
+        result['bounds'] = bounds
+        result['zoom'] = zoom
+        self.stats['point_responses' if result['mode'] == 'points' else 'cluster_responses'] += 1
+        return result
+
+    # ------------------------------------------------------------------
+    # Слои
+    # ------------------------------------------------------------------
+
+    def _properties(self, snapshot, positions: np.ndarray, zoom: int, shift: int) -> Dict[str, Any]:
+        total = int(positions.size)
+        if total <= MAX_POINTS or zoom >= POINTS_ZOOM:
+            price = np.where(np.isnan(snapshot.price[positions]), np.inf, snapshot.price[positions])
+            order = np.lexsort((snapshot.ids[positions], price))[:MAX_POINTS]
+            return {
+                'mode': 'points',
+                'total': total,
+                'truncated': total > MAX_POINTS,
+                'ids': [int(pid) for pid in snapshot.ids[positions[order]]],
+            }
+
+        clusters = self._aggregate(
+            grid_x=snapshot.grid_x[positions],
+            grid_y=snapshot.grid_y[positions],
+            lat=snapshot.lat[positions],
+            lng=snapshot.lng[positions],
+            price=snapshot.price[positions],
+            weight=np.ones(total, dtype=np.int64),
+            group_id=snapshot.complex_id[positions],
+            ids=snapshot.ids[positions],
+            shift=shift,
+        )
+        return {'mode': 'clusters', 'total': total, 'clusters': clusters}
+
+    def _complexes(self, snapshot, positions: np.ndarray, zoom: int, shift: int) -> Dict[str, Any]:
+        """ЖК как точки (центроид квартир), при отдалении — кластеры ЖК"""
+        complex_ids = snapshot.complex_id[positions]
+        uniq, inverse, counts = np.unique(complex_ids, return_inverse=True, return_counts=True)
+        lat = np.bincount(inverse, weights=snapshot.lat[positions]) / counts
+        lng = np.bincount(inverse, weights=snapshot.lng[positions]) / counts
+        min_price = self._group_min(inverse, snapshot.price[positions], len(uniq))
+        total = int(counts.sum())
+
+        if len(uniq) <= MAX_POINTS or zoom >= POINTS_ZOOM:
+            # Корпуса считаются здесь же — без COUNT(DISTINCT) на каждый ЖК
+            pairs = np.unique(np.stack([inverse, snapshot.complex_building_name[positions]]), axis=1)
+            buildings = np.bincount(pairs[0][pairs[1] >= 0], minlength=len(uniq))
+            complexes = [
+                {
+                    'id': int(uniq[i]),
+                    'lat': round(float(lat[i]), 6),
+                    'lng': round(float(lng[i]), 6),
+                    'count': int(counts[i]),
+                    'buildings': int(buildings[i]),
+                    'min_price': self._price(min_price[i]),
+                }
+                for i in range(len(uniq))
+            ]
+            return {'mode': 'points', 'total': total, 'complexes': complexes}
+
+        grid_x, grid_y = project_to_grid(lat, lng)
+        clusters = self._aggregate(
+            grid_x=grid_x, grid_y=grid_y, lat=lat, lng=lng,
+            price=np.where(np.isinf(min_price), np.nan, min_price),
+            weight=counts, group_id=uniq, ids=uniq, shift=shift,
+        )
+        return {'mode': 'clusters', 'total': total, 'clusters': clusters}
+
+    # ------------------------------------------------------------------
+    # Агрегация
+    # ------------------------------------------------------------------
+
+    def _aggregate(self, grid_x, grid_y, lat, lng, price, weight, group_id, ids, shift) -> List[Dict[str, Any]]:
+        """Свернуть точки в ячейки сетки: количество, центроид, мин. цена, границы"""
+        if grid_x.size == 0:
+            return []
+        cell_x = (grid_x >> shift).astype(np.int64)
+        cell_y = (grid_y >> shift).astype(np.int64)
+        keys = (cell_x << 32) | cell_y
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        groups = len(uniq)
+
+        counts = np.bincount(inverse, weights=weight, minlength=groups)
+        # Центроид взвешенный, чтобы маркер стоял там, где реально объекты
+        center_lat = np.bincount(inverse, weights=lat * weight, minlength=groups) / counts
+        center_lng = np.bincount(inverse, weights=lng * weight, minlength=groups) / counts
+        min_price = self._group_min(inverse, price, groups)
+
+        south = np.full(groups, np.inf)
+        north = np.full(groups, -np.inf)
+        west = np.full(groups, np.inf)
+        east = np.full(groups, -np.inf)
+        np.minimum.at(south, inverse, lat)
+        np.maximum.at(north, inverse, lat)
+        np.minimum.at(west, inverse, lng)
+        np.maximum.at(east, inverse, lng)
+
+        pairs = np.unique(np.stack([inverse, group_id]), axis=1)
+        groups_per_cell = np.bincount(pairs[0][pairs[1] >= 0], minlength=groups)
+        # Ячейка из одной точки — клиент рисует её как обычный маркер
+        rows_per_cell = np.bincount(inverse, minlength=groups)
+        single = np.full(groups, -1, dtype=np.int64)
+        single[inverse] = ids
+
+        clusters = []
+        for i in range(groups):
+            cluster = {
+                'lat': round(float(center_lat[i]), 6),
+                'lng': round(float(center_lng[i]), 6),
+                'count': int(counts[i]),
+                'complexes': int(groups_per_cell[i]),
+                'min_price': self._price(min_price[i]),
+                'bounds': [[round(float(south[i]), 6), round(float(west[i]), 6)],
+                           [round(float(north[i]), 6), round(float(east[i]), 6)]],
+            }
+            if rows_per_cell[i] == 1:
+                cluster['id'] = int(single[i])
+            clusters.append(cluster)
+        return clusters
+
+    @staticmethod
+    def _group_min(inverse: np.ndarray, values: np.ndarray, groups: int) -> np.ndarray:
+        result = np.full(groups, np.inf)
+        np.minimum.at(result, inverse, np.where(np.isnan(values), np.inf, values))
+        return result
+
+    @staticmethod
+    def _price(value: float) -> Optional[int]:
+        return int(value) if np.isfinite(value) else None
+
+    @staticmethod
+    def _bounds(lat: np.ndarray, lng: np.ndarray) -> Optional[List[List[float]]]:
+        if lat.size == 0:
+            return None
+        return [[float(lat.min()), float(lng.min())], [float(lat.max()), float(lng.max())]]
+
+    @staticmethod
+    def _bbox_mask(snapshot, bbox: Tuple[float, float, float, float], shift: int) -> np.ndarray:
+        """
+        Окно, расширенное до границ ячеек: кластер у края экрана
+        считается целиком и не «прыгает» при панорамировании
+        """
+        south, west, north, east = bbox
+        corner_x, corner_y = project_to_grid(np.array([north, south]), np.array([west, east]))
+        min_cx, max_cx = int(corner_x[0]) >> shift, int(corner_x[1]) >> shift
+        min_cy, max_cy = int(corner_y[0]) >> shift, int(corner_y[1]) >> shift
+        cell_x = snapshot.grid_x >> shift
+        cell_y = snapshot.grid_y >> shift
+        in_y = (cell_y >= min_cy) & (cell_y <= max_cy)
+        if west <= east:
+            in_x = (cell_x >= min_cx) & (cell_x <= max_cx)
+        else:
+            # Окно пересекает антимеридиан
+            in_x = (cell_x >= min_cx) | (cell_x <= max_cx)
+        return in_x & in_y
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+# Глобальный экземпляр
+_map_clusterer = None
+
+
+def get_map_clusterer() -> MapClusterer:
+    """Получить singleton экземпляр MapClusterer"""
+    global _map_clusterer
+    if _map_clusterer is None:
+        _map_clusterer = MapClusterer()
+    return _map_clusterer
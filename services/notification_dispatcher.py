@@ -0,0 +1,685 @@
+"""
+Отправка уведомлений через outbox (email / Telegram)
+
+Раньше send_notification() рендерил шаблоны и отправлял письмо / Telegram
+прямо в запросе менеджера, а каждое письмо = новое SMTP-соединение
+со STARTTLS и логином (или новый SendGridAPIClient). Теперь:
+
+1. Обработчик запроса только рендерит сообщение (TemplateRenderCache)
+   и кладёт строку в notification_outbox — одна короткая транзакция.
+2. Фоновый поток (или scripts/notification_worker.py) забирает пачку
+   готовых к отправке строк с claim_token — несколько процессов не
+   отправят одно сообщение дважды.
+3. Email: постоянные SMTP-соединения из SMTPConnectionPool или SendGrid
+   пачками (одинаковые письма — одним запросом с personalizations).
+   Telegram: один requests.Session и ограничение частоты (глобально
+   и на чат), 429 → повтор через retry_after.
+4. Ошибка → повтор с экспоненциальной задержкой, после MAX_ATTEMPTS — failed.
+"""
+
+import os
+import json
+import time
+import uuid
+import smtplib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from sqlalchemy import and_, bindparam, insert, select, update
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_EMAIL = 'email'
+CHANNEL_TELEGRAM = 'telegram'
+
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+STALE_CLAIM_SECONDS = 600  # 'sending' дольше этого — воркер умер, возвращаем в очередь
+BATCH_SIZE = 200
+
+
+def retry_delay(attempts: int) -> float:
+    """30 с, 1 мин, 2 мин, ... но не больше часа"""
+    return min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+
+
+class DeliveryError(Exception):
+    """
+    Сообщение не доставлено
+
+    Args:
+        retry_after: через сколько секунд повторять (из ответа сервиса)
+        permanent: повторять бессмысленно (адрес / чат не существует)
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, permanent: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+# ----------------------------------------------------------------------
+# Шаблоны
+# ----------------------------------------------------------------------
+
+def _cache_key_default(value):
+    """ORM-объекты в ключе кэша — по классу и id, даты — ISO; остальное не кэшируем"""
+    if hasattr(value, '__table__') and getattr(value, 'id', None) is not None:
+        return f"{type(value).__name__}:{value.id}"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(type(value).__name__)
+
+
+class TemplateRenderCache:
+    """
+    Кэш отрендеренных шаблонов писем
+
+    Одна и та же подборка / рекомендация для многих получателей рендерится
+    один раз. Данные, которые нельзя однозначно превратить в ключ, не кэшируются.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0, renderer: Callable = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._renderer = renderer
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'uncacheable': 0}
+
+    def _render(self, template_name: str, data: Dict[str, Any]) -> str:
+        if self._renderer is not None:
+            return self._renderer(template_name, **data)
+        from flask import render_template
+        return render_template(template_name, **data)
+
+    @staticmethod
+    def make_key(template_name: str, data: Dict[str, Any]) -> Optional[str]:
+        try:
+            return json.dumps([template_name, data], sort_keys=True, ensure_ascii=False, default=_cache_key_default)
+        except (TypeError, ValueError):
+            return None
+
+    def render(self, template_name: str, **data) -> str:
+        key = self.make_key(template_name, data)
+        if key is None:
+            self.stats['uncacheable'] += 1
+            return self._render(template_name, data)
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+
+        html = self._render(template_name, data)
+        with self._lock:
+            self.stats['misses'] += 1
+            self._entries[key] = (now, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+
+# ----------------------------------------------------------------------
+# Email
+# ----------------------------------------------------------------------
+
+class SMTPConnectionPool:
+    """
+    Постоянные SMTP-соединения: STARTTLS и логин один раз на соединение
+
+    Соединение, простоявшее дольше idle_timeout, закрывается; перед
+    повторным использованием проверяется NOOP.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 size: int = 2, idle_timeout: float = 60.0, timeout: float = 30.0,
+                 smtp_factory: Callable = smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self._idle: List[tuple] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self.stats = {'connects': 0, 'reuses': 0, 'messages': 0}
+
+    def _open(self):
+        conn = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        conn.ehlo()
+        if conn.has_extn('starttls'):
+            conn.starttls()
+            conn.ehlo()
+        if self.password:
+            conn.login(self.username, self.password)
+        self.stats['connects'] += 1
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _take_idle(self):
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if time.time() - last_used < self.idle_timeout:
+                    return conn
+                self._close(conn)
+        return None
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            conn = self._take_idle()
+            if conn is not None:
+                try:
+                    if conn.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected('NOOP failed')
+                    self.stats['reuses'] += 1
+                except (smtplib.SMTPException, OSError):
+                    self._close(conn)
+                    conn = None
+            if conn is None:
+                conn = self._open()
+
+            try:
+                yield conn
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._close(conn)
+                raise
+            except Exception:
+                # Ошибка уровня письма (отказ получателя) — соединение живое
+                with self._lock:
+                    self._idle.append((conn, time.time()))
+                raise
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.time()))
+        finally:
+            self._slots.release()
+
+    def send(self, message):
+        with self.connection() as conn:
+            conn.send_message(message)
+            self.stats['messages'] += 1
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+
+def build_email_message(from_address: str, to_email: str, subject: str, html: str) -> MIMEMultipart:
+    message = MIMEMultipart('alternative')
+    message['Subject'] = subject
+    message['From'] = from_address
+    message['To'] = to_email
+    message.attach(MIMEText(html, 'html', 'utf-8'))
+    return message
+
+
+class SMTPEmailBackend:
+    """Email через SMTPConnectionPool"""
+
+    def __init__(self, pool: SMTPConnectionPool, from_address: str):
+        self.pool = pool
+        self.from_address = from_address
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> Dict[int, Optional[DeliveryError]]:
+        results = {}
+        for message in messages:
+            try:
+                self.pool.send(build_email_message(self.from_address, message['recipient'],
+                                                   message['subject'] or '', message['body']))
+                results[message['id']] = None
+            except smtplib.SMTPRecipientsRefused as e:
+                results[message['id']] = DeliveryError(f'Recipient refused: {e}', permanent=True)
+            except Exception as e:
+                results[message['id']] = DeliveryError(f'SMTP error: {e}')
+        return results
+
+
+class SendGridEmailBackend:
+    """
+    Email через SendGrid: один клиент на процесс, одинаковые письма
+    (тема + HTML) — одним запросом с personalization на каждого получателя
+    """
+
+    MAX_PERSONALIZATIONS = 1000
+
+    def __init__(self, client, from_email: str, from_name: str = 'InBack'):
+        self.client = client
+        self.from_email = from_email
+        self.from_name = from_name
+        self.stats = {'requests': 0, 'messages': 0}
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> Dict[int, Optional[DeliveryError]]:
+        from sendgrid.helpers.mail import Mail, Email, To, Content, Personalization
+
+        groups = defaultdict(list)
+        for message in messages:
+            groups[(message['subject'] or '', message['body'])].append(message)
+
+        results = {}
+        for (subject, body), group in groups.items():
+            for start in range(0, len(group), self.MAX_PERSONALIZATIONS):
+                chunk = group[start:start + self.MAX_PERSONALIZATIONS]
+                mail = Mail(from_email=Email(self.from_email, self.from_name), subject=subject,
+                            html_content=Content('text/html', body))
+                for index, message in enumerate(chunk):
+                    personalization = Personalization()
+                    personalization.add_to(To(message['recipient']))
+                    mail.add_personalization(personalization, index=index)
+
+                error = None
+                try:
+                    response = self.client.send(mail)
+                    self.stats['requests'] += 1
+                    if response.status_code not in (200, 201, 202):
+                        error = DeliveryError(f'SendGrid status {response.status_code}')
+                except Exception as e:
+                    status = getattr(e, 'status_code', None)
+                    error = DeliveryError(f'SendGrid error: {e}', permanent=status in (400, 403))
+                for message in chunk:
+                    results[message['id']] = error
+                if error is None:
+                    self.stats['messages'] += len(chunk)
+        return results
+
+
+class LogEmailBackend:
+    """Почта не настроена: только пишем в лог (как раньше без EMAIL_PASSWORD)"""
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> Dict[int, Optional[DeliveryError]]:
+        for message in messages:
+            print(f"Email would be sent to {message['recipient']}: {message['subject']}")
+            print(f"Content preview: {message['body'][:200]}...")
+        return {message['id']: None for message in messages}
+
+
+# ----------------------------------------------------------------------
+# Telegram
+# ----------------------------------------------------------------------
+
+class TelegramSender:
+    """
+    Telegram Bot API через один requests.Session
+
+    Ограничения Telegram: ~30 сообщений в секунду всего и ~1 в секунду в один чат.
+    """
+
+    API_URL = 'https://api.telegram.org/bot{token}/sendMessage'
+    GLOBAL_PER_SECOND = 25
+    PER_CHAT_INTERVAL = 1.0
+
+    def __init__(self, token: str, session=None, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.url = self.API_URL.format(token=token)
+        self.session = session or requests.Session()
+        self.clock = clock
+        self.sleep = sleep
+        self._last_sent = float('-inf')
+        self._last_by_chat: Dict[str, float] = {}
+        self.stats = {'messages': 0, 'throttled_seconds': 0.0}
+
+    def _throttle(self, chat_id: str):
+        now = self.clock()
+        ready_at = max(self._last_sent + 1.0 / self.GLOBAL_PER_SECOND,
+                       self._last_by_chat.get(chat_id, float('-inf')) + self.PER_CHAT_INTERVAL)
+        if ready_at > now:
+            self.sleep(ready_at - now)
+            self.stats['throttled_seconds'] += ready_at - now
+            now = ready_at
+        self._last_sent = now
+        self._last_by_chat[chat_id] = now
+
+    def send(self, chat_id: str, text: str):
+        self._throttle(str(chat_id))
+        try:
+            response = self.session.post(self.url, data={
+                'chat_id': chat_id,
+                'text': text,
+                'parse_mode': 'HTML',
+                'disable_web_page_preview': True,
+            }, timeout=15)
+        except requests.RequestException as e:
+            raise DeliveryError(f'Telegram request failed: {e}')
+
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after', 5)
+            except ValueError:
+                retry_after = 5
+            raise DeliveryError('Telegram rate limit', retry_after=retry_after)
+        if response.status_code in (400, 403):
+            # Чат не найден / бот заблокирован — повтор не поможет
+            raise DeliveryError(f'Telegram {response.status_code}: {response.text[:200]}', permanent=True)
+        if response.status_code != 200:
+            raise DeliveryError(f'Telegram HTTP {response.status_code}')
+        self.stats['messages'] += 1
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> Dict[int, Optional[DeliveryError]]:
+        results = {}
+        for message in messages:
+            try:
+                self.send(message['recipient'], message['body'])
+                results[message['id']] = None
+            except DeliveryError as e:
+                results[message['id']] = e
+        return results
+
+
+# ----------------------------------------------------------------------
+# Dispatcher
+# ----------------------------------------------------------------------
+
+class NotificationDispatcher:
+    """
+    Outbox: enqueue() в запросе, доставка пачками в фоне
+
+    Args:
+        engine: SQLAlchemy engine (отдельные короткие транзакции, без сессии запроса)
+        backends: {'email': backend, 'telegram': backend} с методом send_batch(messages)
+        autostart: запускать фоновый поток при первой постановке в очередь
+    """
+
+    def __init__(self, engine, backends: Dict[str, Any], batch_size: int = BATCH_SIZE,
+                 poll_interval: float = 5.0, max_attempts: int = MAX_ATTEMPTS, autostart: bool = False):
+        from models import NotificationOutbox
+
+        self.engine = engine
+        self.table = NotificationOutbox.__table__
+        self.backends = backends
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.autostart = autostart
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+
+    # ------------------------------------------------------------------
+    # Очередь
+    # ------------------------------------------------------------------
+
+    def enqueue(self, channel: str, recipient: str, body: str, subject: Optional[str] = None,
+                notification_type: Optional[str] = None) -> int:
+        return self.enqueue_many([{
+            'channel': channel, 'recipient': recipient, 'body': body,
+            'subject': subject, 'notification_type': notification_type,
+        }])
+
+    def enqueue_many(self, messages: List[Dict[str, Any]]) -> int:
+        """Положить сообщения в outbox; возвращает количество"""
+        now = datetime.utcnow()
+        rows = [{
+            'channel': message['channel'],
+            'recipient': str(message['recipient'])[:200],
+            'subject': (message.get('subject') or '')[:300] or None,
+            'body': message['body'],
+            'notification_type': message.get('notification_type'),
+            'status': STATUS_PENDING,
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now,
+        } for message in messages if message.get('recipient')]
+        if not rows:
+            return 0
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.table), rows)
+        self.stats['enqueued'] += len(rows)
+        if self.autostart:
+            self.start()
+        self._wake.set()
+        return len(rows)
+
+    def _claim(self, now: datetime) -> List[Dict[str, Any]]:
+        """Забрать пачку готовых сообщений: только строки, помеченные нашим claim_token"""
+        t = self.table
+        token = uuid.uuid4().hex
+        with self.engine.begin() as conn:
+            # Воркер умер посреди отправки: попытка считается, исчерпавшие лимит — failed
+            stale = and_(t.c.status == STATUS_SENDING,
+                         t.c.claimed_at < now - timedelta(seconds=STALE_CLAIM_SECONDS))
+            abandoned = conn.execute(
+                update(t)
+                .where(stale, t.c.attempts + 1 >= self.max_attempts)
+                .values(status=STATUS_FAILED, attempts=t.c.attempts + 1, claim_token=None,
+                        last_error='Claim expired while sending')
+            ).rowcount
+            conn.execute(
+                update(t)
+                .where(stale)
+                .values(status=STATUS_PENDING, attempts=t.c.attempts + 1, claim_token=None,
+                        last_error='Claim expired while sending')
+            )
+            if abandoned:
+                self.stats['failed'] += abandoned
+                logger.warning(f"⚠️ {abandoned} notifications failed after expired claims")
+            ids = conn.execute(
+                select(t.c.id)
+                .where(t.c.status == STATUS_PENDING, t.c.next_attempt_at <= now)
+                .order_by(t.c.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not ids:
+                return []
+            conn.execute(
+                update(t)
+                .where(t.c.id.in_(ids), t.c.status == STATUS_PENDING)
+                .values(status=STATUS_SENDING, claim_token=token, claimed_at=now)
+            )
+            rows = conn.execute(select(t).where(t.c.claim_token == token).order_by(t.c.id)).mappings().all()
+        return [dict(row) for row in rows]
+
+    def _finish(self, messages: List[Dict[str, Any]], errors: Dict[int, Optional[DeliveryError]], now: datetime):
+        t = self.table
+        sent, retry, failed = [], [], []
+        for message in messages:
+            error = errors.get(message['id'], DeliveryError('No result from backend'))
+            attempts = message['attempts'] + 1
+            if error is None:
+                sent.append({'_id': message['id'], '_attempts': attempts})
+            elif error.permanent or attempts >= self.max_attempts:
+                failed.append({'_id': message['id'], '_attempts': attempts, '_error': str(error)[:2000]})
+            else:
+                delay = error.retry_after if error.retry_after is not None else retry_delay(attempts)
+                retry.append({'_id': message['id'], '_attempts': attempts, '_error': str(error)[:2000],
+                              '_next': now + timedelta(seconds=delay)})
+
+        where = and_(t.c.id == bindparam('_id'), t.c.status == STATUS_SENDING)
+        with self.engine.begin() as conn:
+            if sent:
+                conn.execute(update(t).where(where).values(
+                    status=STATUS_SENT, attempts=bindparam('_attempts'), sent_at=now,
+                    claim_token=None, last_error=None), sent)
+            if retry:
+                conn.execute(update(t).where(where).values(
+                    status=STATUS_PENDING, attempts=bindparam('_attempts'), last_error=bindparam('_error'),
+                    next_attempt_at=bindparam('_next'), claim_token=None), retry)
+            if failed:
+                conn.execute(update(t).where(where).values(
+                    status=STATUS_FAILED, attempts=bindparam('_attempts'), last_error=bindparam('_error'),
+                    claim_token=None), failed)
+
+        self.stats['sent'] += len(sent)
+        self.stats['retried'] += len(retry)
+        self.stats['failed'] += len(failed)
+        return {'sent': len(sent), 'retried': len(retry), 'failed': len(failed)}
+
+    def process_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Отправить одну пачку готовых сообщений"""
+        now = now or datetime.utcnow()
+        messages = self._claim(now)
+        if not messages:
+            return {'sent': 0, 'retried': 0, 'failed': 0}
+
+        by_channel = defaultdict(list)
+        for message in messages:
+            by_channel[message['channel']].append(message)
+
+        errors: Dict[int, Optional[DeliveryError]] = {}
+        for channel, channel_messages in by_channel.items():
+            backend = self.backends.get(channel)
+            if backend is None:
+                errors.update({m['id']: DeliveryError(f'Channel {channel} is not configured', permanent=True)
+                               for m in channel_messages})
+                continue
+            try:
+                errors.update(backend.send_batch(channel_messages))
+            except Exception as e:
+                logger.exception(f"❌ Notification backend {channel} failed")
+                errors.update({m['id']: DeliveryError(str(e)) for m in channel_messages})
+
+        result = self._finish(messages, errors, now)
+        logger.info(f"📨 Notifications: {result}")
+        return result
+
+    def drain(self, now: Optional[datetime] = None, max_batches: int = 100) -> Dict[str, int]:
+        """Отправлять пачки, пока есть готовые сообщения"""
+        total = {'sent': 0, 'retried': 0, 'failed': 0}
+        for _ in range(max_batches):
+            result = self.process_once(now)
+            for key in total:
+                total[key] += result[key]
+            if not any(result.values()):
+                break
+        return total
+
+    # ------------------------------------------------------------------
+    # Фоновый поток
+    # ------------------------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='notification_dispatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                result = self.process_once()
+                if any(result.values()):
+                    continue
+            except Exception:
+                logger.exception("❌ Notification dispatcher iteration failed")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        for channel, backend in self.backends.items():
+            backend_stats = getattr(backend, 'stats', None) or getattr(getattr(backend, 'pool', None), 'stats', None)
+            if backend_stats:
+                stats[channel] = dict(backend_stats)
+        return stats
+
+
+# ----------------------------------------------------------------------
+# Глобальные экземпляры
+# ----------------------------------------------------------------------
+
+_template_cache = None
+_smtp_pool = None
+_sendgrid_client = None
+_dispatcher = None
+_init_lock = threading.Lock()
+
+
+def get_template_cache() -> TemplateRenderCache:
+    global _template_cache
+    if _template_cache is None:
+        _template_cache = TemplateRenderCache()
+    return _template_cache
+
+
+def get_smtp_pool() -> SMTPConnectionPool:
+    """Общий пул SMTP-соединений (настройки из email_service)"""
+    global _smtp_pool
+    with _init_lock:
+        if _smtp_pool is None:
+            from email_service import EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD
+            _smtp_pool = SMTPConnectionPool(EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD,
+                                            size=int(os.environ.get('SMTP_POOL_SIZE', '2')))
+    return _smtp_pool
+
+
+def get_sendgrid_client():
+    """Один SendGridAPIClient на процесс или None, если ключа нет"""
+    global _sendgrid_client
+    api_key = os.environ.get('SENDGRID_API_KEY')
+    if not api_key:
+        return None
+    with _init_lock:
+        if _sendgrid_client is None:
+            from sendgrid import SendGridAPIClient
+            _sendgrid_client = SendGridAPIClient(api_key)
+    return _sendgrid_client
+
+
+def _email_backend():
+    from email_service import EMAIL_USER, EMAIL_PASSWORD, sendgrid_available
+    if sendgrid_available and os.environ.get('SENDGRID_API_KEY'):
+        return SendGridEmailBackend(get_sendgrid_client(), os.environ.get('SENDGRID_FROM_EMAIL', 'testing@sendgrid.net'))
+    if EMAIL_PASSWORD or os.environ.get('EMAIL_HOST'):
+        return SMTPEmailBackend(get_smtp_pool(), f"InBack <{EMAIL_USER}>")
+    return LogEmailBackend()
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """Получить singleton NotificationDispatcher (первый вызов — в app context)"""
+    global _dispatcher
+    if _dispatcher is None:
+        from app import db
+        from email_service import TELEGRAM_BOT_TOKEN
+
+        backends = {CHANNEL_EMAIL: _email_backend()}
+        if TELEGRAM_BOT_TOKEN:
+            backends[CHANNEL_TELEGRAM] = TelegramSender(TELEGRAM_BOT_TOKEN)
+        _dispatcher = NotificationDispatcher(
+            db.engine, backends,
+            poll_interval=float(os.environ.get('NOTIFICATION_POLL_SECONDS', '5')),
+            autostart=os.environ.get('NOTIFICATION_WORKER_THREAD', '1') != '0',
+        )
+    return _dispatcher
@@ -0,0 +1,227 @@
+"""
+Кэш готовых PDF карточек квартир
+
+WeasyPrint тратит секунды CPU на каждый PDF, хотя чаще всего клиент или
+менеджер скачивает тот же самый файл повторно. Ключ кэша — хэш всего,
+от чего зависит результат:
+
+- имя и содержимое шаблона и всех его extends/include/import (правка любого = новые ключи);
+- updated_at квартиры, её ЖК, застройщика, района, соседних квартир ЖК (фото комплекса) и менеджера;
+- параметры презентации (id, заголовок, заметка менеджера) и base_url.
+
+Поэтому обновление Property / ResidentialComplex / Developer автоматически даёт новый ключ,
+а старые файлы со временем вытесняются по LRU.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_pdf_inputs_version(property_id, presentation_id=None) -> Optional[Tuple]:
+    """
+    Версии строк, которые читает fetch_pdf_context, одним запросом.
+    None — квартиры нет.
+    """
+    from app import db
+    from sqlalchemy import text
+
+    try:
+        property_id = int(property_id)
+    except (TypeError, ValueError):
+        return None
+
+    row = db.session.execute(text("""
+        SELECT p.updated_at,
+               rc.updated_at,
+               (SELECT MAX(sibling.updated_at) FROM properties sibling
+                 WHERE sibling.complex_id = p.complex_id),
+               m.updated_at,
+               dev.updated_at,
+               dist.updated_at
+        FROM properties p
+        LEFT JOIN residential_complexes rc ON rc.id = p.complex_id
+        LEFT JOIN developers dev ON dev.id = p.developer_id
+        LEFT JOIN districts dist ON dist.id = p.district_id
+        LEFT JOIN collections c ON c.id = :presentation_id
+        LEFT JOIN managers m ON m.id = c.created_by_manager_id
+        WHERE p.id = :property_id
+    """), {'property_id': property_id, 'presentation_id': presentation_id}).fetchone()
+    if row is None:
+        return None
+    return tuple(str(value) if value is not None else None for value in row)
+
+
+def _mtime(filename: Optional[str]) -> Optional[float]:
+    try:
+        return os.path.getmtime(filename) if filename else None
+    except OSError:
+        return None
+
+
+class PdfRenderCache:
+    """Дисковый LRU-кэш PDF, ключ — хэш входных данных рендера"""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 ** 2):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._template_versions: Dict[str, Tuple[Optional[Tuple], str]] = {}
+        self._approx_size: Optional[int] = None
+        self.stats = {'hits': 0, 'renders': 0, 'evicted': 0}
+
+    # ------------------------------------------------------------------
+    # Ключи
+    # ------------------------------------------------------------------
+
+    def template_version(self, template_name: str) -> str:
+        """
+        Хэш исходника Jinja-шаблона и всех шаблонов, которые он extends/include/import
+        (пересчитывается при изменении любого из файлов)
+        """
+        from flask import current_app
+        from jinja2 import meta
+
+        cached = self._template_versions.get(template_name)
+        if cached and cached[0] is not None and all(_mtime(filename) == mtime for filename, mtime in cached[0]):
+            return cached[1]
+
+        env = current_app.jinja_env
+        digest = hashlib.sha1()
+        files = []
+        pending, seen = [template_name], set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            source, filename, _uptodate = env.loader.get_source(env, name)
+            files.append((filename, _mtime(filename)))
+            digest.update(name.encode('utf-8'))
+            digest.update(source.encode('utf-8'))
+            # Динамические имена (None) проследить нельзя
+            pending.extend(sorted(ref for ref in meta.find_referenced_templates(env.parse(source)) if ref))
+
+        version = digest.hexdigest()[:16]
+        # Шаблоны не из файлов (DictLoader) не кэшируем — нечем проверить свежесть
+        checked = tuple(files) if all(mtime is not None for _, mtime in files) else None
+        self._template_versions[template_name] = (checked, version)
+        return version
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    # ------------------------------------------------------------------
+    # Чтение / запись
+    # ------------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        self.stats['hits'] += 1
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        if self._approx_size is None:
+            self._approx_size = sum(size for _, size, _ in self._scan())
+        else:
+            self._approx_size += len(data)
+        if self._approx_size > self.max_bytes:
+            self.evict()
+        return path
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> str:
+        """Путь к PDF из кэша; при промахе — один рендер на ключ внутри процесса"""
+        path = self.get(key)
+        if path:
+            return path
+
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        try:
+            with lock:
+                path = self.get(key)
+                if path:
+                    return path
+                started = time.time()
+                path = self.put(key, render())
+                self.stats['renders'] += 1
+                logger.info(f"📄 PDF rendered and cached in {(time.time() - started) * 1000:.0f} ms")
+                return path
+        finally:
+            with self._locks_guard:
+                self._locks.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # Вытеснение
+    # ------------------------------------------------------------------
+
+    def _scan(self):
+        files = []
+        for root, _dirs, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith('.pdf'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def evict(self, target_ratio: float = 0.9) -> int:
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * target_ratio)
+        removed = 0
+        for _mtime, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._approx_size = total
+        self.stats['evicted'] += removed
+        return removed
+
+
+# Глобальный экземпляр кэша
+_pdf_cache = None
+
+
+def get_pdf_cache() -> PdfRenderCache:
+    """Получить singleton экземпляр PdfRenderCache"""
+    global _pdf_cache
+    if _pdf_cache is None:
+        cache_dir = os.environ.get('PDF_CACHE_DIR', os.path.join('instance', 'pdf_cache'))
+        max_mb = int(os.environ.get('PDF_CACHE_MAX_MB', '512'))
+        _pdf_cache = PdfRenderCache(cache_dir, max_bytes=max_mb * 1024 ** 2)
+    return _pdf_cache
@@ -0,0 +1,300 @@
+"""
+Региональное хранилище POI для блока «Рядом» у ЖК
+
+Раньше каждый ЖК = 6 последовательных запросов к Overpass (around:радиус),
+а демон успевал 5 ЖК за 30 минут. Теперь:
+
+1. Одна выгрузка Overpass по bbox всего региона (все теги CATEGORIES_CONFIG)
+   сохраняется на диск как есть (JSON Overpass). Этот же файл — локальная
+   подмена для тестов и окружений без доступа к Overpass.
+2. POI загружаются в колонки NumPy, отсортированные по широте: кандидаты
+   для точки — бинарный поиск полосы по широте + маска по долготе.
+3. Расстояния — nearby_places.distances_from() по кандидатам, затем по
+   категориям select_nearest(): дедупликация по имени и топ-5 ближайших.
+   nearby_many() делает то же для всего каталога одним векторным проходом
+   по парам (ЖК, кандидат).
+
+Весь каталог ЖК пересчитывается локально за секунды; к Overpass ходим
+только при обновлении выгрузки (раз в POI_EXTRACT_MAX_AGE_DAYS).
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+from nearby_places import (
+    CATEGORIES_CONFIG, LEISURE_EXCLUDED_AMENITIES, OVERPASS_URL, OVERPASS_USER_AGENT,
+    parse_overpass_elements, distances_from, haversine_pairs, select_nearest,
+)
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111320.0
+
+# Сколько мест каждой категории сохраняем у ЖК
+TOP_PER_CATEGORY = 5
+
+
+def build_region_query(bbox: Tuple[float, float, float, float], timeout: int = 600) -> str:
+    """
+    Один запрос Overpass на весь регион: по regex значений для каждого ключа OSM
+
+    Args:
+        bbox: (south, west, north, east)
+    """
+    values_by_key: Dict[str, List[str]] = {}
+    for tags_list in CATEGORIES_CONFIG.values():
+        for osm_key, osm_value, _, _ in tags_list:
+            values = values_by_key.setdefault(osm_key, [])
+            if osm_value not in values:
+                values.append(osm_value)
+
+    south, west, north, east = bbox
+    area = f"({south},{west},{north},{east})"
+    conditions = ''.join(
+        f'nwr["{key}"~"^({"|".join(values)})$"]{area};'
+        for key, values in values_by_key.items()
+    )
+    return f"[out:json][timeout:{timeout}];({conditions});out center tags;"
+
+
+def download_region_extract(bbox: Tuple[float, float, float, float], path: str,
+                            session=None, timeout: int = 900) -> int:
+    """
+    Скачать выгрузку региона и атомарно сохранить JSON Overpass в path
+
+    Returns:
+        количество элементов в выгрузке
+    """
+    session = session or requests
+    response = session.post(
+        OVERPASS_URL,
+        data={'data': build_region_query(bbox, timeout=timeout)},
+        timeout=timeout + 60,
+        headers={'User-Agent': OVERPASS_USER_AGENT},
+    )
+    response.raise_for_status()
+    data = response.json()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'bbox': list(bbox), 'downloaded_at': datetime.utcnow().isoformat(),
+                   'elements': data.get('elements', [])}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return len(data.get('elements', []))
+
+
+def region_bbox(points: Iterable[Tuple[float, float]], pad_meters: int = 3000) -> Optional[Tuple[float, float, float, float]]:
+    """bbox всех ЖК, расширенный на радиус поиска"""
+    coords = np.array([(lat, lon) for lat, lon in points if lat is not None and lon is not None], dtype=float)
+    if coords.size == 0:
+        return None
+    pad_lat = pad_meters / METERS_PER_DEGREE
+    pad_lon = pad_meters / (METERS_PER_DEGREE * np.cos(np.radians(np.abs(coords[:, 0]).max())))
+    return (
+        round(float(coords[:, 0].min() - pad_lat), 5),
+        round(float(coords[:, 1].min() - pad_lon), 5),
+        round(float(coords[:, 0].max() + pad_lat), 5),
+        round(float(coords[:, 1].max() + pad_lon), 5),
+    )
+
+
+class PoiStore:
+    """
+    POI региона в колонках NumPy, отсортированных по широте
+
+    Использование:
+        store = PoiStore.load('instance/poi_extract.json')
+        nearby = store.nearby(45.03, 38.97, radius_meters=3000)
+    """
+
+    CATEGORIES = tuple(CATEGORIES_CONFIG.keys())
+
+    def __init__(self, places: List[Dict]):
+        places = sorted(places, key=lambda place: place['lat'])
+        self.lat = np.array([place['lat'] for place in places], dtype=np.float64)
+        self.lon = np.array([place['lon'] for place in places], dtype=np.float64)
+        self.category = np.array([self.CATEGORIES.index(place['category']) for place in places], dtype=np.int8)
+        self.name = np.array([place['name'] for place in places], dtype=object)
+        self.type = np.array([place['type'] for place in places], dtype=object)
+        self.type_display = np.array([place['type_display'] for place in places], dtype=object)
+        # Целочисленные коды имён — дедупликация по имени в nearby_many() без Python-цикла
+        codes: Dict[object, int] = {}
+        self._name_codes = np.array([codes.setdefault(place['name'], len(codes)) for place in places],
+                                    dtype=np.int64)
+
+    def __len__(self):
+        return int(self.lat.size)
+
+    @classmethod
+    def from_elements(cls, elements: List[Dict]) -> 'PoiStore':
+        """
+        Элементы Overpass → места по категориям
+        Те же правила, что в fetch_nearby_places(): без названия не берём,
+        учебные/медицинские учреждения не попадают в «Досуг»
+        """
+        places = []
+        for category, tags_list in CATEGORIES_CONFIG.items():
+            for place in parse_overpass_elements(elements, tags_list):
+                if not place.get('name') or place['lat'] is None or place['lon'] is None:
+                    continue
+                if category == 'leisure' and place['tags'].get('amenity', '') in LEISURE_EXCLUDED_AMENITIES:
+                    continue
+                place['category'] = category
+                places.append(place)
+        return cls(places)
+
+    @classmethod
+    def load(cls, path: str) -> 'PoiStore':
+        started = time.time()
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        store = cls.from_elements(data.get('elements', []))
+        logger.info(f"📍 POI store loaded: {len(store)} places in {(time.time() - started) * 1000:.0f} ms")
+        return store
+
+    def _candidates(self, lat: float, lon: float, radius_meters: int) -> np.ndarray:
+        """Позиции POI в квадрате вокруг точки: полоса по широте бинарным поиском + маска долготы"""
+        dlat = radius_meters / METERS_PER_DEGREE
+        dlon = radius_meters / (METERS_PER_DEGREE * max(np.cos(np.radians(lat)), 0.01))
+        start, end = np.searchsorted(self.lat, [lat - dlat, lat + dlat], side='left')
+        band = np.arange(start, end)
+        return band[np.abs(self.lon[start:end] - lon) <= dlon]
+
+    def nearby(self, latitude: float, longitude: float, radius_meters: int = 2000) -> Dict:
+        """Близлежащие места в формате fetch_nearby_places()"""
+        positions = self._candidates(latitude, longitude, radius_meters)
+        distances = distances_from(latitude, longitude, self.lat[positions], self.lon[positions]).astype(np.int64)
+        categories = self.category[positions]
+
+        result = {}
+        for code, category in enumerate(self.CATEGORIES):
+            in_category = np.flatnonzero(categories == code)
+            nearest = select_nearest(self.name[positions[in_category]], distances[in_category],
+                                     k=TOP_PER_CATEGORY, radius_meters=radius_meters)
+            result[category] = []
+            for i in nearest:
+                pos = positions[in_category[i]]
+                result[category].append({
+                    'type': self.type[pos],
+                    'type_display': self.type_display[pos],
+                    'name': self.name[pos],
+                    'distance': int(distances[in_category[i]]),
+                    'coordinates': [float(self.lat[pos]), float(self.lon[pos])],
+                })
+
+        result['updated_at'] = datetime.utcnow().isoformat()
+        return result
+
+    def nearby_many(self, points: Iterable[Tuple[object, float, float]],
+                    radius_meters: int = 3000) -> Dict[object, Dict]:
+        """
+        {key: nearby} для списка (key, lat, lon) — весь каталог одним векторным проходом
+
+        Пары (точка, POI-кандидат) строятся сразу для всех точек, расстояния —
+        haversine_pairs() по парам, дедупликация по имени и топ-5 по категориям —
+        сортировкой по (точка, категория, расстояние). Результат совпадает с nearby()
+        """
+        points = list(points)
+        updated_at = datetime.utcnow().isoformat()
+        results = [{category: [] for category in self.CATEGORIES} for _ in points]
+        for result in results:
+            result['updated_at'] = updated_at
+        if not points or not len(self):
+            return {key: result for (key, _, _), result in zip(points, results)}
+
+        lats = np.array([lat for _, lat, _ in points], dtype=np.float64)
+        lons = np.array([lon for _, _, lon in points], dtype=np.float64)
+
+        # Полосы по широте для всех точек сразу (как в _candidates)
+        dlat = radius_meters / METERS_PER_DEGREE
+        dlon = radius_meters / (METERS_PER_DEGREE * np.maximum(np.cos(np.radians(lats)), 0.01))
+        starts = np.searchsorted(self.lat, lats - dlat, side='left')
+        counts = np.searchsorted(self.lat, lats + dlat, side='left') - starts
+
+        point_idx = np.repeat(np.arange(lats.size), counts)
+        offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.repeat(starts, counts) + offsets
+        in_box = np.abs(self.lon[positions] - lons[point_idx]) <= dlon[point_idx]
+        point_idx, positions = point_idx[in_box], positions[in_box]
+
+        distances = haversine_pairs(lats[point_idx], lons[point_idx],
+                                    self.lat[positions], self.lon[positions]).astype(np.int64)
+        within = distances <= radius_meters
+        point_idx, positions, distances = point_idx[within], positions[within], distances[within]
+        categories = self.category[positions]
+
+        # Внутри (точка, категория) — по расстоянию, при равенстве — по позиции,
+        # как стабильная сортировка в select_nearest()
+        order = np.lexsort((positions, distances, categories, point_idx))
+        point_idx, positions, distances, categories = \
+            point_idx[order], positions[order], distances[order], categories[order]
+
+        # Ближайший дубль по имени побеждает: первое вхождение (точка, категория, имя)
+        names = self._name_codes[positions]
+        by_name = np.lexsort((np.arange(order.size), names, categories, point_idx))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = ((np.diff(point_idx[by_name]) != 0) | (np.diff(categories[by_name]) != 0)
+                     | (np.diff(names[by_name]) != 0))
+        unique = np.zeros(order.size, dtype=bool)
+        unique[by_name[first]] = True
+        point_idx, positions, distances, categories = \
+            point_idx[unique], positions[unique], distances[unique], categories[unique]
+
+        # Ранг внутри группы (точка, категория) — оставляем топ-5
+        group_start = np.ones(point_idx.size, dtype=bool)
+        group_start[1:] = (np.diff(point_idx) != 0) | (np.diff(categories) != 0)
+        starts_at = np.flatnonzero(group_start)
+        rank = np.arange(point_idx.size) - np.repeat(starts_at, np.diff(np.append(starts_at, point_idx.size)))
+        top = rank < TOP_PER_CATEGORY
+
+        for i, pos, distance, code in zip(point_idx[top], positions[top], distances[top], categories[top]):
+            results[i][self.CATEGORIES[code]].append({
+                'type': self.type[pos],
+                'type_display': self.type_display[pos],
+                'name': self.name[pos],
+                'distance': int(distance),
+                'coordinates': [float(self.lat[pos]), float(self.lon[pos])],
+            })
+
+        return {key: result for (key, _, _), result in zip(points, results)}
+
+
+def poi_extract_path() -> str:
+    return os.environ.get('POI_EXTRACT_PATH', os.path.join('instance', 'poi_extract.json'))
+
+
+def poi_extract_age_days(path: Optional[str] = None) -> Optional[float]:
+    """Возраст выгрузки в днях или None, если её нет"""
+    path = path or poi_extract_path()
+    if not os.path.exists(path):
+        return None
+    return (time.time() - os.path.getmtime(path)) / 86400
+
+
+# Глобальный экземпляр хранилища (перечитывается при обновлении файла)
+_poi_store = None
+_poi_store_mtime = None
+_poi_store_lock = threading.Lock()
+
+
+def get_poi_store() -> Optional[PoiStore]:
+    """Получить PoiStore из файла выгрузки или None, если выгрузки ещё нет"""
+    global _poi_store, _poi_store_mtime
+    path = poi_extract_path()
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _poi_store_lock:
+        if _poi_store is None or _poi_store_mtime != mtime:
+            _poi_store = PoiStore.load(path)
+            _poi_store_mtime = mtime
+    return _poi_store
@@ -0,0 +1,345 @@
+"""
+Фоновая генерация PDF/ZIP для презентаций
+
+Задача (job) = одна презентация с конкретным набором квартир. Состояние хранится
+в файлах общего каталога, поэтому прогресс видят все worker-процессы, а не только тот,
+что принял запрос:
+
+    <root>/jobs/<job_id>.json      — статус (stage / progress / current / total / message)
+    <root>/jobs/<job_id>.zip       — готовый архив (живёт до expires_at)
+    <root>/parts/<sha1>.pdf        — PDF одной квартиры, ключ = хэш HTML
+
+HTML рендерится в потоке-координаторе (нужен app context), сами PDF —
+в пуле процессов WeasyPrint. Архив собирается по мере готовности частей.
+Если процесс упал посреди работы, повторный запуск подхватит уже
+готовые части (они content-addressed) и досчитает остальное.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+STAGE_STARTING = 'starting'
+STAGE_PROCESSING = 'processing'
+STAGE_COMPLETING = 'completing'
+STAGE_COMPLETE = 'complete'
+STAGE_ERROR = 'error'
+
+
+def render_pdf_file(html: str, base_url: str, out_path: str) -> str:
+    """Отрендерить один PDF (выполняется в процессе пула)"""
+    from weasyprint import HTML
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    HTML(string=html, base_url=base_url).write_pdf(tmp_path)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def presentation_fingerprint(items: Iterable[Dict[str, Any]], *extra) -> str:
+    """Отпечаток содержимого презентации: состав квартир, заметки и версия данных"""
+    payload = json.dumps([list(items), list(extra)], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class JobSuperseded(Exception):
+    """Задачу перезапустили с другим составом — текущий прогон больше не нужен"""
+
+
+class JobStore:
+    """Файловое хранилище статусов, частей и архивов (общее для всех процессов)"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.jobs_dir = os.path.join(self.root, 'jobs')
+        self.parts_dir = os.path.join(self.root, 'parts')
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+    def _status_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def artifact_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.zip")
+
+    def part_path(self, digest: str) -> str:
+        return os.path.join(self.parts_dir, f"{digest}.pdf")
+
+    def read(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._status_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, job_id: str, status: Dict[str, Any]) -> Dict[str, Any]:
+        status = dict(status, job_id=job_id, updated_at=time.time())
+        path = self._status_path(job_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return status
+
+    def cleanup(self, ttl: float) -> int:
+        """Удалить истёкшие архивы, статусы и неиспользуемые части"""
+        now = time.time()
+        removed = 0
+        for directory in (self.jobs_dir, self.parts_dir):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if now - os.path.getmtime(path) > ttl:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            logger.info(f"🧹 Presentation jobs cleanup: removed {removed} files")
+        return removed
+
+
+class PresentationJobQueue:
+    """
+    Очередь задач генерации архивов презентаций
+
+    Args:
+        store: JobStore с общим каталогом
+        render_workers: размер пула процессов WeasyPrint
+        ttl: сколько секунд хранить готовые архивы и части
+        executor: готовый executor для рендера (для тестов / без процессов)
+        renderer: функция (html, base_url, out_path), по умолчанию WeasyPrint
+    """
+
+    STALE_AFTER = 300  # сек без обновления статуса — задача считается брошенной
+    MAX_PARALLEL_JOBS = 2
+
+    def __init__(self, store: JobStore, render_workers: Optional[int] = None,
+                 ttl: float = 6 * 3600, executor=None, renderer: Callable = render_pdf_file):
+        self.store = store
+        self.renderer = renderer
+        self.ttl = ttl
+        self.render_workers = render_workers or min(4, os.cpu_count() or 1)
+        self._render_executor = executor
+        self._owns_executor = executor is None
+        self._coordinator = ThreadPoolExecutor(max_workers=self.MAX_PARALLEL_JOBS,
+                                               thread_name_prefix='presentation_job')
+        self._lock = threading.Lock()
+        self._active: Dict[str, str] = {}  # job_id -> fingerprint (задачи этого процесса)
+
+    # ------------------------------------------------------------------
+    # Пул рендеринга
+    # ------------------------------------------------------------------
+
+    def _executor(self):
+        if self._render_executor is None:
+            # spawn: дочерние процессы не наследуют соединения с БД и потоки Flask
+            self._render_executor = ProcessPoolExecutor(
+                max_workers=self.render_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._render_executor
+
+    def _reset_executor(self):
+        if self._owns_executor and self._render_executor is not None:
+            self._render_executor.shutdown(wait=False, cancel_futures=True)
+            self._render_executor = None
+
+    # ------------------------------------------------------------------
+    # Публичный API
+    # ------------------------------------------------------------------
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.read(job_id)
+
+    def artifact(self, job_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(путь к архиву, статус) если архив готов и не истёк"""
+        status = self.store.read(job_id)
+        if not status or status.get('stage') != STAGE_COMPLETE:
+            return None
+        path = self.store.artifact_path(job_id)
+        if not os.path.exists(path) or status.get('expires_at', 0) < time.time():
+            return None
+        return path, status
+
+    def submit(self, job_id: str, fingerprint: str, items: List[Any],
+               render_html: Callable[[Any], Optional[Tuple[str, str]]], base_url: str,
+               download_name: str = None, context_factory: Callable = None) -> Dict[str, Any]:
+        """
+        Поставить задачу в очередь (или вернуть уже идущую / готовую с тем же отпечатком)
+
+        render_html(item) -> (имя файла в архиве, HTML) или None, если объект пропускается
+        """
+        with self._lock:
+            current = self.store.read(job_id)
+            if current and current.get('fingerprint') == fingerprint:
+                if self.artifact(job_id):
+                    return current
+                in_progress = current.get('stage') in (STAGE_STARTING, STAGE_PROCESSING, STAGE_COMPLETING)
+                fresh = time.time() - current.get('updated_at', 0) < self.STALE_AFTER
+                if in_progress and (fresh or self._active.get(job_id) == fingerprint):
+                    return current
+
+            self.store.cleanup(self.ttl)
+            status = self.store.write(job_id, {
+                'stage': STAGE_STARTING,
+                'progress': 0,
+                'current': 0,
+                'total': len(items),
+                'message': f'Начинаем создание {len(items)} PDF файлов...',
+                'fingerprint': fingerprint,
+                'download_name': download_name or f"{job_id}.zip",
+            })
+            self._active[job_id] = fingerprint
+
+        self._coordinator.submit(self._run, job_id, fingerprint, list(items), render_html,
+                                 base_url, status['download_name'], context_factory)
+        return status
+
+    def wait(self, job_id: str, timeout: float = 600, interval: float = 0.5) -> Optional[Dict[str, Any]]:
+        """Дождаться завершения задачи (из любого процесса)"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = self.store.read(job_id)
+            if status and status.get('stage') in (STAGE_COMPLETE, STAGE_ERROR):
+                return status
+            time.sleep(interval)
+        return self.store.read(job_id)
+
+    # ------------------------------------------------------------------
+    # Координатор
+    # ------------------------------------------------------------------
+
+    def _update(self, job_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Записать статус, если задачу не перезапустили с другим отпечатком"""
+        current = self.store.read(job_id)
+        if current and current.get('fingerprint') != fields['fingerprint']:
+            raise JobSuperseded(job_id)
+        return self.store.write(job_id, fields)
+
+    def _run(self, job_id, fingerprint, items, render_html, base_url, download_name, context_factory):
+        total = len(items)
+        base = {'fingerprint': fingerprint, 'download_name': download_name, 'total': total}
+        started = time.time()
+        try:
+            with (context_factory() if context_factory else nullcontext()):
+                parts = self._render_parts(job_id, base, items, render_html, base_url)
+
+            if not parts:
+                raise RuntimeError('Не удалось создать ни одного PDF')
+
+            self._update(job_id, dict(base, stage=STAGE_COMPLETE, progress=100, current=total,
+                                      message='Архив готов!', files=len(parts),
+                                      expires_at=time.time() + self.ttl))
+            logger.info(f"✅ Presentation job {job_id}: {len(parts)} PDF in {time.time() - started:.1f}s")
+        except JobSuperseded:
+            logger.info(f"Presentation job {job_id} superseded by a newer run")
+        except Exception as e:
+            logger.exception(f"❌ Presentation job {job_id} failed")
+            try:
+                self._update(job_id, dict(base, stage=STAGE_ERROR, progress=0, message=f'Ошибка: {e}'))
+            except JobSuperseded:
+                pass
+        finally:
+            with self._lock:
+                if self._active.get(job_id) == fingerprint:
+                    self._active.pop(job_id, None)
+
+    def _render_parts(self, job_id, base, items, render_html, base_url) -> List[str]:
+        futures = {}
+        ready: List[Tuple[str, str]] = []
+
+        for item in items:
+            rendered = render_html(item)
+            if not rendered:
+                continue
+            filename, html = rendered
+            digest = hashlib.sha1(f"{base_url}\n{html}".encode('utf-8')).hexdigest()
+            part_path = self.store.part_path(digest)
+            if os.path.exists(part_path):
+                os.utime(part_path, None)
+                ready.append((filename, part_path))
+            else:
+                futures[self._submit_render(html, base_url, part_path)] = (filename, html, part_path)
+
+        tmp_zip = f"{self.store.artifact_path(job_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            written = self._assemble(job_id, base, tmp_zip, ready, futures, base_url)
+        except BaseException:
+            os.remove(tmp_zip)
+            raise
+
+        if not written:
+            os.remove(tmp_zip)
+            return []
+        os.replace(tmp_zip, self.store.artifact_path(job_id))
+        return written
+
+    def _assemble(self, job_id, base, tmp_zip, ready, futures, base_url) -> List[str]:
+        """Дописывать PDF в архив по мере готовности, обновляя прогресс"""
+        total = base['total']
+        written: List[str] = []
+        done = 0
+
+        def add(filename, part_path):
+            nonlocal done
+            if filename not in written:
+                zipf.write(part_path, filename)
+                written.append(filename)
+            done += 1
+            self._update(job_id, dict(base, stage=STAGE_PROCESSING,
+                                      progress=int(done / max(total, 1) * 90), current=done,
+                                      message=f'Создаю PDF {done} из {total}'))
+
+        # PDF уже сжаты внутри — ZIP_STORED экономит CPU без потери размера
+        with zipfile.ZipFile(tmp_zip, 'w', zipfile.ZIP_STORED) as zipf:
+            for filename, part_path in ready:
+                add(filename, part_path)
+
+            for future in as_completed(list(futures)):
+                filename, html, part_path = futures[future]
+                try:
+                    future.result()
+                except BrokenProcessPool:
+                    # Упавший процесс WeasyPrint не должен ронять всю задачу
+                    self._reset_executor()
+                    self.renderer(html, base_url, part_path)
+                add(filename, part_path)
+
+            self._update(job_id, dict(base, stage=STAGE_COMPLETING, progress=90, current=done,
+                                      message='Создаю архив...'))
+        return written
+
+    def _submit_render(self, html, base_url, part_path):
+        try:
+            return self._executor().submit(self.renderer, html, base_url, part_path)
+        except (BrokenProcessPool, RuntimeError):
+            self._reset_executor()
+            return self._executor().submit(self.renderer, html, base_url, part_path)
+
+
+# Глобальный экземпляр очереди
+_presentation_jobs = None
+
+
+def get_presentation_jobs() -> PresentationJobQueue:
+    """Получить singleton экземпляр PresentationJobQueue"""
+    global _presentation_jobs
+    if _presentation_jobs is None:
+        root = os.environ.get('PRESENTATION_JOBS_DIR', os.path.join('instance', 'presentation_jobs'))
+        workers = int(os.environ.get('PDF_RENDER_WORKERS', '0')) or None
+        ttl_hours = float(os.environ.get('PRESENTATION_JOBS_TTL_HOURS', '6'))
+        _presentation_jobs = PresentationJobQueue(JobStore(root), render_workers=workers, ttl=ttl_hours * 3600)
+    return _presentation_jobs
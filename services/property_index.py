@@ -0,0 +1,635 @@
+"""
+In-memory колоночный индекс активных квартир
+Обслуживает /api/properties/list и /api/properties/count без SQL:
+все фильтры build_property_filters() считаются векторными масками NumPy,
+страница id и общее количество возвращаются за один проход.
+
+Индекс живёт в процессе (один на gunicorn worker) и обновляется
+инкрементально по Property.updated_at.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# Порядок колонок в строках, которые отдаёт _fetch_property_rows()
+PROPERTY_COLUMNS = (
+    'id', 'price', 'area', 'rooms', 'floor', 'total_floors',
+    'complex_id', 'developer_id', 'district_id',
+    'complex_building_name', 'building_type', 'renovation_type', 'deal_type',
+    'is_active', 'created_at', 'updated_at', 'latitude', 'longitude',
+)
+
+# Разрядность сетки Web Mercator: ячейка самого мелкого уровня ≈ 2.4 м.
+# Ячейка на любом зуме получается сдвигом вправо (квадродерево без дерева).
+GRID_BITS = 24
+
+# Фильтры PropertyRepository, которые индекс умеет считать сам.
+# Всё остальное (например полнотекстовый 'search') уходит в SQL.
+UNSUPPORTED_FILTERS = ('search',)
+
+
+def _to_float(value) -> float:
+    """NULL → NaN: сравнения с NaN ложны, как и сравнения с NULL в SQL"""
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def project_to_grid(lat: np.ndarray, lng: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Широта/долгота → целые координаты сетки Web Mercator (GRID_BITS бит на ось)"""
+    size = float(1 << GRID_BITS)
+    lat = np.clip(np.nan_to_num(lat), -85.05112878, 85.05112878)
+    lng = np.nan_to_num(lng)
+    x = (lng + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+    grid_x = np.clip(x * size, 0, size - 1).astype(np.uint32)
+    grid_y = np.clip(y * size, 0, size - 1).astype(np.uint32)
+    return grid_x, grid_y
+
+
+def _to_epoch(value) -> float:
+    if value is None:
+        return np.nan
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return _to_float(value)
+
+
+class _Snapshot:
+    """Неизменяемый набор колонок; заменяется целиком при обновлении"""
+
+    __slots__ = (
+        'ids', 'price', 'area', 'rooms', 'floor', 'total_floors',
+        'complex_id', 'developer_id', 'district_id', 'created_at', 'is_active',
+        'lat', 'lng', 'grid_x', 'grid_y',
+        'complex_building_name', 'building_type', 'renovation_type', 'deal_type', 'codes',
+        'cx_end_year', 'cx_cashback', 'cx_object_class', 'cx_by_name',
+        'dev_by_name', 'district_by_name', 'watermark', 'row_count',
+    )
+
+
+class PropertyIndex:
+    """
+    Колоночный индекс квартир (struct-of-arrays на NumPy)
+
+    Использование:
+        index = get_property_index()
+        result = index.query(filters, sort_by='price', sort_order='asc', limit=20, offset=0)
+        if result is not None:
+            ids, total = result
+    """
+
+    CATEGORICAL_COLUMNS = ('complex_building_name', 'building_type', 'renovation_type', 'deal_type')
+
+    def __init__(self, refresh_interval: float = 15.0):
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[_Snapshot] = None
+        self._lookup_signature = None
+        self._property_signature = None  # (count, max updated_at) на момент последней сверки
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.stats = {
+            'full_builds': 0,
+            'incremental_updates': 0,
+            'queries': 0,
+            'fallbacks': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Загрузка данных
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _fetch_property_rows(since: Optional[datetime] = None) -> List[tuple]:
+        from app import db
+        from models import Property
+
+        columns = [getattr(Property, name) for name in PROPERTY_COLUMNS]
+        query = db.session.query(*columns)
+        if since is not None:
+            query = query.filter(Property.updated_at >= since)
+        return [tuple(row) for row in query.all()]
+
+    @staticmethod
+    def _fetch_lookups() -> Dict[str, List[tuple]]:
+        from app import db
+        from models import ResidentialComplex, Developer, District
+
+        complexes = db.session.query(
+            ResidentialComplex.id,
+            ResidentialComplex.name,
+            ResidentialComplex.end_build_year,
+            ResidentialComplex.cashback_rate,
+            ResidentialComplex.object_class_display_name,
+        ).all()
+        developers = db.session.query(Developer.id, Developer.name).all()
+        districts = db.session.query(District.id, District.name).all()
+        return {
+            'complexes': [tuple(r) for r in complexes],
+            'developers': [tuple(r) for r in developers],
+            'districts': [tuple(r) for r in districts],
+        }
+
+    @staticmethod
+    def _fetch_signature() -> Tuple:
+        """Дешёвая проверка «изменилось ли что-нибудь» одним запросом"""
+        from app import db
+        from sqlalchemy import func, select
+        from models import Property, ResidentialComplex, Developer, District
+
+        row = db.session.execute(select(
+            select(func.count(Property.id)).scalar_subquery(),
+            select(func.max(Property.updated_at)).scalar_subquery(),
+            select(func.count(ResidentialComplex.id)).scalar_subquery(),
+            select(func.max(ResidentialComplex.updated_at)).scalar_subquery(),
+            select(func.count(Developer.id)).scalar_subquery(),
+            select(func.count(District.id)).scalar_subquery(),
+        )).first()
+        return tuple(row)
+
+    # ------------------------------------------------------------------
+    # Построение колонок
+    # ------------------------------------------------------------------
+
+    def load(self, rows: List[tuple], lookups: Dict[str, List[tuple]]):
+        """Полная пересборка индекса из готовых строк (без обращения к БД)"""
+        snapshot = _Snapshot()
+        snapshot.codes = {name: {} for name in self.CATEGORICAL_COLUMNS}
+        self._set_columns(snapshot, self._build_columns(rows, snapshot.codes))
+        self._fill_lookups(snapshot, lookups)
+        snapshot.watermark = self._max_updated_at(rows)
+        snapshot.row_count = len(rows)
+        self._snapshot = snapshot
+        self.stats['full_builds'] += 1
+
+    def apply_changes(self, rows: List[tuple]):
+        """Инкрементально применить изменённые строки к текущему снимку"""
+        old = self._snapshot
+        if old is None:
+            raise RuntimeError("PropertyIndex is not built yet")
+        if not rows:
+            return
+
+        # Последняя версия строки побеждает; изменённые id заменяются, новые дописываются
+        changed = list({row[0]: row for row in rows}.values())
+        keep = ~np.isin(old.ids, [row[0] for row in changed])
+
+        snapshot = _Snapshot()
+        snapshot.codes = {name: dict(codes) for name, codes in old.codes.items()}
+        fresh = self._build_columns(changed, snapshot.codes)
+        merged = {
+            name: np.concatenate([getattr(old, name)[keep], column])
+            for name, column in fresh.items()
+        }
+        self._set_columns(snapshot, merged)
+        for attr in ('cx_end_year', 'cx_cashback', 'cx_object_class', 'cx_by_name',
+                     'dev_by_name', 'district_by_name'):
+            setattr(snapshot, attr, getattr(old, attr))
+        watermark = self._max_updated_at(changed)
+        snapshot.watermark = max(filter(None, [old.watermark, watermark]), default=None)
+        snapshot.row_count = len(snapshot.ids)
+        self._snapshot = snapshot
+        self.stats['incremental_updates'] += 1
+
+    @staticmethod
+    def _encode(codes: Dict[str, int], value) -> int:
+        if value is None:
+            return -1
+        code = codes.get(value)
+        if code is None:
+            code = len(codes)
+            codes[value] = code
+        return code
+
+    def _build_columns(self, rows: List[tuple], codes: Dict[str, Dict[str, int]]) -> Dict[str, np.ndarray]:
+        n = len(rows)
+        columns = {'ids': np.empty(n, dtype=np.int64), 'is_active': np.empty(n, dtype=bool)}
+        for name in ('price', 'area', 'rooms', 'floor', 'total_floors', 'created_at', 'lat', 'lng'):
+            columns[name] = np.empty(n, dtype=np.float64)
+        for name in ('complex_id', 'developer_id', 'district_id'):
+            columns[name] = np.empty(n, dtype=np.int64)
+        for name in self.CATEGORICAL_COLUMNS:
+            columns[name] = np.empty(n, dtype=np.int32)
+
+        for pos, row in enumerate(rows):
+            record = dict(zip(PROPERTY_COLUMNS, row))
+            columns['ids'][pos] = record['id']
+            columns['is_active'][pos] = bool(record['is_active'])
+            for name in ('price', 'area', 'rooms', 'floor', 'total_floors'):
+                columns[name][pos] = _to_float(record[name])
+            columns['created_at'][pos] = _to_epoch(record['created_at'])
+            columns['lat'][pos] = _to_float(record['latitude'])
+            columns['lng'][pos] = _to_float(record['longitude'])
+            for name in ('complex_id', 'developer_id', 'district_id'):
+                columns[name][pos] = record[name] if record[name] is not None else -1
+            for name in self.CATEGORICAL_COLUMNS:
+                columns[name][pos] = self._encode(codes[name], record[name])
+        columns['grid_x'], columns['grid_y'] = project_to_grid(columns['lat'], columns['lng'])
+        return columns
+
+    @staticmethod
+    def _set_columns(snapshot: _Snapshot, columns: Dict[str, np.ndarray]):
+        snapshot.ids = columns['ids']
+        snapshot.is_active = columns['is_active']
+        snapshot.price = columns['price']
+        snapshot.area = columns['area']
+        snapshot.rooms = columns['rooms']
+        snapshot.floor = columns['floor']
+        snapshot.total_floors = columns['total_floors']
+        snapshot.created_at = columns['created_at']
+        snapshot.lat = columns['lat']
+        snapshot.lng = columns['lng']
+        snapshot.grid_x = columns['grid_x']
+        snapshot.grid_y = columns['grid_y']
+        snapshot.complex_id = columns['complex_id']
+        snapshot.developer_id = columns['developer_id']
+        snapshot.district_id = columns['district_id']
+        snapshot.complex_building_name = columns['complex_building_name']
+        snapshot.building_type = columns['building_type']
+        snapshot.renovation_type = columns['renovation_type']
+        snapshot.deal_type = columns['deal_type']
+
+    @staticmethod
+    def _fill_lookups(snapshot: _Snapshot, lookups: Dict[str, List[tuple]]):
+        complexes = lookups.get('complexes', [])
+        size = max([row[0] for row in complexes], default=0) + 1
+
+        # Атрибуты ЖК — плотные массивы по complex_id, берутся через gather
+        snapshot.cx_end_year = np.full(size, np.nan)
+        snapshot.cx_cashback = np.full(size, np.nan)
+        snapshot.cx_object_class = np.full(size, None, dtype=object)
+        snapshot.cx_by_name = {}
+        for complex_id, name, end_year, cashback_rate, object_class in complexes:
+            snapshot.cx_end_year[complex_id] = _to_float(end_year)
+            snapshot.cx_cashback[complex_id] = _to_float(cashback_rate)
+            snapshot.cx_object_class[complex_id] = object_class
+            snapshot.cx_by_name.setdefault(name, []).append(complex_id)
+
+        snapshot.dev_by_name = {}
+        for developer_id, name in lookups.get('developers', []):
+            snapshot.dev_by_name.setdefault(name, []).append(developer_id)
+
+        snapshot.district_by_name = {}
+        for district_id, name in lookups.get('districts', []):
+            snapshot.district_by_name.setdefault(name, []).append(district_id)
+
+    @staticmethod
+    def _max_updated_at(rows: List[tuple]) -> Optional[datetime]:
+        position = PROPERTY_COLUMNS.index('updated_at')
+        values = [row[position] for row in rows if row[position] is not None]
+        return max(values) if values else None
+
+    # ------------------------------------------------------------------
+    # Обновление
+    # ------------------------------------------------------------------
+
+    def build(self):
+        """Полная пересборка из БД"""
+        started = time.time()
+        rows = self._fetch_property_rows()
+        lookups = self._fetch_lookups()
+        self.load(rows, lookups)
+        self._lookup_signature = None
+        self._property_signature = None
+        logger.info(f"✅ PropertyIndex built: {len(rows)} rows in {(time.time() - started) * 1000:.0f} ms")
+
+    def refresh(self):
+        """
+        Инкрементальное обновление по updated_at.
+        Жёсткое удаление строк или изменения справочников → полная пересборка.
+        Та же (count, max updated_at), что при прошлой сверке, → ничего не делаем.
+        """
+        signature = self._fetch_signature()
+        (property_count, max_updated, complex_count, complex_updated,
+         developer_count, district_count) = signature
+        lookup_signature = (complex_count, complex_updated, developer_count, district_count)
+        property_signature = (property_count, max_updated)
+
+        snapshot = self._snapshot
+        if snapshot is None or (self._lookup_signature is not None and self._lookup_signature != lookup_signature):
+            self.build()
+        elif property_signature != self._property_signature:
+            # updated_at >= watermark возвращает и уже применённые строки — только при реальных изменениях
+            changed = self._fetch_property_rows(since=snapshot.watermark) if snapshot.watermark else []
+            if changed:
+                self.apply_changes(changed)
+            if self._snapshot.row_count != property_count:
+                # Строки были удалены (или updated_at не проставлен) — пересобираем
+                self.build()
+
+        self._lookup_signature = lookup_signature
+        self._property_signature = property_signature
+
+    def ensure_fresh(self):
+        """Проверить свежесть не чаще refresh_interval секунд"""
+        now = time.time()
+        if self._snapshot is not None and now - self._last_check < self.refresh_interval:
+            return
+        if not self._lock.acquire(blocking=self._snapshot is None):
+            # Другой поток уже обновляет — отвечаем по текущему снимку
+            return
+        try:
+            if self._snapshot is not None and time.time() - self._last_check < self.refresh_interval:
+                return
+            self.refresh()
+            self._last_check = time.time()
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        """Сбросить индекс (следующий запрос пересоберёт его)"""
+        with self._lock:
+            self._snapshot = None
+            self._lookup_signature = None
+            self._property_signature = None
+            self._last_check = 0.0
+
+    # ------------------------------------------------------------------
+    # Запросы
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def supports(filters: Optional[Dict[str, Any]]) -> bool:
+        """Можно ли посчитать фильтры индексом (иначе — SQL fallback)"""
+        if not filters:
+            return True
+        return not any(filters.get(name) for name in UNSUPPORTED_FILTERS)
+
+    def _mask(self, snapshot: _Snapshot, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Маска по тем же правилам, что и PropertyRepository.get_all_active()"""
+        mask = snapshot.is_active.copy()
+        if not filters:
+            return mask
+
+        def ids_for(mapping, names):
+            result = []
+            for name in names:
+                result.extend(mapping.get(name, []))
+            return result
+
+        def codes_for(column, values):
+            codes = snapshot.codes[column]
+            return [codes[v] for v in values if v in codes]
+
+        # LEFT JOIN к ЖК: квартиры без ЖК получают NULL-атрибуты
+        complex_known = (snapshot.complex_id >= 0) & (snapshot.complex_id < len(snapshot.cx_end_year))
+        complex_ref = np.where(complex_known, snapshot.complex_id, 0)
+
+        def complex_attr(values):
+            gathered = values[complex_ref]
+            if gathered.dtype == object:
+                return np.where(complex_known, gathered, None)
+            return np.where(complex_known, gathered, np.nan)
+
+        if filters.get('min_price'):
+            mask &= snapshot.price >= float(filters['min_price'])
+        if filters.get('max_price'):
+            mask &= snapshot.price <= float(filters['max_price'])
+        if filters.get('min_area'):
+            mask &= snapshot.area >= float(filters['min_area'])
+        if filters.get('max_area'):
+            mask &= snapshot.area <= float(filters['max_area'])
+
+        if filters.get('rooms'):
+            room_values = []
+            for r in filters['rooms']:
+                try:
+                    room_values.append(int(r))
+                except (ValueError, TypeError):
+                    pass
+            if room_values:
+                mask &= np.isin(snapshot.rooms, room_values)
+
+        if filters.get('floor_min'):
+            mask &= snapshot.floor >= float(filters['floor_min'])
+        if filters.get('floor_max'):
+            mask &= snapshot.floor <= float(filters['floor_max'])
+        if filters.get('floor_options'):
+            for option in filters['floor_options']:
+                if option == 'not_first':
+                    mask &= snapshot.floor > 1
+                elif option == 'not_last':
+                    mask &= snapshot.floor < snapshot.total_floors
+
+        if filters.get('complex_id'):
+            mask &= snapshot.complex_id == int(filters['complex_id'])
+        if filters.get('residential_complex'):
+            mask &= np.isin(snapshot.complex_id, ids_for(snapshot.cx_by_name, [filters['residential_complex']]))
+
+        if filters.get('developer_id'):
+            mask &= snapshot.developer_id == int(filters['developer_id'])
+        if filters.get('developer'):
+            mask &= np.isin(snapshot.developer_id, ids_for(snapshot.dev_by_name, [filters['developer']]))
+        if filters.get('developers'):
+            developer_ids = []
+            developer_names = []
+            for dev_value in filters['developers']:
+                if isinstance(dev_value, str) and dev_value.strip():
+                    if dev_value.strip().isdigit():
+                        developer_ids.append(int(dev_value.strip()))
+                    else:
+                        developer_names.append(dev_value.strip())
+                elif isinstance(dev_value, int):
+                    developer_ids.append(dev_value)
+            if developer_ids or developer_names:
+                allowed = developer_ids + ids_for(snapshot.dev_by_name, developer_names)
+                mask &= np.isin(snapshot.developer_id, allowed)
+
+        if filters.get('district'):
+            mask &= np.isin(snapshot.district_id, ids_for(snapshot.district_by_name, [filters['district']]))
+        if filters.get('districts'):
+            mask &= np.isin(snapshot.district_id, ids_for(snapshot.district_by_name, filters['districts']))
+
+        if filters.get('building'):
+            mask &= np.isin(snapshot.complex_building_name, codes_for('complex_building_name', [filters['building']]))
+        if filters.get('building_floors_min'):
+            mask &= snapshot.total_floors >= float(filters['building_floors_min'])
+        if filters.get('building_floors_max'):
+            mask &= snapshot.total_floors <= float(filters['building_floors_max'])
+        if filters.get('building_types'):
+            mask &= np.isin(snapshot.building_type, codes_for('building_type', filters['building_types']))
+
+        if any(filters.get(name) for name in ('build_year_min', 'build_year_max', 'delivery_years', 'building_released')):
+            end_year = complex_attr(snapshot.cx_end_year)
+            if filters.get('build_year_min'):
+                mask &= end_year >= float(filters['build_year_min'])
+            if filters.get('build_year_max'):
+                mask &= end_year <= float(filters['build_year_max'])
+            if filters.get('delivery_years'):
+                mask &= np.isin(end_year, [float(y) for y in filters['delivery_years']])
+            if filters.get('building_released'):
+                current_year = datetime.now().year
+                release_mask = None
+                for status in filters['building_released']:
+                    if status in ['true', 'True', 'сданный']:
+                        condition = end_year <= current_year
+                    elif status in ['false', 'False', 'в строительстве']:
+                        condition = end_year > current_year
+                    else:
+                        continue
+                    release_mask = condition if release_mask is None else (release_mask | condition)
+                if release_mask is not None:
+                    mask &= release_mask
+
+        if filters.get('cashback_only'):
+            mask &= complex_attr(snapshot.cx_cashback) > 0
+        if filters.get('renovation'):
+            mask &= np.isin(snapshot.renovation_type, codes_for('renovation_type', filters['renovation']))
+        if filters.get('object_classes'):
+            mask &= np.isin(complex_attr(snapshot.cx_object_class), list(filters['object_classes']))
+        if filters.get('deal_type'):
+            mask &= np.isin(snapshot.deal_type, codes_for('deal_type', [filters['deal_type']]))
+
+        return mask
+
+    @staticmethod
+    def _sort_key(snapshot: _Snapshot, sort_by: str, sort_order: str) -> np.ndarray:
+        column = {
+            'price': snapshot.price,
+            'area': snapshot.area,
+            'date': snapshot.created_at,
+        }.get(sort_by, snapshot.price)
+        if sort_by not in ('price', 'area', 'date'):
+            sort_order = 'asc'
+
+        # PostgreSQL: NULLS LAST для ASC и NULLS FIRST для DESC
+        if sort_order == 'desc':
+            return np.where(np.isnan(column), -np.inf, -column)
+        return np.where(np.isnan(column), np.inf, column)
+
+    @staticmethod
+    def _cursor_key(value, sort_by: str, sort_order: str) -> float:
+        """Значение сортировочной колонки из курсора в шкале _sort_key()"""
+        value = _to_epoch(value) if sort_by == 'date' else _to_float(value)
+        if sort_by in ('price', 'area', 'date') and sort_order == 'desc':
+            return -np.inf if np.isnan(value) else -value
+        return np.inf if np.isnan(value) else value
+
+    def _ordered(self, snapshot: _Snapshot, positions: np.ndarray, sort_by: str, sort_order: str,
+                 after: Optional[Tuple[Any, int]] = None) -> np.ndarray:
+        """
+        Позиции в порядке (сортировочный ключ, id) — тот же порядок, что у
+        PropertyRepository.sort_clause(): id идёт в направлении сортировки
+        after: (значение, id) последней квартиры предыдущей страницы
+        """
+        descending = sort_by in ('price', 'area', 'date') and sort_order == 'desc'
+        key = self._sort_key(snapshot, sort_by, sort_order)[positions]
+        ids = snapshot.ids[positions]
+        # Ключ id в шкале «по возрастанию»: для DESC — с обратным знаком
+        id_key = -ids.astype(np.int64) if descending else ids.astype(np.int64)
+        if after is not None:
+            cursor_key = self._cursor_key(after[0], sort_by, sort_order)
+            cursor_id = -int(after[1]) if descending else int(after[1])
+            keep = (key > cursor_key) | ((key == cursor_key) & (id_key > cursor_id))
+            positions, key, id_key = positions[keep], key[keep], id_key[keep]
+        return positions[np.lexsort((id_key, key))]
+
+    def query(self, filters: Optional[Dict[str, Any]] = None, sort_by: str = 'price',
+              sort_order: str = 'asc', limit: int = 50, offset: int = 0) -> Optional[Tuple[List[int], int]]:
+        """
+        Отфильтровать, отсортировать и нарезать страницу
+
+        Returns:
+            (список id страницы, общее количество) или None, если фильтры
+            не поддерживаются индексом и нужен SQL
+        """
+        if not self.supports(filters):
+            self.stats['fallbacks'] += 1
+            return None
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+
+        self.stats['queries'] += 1
+        mask = self._mask(snapshot, filters)
+        positions = np.flatnonzero(mask)
+        total = int(positions.size)
+        if total == 0 or limit <= 0 or offset >= total:
+            return [], total
+
+        # Стабильный порядок: сортировочный ключ, затем id
+        page = self._ordered(snapshot, positions, sort_by, sort_order)[offset:offset + limit]
+        return [int(pid) for pid in snapshot.ids[page]], total
+
+    def query_after(self, filters: Optional[Dict[str, Any]] = None, sort_by: str = 'price',
+                    sort_order: str = 'asc', limit: int = 50,
+                    after: Optional[Tuple[Any, int]] = None) -> Optional[List[int]]:
+        """
+        Keyset-страница: до limit id после квартиры after = (значение, id)
+        Позиция не зависит от номера страницы и не сдвигается, когда меняются
+        цены уже показанных квартир
+
+        Returns:
+            список id или None, если нужен SQL
+        """
+        if not self.supports(filters):
+            self.stats['fallbacks'] += 1
+            return None
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+
+        self.stats['queries'] += 1
+        positions = np.flatnonzero(self._mask(snapshot, filters))
+        if positions.size == 0 or limit <= 0:
+            return []
+        page = self._ordered(snapshot, positions, sort_by, sort_order, after)[:limit]
+        return [int(pid) for pid in snapshot.ids[page]]
+
+    def select(self, filters: Optional[Dict[str, Any]] = None) -> Optional[Tuple[_Snapshot, np.ndarray]]:
+        """(снимок, маска) для собственных агрегаций поверх индекса (карта) или None"""
+        if not self.supports(filters):
+            self.stats['fallbacks'] += 1
+            return None
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        self.stats['queries'] += 1
+        return snapshot, self._mask(snapshot, filters)
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """Количество квартир по фильтрам или None (нужен SQL)"""
+        if not self.supports(filters):
+            self.stats['fallbacks'] += 1
+            return None
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        self.stats['queries'] += 1
+        return int(np.count_nonzero(self._mask(snapshot, filters)))
+
+    def get_stats(self) -> Dict:
+        snapshot = self._snapshot
+        return dict(self.stats, rows=len(snapshot.ids) if snapshot is not None else 0)
+
+
+# Глобальный экземпляр индекса
+_property_index = None
+
+
+def is_property_index_enabled() -> bool:
+    """Индекс можно отключить переменной окружения PROPERTY_INDEX_ENABLED=0"""
+    return os.environ.get('PROPERTY_INDEX_ENABLED', '1') not in ('0', 'false', 'False')
+
+
+def get_property_index() -> PropertyIndex:
+    """Получить singleton экземпляр PropertyIndex"""
+    global _property_index
+    if _property_index is None:
+        _property_index = PropertyIndex()
+    return _property_index
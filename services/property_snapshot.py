@@ -0,0 +1,206 @@
+"""
+Версионированный снимок каталога квартир для load_properties()
+
+Вместо глобального list-of-dicts каждый worker держит один read-only
+снимок: записи собираются один раз на версию (FrozenRecord с общими
+интернированными строками) и отдаются всем запросам без копирования.
+Снимок пересобирается только когда меняется версия данных
+(количество + max(updated_at) по квартирам, ЖК и застройщикам),
+и один раз сериализуется в готовый JSON с ETag.
+"""
+
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections.abc import Sequence
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+logger = logging.getLogger(__name__)
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError('Snapshot records are shared and read-only; copy with dict(record)')
+
+
+class FrozenRecord(dict):
+    """
+    dict только для чтения — одна запись снимка на все запросы
+    json/jsonify/шаблоны работают как с dict; изменить — только копию dict(record)
+    """
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # copy.deepcopy / pickle дают обычный изменяемый dict
+        return dict, (dict(self),)
+
+
+class FrozenList(list):
+    """list только для чтения (вложенные фото, особенности и т.п.)"""
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def _freeze(value, interned: Dict[str, str]):
+    if isinstance(value, str):
+        return interned.setdefault(value, value)
+    if type(value) is dict:
+        return FrozenRecord((key, _freeze(item, interned)) for key, item in value.items())
+    if type(value) is list:
+        return FrozenList(_freeze(item, interned) for item in value)
+    return value
+
+
+class PropertySnapshot(Sequence):
+    """
+    Неизменяемый снимок квартир
+
+    Ведёт себя как list of dicts: итерация, len(), индексы и срезы
+    отдают одни и те же FrozenRecord — без выделения памяти на запрос.
+    Вызывающий код, которому нужно дописать поля (cashback), копирует
+    только отобранные записи: dict(record).
+    """
+
+    __slots__ = ('version', 'built_at', '_records', '_positions', '_json_blob', '_etag')
+
+    def __init__(self, records: List[Dict[str, Any]], version: Any = None):
+        self.version = version
+        self.built_at = time.time()
+
+        # Повторяющиеся строки (ЖК, застройщик, район) храним одним объектом
+        interned: Dict[str, str] = {}
+        self._records: Tuple[FrozenRecord, ...] = tuple(_freeze(dict(record), interned) for record in records)
+
+        self._positions: Dict[str, int] = {}
+        for position, record in enumerate(self._records):
+            if 'id' in record:
+                self._positions.setdefault(str(record['id']), position)
+
+        self._json_blob: Optional[bytes] = None
+        self._etag: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(self._records[item])
+        return self._records[item]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def copy(self) -> List[Dict[str, Any]]:
+        """Совместимость с list.copy() — новый список тех же read-only записей"""
+        return list(self._records)
+
+    def get_by_id(self, property_id) -> Optional[Dict[str, Any]]:
+        """O(1) поиск квартиры по id вместо линейного прохода"""
+        position = self._positions.get(str(property_id))
+        if position is None:
+            return None
+        return self._records[position]
+
+    def to_json_bytes(self) -> bytes:
+        """JSON всего снимка; кодируется один раз на версию"""
+        if self._json_blob is None:
+            self._json_blob = json.dumps(self._records, ensure_ascii=False, separators=(',', ':'),
+                                         default=str).encode('utf-8')
+        return self._json_blob
+
+    @property
+    def etag(self) -> str:
+        if self._etag is None:
+            self._etag = hashlib.sha1(self.to_json_bytes()).hexdigest()
+        return self._etag
+
+
+def fetch_catalogue_version() -> Tuple:
+    """Версия данных каталога: количество и max(updated_at) одним запросом"""
+    from app import db
+    from sqlalchemy import func, select
+    from models import Property, ResidentialComplex, Developer
+
+    try:
+        row = db.session.execute(select(
+            select(func.count(Property.id)).where(Property.is_active == True).scalar_subquery(),
+            select(func.max(Property.updated_at)).scalar_subquery(),
+            select(func.count(ResidentialComplex.id)).scalar_subquery(),
+            select(func.max(ResidentialComplex.updated_at)).scalar_subquery(),
+            select(func.max(Developer.updated_at)).scalar_subquery(),
+        )).first()
+    except Exception:
+        # Прерванная транзакция не должна ломать остаток запроса
+        db.session.rollback()
+        raise
+    return tuple(row)
+
+
+class PropertySnapshotStore:
+    """
+    Хранилище снимка с проверкой версии
+
+    Args:
+        builder: функция, возвращающая list of dicts (дорогая сборка из БД)
+        version_fetcher: функция, возвращающая версию данных (дешёвый запрос)
+        check_interval: как часто (сек) сверять версию с БД
+    """
+
+    def __init__(self, builder: Callable[[], List[Dict[str, Any]]],
+                 version_fetcher: Callable[[], Any] = fetch_catalogue_version,
+                 check_interval: float = 30.0):
+        self.builder = builder
+        self.version_fetcher = version_fetcher
+        self.check_interval = check_interval
+        self._snapshot: Optional[PropertySnapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'builds': 0, 'version_checks': 0, 'errors': 0}
+
+    def get(self) -> PropertySnapshot:
+        """
+        Текущий снимок; ошибка БД при проверке версии или сборке не роняет
+        запрос — отдаётся прежний снимок, следующая попытка через check_interval.
+        Пустой снимок — только если ни одной сборки ещё не было
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - self._last_check < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.time() - self._last_check < self.check_interval:
+                return snapshot
+
+            try:
+                version = self.version_fetcher()
+                self.stats['version_checks'] += 1
+                if snapshot is None or snapshot.version != version:
+                    started = time.time()
+                    snapshot = PropertySnapshot(self.builder(), version=version)
+                    self._snapshot = snapshot
+                    self.stats['builds'] += 1
+                    logger.info(f"✅ Property snapshot rebuilt: {len(snapshot)} records in {(time.time() - started) * 1000:.0f} ms")
+            except Exception as e:
+                self.stats['errors'] += 1
+                if snapshot is None:
+                    logger.error(f"❌ Property snapshot build failed, no previous snapshot: {e}")
+                    return PropertySnapshot([])
+                logger.error(f"❌ Property snapshot refresh failed, serving version {snapshot.version}: {e}")
+            self._last_check = time.time()
+            return snapshot
+
+    def invalidate(self):
+        """Принудительно пересобрать снимок при следующем обращении"""
+        with self._lock:
+            self._snapshot = None
+            self._last_check = 0.0
@@ -0,0 +1,458 @@
+"""
+Общий кэш ответов с инвалидацией по тегам
+
+CACHE_TYPE 'simple' держал кэш в памяти каждого воркера: попадания делились
+на число воркеров, а правки в админке не сбрасывали ничего до истечения TTL.
+Теперь:
+
+1. SQLiteCache — backend Flask-Caching в общем SQLite-файле (WAL), один на
+   все процессы сервера. Redis / memcached подключаются без изменений кода:
+   CACHE_TYPE=RedisCache + CACHE_REDIS_URL или CACHE_TYPE=MemcachedCache +
+   CACHE_MEMCACHED_SERVERS.
+2. TaggedCache поверх любого backend'а: запись хранит версии своих тегов
+   (property:<id>, complex:<id>, catalogue); invalidate(tag) записывает новую
+   версию тега, и все записи со старой версией становятся промахом.
+3. Stale-while-revalidate: после ttl запись ещё stale_ttl секунд отдаётся
+   как есть, пока один запрос (владелец блокировки) её пересчитывает.
+4. Склейка запросов: при промахе считает только владелец блокировки
+   (atomic add в backend), остальные до coalesce_wait ждут его результат.
+5. Теги сбрасываются после commit изменённых квартир, ЖК, корпусов и
+   застройщиков (setup_response_cache_tracking). Массовые записи мимо ORM
+   (upsert импорта и парсеров, UPDATE геокодера) вызывают invalidate_tags()
+   после своего commit.
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from flask_caching.backends.base import BaseCache
+
+logger = logging.getLogger(__name__)
+
+STALE_TTL = 300  # сколько секунд после ttl ещё можно отдавать старый ответ
+LOCK_TIMEOUT = 30  # блокировка пересчёта, если владелец упал
+COALESCE_WAIT = 5.0  # сколько ждать чужой пересчёт, прежде чем считать самому
+EVICT_EVERY = 500
+
+TAG_CATALOGUE = 'catalogue'
+
+
+def property_tag(property_id) -> str:
+    return f'property:{property_id}'
+
+
+def complex_tag(complex_id) -> str:
+    return f'complex:{complex_id}'
+
+
+class SQLiteCache(BaseCache):
+    """
+    Backend Flask-Caching в SQLite-файле, общий для всех воркеров
+
+    Args:
+        path: файл базы (':memory:' — для тестов)
+        default_timeout: TTL по умолчанию, сек (0 — без срока)
+        max_entries: предел записей; сверх него удаляются ближайшие к истечению
+    """
+
+    def __init__(self, path: str, default_timeout: int = 300, max_entries: int = 50_000):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.max_entries = max_entries
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._memory_conn = (sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+                             if path == ':memory:' else None)
+        self._lock = threading.RLock()
+        self._writes = 0
+        with self._lock:
+            self._conn().execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        path = config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'response_cache.sqlite')
+        kwargs.setdefault('max_entries', int(config.get('CACHE_SQLITE_MAX_ENTRIES') or 50_000))
+        return cls(path, *args, **kwargs)
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._memory_conn is not None:
+            return self._memory_conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; несколько процессов пишут в один файл: WAL + ожидание блокировки
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _expires_at(self, timeout: Optional[int]) -> Optional[float]:
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout else None
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT value FROM response_cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def get_many(self, *keys: str) -> list:
+        if not keys:
+            return []
+        placeholders = ','.join('?' * len(keys))
+        with self._lock:
+            rows = dict(self._conn().execute(
+                f"SELECT key, value FROM response_cache WHERE key IN ({placeholders}) "
+                f"AND (expires_at IS NULL OR expires_at > ?)", (*keys, time.time()),
+            ).fetchall())
+        return [pickle.loads(rows[key]) if key in rows else None for key in keys]
+
+    def has(self, key: str) -> bool:
+        with self._lock:
+            return self._conn().execute(
+                "SELECT 1 FROM response_cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone() is not None
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        with self._lock:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires_at(timeout)),
+            )
+            self._writes += 1
+            if self._writes >= EVICT_EVERY:
+                self._writes = 0
+                self.evict()
+        return True
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        """Записать, только если ключа нет (или он истёк) — атомарно между процессами"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn().execute(
+                "INSERT INTO response_cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE response_cache.expires_at IS NOT NULL AND response_cache.expires_at <= ?",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires_at(timeout), now),
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._conn().execute("DELETE FROM response_cache WHERE key = ?", (key,)).rowcount == 1
+
+    def inc(self, key: str, delta: int = 1) -> Optional[int]:
+        with self._lock:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute("SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+                alive = row is not None and (row[1] is None or row[1] > time.time())
+                value = (pickle.loads(row[0]) if alive else 0) + delta
+                conn.execute("INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, pickle.dumps(value), row[1] if alive else None))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return value
+
+    def clear(self) -> bool:
+        with self._lock:
+            self._conn().execute("DELETE FROM response_cache")
+        return True
+
+    def evict(self) -> int:
+        """Удалить истёкшие записи и ближайшие к истечению сверх max_entries"""
+        with self._lock:
+            conn = self._conn()
+            removed = conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            overflow = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                removed += conn.execute(
+                    "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache "
+                    "WHERE expires_at IS NOT NULL ORDER BY expires_at LIMIT ?)", (overflow + self.max_entries // 10,)
+                ).rowcount
+        if removed:
+            logger.info(f"🧹 Response cache: evicted {removed} entries")
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class _Uncacheable(Exception):
+    """Ответ view не кэшируется (не 200) — отдаём как есть"""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class TaggedCache:
+    """
+    Теги, stale-while-revalidate и склейка запросов поверх backend'а Flask-Caching
+
+    Args:
+        backend: SQLiteCache, RedisCache, MemcachedCache, ... (cache.cache)
+        stale_ttl: сколько секунд после ttl отдавать старый ответ во время пересчёта
+        lock_timeout: срок блокировки пересчёта
+        coalesce_wait: сколько ждать чужой пересчёт при промахе
+    """
+
+    def __init__(self, backend: BaseCache, stale_ttl: float = STALE_TTL, lock_timeout: int = LOCK_TIMEOUT,
+                 coalesce_wait: float = COALESCE_WAIT, poll_interval: float = 0.05, prefix: str = 'rc:'):
+        self.backend = backend
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.coalesce_wait = coalesce_wait
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'coalesced': 0, 'refreshes': 0, 'invalidations': 0}
+
+    # ------------------------------------------------------------------
+    # Теги
+    # ------------------------------------------------------------------
+
+    def _tag_key(self, tag: str) -> str:
+        return f'{self.prefix}tag:{tag}'
+
+    def _versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = sorted(set(tags))
+        if not tags:
+            return {}
+        values = self.backend.get_many(*[self._tag_key(tag) for tag in tags])
+        return {tag: value or 0 for tag, value in zip(tags, values)}
+
+    def invalidate(self, *tags: str):
+        """
+        Новая версия тегов — все записи с ними становятся промахом
+        Версия — время в нс, а не счётчик: вытеснение ключа тега из memcached
+        не может «вернуть» старую версию
+        """
+        tags = set(tags)
+        if not tags:
+            return
+        version = time.time_ns()
+        self.backend.set_many({self._tag_key(tag): version for tag in tags}, timeout=0)
+        self.stats['invalidations'] += len(tags)
+        logger.debug(f"🏷️ Response cache invalidated: {', '.join(sorted(tags))}")
+
+    def _valid(self, entry: Dict) -> bool:
+        return self._versions(entry['tags']) == entry['tags']
+
+    # ------------------------------------------------------------------
+    # Чтение / пересчёт
+    # ------------------------------------------------------------------
+
+    def _acquire(self, key: str) -> bool:
+        return bool(self.backend.add(f'{key}:lock', 1, timeout=self.lock_timeout))
+
+    def _compute(self, key: str, compute: Callable[[], Any], ttl: float, stale_ttl: float, tags: Iterable[str]):
+        # Версии тегов — до пересчёта: инвалидация во время compute сделает запись промахом
+        versions = self._versions(tags)
+        value = compute()
+        entry = {'value': value, 'fresh_until': time.time() + ttl, 'tags': versions}
+        self.backend.set(key, entry, timeout=int(ttl + stale_ttl) or 1)
+        return value
+
+    def fetch(self, key: str, compute: Callable[[], Any], ttl: float, tags: Iterable[str] = (),
+              stale_ttl: Optional[float] = None) -> Tuple[Any, str]:
+        """
+        (значение, состояние): 'hit', 'stale', 'refresh', 'coalesced' или 'miss'
+        Исключение из compute пробрасывается и ничего не кэширует
+        """
+        key = self.prefix + key
+        tags = list(tags)
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+
+        entry = self.backend.get(key)
+        if entry is not None and self._valid(entry):
+            if entry['fresh_until'] > time.time():
+                self.stats['hits'] += 1
+                return entry['value'], 'hit'
+            if not self._acquire(key):
+                # Пересчитывает другой запрос — отдаём старое
+                self.stats['stale'] += 1
+                return entry['value'], 'stale'
+            self.stats['refreshes'] += 1
+            return self._locked_compute(key, compute, ttl, stale_ttl, tags), 'refresh'
+
+        if self._acquire(key):
+            self.stats['misses'] += 1
+            return self._locked_compute(key, compute, ttl, stale_ttl, tags), 'miss'
+
+        deadline = time.time() + self.coalesce_wait
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            entry = self.backend.get(key)
+            if entry is not None and entry['fresh_until'] > time.time() and self._valid(entry):
+                self.stats['coalesced'] += 1
+                return entry['value'], 'coalesced'
+        self.stats['misses'] += 1
+        return self._compute(key, compute, ttl, stale_ttl, tags), 'miss'
+
+    def _locked_compute(self, key, compute, ttl, stale_ttl, tags):
+        try:
+            return self._compute(key, compute, ttl, stale_ttl, tags)
+        finally:
+            self.backend.delete(f'{key}:lock')
+
+    def cached_view(self, ttl: float, tags=(), stale_ttl: Optional[float] = None, query_string: bool = True):
+        """
+        Декоратор Flask view вместо @cache.cached / @cache.memoize
+
+        Args:
+            ttl: сколько секунд ответ свежий
+            tags: список тегов или функция (**view_kwargs) -> теги
+            query_string: учитывать параметры запроса в ключе
+        Кэшируются только ответы 200; заголовок X-Cache показывает состояние
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                from flask import Response, make_response, request
+
+                key = f'view:{request.path}'
+                if query_string and request.args:
+                    args_key = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+                    key += '?' + hashlib.md5(args_key.encode('utf-8')).hexdigest()
+                view_tags = tags(**kwargs) if callable(tags) else tags
+
+                def compute():
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.direct_passthrough:
+                        raise _Uncacheable(response)
+                    return response.get_data(), response.status_code, response.mimetype
+
+                try:
+                    (body, status, mimetype), state = self.fetch(key, compute, ttl, view_tags, stale_ttl)
+                except _Uncacheable as uncacheable:
+                    return uncacheable.response
+                response = Response(body, status=status, mimetype=mimetype)
+                response.headers['X-Cache'] = state.upper()
+                return response
+            return wrapper
+        return decorator
+
+    def get_stats(self) -> Dict:
+        lookups = sum(self.stats[name] for name in ('hits', 'stale', 'misses', 'coalesced', 'refreshes'))
+        served = self.stats['hits'] + self.stats['stale'] + self.stats['coalesced']
+        return dict(self.stats, hit_rate=round(served / lookups * 100, 1) if lookups else 0.0)
+
+
+_response_cache: Optional[TaggedCache] = None
+
+
+def init_response_cache(backend: BaseCache, **options) -> TaggedCache:
+    """Создать singleton поверх backend'а Flask-Caching приложения"""
+    global _response_cache
+    _response_cache = TaggedCache(backend, **options)
+    return _response_cache
+
+
+def get_response_cache() -> TaggedCache:
+    """Получить singleton TaggedCache (без приложения — SQLite-файл из RESPONSE_CACHE_PATH)"""
+    global _response_cache
+    if _response_cache is None:
+        path = os.environ.get('RESPONSE_CACHE_PATH', os.path.join('instance', 'response_cache.sqlite'))
+        _response_cache = TaggedCache(SQLiteCache(path))
+    return _response_cache
+
+
+# ----------------------------------------------------------------------
+# Сброс тегов при записи моделей
+# ----------------------------------------------------------------------
+
+def _history_values(obj, attribute: str) -> Set:
+    """Текущее и прежнее значение атрибута (квартиру могли перенести в другой ЖК)"""
+    from sqlalchemy import inspect
+
+    values = {getattr(obj, attribute, None)}
+    try:
+        values.update(inspect(obj).attrs[attribute].history.deleted)
+    except Exception:
+        pass
+    values.discard(None)
+    return values
+
+
+def tags_for(obj) -> Set[str]:
+    """Теги, которые нужно сбросить после изменения объекта"""
+    from models import Building, Developer, Property, ResidentialComplex
+
+    if isinstance(obj, Property):
+        tags = {TAG_CATALOGUE, property_tag(obj.id)}
+        tags.update(complex_tag(complex_id) for complex_id in _history_values(obj, 'complex_id'))
+        return tags
+    if isinstance(obj, ResidentialComplex):
+        return {TAG_CATALOGUE, complex_tag(obj.id)}
+    if isinstance(obj, Building):
+        return {TAG_CATALOGUE} | {complex_tag(complex_id) for complex_id in _history_values(obj, 'complex_id')}
+    if isinstance(obj, Developer):
+        return {TAG_CATALOGUE}
+    return set()
+
+
+def _after_flush(session, flush_context):
+    tags = set()
+    for obj in list(session.new) + list(session.deleted):
+        tags |= tags_for(obj)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            tags |= tags_for(obj)
+    if tags:
+        session.info.setdefault('response_cache_tags', set()).update(tags)
+
+
+def invalidate_tags(tags: Iterable[str]):
+    """Сбросить теги после commit; ошибка кэша не должна ронять уже записанные данные"""
+    tags = set(tags)
+    if not tags:
+        return
+    try:
+        get_response_cache().invalidate(*tags)
+    except Exception as e:
+        logger.error(f"❌ Response cache invalidation failed: {e}")
+
+
+def _after_commit(session):
+    invalidate_tags(session.info.pop('response_cache_tags', None) or ())
+
+
+def _after_rollback(session):
+    session.info.pop('response_cache_tags', None)
+
+
+_tracking_enabled = False
+
+
+def setup_response_cache_tracking():
+    """
+    Подписаться на события Session: после commit квартир, ЖК, корпусов и
+    застройщиков сбрасываются теги property:<id>, complex:<id> и catalogue
+    """
+    global _tracking_enabled
+    if _tracking_enabled:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _tracking_enabled = True
@@ -0,0 +1,432 @@
+"""
+Асинхронный движок парсеров (domclick, застройщики, агрегаторы)
+
+Скрипты в scripts/ качали страницы по одной через requests + time.sleep,
+у каждого свои ретраи и свой разбор. Здесь общий движок:
+
+1. Запросы выполняются конкурентно (asyncio + httpx.AsyncClient с общим пулом
+   соединений); на каждый хост — свой лимит параллельности и token bucket
+   (HostPolicy), поэтому ускорение не превращается в бан.
+2. Ответы лежат в дисковом HTTP-кэше (HttpCache): повторный проход шлёт
+   If-None-Match / If-Modified-Since, на 304 тело берётся с диска.
+   offline=True отвечает только из кэша — каталог кэша служит записанными
+   фикстурами для разбора без сети.
+3. parse(request, response) отдаёт записи в колонках парсера (inner_id,
+   price, ...) и, при необходимости, следующие ScrapeRequest (пагинация).
+   Записи пачками уходят в sink — обычно ImportSink → services/import_engine.py,
+   то есть в БД по мере разбора, без промежуточного Excel.
+4. Checkpoint сохраняет выполненные и ещё не выполненные запросы после каждой
+   записанной пачки: прерванный проход продолжается с места остановки.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+MAX_RETRIES = 3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+USER_AGENT = 'InBack Catalogue Scraper 2.0'
+
+
+class ScrapeError(Exception):
+    """Запрос не удался после всех попыток (или нет в кэше при offline)"""
+
+
+class ScrapeRequest:
+    """GET-запрос к источнику; meta передаётся в parse() как есть"""
+
+    def __init__(self, url: str, params: Optional[Dict[str, Any]] = None, meta: Optional[Dict[str, Any]] = None):
+        self.url = url
+        self.params = {key: value for key, value in (params or {}).items() if value is not None}
+        self.meta = meta or {}
+
+    @property
+    def full_url(self) -> str:
+        return str(httpx.URL(self.url, params=self.params))
+
+    @property
+    def host(self) -> str:
+        return httpx.URL(self.url).host
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha1(self.full_url.encode('utf-8')).hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'url': self.url, 'params': self.params, 'meta': self.meta}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ScrapeRequest':
+        return cls(data['url'], data.get('params'), data.get('meta'))
+
+    def __repr__(self):
+        return f'<ScrapeRequest {self.full_url}>'
+
+
+class ScrapeResponse:
+    """Ответ источника (из сети или из кэша)"""
+
+    def __init__(self, url: str, status: int, headers: Dict[str, str], content: bytes, from_cache: bool = False):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+# ----------------------------------------------------------------------
+# Ограничение скорости
+# ----------------------------------------------------------------------
+
+class HostPolicy:
+    """
+    Args:
+        concurrency: одновременных запросов к хосту
+        rate: запросов в секунду (None — без ограничения)
+        burst: сколько запросов можно выпустить сразу после простоя
+    """
+
+    def __init__(self, concurrency: int = 4, rate: Optional[float] = 5.0, burst: int = 5):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+
+
+class TokenBucket:
+    """Token bucket: в среднем rate запросов в секунду, до burst подряд"""
+
+    def __init__(self, rate: Optional[float], burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# ----------------------------------------------------------------------
+# HTTP-кэш и контрольная точка
+# ----------------------------------------------------------------------
+
+class HttpCache:
+    """
+    Ответы на диске: <key>.json (статус, ETag, Last-Modified, заголовки) + <key>.body
+    Ключ — sha1 полного URL с параметрами (ScrapeRequest.key)
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def get(self, request: ScrapeRequest) -> Optional[Dict[str, Any]]:
+        """{'status', 'headers', 'etag', 'last_modified', 'fetched_at', 'content'} или None"""
+        try:
+            with open(self._path(request.key, '.json'), encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(self._path(request.key, '.body'), 'rb') as f:
+                entry['content'] = f.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, request: ScrapeRequest, response: ScrapeResponse):
+        entry = {
+            'url': request.full_url,
+            'status': response.status,
+            'headers': {key: value for key, value in response.headers.items()
+                        if key.lower() in ('content-type', 'etag', 'last-modified')},
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+            'fetched_at': time.time(),
+        }
+        os.makedirs(os.path.dirname(self._path(request.key, '')), exist_ok=True)
+        for suffix, data in (('.body', response.content),
+                             ('.json', json.dumps(entry, ensure_ascii=False).encode('utf-8'))):
+            path = self._path(request.key, suffix)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def touch(self, request: ScrapeRequest):
+        """Ответ 304 — запись актуальна, обновить время проверки"""
+        entry = self.get(request)
+        if entry is not None:
+            entry.pop('content')
+            entry['fetched_at'] = time.time()
+            with open(self._path(request.key, '.json'), 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+
+
+class Checkpoint:
+    """
+    Состояние прохода в JSON-файле: ключи выполненных запросов и очередь невыполненных
+    Сохраняется после каждой записанной пачки; reset() — начать проход заново
+    (AsyncScraper вызывает его сам, когда проход завершился без невыполненных запросов)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        self.pending: Dict[str, Dict] = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.done = set(data.get('done', []))
+            self.pending = {ScrapeRequest.from_dict(item).key: item for item in data.get('pending', [])}
+        except (OSError, ValueError):
+            pass
+
+    def save(self, done: Iterable[str], pending: Iterable[ScrapeRequest]):
+        self.done.update(done)
+        self.pending = {request.key: request.to_dict() for request in pending if request.key not in self.done}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'done': sorted(self.done), 'pending': list(self.pending.values())}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def reset(self):
+        self.done, self.pending = set(), {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ----------------------------------------------------------------------
+# Движок
+# ----------------------------------------------------------------------
+
+class ImportSink:
+    """Пачка записей парсера → services/import_engine.py (upsert по inner_id)"""
+
+    def __init__(self, session=None, dry_run: bool = False):
+        self.session = session
+        self.dry_run = dry_run
+        self.totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+
+    def __call__(self, records: List[Dict[str, Any]]):
+        from services.import_engine import RecordsSource, import_catalogue
+
+        report = import_catalogue(RecordsSource(records), session=self.session, dry_run=self.dry_run)
+        for field in self.totals:
+            self.totals[field] += getattr(report, field)
+
+
+class AsyncScraper:
+    """
+    Args:
+        parse: (ScrapeRequest, ScrapeResponse) → итерируемое из записей (dict) и новых ScrapeRequest
+        sink: вызывается с пачкой записей (до batch_size); по умолчанию записи копятся в .records
+        cache: HttpCache для условных запросов и offline
+        checkpoint: Checkpoint для продолжения прерванного прохода
+        policies: {host: HostPolicy}; остальным хостам — default_policy
+        fresh_for: сек — ответ из кэша моложе этого не перепроверяется вовсе
+        offline: не ходить в сеть, отвечать только из кэша (фикстуры)
+        params: параметры для всех запросов, не входят в ключ кэша и контрольную точку (токены API)
+        transport: httpx-транспорт (для тестов — httpx.MockTransport)
+    """
+
+    def __init__(self, parse: Callable[[ScrapeRequest, ScrapeResponse], Iterable],
+                 sink: Optional[Callable[[List[Dict]], None]] = None, cache: Optional[HttpCache] = None,
+                 checkpoint: Optional[Checkpoint] = None, policies: Optional[Dict[str, HostPolicy]] = None,
+                 default_policy: Optional[HostPolicy] = None, batch_size: int = BATCH_SIZE,
+                 fresh_for: float = 0, offline: bool = False, max_retries: int = MAX_RETRIES,
+                 timeout: float = 30, headers: Optional[Dict[str, str]] = None,
+                 params: Optional[Dict[str, Any]] = None, transport=None):
+        self.parse = parse
+        self.sink = sink
+        self.cache = cache
+        self.checkpoint = checkpoint
+        self.policies = policies or {}
+        self.default_policy = default_policy or HostPolicy()
+        self.batch_size = batch_size
+        self.fresh_for = fresh_for
+        self.offline = offline
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.headers = {'User-Agent': USER_AGENT, 'Accept': 'application/json, text/html;q=0.9', **(headers or {})}
+        self.params = params or {}
+        self.transport = transport
+        self.records: List[Dict] = []
+        self.stats = {'requests': 0, 'fetched': 0, 'not_modified': 0, 'cached': 0,
+                      'retries': 0, 'failed': 0, 'records': 0, 'resumed': 0}
+
+    def run_sync(self, seeds: Iterable[ScrapeRequest]) -> Dict[str, int]:
+        return asyncio.run(self.run(seeds))
+
+    async def run(self, seeds: Iterable[ScrapeRequest]) -> Dict[str, int]:
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._seen = set(self.checkpoint.done) if self.checkpoint else set()
+        self._outstanding: Dict[str, ScrapeRequest] = {}
+        self._buffer: List[Dict] = []
+        self._finished: List[str] = []
+        self._hosts: Dict[str, tuple] = {}
+
+        if self.checkpoint:
+            for item in self.checkpoint.pending.values():
+                self.stats['resumed'] += self._enqueue(ScrapeRequest.from_dict(item))
+        for request in seeds:
+            self._enqueue(request)
+
+        workers_count = max(1, sum(policy.concurrency for policy in self.policies.values())
+                            + self.default_policy.concurrency)
+        async with httpx.AsyncClient(headers=self.headers, params=self.params, timeout=self.timeout,
+                                     follow_redirects=True,
+                                     transport=self.transport,
+                                     limits=httpx.Limits(max_connections=workers_count)) as client:
+            self._client = client
+            workers = [asyncio.create_task(self._worker()) for _ in range(workers_count)]
+            try:
+                await self._queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                self._flush()
+        if self.checkpoint and not self._outstanding:
+            # Проход завершён целиком: done нужен только прерванному проходу,
+            # иначе следующий запуск пропустил бы seeds и ничего не сделал
+            self.checkpoint.reset()
+        logger.info(f"🕸️ Scrape finished: {self.stats}")
+        return self.stats
+
+    def _enqueue(self, request: ScrapeRequest) -> bool:
+        if request.key in self._seen:
+            return False
+        self._seen.add(request.key)
+        self._outstanding[request.key] = request
+        self._queue.put_nowait(request)
+        return True
+
+    def _host_limits(self, host: str):
+        if host not in self._hosts:
+            policy = self.policies.get(host, self.default_policy)
+            self._hosts[host] = (asyncio.Semaphore(policy.concurrency), TokenBucket(policy.rate, policy.burst))
+        return self._hosts[host]
+
+    async def _worker(self):
+        while True:
+            request = await self._queue.get()
+            try:
+                await self._handle(request)
+            except ScrapeError as e:
+                self.stats['failed'] += 1
+                logger.warning(f"⚠️ {request.full_url}: {e}")
+            except Exception:
+                self.stats['failed'] += 1
+                logger.exception(f"❌ Parse failed for {request.full_url}")
+            finally:
+                self._queue.task_done()
+
+    async def _handle(self, request: ScrapeRequest):
+        response = await self._fetch(request)
+        for item in self.parse(request, response) or ():
+            if isinstance(item, ScrapeRequest):
+                self._enqueue(item)
+            else:
+                self._buffer.append(item)
+                self.stats['records'] += 1
+        self._finished.append(request.key)
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """Записать накопленные записи и только после этого отметить их запросы выполненными"""
+        records, self._buffer = self._buffer, []
+        finished, self._finished = self._finished, []
+        if records:
+            if self.sink:
+                self.sink(records)
+            else:
+                self.records.extend(records)
+        for key in finished:
+            self._outstanding.pop(key, None)
+        if self.checkpoint and (finished or records):
+            self.checkpoint.save(finished, self._outstanding.values())
+
+    async def _fetch(self, request: ScrapeRequest) -> ScrapeResponse:
+        self.stats['requests'] += 1
+        cached = self.cache.get(request) if self.cache else None
+        if cached is not None and (self.offline or time.time() - cached['fetched_at'] < self.fresh_for):
+            self.stats['cached'] += 1
+            return ScrapeResponse(request.full_url, cached['status'], cached['headers'], cached['content'], True)
+        if self.offline:
+            raise ScrapeError('нет в кэше (offline)')
+
+        headers = {}
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        semaphore, bucket = self._host_limits(request.host)
+        for attempt in range(self.max_retries + 1):
+            delay = None
+            async with semaphore:
+                await bucket.acquire()
+                try:
+                    response = await self._client.get(request.url, params=request.params, headers=headers)
+                except httpx.HTTPError as e:
+                    if attempt == self.max_retries:
+                        raise ScrapeError(str(e))
+                else:
+                    if response.status_code == 304 and cached is not None:
+                        self.stats['not_modified'] += 1
+                        self.cache.touch(request)
+                        return ScrapeResponse(request.full_url, cached['status'], cached['headers'],
+                                              cached['content'], True)
+                    if response.status_code not in RETRY_STATUSES:
+                        if response.status_code >= 400:
+                            raise ScrapeError(f'HTTP {response.status_code}')
+                        self.stats['fetched'] += 1
+                        result = ScrapeResponse(request.full_url, response.status_code,
+                                                dict(response.headers), response.content)
+                        if self.cache:
+                            self.cache.put(request, result)
+                        return result
+                    if attempt == self.max_retries:
+                        raise ScrapeError(f'HTTP {response.status_code}')
+                    retry_after = response.headers.get('retry-after', '')
+                    delay = float(retry_after) if retry_after.isdigit() else None
+            self.stats['retries'] += 1
+            # Ждём вне семафора, чтобы не держать слот хоста
+            await asyncio.sleep(delay if delay is not None else 2 ** attempt + random.random())
+        raise ScrapeError('исчерпаны попытки')
+
+
+def default_cache() -> HttpCache:
+    return HttpCache(os.environ.get('SCRAPER_CACHE_DIR', os.path.join('instance', 'scraper_cache')))
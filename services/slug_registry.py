@@ -0,0 +1,227 @@
+"""
+Реестр slug'ов для SEO-страниц ЖК, застройщиков, районов и улиц
+
+Раньше каждая страница искала сущность по-своему: /zk/<slug> при промахе
+грузил 100 ЖК и прогонял create_slug() по каждому, /developer/<slug> делал
+цепочку LIKE и затем SELECT * FROM developers с транслитерацией в цикле,
+/streets/ и /street/ транслитерировали имя на каждом запросе. Теперь:
+
+1. При построении для каждой сущности считаются канонический slug (из БД)
+   и старые варианты: create_slug() / street_slug(), транслитерации с
+   разными правилами (х → h / kh, ё → e / yo, й → y / i), кириллический
+   slug, префикс zhk- для ЖК.
+2. resolve(kind, slug) — поиск в dict за O(1); входной slug нормализуется
+   так же (регистр, пробелы / _ / %20 → дефис), поэтому варианты
+   «с пробелами» и «через дефис» совпадают.
+3. Если пришёл не канонический slug, страница отвечает 301 на канонический.
+4. Реестр перестраивается после commit изменённых ЖК / застройщиков /
+   районов / улиц; другие процессы подхватывают изменения через
+   REFRESH_SECONDS или при промахе, найденном прямым запросом по slug.
+"""
+
+import logging
+import re
+import threading
+import time
+import urllib.parse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = 300
+
+KIND_COMPLEX = 'complex'
+KIND_DEVELOPER = 'developer'
+KIND_DISTRICT = 'district'
+KIND_STREET = 'street'
+
+_BASE_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+# Правила, которые в разное время использовали разные страницы сайта
+TRANSLIT_VARIANTS = [
+    dict(_BASE_TRANSLIT, х='h', ё='yo', й='y'),
+    dict(_BASE_TRANSLIT, х='kh', ё='yo', й='y'),
+    dict(_BASE_TRANSLIT, х='h', ё='e', й='i'),
+]
+
+
+def normalize_slug(value: Optional[str]) -> str:
+    """Ключ поиска: URL-декодирование, нижний регистр, пробелы / _ → дефис, без знаков препинания"""
+    if not value:
+        return ''
+    value = urllib.parse.unquote(str(value)).strip().lower()
+    value = re.sub(r'[«»"\'\(\)\.,:;№]', '', value)
+    value = re.sub(r'[\s_]+', '-', value)
+    return re.sub(r'-+', '-', value).strip('-')
+
+
+def slug_variants(name: str, kind: str) -> List[str]:
+    """Все slug'и, по которым сущность могли открывать раньше"""
+    from app import create_slug, street_slug
+
+    name = (name or '').strip()
+    if not name:
+        return []
+    bare = re.sub(r'^ЖК\s*', '', name, flags=re.IGNORECASE).strip() if kind == KIND_COMPLEX else name
+    variants = [create_slug(name), street_slug(name), normalize_slug(name), normalize_slug(bare)]
+    for source in {name, bare}:
+        lowered = source.lower()
+        for table in TRANSLIT_VARIANTS:
+            variants.append(''.join(table.get(char, char) for char in lowered))
+    if kind == KIND_COMPLEX:
+        variants += [f'zhk-{variant}' for variant in list(variants)]
+    if kind == KIND_STREET:
+        # «Красная ул.» ↔ «Красная»
+        short = re.sub(r'\s*(ул\.?|улица)\s*', ' ', name, flags=re.IGNORECASE).strip()
+        if short and short != name:
+            variants += slug_variants(short, KIND_DISTRICT)
+    return [normalize_slug(variant) for variant in variants]
+
+
+class SlugRegistry:
+    """alias → id и id → канонический slug для каждого вида сущности"""
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._aliases: Dict[str, Dict[str, int]] = {}
+        self._canonical: Dict[str, Dict[int, str]] = {}
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'redirects': 0, 'misses': 0, 'fallback_hits': 0, 'builds': 0}
+
+    @staticmethod
+    def _models():
+        from models import Developer, District, ResidentialComplex, Street
+        return {KIND_COMPLEX: ResidentialComplex, KIND_DEVELOPER: Developer,
+                KIND_DISTRICT: District, KIND_STREET: Street}
+
+    def build(self, session=None):
+        """Загрузить (id, name, slug) всех сущностей и посчитать варианты"""
+        if session is None:
+            from app import db
+            session = db.session
+        aliases, canonical = {}, {}
+        for kind, model in self._models().items():
+            rows = session.execute(select(model.id, model.name, model.slug).order_by(model.id)).all()
+            kind_aliases, kind_canonical = {}, {}
+            # Сначала канонические slug'и — их не перекроет чужой старый вариант
+            for entity_id, name, slug in rows:
+                kind_canonical[entity_id] = slug or normalize_slug(name)
+                kind_aliases.setdefault(normalize_slug(kind_canonical[entity_id]), entity_id)
+            for entity_id, name, slug in rows:
+                for variant in slug_variants(name, kind):
+                    if variant:
+                        kind_aliases.setdefault(variant, entity_id)
+            aliases[kind], canonical[kind] = kind_aliases, kind_canonical
+        with self._lock:
+            self._aliases, self._canonical = aliases, canonical
+            self._built_at = time.time()
+        self.stats['builds'] += 1
+        logger.info(f"🔗 Slug registry built: " + ', '.join(
+            f"{kind} {len(canonical[kind])}/{len(aliases[kind])}" for kind in aliases))
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _ensure(self, session=None):
+        built_at = self._built_at
+        if built_at is None or time.time() - built_at > self.refresh_seconds:
+            self.build(session)
+
+    def resolve(self, kind: str, slug: str, session=None) -> Optional[Tuple[int, str]]:
+        """
+        (id, канонический slug) или None
+        Канонический slug отличается от запрошенного — нужен 301 на него
+        """
+        self._ensure(session)
+        key = normalize_slug(slug)
+        entity_id = self._aliases.get(kind, {}).get(key)
+        if entity_id is not None:
+            canonical = self._canonical[kind][entity_id]
+            self.stats['hits' if canonical == slug else 'redirects'] += 1
+            return entity_id, canonical
+        return self._fallback(kind, slug, session)
+
+    def _fallback(self, kind: str, slug: str, session=None) -> Optional[Tuple[int, str]]:
+        """Промах: сущность могли создать в другом процессе — один запрос по уникальному slug"""
+        if session is None:
+            from app import db
+            session = db.session
+        model = self._models()[kind]
+        row = session.execute(select(model.id, model.slug).where(model.slug == slug).limit(1)).first()
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['fallback_hits'] += 1
+        self.invalidate()
+        return row.id, row.slug
+
+    def canonical_slug(self, kind: str, entity_id: int, session=None) -> Optional[str]:
+        self._ensure(session)
+        return self._canonical.get(kind, {}).get(entity_id)
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats['aliases'] = {kind: len(aliases) for kind, aliases in self._aliases.items()}
+        return stats
+
+
+_registry: Optional[SlugRegistry] = None
+
+
+def get_slug_registry() -> SlugRegistry:
+    global _registry
+    if _registry is None:
+        _registry = SlugRegistry()
+    return _registry
+
+
+def _tracked_types() -> Tuple[type, ...]:
+    return tuple(SlugRegistry._models().values())
+
+
+def _changed(objects: Iterable) -> bool:
+    tracked = _tracked_types()
+    return any(isinstance(obj, tracked) for obj in objects)
+
+
+def _after_flush(session, flush_context):
+    if _changed(session.new) or _changed(session.deleted) or any(
+            isinstance(obj, _tracked_types()) and session.is_modified(obj) for obj in session.dirty):
+        session.info['slug_registry_dirty'] = True
+
+
+def _after_commit(session):
+    if session.info.pop('slug_registry_dirty', False) and _registry is not None:
+        _registry.invalidate()
+
+
+def _after_rollback(session):
+    session.info.pop('slug_registry_dirty', None)
+
+
+_tracking_enabled = False
+
+
+def setup_slug_registry_tracking():
+    """
+    Подписаться на события Session: реестр перестраивается после commit
+    изменённых ЖК, застройщиков, районов и улиц
+    """
+    global _tracking_enabled
+    if _tracking_enabled:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _tracking_enabled = True
@@ -0,0 +1,362 @@
+"""
+Индекс автодополнения поиска для /api/search/suggestions и /api/search-suggestions
+
+Все названия (ЖК, застройщики, районы, улицы, корпуса) заранее нормализуются
+(нижний регистр, ё→е, без кавычек и пунктуации) и транслитерируются в латиницу,
+поэтому «Солнечный», «солнечныи», «solnechny» и набранное в английской
+раскладке «cjkytxysq» находят одно и то же.
+
+Поиск идёт по двум структурам:
+- отсортированный список слов → префиксный поиск через bisect;
+- триграммы → подстроки и нечёткий поиск (опечатки).
+
+Индекс пересобирается вместе с версией каталога (см. property_snapshot).
+"""
+
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+TRANSLIT_MAP = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+
+# Русская раскладка, набранная на английской клавиатуре («ccr» → «сск»)
+_LAYOUT_EN = "qwertyuiop[]asdfghjkl;'zxcvbnm,.`"
+_LAYOUT_RU = "йцукенгшщзхъфывапролджэячсмитьбюё"
+LAYOUT_MAP = dict(zip(_LAYOUT_EN, _LAYOUT_RU))
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s-]+', re.UNICODE)
+_SPACES_RE = re.compile(r'[\s\-_]+')
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, ё→е, без кавычек и пунктуации, одинарные пробелы"""
+    if not text:
+        return ''
+    text = text.lower().replace('ё', 'е')
+    text = _PUNCTUATION_RE.sub(' ', text)
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+def to_search_key(text: str) -> str:
+    """Нормализованный латинский ключ, по которому идёт сравнение"""
+    normalized = normalize_text(text)
+    return ''.join(TRANSLIT_MAP.get(ch, ch) for ch in normalized)
+
+
+def swap_layout(text: str) -> str:
+    """Перевести текст, набранный в английской раскладке, в русскую"""
+    return ''.join(LAYOUT_MAP.get(ch, ch) for ch in text.lower())
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestionEntry:
+    """Одна подсказка: сущность каталога и количество активных квартир"""
+
+    __slots__ = ('kind', 'entity_id', 'name', 'key', 'words', 'count', 'extra')
+
+    def __init__(self, kind: str, entity_id: Any, name: str, count: int = 0, extra: Optional[Dict] = None):
+        self.kind = kind
+        self.entity_id = entity_id
+        self.name = name
+        self.key = to_search_key(name)
+        self.words = tuple(self.key.split())
+        self.count = int(count or 0)
+        self.extra = extra or {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.extra, type=self.kind, id=self.entity_id, text=self.name, count=self.count)
+
+
+class SuggestionIndex:
+    """
+    Префиксный + триграммный индекс подсказок
+
+    Использование:
+        index = get_suggestion_index()
+        index.ensure_fresh()
+        for entry, score in index.search('солн', kinds=('complex',), limit=5):
+            ...
+    """
+
+    # Совпадения, от лучшего к худшему
+    SCORE_EXACT = 100
+    SCORE_FULL_PREFIX = 80
+    SCORE_WORD_PREFIX = 60
+    SCORE_SUBSTRING = 40
+    SCORE_FUZZY = 30
+    FUZZY_THRESHOLD = 0.45
+
+    def __init__(self, check_interval: float = 30.0):
+        self.check_interval = check_interval
+        self.entries: List[SuggestionEntry] = []
+        self.room_counts: Dict[int, int] = {}
+        self.property_type_counts: Dict[str, int] = {}
+        self.version = None
+        self._words: List[Tuple[str, int]] = []
+        self._trigrams: Dict[str, List[int]] = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Построение
+    # ------------------------------------------------------------------
+
+    def load(self, entries: Iterable[SuggestionEntry], room_counts: Optional[Dict[int, int]] = None,
+             property_type_counts: Optional[Dict[str, int]] = None, version: Any = None):
+        """Собрать индекс из готовых записей (без обращения к БД)"""
+        entries = [entry for entry in entries if entry.key]
+        words: List[Tuple[str, int]] = []
+        postings: Dict[str, List[int]] = {}
+        for position, entry in enumerate(entries):
+            for word in set(entry.words):
+                words.append((word, position))
+            for gram in trigrams(entry.key):
+                postings.setdefault(gram, []).append(position)
+        words.sort()
+
+        # Подмена ссылок атомарна для читающих потоков
+        self._words = words
+        self._trigrams = postings
+        self.entries = entries
+        self.room_counts = dict(room_counts or {})
+        self.property_type_counts = dict(property_type_counts or {})
+        self.version = version
+
+    @staticmethod
+    def _fetch_entries() -> Tuple[List[SuggestionEntry], Dict[int, int], Dict[str, int]]:
+        from app import db
+        from sqlalchemy import func, and_
+        from models import Property, ResidentialComplex, Developer, District
+
+        active = Property.is_active == True
+        entries: List[SuggestionEntry] = []
+
+        complexes = (
+            db.session.query(ResidentialComplex.id, ResidentialComplex.name, ResidentialComplex.slug,
+                             ResidentialComplex.address, func.count(Property.id))
+            .outerjoin(Property, and_(Property.complex_id == ResidentialComplex.id, active))
+            .filter(ResidentialComplex.is_active == True)
+            .group_by(ResidentialComplex.id)
+            .all()
+        )
+        complex_names = {}
+        for complex_id, name, slug, address, count in complexes:
+            complex_names[complex_id] = name
+            entries.append(SuggestionEntry('complex', complex_id, name, count, {'slug': slug, 'address': address}))
+
+        developers = (
+            db.session.query(Developer.id, Developer.name, Developer.slug, func.count(Property.id))
+            .outerjoin(Property, and_(Property.developer_id == Developer.id, active))
+            .group_by(Developer.id)
+            .all()
+        )
+        for developer_id, name, slug, count in developers:
+            entries.append(SuggestionEntry('developer', developer_id, name, count, {'slug': slug}))
+
+        districts = (
+            db.session.query(District.id, District.name, District.slug, func.count(Property.id))
+            .outerjoin(Property, and_(Property.district_id == District.id, active))
+            .group_by(District.id)
+            .all()
+        )
+        for district_id, name, slug, count in districts:
+            entries.append(SuggestionEntry('district', district_id, name, count, {'slug': slug}))
+
+        streets = (
+            db.session.query(Property.parsed_street, func.count(Property.id))
+            .filter(active, Property.parsed_street.isnot(None), Property.parsed_street != '')
+            .group_by(Property.parsed_street)
+            .all()
+        )
+        for street, count in streets:
+            entries.append(SuggestionEntry('street', street, street, count))
+
+        buildings = (
+            db.session.query(Property.complex_id, Property.complex_building_name, func.count(Property.id))
+            .filter(active, Property.complex_building_name.isnot(None), Property.complex_building_name != '')
+            .group_by(Property.complex_id, Property.complex_building_name)
+            .all()
+        )
+        for complex_id, building, count in buildings:
+            complex_name = complex_names.get(complex_id)
+            if not complex_name:
+                continue
+            entries.append(SuggestionEntry(
+                'building', f"{complex_id}:{building}", f"{complex_name} {building}", count,
+                {'complex_id': complex_id, 'complex_name': complex_name, 'building': building}
+            ))
+
+        room_counts = {
+            int(rooms): int(count)
+            for rooms, count in db.session.query(Property.rooms, func.count(Property.id))
+            .filter(active, Property.rooms.isnot(None))
+            .group_by(Property.rooms)
+            .all()
+        }
+        property_type_counts = {
+            property_type: int(count)
+            for property_type, count in db.session.query(Property.property_type, func.count(Property.id))
+            .filter(active, Property.property_type.isnot(None))
+            .group_by(Property.property_type)
+            .all()
+        }
+        return entries, room_counts, property_type_counts
+
+    def build(self, version: Any = None):
+        started = time.time()
+        entries, room_counts, property_type_counts = self._fetch_entries()
+        self.load(entries, room_counts, property_type_counts, version=version)
+        logger.info(f"✅ SuggestionIndex built: {len(self.entries)} entries in {(time.time() - started) * 1000:.0f} ms")
+
+    def ensure_fresh(self):
+        """Пересобрать индекс, если изменилась версия каталога (проверка не чаще check_interval)"""
+        if self.version is not None and time.time() - self._last_check < self.check_interval:
+            return
+        if not self._lock.acquire(blocking=self.version is None):
+            return
+        try:
+            if self.version is not None and time.time() - self._last_check < self.check_interval:
+                return
+            from services.property_snapshot import fetch_catalogue_version
+            version = fetch_catalogue_version()
+            if version != self.version:
+                self.build(version=version)
+            self._last_check = time.time()
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            self.version = None
+            self._last_check = 0.0
+
+    # ------------------------------------------------------------------
+    # Поиск
+    # ------------------------------------------------------------------
+
+    def _prefix_candidates(self, token: str) -> set:
+        words = self._words
+        result = set()
+        position = bisect_left(words, (token, -1))
+        while position < len(words) and words[position][0].startswith(token):
+            result.add(words[position][1])
+            position += 1
+        return result
+
+    def _score_key(self, query_key: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        tokens = query_key.split()
+        if not tokens:
+            return scores
+
+        # 1. Префиксы слов (каждое слово запроса — префикс какого-то слова названия)
+        candidates = None
+        for token in tokens:
+            matched = self._prefix_candidates(token)
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                break
+        for position in candidates or ():
+            key = self.entries[position].key
+            if key == query_key:
+                scores[position] = self.SCORE_EXACT
+            elif key.startswith(query_key):
+                scores[position] = self.SCORE_FULL_PREFIX
+            else:
+                scores[position] = self.SCORE_WORD_PREFIX
+
+        if len(query_key) < 3:
+            return scores
+
+        # 2. Подстроки и опечатки через триграммы
+        query_grams = trigrams(query_key)
+        overlap = Counter()
+        for gram in query_grams:
+            overlap.update(self._trigrams.get(gram, ()))
+        for position, shared in overlap.items():
+            if position in scores:
+                continue
+            entry_key = self.entries[position].key
+            if query_key in entry_key:
+                scores[position] = self.SCORE_SUBSTRING
+                continue
+            similarity = shared / len(query_grams)
+            if similarity >= self.FUZZY_THRESHOLD:
+                scores[position] = self.SCORE_FUZZY * similarity
+        return scores
+
+    def search(self, query: str, kinds: Optional[Iterable[str]] = None, limit: int = 10,
+               per_kind: Optional[Dict[str, int]] = None) -> List[Tuple[SuggestionEntry, float]]:
+        """
+        Найти подсказки
+
+        Args:
+            query: строка запроса в любой раскладке/алфавите
+            kinds: ограничить типами ('complex', 'developer', 'district', 'street', 'building')
+            limit: общее количество результатов
+            per_kind: максимум результатов для каждого типа
+
+        Returns:
+            [(SuggestionEntry, score)] по убыванию релевантности, затем по количеству квартир
+        """
+        query_key = to_search_key(query)
+        if not query_key:
+            return []
+
+        scores = self._score_key(query_key)
+        raw = normalize_text(query)
+        if raw and raw.isascii() and any(ch.isalpha() for ch in raw):
+            # Возможно, набрано в английской раскладке
+            for position, score in self._score_key(to_search_key(swap_layout(raw))).items():
+                if score > scores.get(position, 0):
+                    scores[position] = score
+
+        kinds = set(kinds) if kinds else None
+        ranked = sorted(
+            (
+                (self.entries[position], score)
+                for position, score in scores.items()
+                if kinds is None or self.entries[position].kind in kinds
+            ),
+            key=lambda item: (-item[1], -item[0].count, len(item[0].name)),
+        )
+
+        if per_kind:
+            taken: Counter = Counter()
+            limited = []
+            for entry, score in ranked:
+                if taken[entry.kind] >= per_kind.get(entry.kind, limit):
+                    continue
+                taken[entry.kind] += 1
+                limited.append((entry, score))
+            ranked = limited
+        return ranked[:limit]
+
+
+# Глобальный экземпляр индекса
+_suggestion_index = None
+
+
+def get_suggestion_index() -> SuggestionIndex:
+    """Получить singleton экземпляр SuggestionIndex"""
+    global _suggestion_index
+    if _suggestion_index is None:
+        _suggestion_index = SuggestionIndex()
+    return _suggestion_index
@@ -1,15 +1,21 @@
 import json
 import os
 import re
-from openai import OpenAI
 from sqlalchemy import func, or_
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai_client = None
-if OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+_openai_client = None
+
+
+def get_openai_client():
+    """Клиент OpenAI создаётся при первом AI-запросе: пакет openai тяжёлый, а нужен не каждому процессу"""
+    global _openai_client
+    if _openai_client is None and OPENAI_API_KEY:
+        from openai import OpenAI
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
 
 class SmartSearch:
     def __init__(self):
@@ -43,6 +49,7 @@ class SmartSearch:
 
     def analyze_search_query(self, query):
         """Анализирует поисковый запрос с помощью OpenAI для извлечения критериев"""
+        openai_client = get_openai_client()
         if not openai_client:
             print("OpenAI client not available, using fallback analysis")
             return self.fallback_analysis(query)
@@ -209,6 +216,7 @@ class SmartSearch:
         if not criteria.get("semantic_search") and not criteria.get("features"):
             return properties
             
+        openai_client = get_openai_client()
         if not openai_client:
             print("OpenAI client not available, skipping semantic search")
             return properties
@@ -268,6 +276,7 @@ class SmartSearch:
 
     def search_suggestions(self, query, limit=5):
         """Генерирует умные подсказки для автокомплита"""
+        openai_client = get_openai_client()
         if not openai_client:
             print("OpenAI client not available, using fallback suggestions")
             return self.fallback_suggestions(query, limit=limit)
@@ -411,7 +420,67 @@ class SmartSearch:
         return suggestions[:limit]
     
     def database_suggestions(self, query, limit=8):
-        """Поиск по реальным данным из БД - ЖК, застройщики, районы, улицы"""
+        """Поиск по реальным данным из БД - ЖК, застройщики, районы, улицы (через SuggestionIndex)"""
+        if not query or not query.strip():
+            return []
+        
+        try:
+            from services.suggestion_index import get_suggestion_index
+            index = get_suggestion_index()
+            index.ensure_fresh()
+            matches = index.search(
+                query,
+                kinds=('complex', 'developer', 'district', 'street'),
+                limit=limit,
+                per_kind={'complex': 3, 'developer': 2, 'district': 2, 'street': 2}
+            )
+        except Exception as e:
+            print(f"ERROR in SuggestionIndex, falling back to SQL: {e}")
+            return self._database_suggestions_sql(query, limit=limit)
+        
+        # Порядок групп как в SQL-версии: ЖК, застройщики, районы, улицы
+        kind_order = {'complex': 0, 'developer': 1, 'district': 2, 'street': 3}
+        matches.sort(key=lambda item: kind_order[item[0].kind])
+        
+        suggestions = []
+        for entry, _score in matches:
+            if entry.kind == 'complex':
+                suggestions.append({
+                    'text': entry.name,
+                    'type': 'complex',
+                    'subtitle': f'{entry.count} квартир',
+                    'url': f'/zk/{entry.entity_id}',
+                    'icon': 'fas fa-building'
+                })
+            elif entry.kind == 'developer':
+                suggestions.append({
+                    'text': entry.name,
+                    'type': 'developer',
+                    'subtitle': f'Застройщик, {entry.count} объектов',
+                    'url': f'/properties?developer_id={entry.entity_id}',
+                    'icon': 'fas fa-user-tie'
+                })
+            elif entry.kind == 'district':
+                suggestions.append({
+                    'text': entry.name,
+                    'type': 'district',
+                    'subtitle': f'Район, {entry.count} квартир',
+                    'url': f'/properties?district_id={entry.entity_id}',
+                    'icon': 'fas fa-map-marker-alt'
+                })
+            elif entry.kind == 'street' and entry.count:
+                suggestions.append({
+                    'text': entry.name,
+                    'type': 'street',
+                    'subtitle': f'Улица, {entry.count} квартир',
+                    'url': f'/properties?q={entry.name}',
+                    'icon': 'fas fa-road'
+                })
+        
+        return suggestions[:limit]
+    
+    def _database_suggestions_sql(self, query, limit=8):
+        """SQL-версия database_suggestions (fallback, если индекс недоступен)"""
         from app import db
         from models import ResidentialComplex, Developer, District, Property
         from flask import url_for
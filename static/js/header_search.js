@@ -461,6 +461,7 @@ SmartSearch.prototype.renderModernSuggestions = function(suggestions, dropdown)
         'developer': 'fas fa-user-tie', 
         'district': 'fas fa-map-marker-alt',
         'street': 'fas fa-road',
+        'building': 'fas fa-layer-group',
         'city': 'fas fa-city',
         'settlement': 'fas fa-map-pin',
         'region': 'fas fa-globe-europe',
@@ -473,6 +474,7 @@ SmartSearch.prototype.renderModernSuggestions = function(suggestions, dropdown)
         'developer': 'Застройщик',
         'district': 'Район', 
         'street': 'Улица',
+        'building': 'Корпус',
         'city': 'Город',
         'settlement': 'Населенный пункт',
         'region': 'Регион',
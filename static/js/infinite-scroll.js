@@ -7,6 +7,7 @@ console.log('♾️ INFINITE-SCROLL.JS LOADED');
     let isLoading = false;
     let hasMorePages = true;
     let currentPage = 1;
+    let nextCursor = null;
     let observer = null;
     let sentinel = null;
     let currentAbortController = null;
@@ -20,6 +21,11 @@ console.log('♾️ INFINITE-SCROLL.JS LOADED');
             currentPage = window.currentServerPage;
         }
         
+        // Keyset cursor after the last server-rendered property
+        if (window.nextCursor) {
+            nextCursor = window.nextCursor;
+        }
+        
         if (typeof window.totalPages !== 'undefined') {
             hasMorePages = currentPage < window.totalPages;
         }
@@ -94,7 +100,13 @@ console.log('♾️ INFINITE-SCROLL.JS LOADED');
         const signal = currentAbortController.signal;
         
         const currentUrl = new URLSearchParams(window.location.search);
-        currentUrl.set('page', nextPage);
+        if (nextCursor) {
+            // Continue after the last loaded property: no OFFSET, no duplicates when prices change
+            currentUrl.set('cursor', nextCursor);
+            currentUrl.delete('page');
+        } else {
+            currentUrl.set('page', nextPage);
+        }
         
         const apiUrl = '/api/properties/list?' + currentUrl.toString();
         console.log('📡 Fetching:', apiUrl);
@@ -111,6 +123,7 @@ console.log('♾️ INFINITE-SCROLL.JS LOADED');
                     appendProperties(data.properties);
                     currentPage = nextPage;
                     hasMorePages = data.pagination.has_next;
+                    nextCursor = data.pagination.next_cursor || null;
                     
                     if (typeof window.currentServerPage !== 'undefined') {
                         window.currentServerPage = nextPage;
@@ -221,6 +234,7 @@ console.log('♾️ INFINITE-SCROLL.JS LOADED');
         // Reset state variables
         currentPage = newPage || 1;
         hasMorePages = hasMore !== undefined ? hasMore : true;
+        nextCursor = null;  // sort or filters changed - the next load starts from a page number
         isLoading = false;
         
         // Disconnect and cleanup old observer
@@ -0,0 +1,35 @@
+/**
+ * Архив презентации (ZIP со всеми PDF)
+ * download-all только ставит фоновую задачу и сразу отвечает 202 со status_url;
+ * опрашиваем статус и скачиваем готовый файл по download_url.
+ */
+async function downloadPresentationArchive(startUrl, onProgress) {
+    const readJob = async (url) => {
+        const response = await fetch(url, { credentials: 'same-origin' });
+        const job = await response.json();
+        if (!response.ok && response.status !== 202) {
+            throw new Error(job.error || job.message || `HTTP ${response.status}`);
+        }
+        return job;
+    };
+
+    let job = await readJob(startUrl);
+    const { status_url: statusUrl, download_url: downloadUrl } = job;
+    while (job.stage !== 'complete') {
+        if (job.stage === 'error') {
+            throw new Error(job.message || 'Не удалось создать архив');
+        }
+        if (onProgress) onProgress(job);
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        job = await readJob(statusUrl);
+    }
+    if (onProgress) onProgress(job);
+
+    const link = document.createElement('a');
+    link.href = downloadUrl;
+    link.style.display = 'none';
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    return job;
+}
@@ -199,6 +199,8 @@ class SmartAutocomplete {
             'complex': 'ЖК',
             'developer': 'Застройщик',
             'district': 'Район',
+            'street': 'Улица',
+            'building': 'Корпус',
             'rooms': 'Тип',
             'category': 'Категория'
         };
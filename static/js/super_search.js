@@ -358,6 +358,7 @@ class SuperSearch {
             'developer': '👔',
             'district': '📍',
             'street': '🛣️',
+            'building': '🏗️',
             'rooms': '🏠'
         };
         
@@ -366,6 +367,7 @@ class SuperSearch {
             'developer': 'Застройщик',
             'district': 'Район',
             'street': 'Улица',
+            'building': 'Корпус',
             'rooms': 'Тип квартиры'
         };
         
@@ -0,0 +1,16 @@
+"""
+Общая настройка тестов
+Кэш ответов (Flask-Caching SQLiteCache и get_response_cache()) по умолчанию
+пишет в instance/ — тесты перенаправляют его во временный каталог до импорта app
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+_cache_dir = tempfile.mkdtemp(prefix='inback-tests-')
+atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+
+os.environ['CACHE_SQLITE_PATH'] = os.path.join(_cache_dir, 'flask_cache.sqlite')
+os.environ['RESPONSE_CACHE_PATH'] = os.path.join(_cache_dir, 'response_cache.sqlite')
@@ -0,0 +1,142 @@
+"""
+Unit tests for AlertMatcher
+Индекс сохранённых поисков и инкрементальный подбор NEW_LISTING / PRICE_DROP
+"""
+
+import json
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import db, Property, ResidentialComplex, Developer, SavedSearch, PropertyAlert
+from services import alert_matcher
+from services.alert_matcher import AlertMatcher, SavedSearchIndex, compile_search
+
+T0 = datetime(2026, 3, 1, 12, 0)
+
+
+def entry(search_id, created_at=None, **columns):
+    return search_id, compile_search(columns), created_at
+
+
+def prop(**values):
+    base = {'price': 6_000_000, 'area': 45.0, 'floor': 5, 'rooms': 2, 'cashback_rate': 5.0,
+            'developer_id': 1, 'developer_name': 'ССК', 'complex_id': 10, 'complex_name': 'ЖК Солнечный',
+            'district_id': None, 'district_name': None}
+    base.update(values)
+    return base
+
+
+class TestSavedSearchIndex:
+
+    def test_ranges_and_terms(self):
+        index = SavedSearchIndex([
+            entry(1),                                                   # без условий
+            entry(2, price_min=5, price_max=7),                          # миллионы
+            entry(3, price_max=4_000_000),
+            entry(4, additional_filters=json.dumps({'rooms': ['1-комн', '2-комн'], 'developer': 'ссК'})),
+            entry(5, additional_filters={'rooms': ['студия']}),
+            entry(6, property_type='4+', size_min=40),
+            entry(7, complex_name='ЖК Солнечный', cashback_min=6),
+            entry(8, additional_filters={'developers': ['2'], 'floor_min': '3'}),
+        ])
+        assert sorted(index.match(prop())) == [1, 2, 4]
+        assert sorted(index.match(prop(rooms=5, price=3_000_000, cashback_rate=7.0))) == [1, 3, 6, 7]
+        assert sorted(index.match(prop(rooms=0, developer_id=2, developer_name='Другой'))) == [1, 2, 5, 8]
+        assert sorted(index.match(prop(price=None))) == [1, 4]
+
+    def test_created_after_filters_newer_searches(self):
+        index = SavedSearchIndex([entry(1, T0), entry(2, T0 + timedelta(days=1))])
+        assert list(index.match(prop(), created_after=T0 + timedelta(hours=1))) == [1]
+
+    def test_empty_index(self):
+        assert SavedSearchIndex([]).match(prop()).size == 0
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    names = ('properties', 'developers', 'residential_complexes', 'districts', 'saved_searches',
+             'property_alerts', 'alert_matcher_runs', 'alert_price_marks', 'complex_stats')
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in names])
+    with Session(engine) as session:
+        session.add(Developer(id=1, name='ССК', slug='ssk'))
+        session.add(ResidentialComplex(id=10, name='ЖК Солнечный', slug='sun', developer_id=1, cashback_rate=5.0))
+        session.add(Property(id=1, title='1', price=6_000_000, area=45.0, rooms=2, floor=3,
+                             developer_id=1, complex_id=10, created_at=T0, updated_at=T0))
+        session.add(SavedSearch(id=1, user_id=1, name='Двушки', alert_frequency='instant',
+                                created_at=T0, additional_filters=json.dumps({'rooms': ['2-комн'], 'price_max': 7})))
+        session.add(SavedSearch(id=2, user_id=2, name='Всё', alert_frequency='weekly', created_at=T0,
+                                alert_channels='["telegram"]'))
+        session.add(SavedSearch(id=3, user_id=3, name='Выкл', alert_enabled=False, created_at=T0))
+        session.commit()
+        yield session
+
+
+def alerts(session):
+    return sorted((a.saved_search_id, a.property_id, a.alert_type, a.alert_frequency)
+                  for a in session.query(PropertyAlert).all())
+
+
+class TestAlertMatcher:
+
+    def test_first_run_only_seeds_prices(self, session):
+        result = AlertMatcher(session).run(now=T0 + timedelta(hours=1))
+        assert result['alerts'] == 0
+        assert alerts(session) == []
+
+    def test_new_listing_and_price_drop(self, session):
+        matcher = AlertMatcher(session)
+        matcher.run(now=T0 + timedelta(hours=1))
+
+        t1 = T0 + timedelta(hours=2)
+        session.add(Property(id=2, title='2', price=6_500_000, area=50.0, rooms=2, developer_id=1,
+                             complex_id=10, created_at=t1, updated_at=t1))
+        session.add(Property(id=3, title='3', price=9_000_000, rooms=3, created_at=t1, updated_at=t1))
+        session.get(Property, 1).price = 5_500_000
+        session.get(Property, 1).updated_at = t1
+        session.commit()
+
+        result = matcher.run(now=T0 + timedelta(hours=3))
+        assert result['events'] == 3
+        assert alerts(session) == [
+            (1, 1, 'PRICE_DROP', 'instant'), (1, 2, 'NEW_LISTING', 'instant'),
+            (2, 1, 'PRICE_DROP', 'weekly'), (2, 2, 'NEW_LISTING', 'weekly'), (2, 3, 'NEW_LISTING', 'weekly'),
+        ]
+        drop = session.query(PropertyAlert).filter_by(alert_type='PRICE_DROP', saved_search_id=2).one()
+        assert drop.price_drop_amount == 500_000 and drop.delivery_channel == 'telegram'
+        assert drop.delivery_status == 'pending'
+
+        # Повторный запуск без изменений ничего не добавляет
+        assert matcher.run(now=T0 + timedelta(hours=4))['alerts'] == 0
+
+    def test_instant_cap_moves_to_daily(self, session, monkeypatch):
+        monkeypatch.setattr(alert_matcher, 'INSTANT_DAILY_CAP', 1)
+        matcher = AlertMatcher(session)
+        matcher.run(now=T0 + timedelta(hours=1))
+        t1 = T0 + timedelta(hours=2)
+        for pid in (2, 3):
+            session.add(Property(id=pid, title=str(pid), price=6_000_000, rooms=2, created_at=t1, updated_at=t1))
+        session.commit()
+        matcher.run(now=T0 + timedelta(hours=3))
+        frequencies = sorted(a.alert_frequency for a in session.query(PropertyAlert).filter_by(saved_search_id=1))
+        assert frequencies == ['daily', 'instant']
+        assert session.get(SavedSearch, 1).alert_count_today == 1
+
+    def test_pending_batches_respect_frequency(self, session):
+        matcher = AlertMatcher(session)
+        matcher.run(now=T0 + timedelta(hours=1))
+        t1 = T0 + timedelta(hours=2)
+        session.add(Property(id=2, title='2', price=6_000_000, rooms=2, created_at=t1, updated_at=t1))
+        session.get(SavedSearch, 2).last_alert_sent = T0
+        session.commit()
+        matcher.run(now=T0 + timedelta(hours=3))
+
+        batches = matcher.pending_alert_batches(now=T0 + timedelta(days=1))
+        assert sorted(batches) == [1]
+        assert sorted(matcher.pending_alert_batches(now=T0 + timedelta(days=8))) == [1, 2]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
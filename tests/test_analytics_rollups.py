@@ -0,0 +1,174 @@
+"""
+Unit tests for analytics_rollups
+Свёртки дашбордов: пересчёт затронутых дней при commit и чтение одним запросом
+"""
+
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from models import db, AnalyticsRollup, CallbackRequest, CashbackApplication, Collection, Manager, User
+from services import analytics_rollups
+from services.analytics_rollups import (
+    admin_dashboard_stats, compute_daily, ensure_rollups, manager_dashboard_stats, monthly_series,
+    rebuild_rollups, setup_analytics_rollups_tracking, status_breakdown,
+)
+
+TABLES = ('managers', 'users', 'cashback_applications', 'callback_requests', 'collections', 'analytics_rollups',
+          'manager_activity', 'manager_dashboard_snapshots')
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in TABLES])
+    return engine
+
+
+@pytest.fixture
+def session(engine):
+    setup_analytics_rollups_tracking()
+    with Session(engine) as session:
+        yield session
+
+
+def add_application(session, aid, amount, status, created_at):
+    session.add(CashbackApplication(
+        id=aid, user_id=1, property_name='Квартира', property_type='1-комн', property_size=40.0,
+        property_price=5_000_000, complex_name='ЖК Тест', developer_name='ССК',
+        cashback_amount=amount, cashback_percent=2.0, status=status, created_at=created_at,
+    ))
+
+
+@pytest.fixture
+def data(session):
+    session.add(Manager(id=7, email='m@example.com', password_hash='x', first_name='Анна', last_name='М',
+                        manager_id='MNG00000007'))
+    session.add(User(id=1, email='u1@example.com', full_name='Клиент 1', user_id='CB00000001',
+                     assigned_manager_id=7, client_status='Новый', created_at=datetime(2025, 1, 5)))
+    session.add(User(id=2, email='u2@example.com', full_name='Клиент 2', user_id='CB00000002',
+                     assigned_manager_id=7, client_status='В работе', is_active=False,
+                     created_at=datetime(2025, 2, 1)))
+    add_application(session, 1, 100_000, 'Одобрена', datetime(2025, 1, 10, 12))
+    add_application(session, 2, 50_000, 'Выплачена', datetime(2025, 1, 10, 18))
+    add_application(session, 3, 70_000, 'На рассмотрении', datetime(2025, 2, 3))
+    session.add(CallbackRequest(id=1, name='А', phone='1', notes='Вопрос по кешбеку: кешбек', status='Новая',
+                                created_at=datetime(2025, 1, 11)))
+    session.add(CallbackRequest(id=2, name='Б', phone='2', notes='Звонок', status='Обработана',
+                                created_at=datetime(2025, 1, 12)))
+    session.add(Collection(id=1, title='Подборка', created_by_manager_id=7, status='Отправлена',
+                           created_at=datetime(2025, 1, 20)))
+    session.add(Collection(id=2, title='Черновик', created_by_manager_id=7, status='Черновик',
+                           created_at=datetime(2025, 2, 20)))
+    session.commit()
+    return session
+
+
+class TestAnalyticsRollups:
+
+    def test_commit_maintains_rollups(self, data):
+        stats = admin_dashboard_stats(session=data)
+        assert stats == {
+            'total_users': 2, 'active_users': 1, 'total_managers': 1, 'active_managers': 1,
+            'total_applications': 3, 'pending_applications': 1, 'approved_applications': 1,
+            'paid_applications': 1, 'total_cashback_approved': 100_000, 'total_cashback_paid': 50_000,
+            'cashback_requests': 1, 'new_requests': 1,
+        }
+        assert monthly_series('applications', session=data) == [
+            (date(2025, 1, 1), 2, 150_000), (date(2025, 2, 1), 1, 70_000),
+        ]
+
+    def test_status_change_moves_counts(self, data):
+        application = data.get(CashbackApplication, 1)
+        application.status = 'Выплачена'
+        data.commit()
+        breakdown = {row.status: (row.count, row.total_amount) for row in status_breakdown('applications', session=data)}
+        assert breakdown == {'Выплачена': (2, 150_000), 'На рассмотрении': (1, 70_000)}
+
+        data.delete(data.get(CashbackApplication, 3))
+        data.commit()
+        assert [row.month for row in monthly_series('applications', session=data)] == [date(2025, 1, 1)]
+
+    def test_rollback_and_untracked_fields(self, data, engine):
+        statements = []
+        event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        data.get(User, 1).last_login = datetime(2025, 3, 1)
+        data.commit()
+        assert not any('analytics_rollups' in sql for sql in statements)
+
+        data.get(Collection, 2).status = 'Отправлена'
+        data.flush()
+        data.rollback()
+        data.get(User, 1).full_name = 'Клиент'
+        data.commit()
+        assert manager_dashboard_stats(7, session=data)['sent_collections'] == 1
+
+    def test_manager_dashboard(self, data):
+        stats = manager_dashboard_stats(7, session=data)
+        assert (stats['clients_count'], stats['collections_count'], stats['sent_collections']) == (2, 2, 1)
+        assert [tuple(row) for row in stats['monthly_collections']] == [(date(2025, 1, 1), 1), (date(2025, 2, 1), 1)]
+        assert max(row.count for row in stats['monthly_collections']) == 1
+        assert dict(stats['client_stats']) == {'Новый': 1, 'В работе': 1}
+        assert manager_dashboard_stats(8, session=data)['clients_count'] == 0
+
+    def test_rebuild_matches_incremental(self, data):
+        def snapshot():
+            table = AnalyticsRollup.__table__
+            return data.execute(table.select().order_by(*table.primary_key)).all()
+
+        incremental = snapshot()
+        daily_rows = sum(len(compute_daily(metric, session=data)) for metric in analytics_rollups.METRICS)
+        assert rebuild_rollups(session=data) == daily_rows
+        assert snapshot() == incremental
+
+    def test_increments_after_commit_outside_user_transaction(self, data, engine):
+        statements = []
+        event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        add_application(data, 4, 30_000, 'Одобрена', datetime(2025, 1, 10, 20))
+        data.flush()
+        assert not any('analytics_rollups' in sql for sql in statements)
+        data.commit()
+        assert [sql.split()[0] for sql in statements if 'analytics_rollups' in sql] == ['INSERT', 'DELETE']
+        assert 'ON CONFLICT' in next(sql for sql in statements if 'analytics_rollups' in sql)
+
+        # Вторая сессия в тот же день: счётчики складываются, а не перезаписываются
+        with Session(engine) as other:
+            add_application(other, 5, 20_000, 'Одобрена', datetime(2025, 1, 10, 21))
+            other.commit()
+        stats = admin_dashboard_stats(session=data)
+        assert (stats['approved_applications'], stats['total_cashback_approved']) == (3, 150_000)
+
+        # Правка и удаление в одной транзакции: старый вклад вычитается, новый прибавляется
+        data.get(CashbackApplication, 4).cashback_amount = 40_000
+        data.flush()
+        data.delete(data.get(CashbackApplication, 5))
+        data.commit()
+        incremental = data.execute(AnalyticsRollup.__table__.select().order_by(
+            *AnalyticsRollup.__table__.primary_key)).all()
+        rebuild_rollups(session=data)
+        assert data.execute(AnalyticsRollup.__table__.select().order_by(
+            *AnalyticsRollup.__table__.primary_key)).all() == incremental
+        assert admin_dashboard_stats(session=data)['total_cashback_approved'] == 140_000
+
+    def test_reads_do_not_build_and_ensure_does(self, engine):
+        setup_analytics_rollups_tracking()
+        with Session(engine) as session:
+            session.execute(CashbackApplication.__table__.insert(), [{
+                'id': 1, 'user_id': 1, 'property_name': 'Квартира', 'property_type': '1-комн',
+                'property_size': 40.0, 'property_price': 5_000_000, 'complex_name': 'ЖК',
+                'developer_name': 'ССК', 'cashback_amount': 10_000, 'cashback_percent': 2.0,
+                'status': 'Одобрена', 'created_at': datetime(2025, 1, 1),
+            }])
+            session.commit()
+            assert monthly_series('applications', session=session) == []
+            assert session.query(AnalyticsRollup).count() == 0
+
+            assert ensure_rollups(session=session) is True
+            assert monthly_series('applications', session=session) == [(date(2025, 1, 1), 1, 10_000)]
+            assert ensure_rollups(session=session) is False
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,88 @@
+"""
+Unit tests for ComplexAttributeTable
+Ставки кешбека ЖК из общей таблицы вместо запроса на каждую квартиру
+"""
+
+import pytest
+from services.complex_attributes import (
+    DEFAULT_CASHBACK_RATE, ComplexAttributeStore, ComplexAttributeTable, cashback_amounts,
+)
+
+
+ROWS = [
+    {'id': 3, 'name': 'ЖК Солнечный', 'cashback_rate': 7.5, 'object_class': 'Комфорт', 'end_build_year': 2026},
+    {'id': 1, 'name': 'ЖК Без ставки', 'cashback_rate': None, 'object_class': None, 'end_build_year': None},
+    {'id': 2, 'name': 'ЖК Солнечный', 'cashback_rate': 3.0, 'object_class': 'Эконом', 'end_build_year': 2025},
+    {'id': 10, 'name': 'ЖК Премиум', 'cashback_rate': 10.0, 'object_class': 'Бизнес', 'end_build_year': 2027},
+]
+
+
+@pytest.fixture
+def table():
+    return ComplexAttributeTable(ROWS, version=(4, None))
+
+
+def legacy_cashback(table, price, complex_id=None, complex_name=None):
+    """Скалярный расчёт как в calculate_cashback"""
+    if not price:
+        return 0
+    rate = table.cashback_rate(complex_id, complex_name)
+    return int(price * (rate / 100)) if rate else int(price * 0.05)
+
+
+class TestComplexAttributeTable:
+
+    def test_lookup_by_id_then_name(self, table):
+        assert table.cashback_rate(3) == 7.5
+        assert table.cashback_rate('10') == 10.0
+        # Дубль названия — ЖК с меньшим id, как .first()
+        assert table.cashback_rate(complex_name='ЖК Солнечный') == 3.0
+        # Ставка у ЖК не задана → ищем по названию
+        assert table.cashback_rate(1, 'ЖК Премиум') == 10.0
+        assert table.cashback_rate(999) is None
+        assert table.get(2)['end_build_year'] == 2025
+
+    def test_vectorized_matches_scalar(self, table):
+        cases = [
+            (5_000_000, 3, None), (5_000_000, None, 'ЖК Премиум'), (7_777_777, 1, None),
+            (0, 10, None), (None, 10, None), (3_333_333, 'abc', 'ЖК Солнечный'),
+            (12_345_678, 999, 'Неизвестный'), (9_999_999, 10, 'ЖК Солнечный'),
+        ]
+        prices, ids, names = zip(*cases)
+        amounts = cashback_amounts(prices, table.rates_for(ids, names))
+        assert amounts.tolist() == [legacy_cashback(table, *case) for case in cases]
+
+    def test_rates_without_ids(self, table):
+        rates = table.rates_for(complex_names=['ЖК Премиум', None])
+        assert rates.tolist() == [10.0, DEFAULT_CASHBACK_RATE]
+        assert ComplexAttributeTable([]).rates_for([1, 2]).tolist() == [DEFAULT_CASHBACK_RATE] * 2
+
+
+class TestComplexAttributeStore:
+
+    def test_reload_on_version_change_and_invalidate(self):
+        state = {'version': 1, 'loads': 0}
+
+        def loader():
+            state['loads'] += 1
+            return ROWS
+
+        store = ComplexAttributeStore(loader, lambda: state['version'], check_interval=0)
+        first = store.get()
+        assert store.get() is first
+        state['version'] = 2
+        assert store.get() is not first
+        store.invalidate()
+        store.get()
+        assert state['loads'] == 3
+        assert store.stats['builds'] == 3
+
+    def test_check_interval_skips_version_query(self):
+        store = ComplexAttributeStore(lambda: ROWS, lambda: 1, check_interval=60)
+        store.get()
+        store.get()
+        assert store.stats['version_checks'] == 1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
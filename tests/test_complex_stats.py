@@ -0,0 +1,113 @@
+"""
+Unit tests for complex_stats
+Материализованная статистика ЖК и её пересчёт при commit квартир
+"""
+
+import json
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import db, Property, ComplexStats
+from services.complex_stats import (
+    compute_complex_stats, ensure_complex_stats, load_complex_stats, rebuild_complex_stats,
+    refresh_complex_stats, setup_complex_stats_tracking,
+)
+
+
+@pytest.fixture
+def session():
+    setup_complex_stats_tracking()
+    engine = create_engine('sqlite://')
+    tables = [db.metadata.tables[name] for name in ('properties', 'complex_stats')]
+    db.metadata.create_all(engine, tables=tables)
+    with Session(engine) as session:
+        yield session
+
+
+def add_property(session, pid, complex_id, price, area, rooms, building=None, photos=None, active=True):
+    prop = Property(id=pid, title=f'Квартира {pid}', complex_id=complex_id, price=price, area=area,
+                    rooms=rooms, complex_building_name=building, is_active=active,
+                    gallery_images=json.dumps(photos) if photos else None)
+    session.add(prop)
+    return prop
+
+
+@pytest.fixture
+def catalogue(session):
+    add_property(session, 1, 1, 5_000_000, 40.0, 1, 'Литер 1', photos=['a', 'b', 'c'])
+    add_property(session, 2, 1, 7_000_000, 60.0, 2, 'Литер 2')
+    add_property(session, 3, 1, 3_000_000, 25.0, 0, 'Литер 2')
+    add_property(session, 4, 2, 9_000_000, 80.0, 3)
+    add_property(session, 5, 2, 1_000_000, 10.0, 1, active=False)
+    session.commit()
+    return session
+
+
+class TestComplexStats:
+
+    def test_compute_matches_legacy_shape(self, catalogue):
+        stats = compute_complex_stats(session=catalogue)
+        assert set(stats) == {1, 2}
+        first = stats[1]
+        assert first['total_count'] == 3
+        assert (first['min_price'], first['max_price']) == (3_000_000, 7_000_000)
+        assert first['buildings_count'] == 2
+        assert first['sample_photos'] == ['b', 'c']
+        assert first['room_details']['Студия'] == {
+            'count': 1, 'price_from': 3_000_000, 'price_to': 3_000_000, 'area_from': 25.0, 'area_to': 25.0,
+        }
+        # Неактивная квартира не учитывается
+        assert stats[2]['total_count'] == 1 and stats[2]['buildings_count'] == 1
+
+    def test_commit_maintains_table(self, catalogue):
+        stored = load_complex_stats(session=catalogue)
+        assert stored[1]['total_properties'] == 3
+        assert stored[1]['room_distribution'] == {'Студия': 1, '1-комн': 1, '2-комн': 1}
+
+    def test_update_and_deactivate_refresh_only_touched_complex(self, catalogue):
+        catalogue.get(Property, 3).price = 2_000_000
+        catalogue.get(Property, 4).is_active = False
+        catalogue.commit()
+        stored = load_complex_stats(session=catalogue)
+        assert stored[1]['min_price'] == 2_000_000
+        assert 2 not in stored
+
+    def test_moving_property_refreshes_both_complexes(self, catalogue):
+        catalogue.get(Property, 2).complex_id = 2
+        catalogue.commit()
+        stored = load_complex_stats(session=catalogue)
+        assert stored[1]['total_count'] == 2
+        assert stored[2]['total_count'] == 2
+
+    def test_rollback_discards_pending(self, catalogue):
+        catalogue.get(Property, 1).price = 1
+        catalogue.flush()
+        catalogue.rollback()
+        catalogue.commit()
+        assert load_complex_stats(session=catalogue)[1]['min_price'] == 3_000_000
+
+    def test_empty_table_is_computed_without_writing(self, catalogue):
+        stored = load_complex_stats(session=catalogue)
+        catalogue.query(ComplexStats).delete()
+        catalogue.commit()
+        assert load_complex_stats(session=catalogue) == stored
+        assert load_complex_stats([2], session=catalogue) == {2: stored[2]}
+        assert not catalogue.new and catalogue.query(ComplexStats).count() == 0
+
+        assert ensure_complex_stats(session=catalogue) is True
+        assert catalogue.query(ComplexStats).count() == 2
+        assert ensure_complex_stats(session=catalogue) is False
+
+    def test_rebuild_and_refresh(self, catalogue):
+        catalogue.query(ComplexStats).delete()
+        catalogue.commit()
+        assert rebuild_complex_stats(session=catalogue) == 2
+        refresh_complex_stats([1], session=catalogue)
+        catalogue.commit()
+        assert sorted(load_complex_stats(session=catalogue)) == [1, 2]
+        assert list(load_complex_stats([2], session=catalogue)) == [2]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,131 @@
+"""
+Unit tests for DeferredEnrichmentWorker
+Геокодирование после commit, без HTTP внутри session.flush()
+"""
+
+import threading
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import db, Property
+from services import auto_geocoding
+from services.auto_geocoding import DeferredEnrichmentWorker, normalize_address, setup_auto_geocoding
+from services.geocode_cache import PersistentGeocodeCache
+
+
+class FakeDaData:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def enrich_property_address(self, address):
+        with self.lock:
+            self.calls.append(address)
+        if 'нет такого' in address:
+            return None
+        return {
+            'parsed_city': 'Краснодар', 'parsed_area': 'Прикубанский', 'parsed_settlement': '',
+            'parsed_street': 'ул Красная', 'parsed_house': '1', 'parsed_block': '',
+            'parsed_district': 'Прикубанский', 'latitude': 45.1, 'longitude': 39.1,
+        }
+
+
+class FakeYandex:
+    def __init__(self):
+        self.calls = []
+
+    def enrich_property_address(self, latitude, longitude):
+        self.calls.append((latitude, longitude))
+        return {'parsed_city': 'Сочи', 'parsed_district': 'Адлерский', 'parsed_street': 'Искры',
+                'latitude': latitude, 'longitude': longitude}
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[db.metadata.tables['properties']])
+    return engine
+
+
+@pytest.fixture
+def worker(engine):
+    return DeferredEnrichmentWorker(engine, dadata_client=FakeDaData(), geocoding_service=FakeYandex(),
+                                    cache=PersistentGeocodeCache(':memory:'), autostart=False)
+
+
+def add(session, pid, address=None, lat=None, lon=None, **fields):
+    session.add(Property(id=pid, title=f'Квартира {pid}', address=address, latitude=lat, longitude=lon, **fields))
+
+
+class TestDeferredEnrichmentWorker:
+
+    def test_deduplicates_and_bulk_updates(self, engine, worker, monkeypatch):
+        with Session(engine) as session:
+            add(session, 1, 'Краснодар, ул Красная, 1', 45.0, 39.0)
+            add(session, 2, 'краснодар,  ул Красная,1')
+            add(session, 3, 'Краснодар, ул Красная, 1')
+            add(session, 4, None, 43.4312345, 39.9212345)
+            add(session, 5, 'Где-то, нет такого')
+            add(session, 6, 'Краснодар, ул Красная, 1', parsed_city='Краснодар', parsed_area='Центральный')
+            session.commit()
+
+        invalidated = []
+        monkeypatch.setattr(auto_geocoding, 'invalidate_tags', invalidated.append)
+        result = worker.process([1, 2, 3, 4, 5, 6])
+        assert result == {'processed': 6, 'enriched': 4, 'skipped': 1, 'errors': 1}
+        assert invalidated == [{'catalogue', 'property:1', 'property:2', 'property:3', 'property:4'}]
+        assert len(worker.dadata_client.calls) == 2
+        assert worker.geocoding_service.calls == [(43.43123, 39.92123)]
+
+        with Session(engine) as session:
+            first, second, point, failed, done = (session.get(Property, pid) for pid in (1, 2, 4, 5, 6))
+            assert first.parsed_street == 'ул Красная' and first.parsed_area == 'Прикубанский'
+            # Координаты не перезаписываются, только заполняются
+            assert (first.latitude, second.latitude) == (45.0, 45.1)
+            assert point.parsed_city == 'Сочи' and point.parsed_area == ''
+            assert failed.parsed_city is None
+            assert done.parsed_area == 'Центральный'
+
+    def test_cache_survives_worker(self, engine, worker):
+        with Session(engine) as session:
+            add(session, 1, 'Краснодар, ул Красная, 1')
+            session.commit()
+        worker.process([1])
+        again = DeferredEnrichmentWorker(engine, dadata_client=FakeDaData(), geocoding_service=FakeYandex(),
+                                         cache=worker.cache, autostart=False)
+        with engine.begin() as conn:
+            conn.execute(Property.__table__.update().values(parsed_city=None, parsed_area=None))
+        assert again.process([1])['enriched'] == 1
+        assert again.dadata_client.calls == [] and again.stats['cache_hits'] == 1
+
+    def test_normalize_address(self):
+        assert normalize_address(' Краснодар,ул  Красная, 1 ') == normalize_address('краснодар, ул красная, 1')
+
+
+class TestAutoGeocodingEvents:
+
+    def test_commit_queues_ids_without_geocoding(self, engine, worker, monkeypatch):
+        setup_auto_geocoding(db)
+        monkeypatch.setattr(auto_geocoding, '_enrichment_worker', worker)
+        monkeypatch.setattr(auto_geocoding.get_auto_geocoding_service(), 'batch_mode', False)
+
+        with Session(engine) as session:
+            add(session, 1, 'Краснодар, ул Красная, 1', 45.0, 39.0)
+            add(session, 2, 'Без координат')
+            session.flush()
+            assert worker.dadata_client.calls == []
+            session.rollback()
+
+            add(session, 3, 'Краснодар, ул Красная, 1', 45.0, 39.0)
+            session.commit()
+            assert worker._queue.get_nowait() == [3]
+
+            session.get(Property, 3).latitude = 45.2
+            session.commit()
+            assert worker._queue.get_nowait() == [3]
+        assert worker.dadata_client.calls == []
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
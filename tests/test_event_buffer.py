@@ -0,0 +1,110 @@
+"""
+Unit tests for event_buffer
+Write-behind буфер: агрегация поисков, пачки журналов и счётчиков просмотров,
+отбрасывание при переполнении и запись остатка при остановке
+"""
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.pool import StaticPool
+
+from models import db
+from services.event_buffer import EventBuffer
+
+TABLES = ('search_analytics', 'search_history', 'user_activities', 'presentation_views', 'collections',
+          'blog_posts')
+
+
+@pytest.fixture
+def engine():
+    # Одно соединение на все потоки — фоновый flush видит ту же in-memory БД
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in TABLES])
+    with engine.begin() as connection:
+        connection.execute(insert(db.metadata.tables['collections']).values(
+            id=1, title='Подборка', created_by_manager_id=1, view_count=5))
+        connection.execute(insert(db.metadata.tables['blog_posts']).values(
+            id=1, title='Пост', slug='post', content='...', author_id=1, views_count=None))
+        connection.execute(insert(db.metadata.tables['search_analytics']).values(
+            query='студия', search_count=2, result_count_avg=5.0))
+    return engine
+
+
+def rows(engine, table, *columns):
+    table = db.metadata.tables[table]
+    with engine.connect() as connection:
+        return connection.execute(select(*[table.c[column] for column in columns]).order_by(*[
+            table.c[column] for column in columns])).all()
+
+
+class TestEventBuffer:
+
+    def test_searches_are_aggregated_per_query(self, engine):
+        buffer = EventBuffer(engine, autostart=False)
+        for result_count in (10, 20, 30):
+            buffer.record_search(' Однушка ', result_count)
+        buffer.record_search('студия', 11)
+        buffer.record_search('   ')
+        assert buffer.get_stats()['pending'] == 2
+
+        assert buffer.flush() == 2
+        assert rows(engine, 'search_analytics', 'query', 'search_count', 'result_count_avg') == [
+            ('однушка', 3, 20.0), ('студия', 3, 7.0)]
+        assert buffer.flush() == 0
+
+    def test_rows_and_counters_are_written_in_bulk(self, engine):
+        buffer = EventBuffer(engine, autostart=False)
+        buffer.record_search_history('однушка', user_id=7, result_count=3)
+        buffer.record_search_history('студия', manager_id=2)
+        buffer.record_activity(7, 'search_saved', 'Сохранён поиск', search_query='однушка', extra_data={'a': 1})
+        buffer.record_presentation_view(1, '10.0.0.1', 'Mozilla', None)
+        buffer.record_presentation_view(1, '10.0.0.2', 'Mozilla', 'https://t.me/', notification_sent=True)
+        for _ in range(3):
+            buffer.increment('blog_posts', 1)
+        with pytest.raises(ValueError):
+            buffer.increment('users', 1)
+
+        buffer.flush()
+        assert rows(engine, 'search_history', 'query', 'user_id', 'manager_id') == [
+            ('однушка', 7, None), ('студия', None, 2)]
+        assert rows(engine, 'user_activities', 'activity_type', 'extra_data') == [('search_saved', '{"a": 1}')]
+        assert rows(engine, 'presentation_views', 'view_ip', 'notification_sent') == [
+            ('10.0.0.1', False), ('10.0.0.2', True)]
+        assert rows(engine, 'collections', 'view_count')[0][0] == 7
+        assert rows(engine, 'collections', 'last_viewed_at')[0][0] is not None
+        assert rows(engine, 'blog_posts', 'views_count') == [(3,)]
+        assert buffer.get_stats()['failed'] == 0
+
+    def test_back_pressure_drops_new_events(self, engine):
+        buffer = EventBuffer(engine, max_pending=2, autostart=False)
+        buffer.record_search('a')
+        buffer.record_search('b')
+        buffer.record_search('a')  # уже в буфере — только счётчик
+        buffer.record_search('c')
+        buffer.record_search_history('d', user_id=1)
+        stats = buffer.get_stats()
+        assert (stats['pending'], stats['dropped']) == (2, 2)
+        buffer.flush()
+        assert rows(engine, 'search_analytics', 'query', 'search_count')[:2] == [('a', 2), ('b', 1)]
+
+    def test_failed_group_does_not_lose_others_and_stop_flushes(self, engine):
+        buffer = EventBuffer(engine, flush_interval=60)
+        buffer.record_search_history('x' * 10, user_id=1)
+        buffer._rows['search_history'].append({'bad_column': 1})  # сломанная пачка журнала
+        buffer.increment('blog_posts', 1)
+        assert buffer._thread is not None and buffer._thread.is_alive()
+
+        buffer.stop()
+        assert not buffer._thread.is_alive()
+        assert rows(engine, 'blog_posts', 'views_count') == [(1,)]
+        assert rows(engine, 'search_history', 'query') == []
+        assert buffer.get_stats()['failed'] == 2
+
+    def test_write_through(self, engine):
+        buffer = EventBuffer(engine, autostart=False, write_through=True)
+        buffer.record_search('студия')
+        assert rows(engine, 'search_analytics', 'search_count') == [(3,)]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
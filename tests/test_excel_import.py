@@ -0,0 +1,112 @@
+"""
+Unit tests for excel_import
+Потоковый импорт Excel: upsert по inner_id пачками и статус задачи в import_jobs
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import openpyxl
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import db, ComplexStats, Developer, ImportJob, Property, ResidentialComplex
+from services.excel_import import ExcelImporter, RowError, normalize_row
+
+TABLES = ('developers', 'residential_complexes', 'districts', 'buildings', 'properties', 'complex_stats',
+          'import_jobs', 'import_row_hashes')
+HEADER = ['inner_id', 'complex_name', 'developer_name', 'price', 'object_area', 'object_rooms',
+          'object_min_floor', 'object_max_floor', 'address_display_name', 'address_position_lat',
+          'address_position_lon', 'photos']
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in TABLES])
+    return engine
+
+
+def workbook(path, rows):
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    book.save(path)
+    return str(path)
+
+
+def flat(inner_id, price, complex_name='ЖК Солнечный', lat=45.03, photos='["a.jpg", "b.jpg"]'):
+    return [inner_id, complex_name, 'ССК', price, 40.5, 1, 3, 16, 'Краснодар, ул. Красная, 1', lat, 38.97, photos]
+
+
+class TestNormalizeRow:
+
+    def test_values_and_rejections(self):
+        values = normalize_row({'inner_id': 123.0, 'price': '5 000 000', 'object_area': 40, 'object_rooms': 0,
+                                'photos': '{x.jpg,"y.jpg"}', 'object_is_apartment': 'false'})
+        assert values['inner_id'] == '123'
+        assert (values['price'], values['price_per_sqm'], values['title']) == (5_000_000, 125_000, 'Студия, 40 м²')
+        assert json.loads(values['gallery_images']) == ['x.jpg', 'y.jpg'] and values['main_image'] == 'x.jpg'
+        assert values['is_apartment'] is False
+        with pytest.raises(RowError):
+            normalize_row({'inner_id': '1', 'price': None})
+        with pytest.raises(RowError):
+            normalize_row({'inner_id': '1', 'price': 'дорого'})
+
+
+class TestExcelImporter:
+
+    def test_import_creates_catalogue_and_reports_progress(self, engine, tmp_path):
+        path = workbook(tmp_path / 'a.xlsx', [
+            flat('1', 5_000_000), flat('2', 7_000_000, complex_name='ЖК Лесной'),
+            flat(None, 1), flat('3', None), flat('1', 5_500_000),
+        ])
+        importer = ExcelImporter(engine=engine, chunk_size=2)
+        job_id = importer.create_job(path, 'a.xlsx')
+        result = importer.run(job_id)
+
+        assert (result['inserted'], result['updated'], result['skipped']) == (2, 1, 2)
+        assert result['complexes_created'] == 2 and result['developers_created'] == 1
+        status = importer.get_status(job_id)
+        assert status['status'] == 'completed' and status['progress'] == 100
+        assert [error['row'] for error in status['result']['errors']] == [4, 5]
+        with Session(engine) as session:
+            assert session.query(Property).filter_by(inner_id='1').one().price == 5_500_000
+            assert session.query(ComplexStats).count() == 2
+            assert session.query(Developer.slug).scalar() == 'ssk'
+
+    def test_reimport_updates_in_place_and_keeps_known_fields(self, engine, tmp_path):
+        importer = ExcelImporter(engine=engine)
+        importer.run(importer.create_job(workbook(tmp_path / 'a.xlsx', [flat('1', 5_000_000)])))
+        with Session(engine) as session:
+            first = session.query(Property).one()
+            first_id, first_updated = first.id, first.updated_at
+
+        result = importer.run(importer.create_job(
+            workbook(tmp_path / 'b.xlsx', [flat('1', 4_900_000, lat=None, photos=None)])))
+        assert (result['inserted'], result['updated']) == (0, 1)
+        with Session(engine) as session:
+            prop = session.query(Property).one()
+            assert (prop.id, prop.price, prop.latitude, prop.main_image) == (first_id, 4_900_000, 45.03, 'a.jpg')
+            assert prop.updated_at > first_updated  # версия каталога меняется для всех процессов
+            assert session.query(ResidentialComplex).count() == 1
+
+    def test_failed_and_stale_jobs(self, engine, tmp_path):
+        importer = ExcelImporter(engine=engine)
+        job_id = importer.create_job(str(tmp_path / 'missing.xlsx'))
+        assert importer.run(job_id)['success'] is False
+        assert importer.get_status(job_id)['status'] == 'error'
+        assert importer.get_status('unknown') is None
+
+        stale = importer.create_job(str(tmp_path / 'x.xlsx'))
+        with Session(engine) as session:
+            session.get(ImportJob, stale).updated_at = datetime.utcnow() - timedelta(hours=1)
+            session.commit()
+        assert importer.get_status(stale)['status'] == 'error'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,108 @@
+"""
+Unit tests for PersistentGeocodeCache
+Общий постоянный кэш Yandex / DaData: LRU, отрицательные ответы, нормализация ключей
+"""
+
+import pytest
+from services import geocode_cache
+from services.geocode_cache import (
+    NamespacedGeocodeCache, PersistentGeocodeCache, forward_key, normalize_address, reverse_key,
+)
+from services.geocoding import YandexGeocodingService
+from services.dadata_client import DaDataClient
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'geocode.sqlite')
+
+
+class TestPersistentGeocodeCache:
+
+    def test_shared_between_instances(self, cache_path):
+        first = PersistentGeocodeCache(cache_path)
+        first.set('yandex:fwd:краснодар', {'lat': 45.03})
+        second = PersistentGeocodeCache(cache_path)
+        assert second.get('yandex:fwd:краснодар') == {'lat': 45.03}
+        assert second.get_stats()['hits'] == 1
+
+    def test_negative_results(self, cache_path):
+        cache = PersistentGeocodeCache(cache_path, negative_ttl=60)
+        cache.set_negative('yandex:fwd:нет такого')
+        assert PersistentGeocodeCache(cache_path).lookup('yandex:fwd:нет такого') == (True, None)
+        assert cache.lookup('yandex:fwd:другой') == (False, None)
+        expired = PersistentGeocodeCache(cache_path, negative_ttl=-1)
+        expired.set_negative('k')
+        assert PersistentGeocodeCache(cache_path).lookup('k') == (False, None)
+
+    def test_lru_eviction(self, cache_path, monkeypatch):
+        clock = iter(range(1000, 2000))
+        monkeypatch.setattr(geocode_cache.time, 'time', lambda: next(clock))
+        cache = PersistentGeocodeCache(cache_path, max_entries=10, memory_entries=0)
+        for i in range(10):
+            cache.set(f'k{i}', i)
+        cache.lookup('k0')  # k0 снова нужен — вытесняется k1
+        cache.set('k10', 10)
+        assert cache.evict() == 2
+        assert len(cache) == 9
+        assert cache.lookup('k0') == (True, 0)
+        assert cache.lookup('k1') == (False, None)
+        assert cache.stats['evictions'] == 2
+
+    def test_prefetch_and_namespaces(self, cache_path):
+        store = PersistentGeocodeCache(cache_path)
+        yandex = NamespacedGeocodeCache('yandex', store=store)
+        dadata = NamespacedGeocodeCache('dadata', store=store)
+        yandex.set('a', 1)
+        yandex.set_negative('b')
+        dadata.set('a', 2)
+        assert yandex.prefetch(['a', 'b', 'c']) == {'c'}
+        assert (yandex.get('a'), dadata.get('a')) == (1, 2)
+        yandex.clear()
+        assert (len(yandex), len(dadata)) == (0, 1)
+
+    def test_key_normalization(self):
+        assert normalize_address('г. Краснодар,  ул.Красная, 1') == normalize_address('Г Краснодар ул Красная 1')
+        assert normalize_address('Ёлочная') == 'елочная'
+        assert forward_key('y', 'Ул. Мира') == 'y:fwd:ул мира'
+        assert reverse_key('y', 45.0355001, 38.97529999, 'house') == reverse_key('y', 45.0354996, 38.9753, 'house')
+
+
+class TestServicesUseSharedCache:
+
+    def test_yandex_negative_and_quantized_reverse(self, cache_path, monkeypatch):
+        service = YandexGeocodingService(api_key='key')
+        service.cache._store = PersistentGeocodeCache(cache_path)
+        calls = []
+        empty = {'response': {'GeoObjectCollection': {'featureMember': []}}}
+        monkeypatch.setattr(service, '_make_request', lambda url, params: calls.append(params) or empty)
+
+        assert service.reverse_geocode(45.0355001, 38.9753) is None
+        assert service.reverse_geocode(45.0354999, 38.9753) is None
+        assert service.forward_geocode('г. Краснодар, ул Красная') is None
+        assert service.forward_geocode('Г. КРАСНОДАР ул. красная') is None
+        assert len(calls) == 2
+        assert service.prefetch_forward(['г Краснодар, ул Красная', 'Сочи']) == ['Сочи']
+        assert service.get_stats()['persistent_cache']['negative_hits'] >= 2
+
+    def test_dadata_bounds_are_part_of_key(self, cache_path):
+        client = DaDataClient()
+
+        class FakeDadata:
+            calls = []
+
+            def suggest(self, name, query, **kwargs):
+                self.calls.append(kwargs['to_bound'])
+                return [{'value': query, 'data': {'city': 'Краснодар', 'street': None}}]
+
+        client.client = FakeDadata()
+        client.cache._store = PersistentGeocodeCache(cache_path)
+        client.suggest_cities('Краснодар')
+        client.suggest_streets('Краснодар')
+        client.suggest_cities('краснодар ')
+        assert len(FakeDadata.calls) == 2
+        assert client.prefetch_addresses(['Краснодар', 'Сочи']) == ['Краснодар', 'Сочи']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,131 @@
+"""
+Unit tests for ImageProxyCache
+Рендер на диск, single-flight, LRU-вытеснение и выбор формата
+"""
+
+import io
+import os
+import threading
+import pytest
+from PIL import Image
+from services.image_cache import ImageProxyCache
+
+
+def make_jpeg(width=200, height=100):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class FakeResponse:
+
+    def __init__(self, content, status=200):
+        self.content = content
+        self.status = status
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise RuntimeError(f"HTTP {self.status}")
+
+
+class FakeSession:
+
+    def __init__(self, status=200, delay=None):
+        self.calls = []
+        self.status = status
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self._lock:
+            self.calls.append(url)
+        if self.delay:
+            self.delay.wait(2)
+        return FakeResponse(make_jpeg(), self.status)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    image_cache = ImageProxyCache(str(tmp_path / 'images'), max_bytes=10 * 1024 ** 2)
+    image_cache._session = FakeSession()
+    return image_cache
+
+
+class TestImageProxyCache:
+
+    def test_renders_once_then_hits_disk(self, cache):
+        path, mimetype, key = cache.get('http://img/1.jpg', crop=10, fmt='jpeg')
+        assert mimetype == 'image/jpeg'
+        assert Image.open(path).size == (200, 90)
+
+        assert cache.get('http://img/1.jpg', crop=10, fmt='jpeg')[0] == path
+        assert cache._session.calls == ['http://img/1.jpg']
+        assert cache.stats['hits'] == 1
+
+    def test_key_depends_on_crop_and_format(self, cache):
+        keys = {
+            cache.make_key('http://img/1.jpg', 8, 'jpeg'),
+            cache.make_key('http://img/1.jpg', 10, 'jpeg'),
+            cache.make_key('http://img/1.jpg', 8, 'webp'),
+        }
+        assert len(keys) == 3
+
+    def test_concurrent_misses_render_once(self, cache):
+        gate = threading.Event()
+        cache._session = FakeSession(delay=gate)
+        results = []
+
+        def fetch():
+            results.append(cache.get('http://img/2.jpg', fmt='jpeg'))
+
+        threads = [threading.Thread(target=fetch) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        gate.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(cache._session.calls) == 1
+        assert all(result is not None for result in results)
+
+    def test_failed_download_is_negative_cached(self, cache):
+        cache._session = FakeSession(status=404)
+        assert cache.get('http://img/missing.jpg') is None
+        assert cache.get('http://img/missing.jpg') is None
+        assert len(cache._session.calls) == 1
+
+    def test_failure_cache_is_bounded(self, cache, monkeypatch):
+        cache._session = FakeSession(status=500)
+        monkeypatch.setattr(cache, 'MAX_FAILURES', 3)
+        for i in range(5):
+            assert cache.get(f'http://img/broken-{i}.jpg') is None
+        assert list(cache._failures) == [f'http://img/broken-{i}.jpg' for i in (2, 3, 4)]
+
+        # Записи старше FAILURE_TTL выбрасываются при следующей ошибке
+        for url in cache._failures:
+            cache._failures[url] -= cache.FAILURE_TTL
+        assert cache.get('http://img/broken-5.jpg') is None
+        assert list(cache._failures) == ['http://img/broken-5.jpg']
+
+    def test_evicts_least_recently_used(self, cache):
+        first = cache.get('http://img/a.jpg')[0]
+        second = cache.get('http://img/b.jpg')[0]
+        os.utime(first, (1, 1))
+        cache.max_bytes = os.path.getsize(second) + 1
+        cache.evict(target_ratio=1.0)
+        assert not os.path.exists(first)
+        assert os.path.exists(second)
+
+    def test_negotiate_format(self, cache):
+        assert cache.negotiate_format('image/webp,*/*') in ('webp', 'jpeg')
+        assert cache.negotiate_format('*/*') == 'jpeg'
+        assert cache.negotiate_format(None) == 'jpeg'
+
+    def test_prewarm_skips_cached(self, cache):
+        cache.get('http://img/a.jpg', fmt='jpeg')
+        result = cache.prewarm(['http://img/a.jpg', 'http://img/b.jpg', None], formats=('jpeg',), workers=2)
+        assert result == {'total': 2, 'cached': 1, 'rendered': 1, 'failed': 0}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
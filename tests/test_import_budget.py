@@ -0,0 +1,41 @@
+"""
+Unit tests for lazy startup
+Импорт app не тянет тяжёлые зависимости и не создаёт схему БД
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ('openai', 'telegram', 'qrcode', 'PIL.Image', 'pandas', 'numpy', 'dadata',
+                'nearby_places', 'services.geocoding', 'services.dadata_client')
+
+
+def import_app(tmp_path, **env):
+    database = tmp_path / 'startup.db'
+    overrides = dict(SESSION_SECRET='test', DATABASE_URL=f'sqlite:///{database}', **env)
+    env = {key: value for key, value in os.environ.items() if key != 'SCHEMA_AUTO_CREATE'}
+    env.update(overrides)
+    code = "import sys, app; print(' '.join(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return set(result.stdout.split()), database
+
+
+class TestLazyStartup:
+
+    def test_heavy_dependencies_are_not_imported(self, tmp_path):
+        loaded, database = import_app(tmp_path)
+        assert [name for name in LAZY_MODULES if name in loaded] == []
+        assert not database.exists() or database.stat().st_size == 0
+
+    def test_schema_auto_create_opt_in(self, tmp_path):
+        _, database = import_app(tmp_path, SCHEMA_AUTO_CREATE='1')
+        assert database.stat().st_size > 0
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
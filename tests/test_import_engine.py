@@ -0,0 +1,144 @@
+"""
+Unit tests for import_engine
+Единый импорт: источники CSV / JSON, пропуск неизменённых строк по хэшу,
+dry-run отчёт и разрешение корпусов / районов
+"""
+
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import db, Building, ComplexStats, District, ImportRowHash, Property, ResidentialComplex
+from services import response_cache
+from services.import_engine import CsvSource, ImportEngine, JsonSource, RecordsSource, open_source
+from services.response_cache import TAG_CATALOGUE, complex_tag, property_tag
+
+TABLES = ('developers', 'residential_complexes', 'districts', 'buildings', 'properties', 'complex_stats',
+          'import_row_hashes')
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in TABLES])
+    with Session(engine) as session:
+        session.add(District(name='Центральный', slug='centralnyy'))
+        session.commit()
+        yield session
+
+
+def record(inner_id, price, **extra):
+    row = {'inner_id': inner_id, 'price': price, 'object_area': 40, 'object_rooms': 1,
+           'complex_name': 'ЖК Солнечный', 'developer_name': 'ССК', 'complex_building_name': 'Литер 1'}
+    row.update(extra)
+    return row
+
+
+class TestImportEngine:
+
+    def test_reimport_skips_unchanged_rows(self, session):
+        rows = [record('1', 5_000_000, district='Центральный'), record('2', 6_000_000)]
+        first = ImportEngine(session).run(RecordsSource(rows))
+        assert (first.inserted, first.updated, first.unchanged) == (2, 0, 0)
+        assert first.created == {'buildings': ['Литер 1'], 'complexes': ['ЖК Солнечный'], 'developers': ['ССК']}
+
+        stamp = session.query(Property.updated_at).filter_by(inner_id='1').scalar()
+        second = ImportEngine(session).run(RecordsSource([rows[0], record('2', 6_100_000)]))
+        assert (second.inserted, second.updated, second.unchanged) == (0, 1, 1)
+        assert session.query(Property.updated_at).filter_by(inner_id='1').scalar() == stamp
+        assert session.query(Property.price).filter_by(inner_id='2').scalar() == 6_100_000
+
+        prop = session.query(Property).filter_by(inner_id='1').one()
+        building = session.query(Building).one()
+        assert (prop.building_id, building.complex_id) == (building.id, prop.complex_id)
+        assert prop.district_id == session.query(District.id).scalar()
+        assert session.query(ImportRowHash).count() == 2
+
+    def test_deactivated_row_is_restored_even_if_hash_matches(self, session):
+        ImportEngine(session).run(RecordsSource([record('1', 5_000_000)]))
+        session.query(Property).update({'is_active': False})
+        session.commit()
+        report = ImportEngine(session).run(RecordsSource([record('1', 5_000_000)]))
+        assert (report.updated, report.unchanged) == (1, 0)
+        assert session.query(Property.is_active).scalar() is True
+
+    def test_dry_run_reports_diff_without_writing(self, session):
+        ImportEngine(session).run(RecordsSource([record('1', 5_000_000)]))
+        report = ImportEngine(session, dry_run=True).run(RecordsSource([
+            record('1', 4_800_000), record('2', 7_000_000, complex_name='ЖК Лесной'), record(None, 1),
+        ]))
+        assert (report.inserted, report.updated, report.skipped) == (1, 1, 1)
+        assert report.diffs[0]['inner_id'] == '1'
+        assert report.diffs[0]['fields']['price'] == [5_000_000, 4_800_000]
+        assert report.created == {'complexes': ['ЖК Лесной']}
+        assert report.as_dict()['dry_run'] is True
+
+        assert session.query(Property.price).all() == [(5_000_000,)]
+        assert session.query(ResidentialComplex).count() == 1
+
+    def test_moved_property_refreshes_previous_complex_stats(self, session):
+        ImportEngine(session).run(RecordsSource([record('1', 5_000_000), record('2', 6_000_000)]))
+        old_complex = session.query(Property.complex_id).filter_by(inner_id='1').scalar()
+        assert session.get(ComplexStats, old_complex).total_count == 2
+
+        report = ImportEngine(session).run(RecordsSource([record('1', 5_000_000, complex_name='ЖК Лесной')]))
+        new_complex = session.query(Property.complex_id).filter_by(inner_id='1').scalar()
+        assert report.complex_ids == {old_complex, new_complex}
+        session.expire_all()
+        assert session.get(ComplexStats, old_complex).total_count == 1
+        assert session.get(ComplexStats, new_complex).total_count == 1
+
+    def test_committed_chunks_invalidate_response_cache(self, session, monkeypatch):
+        invalidated = []
+        cache = response_cache.get_response_cache()
+        monkeypatch.setattr(cache, 'invalidate', lambda *tags: invalidated.append(set(tags)))
+
+        ImportEngine(session, chunk_size=1).run(RecordsSource([record('1', 5_000_000), record('2', 6_000_000)]))
+        first, second = (session.query(Property).filter_by(inner_id=key).one() for key in ('1', '2'))
+        old_complex, first, second = first.complex_id, first.id, second.id
+        tags = set().union(*invalidated)
+        assert {TAG_CATALOGUE, complex_tag(old_complex), property_tag(first), property_tag(second)} <= tags
+
+        # Переезд в другой ЖК сбрасывает оба ЖК, неизменённые строки — ничего
+        invalidated.clear()
+        ImportEngine(session).run(RecordsSource([record('1', 5_000_000, complex_name='ЖК Лесной'),
+                                                 record('2', 6_000_000)]))
+        new_complex = session.query(Property.complex_id).filter_by(inner_id='1').scalar()
+        tags = set().union(*invalidated)
+        assert {TAG_CATALOGUE, complex_tag(old_complex), complex_tag(new_complex), property_tag(first)} <= tags
+        assert property_tag(second) not in tags
+
+        invalidated.clear()
+        ImportEngine(session).run(RecordsSource([record('2', 6_000_000)]))
+        assert invalidated == []
+
+
+class TestSources:
+
+    def test_csv_and_json_sources(self, session, tmp_path):
+        csv_path = tmp_path / 'flats.csv'
+        csv_path.write_text('id;price;object_area;complex_name\n10;5 000 000;40,5;ЖК Лесной\n11;;30;\n',
+                            encoding='utf-8')
+        source = open_source(str(csv_path), column_map={'id': 'inner_id'})
+        assert isinstance(source, CsvSource)
+        report = ImportEngine(session).run(source)
+        assert (report.inserted, report.skipped) == (1, 1)
+        assert report.errors == [{'row': 3, 'error': 'нет цены'}]
+        assert session.query(Property.area).filter_by(inner_id='10').scalar() == 40.5
+
+        json_path = tmp_path / 'flats.json'
+        json_path.write_text(json.dumps({'items': [record('20', 3_000_000), record('21', 3_500_000)]}),
+                             encoding='utf-8')
+        jsonl_path = tmp_path / 'flats.jsonl'
+        jsonl_path.write_text('\n'.join(json.dumps(row) for row in [record('20', 3_000_000)]) + '\n',
+                              encoding='utf-8')
+        assert ImportEngine(session).run(JsonSource(str(json_path))).inserted == 2
+        assert ImportEngine(session).run(open_source(str(jsonl_path))).unchanged == 1
+        with pytest.raises(ValueError):
+            open_source(str(tmp_path / 'flats.xls'))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
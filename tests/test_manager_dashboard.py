@@ -0,0 +1,162 @@
+"""
+Unit tests for manager_dashboard
+Снимок панели менеджера: сброс при записи, лента активности с keyset-пагинацией
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from models import (db, Collection, Deal, Manager, ManagerActivity, ManagerDashboardSnapshot,
+                    ManagerNotification, Recommendation, User)
+from services import manager_dashboard
+from services.manager_dashboard import (
+    activity_page, decode_cursor, ensure_activity, get_snapshot, rebuild_activity, setup_manager_dashboard_tracking,
+)
+
+TABLES = ('managers', 'users', 'recommendations', 'manager_notifications', 'collections', 'deals',
+          'manager_saved_searches', 'manager_favorite_properties', 'manager_favorite_complexes',
+          'manager_comparisons', 'comparison_properties', 'comparison_complexes',
+          'manager_activity', 'manager_dashboard_snapshots', 'analytics_rollups')
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in TABLES])
+    return engine
+
+
+@pytest.fixture
+def session(engine):
+    setup_manager_dashboard_tracking()
+    with Session(engine) as session:
+        session.add(Manager(id=7, email='m@example.com', password_hash='x', first_name='Анна', last_name='М',
+                            manager_id='MNG00000007'))
+        session.add(User(id=1, email='u1@example.com', full_name='Иван Клиентов', user_id='CB00000001',
+                         assigned_manager_id=7, created_at=datetime.utcnow() - timedelta(days=3)))
+        session.commit()
+        yield session
+
+
+def recommend(session, rid, client_id=1, sent_at=None):
+    session.add(Recommendation(id=rid, manager_id=7, client_id=client_id, title=f'Подборка {rid}',
+                               recommendation_type='property', item_id=str(rid), item_name='Квартира',
+                               sent_at=sent_at or datetime.utcnow()))
+
+
+def count_statements(engine):
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+class TestManagerDashboard:
+
+    def test_snapshot_is_cached_until_write(self, session, engine):
+        recommend(session, 1)
+        session.commit()
+        snapshot = get_snapshot(7, session=session)
+        assert snapshot['stats']['total_recommendations'] == 1
+        assert snapshot['top_clients'][0]['interactions_count'] == 1
+        assert snapshot['recommendations'][0]['client_name'] == 'Иван Клиентов'
+
+        statements = count_statements(engine)
+        assert get_snapshot(7, session=session) == snapshot
+        assert len(statements) == 1
+
+        session.add(Deal(id=1, deal_number='DL00000001', manager_id=7, client_id=1,
+                         property_price=5_000_000, cashback_amount=100_000))
+        session.commit()
+        assert session.get(ManagerDashboardSnapshot, 7) is None
+        assert get_snapshot(7, session=session)['stats']['deals_count'] == 1
+
+    def test_reads_never_commit_request_session(self, session):
+        ends = []
+        event.listen(session, 'after_commit', lambda s: ends.append('commit'))
+        event.listen(session, 'after_rollback', lambda s: ends.append('rollback'))
+
+        recommend(session, 1)
+        session.flush()
+        assert get_snapshot(7, session=session)['stats']['total_recommendations'] == 1
+        stored = session.get(ManagerDashboardSnapshot, 7)
+        stored.built_at -= timedelta(seconds=manager_dashboard.SNAPSHOT_TTL + 1)
+        session.flush()
+        get_snapshot(7, session=session)
+        assert activity_page(7, session=session)[0][0]['title'] == 'Отправлена рекомендация'
+        assert ends == [] and session.in_transaction()
+
+    def test_empty_feed_is_filled_only_by_ensure(self, session):
+        recommend(session, 1)
+        session.commit()
+        session.query(ManagerActivity).delete()
+        session.commit()
+        assert [a.get('type') for a in activity_page(7, session=session)[0]] == [None, None]  # демо
+        assert session.query(ManagerActivity).count() == 0
+
+        assert ensure_activity(session=session) is True
+        assert [a['type'] for a in activity_page(7, session=session)[0]] == ['recommendation', 'client']
+        assert ensure_activity(session=session) is False
+
+    def test_unrelated_user_fields_keep_snapshot(self, session):
+        get_snapshot(7, session=session)
+        session.get(User, 1).last_login = datetime.utcnow()
+        session.commit()
+        assert session.get(ManagerDashboardSnapshot, 7) is not None
+
+        session.add(Collection(id=1, title='Подборка', created_by_manager_id=7))
+        session.commit()
+        assert session.get(ManagerDashboardSnapshot, 7) is None
+
+    def test_reassigning_client_invalidates_both_managers(self, session):
+        session.add(Manager(id=8, email='m8@example.com', password_hash='x', first_name='Б', last_name='М',
+                            manager_id='MNG00000008'))
+        session.commit()
+        get_snapshot(7, session=session)
+        get_snapshot(8, session=session)
+        session.get(User, 1).assigned_manager_id = 8
+        session.commit()
+        assert session.query(ManagerDashboardSnapshot).count() == 0
+        assert get_snapshot(7, session=session)['stats']['total_clients'] == 0
+        feed = session.query(ManagerActivity.manager_id).filter_by(kind='client').all()
+        assert feed == [(8,)]
+
+    def test_activity_feed_keyset_pagination(self, session, engine):
+        start = datetime.utcnow() - timedelta(hours=5)
+        for i in range(1, 6):
+            recommend(session, i, sent_at=start + timedelta(minutes=i))
+        session.add(ManagerNotification(id=1, manager_id=7, title='Просмотр', message='Клиент открыл подборку',
+                                        created_at=start + timedelta(minutes=3)))
+        session.commit()
+
+        statements = count_statements(engine)
+        first, cursor = activity_page(7, limit=4, session=session)
+        assert [a['description'] for a in first[:2]] == ['Подборка 5 для Иван Клиентов', 'Подборка 4 для Иван Клиентов']
+        assert first[3]['type'] == 'notification' and first[3]['is_read'] is False
+        assert len(statements) == 2
+
+        second, last_cursor = activity_page(7, cursor=cursor, limit=4, session=session)
+        assert [a['type'] for a in second] == ['recommendation', 'recommendation', 'client']
+        assert last_cursor is None
+        assert decode_cursor(cursor)[0] <= start + timedelta(minutes=3)
+
+        session.delete(session.get(ManagerNotification, 1))
+        session.commit()
+        assert len(activity_page(7, limit=50, session=session)[0]) == 6
+
+    def test_rebuild_activity_matches_incremental(self, session):
+        recommend(session, 1)
+        session.add(ManagerNotification(id=1, manager_id=7, title='Новое', message='Текст',
+                                        notification_type='info'))
+        session.commit()
+        incremental = activity_page(7, session=session)[0]
+        assert rebuild_activity(session=session) == 3
+        assert activity_page(7, session=session)[0] == incremental
+        with pytest.raises(ValueError):
+            decode_cursor('not-a-cursor')
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
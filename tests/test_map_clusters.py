@@ -0,0 +1,122 @@
+"""
+Unit tests for MapClusterer
+Кластеры по сетке Web Mercator, переход к точкам и слой ЖК
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from services.property_index import PropertyIndex
+from services import map_clusters
+from services.map_clusters import MapClusterer, parse_bbox
+from tests.test_property_index import make_row
+
+
+KRASNODAR = (45.035, 38.975)
+NOVOROSSIYSK = (44.72, 37.77)
+
+
+@pytest.fixture
+def lookups():
+    return {
+        'complexes': [(1, 'ЖК Солнечный', 2024, 5.0, 'Комфорт'), (2, 'ЖК Морской', 2027, 0.0, 'Бизнес')],
+        'developers': [(1, 'ССК'), (2, 'Неометрия')],
+        'districts': [(1, 'Центральный')],
+    }
+
+
+@pytest.fixture
+def index_rows():
+    rows = []
+    for pid in range(1, 41):
+        lat, lng = KRASNODAR
+        rows.append(make_row(pid, 5_000_000 + pid * 10_000, 40.0, 1, building=f'Литер {pid % 3}',
+                             latitude=lat + pid * 0.0001, longitude=lng))
+    for pid in range(41, 51):
+        lat, lng = NOVOROSSIYSK
+        rows.append(make_row(pid, 8_000_000 + pid, 50.0, 2, complex_id=2, developer_id=2,
+                             latitude=lat, longitude=lng + pid * 0.0001))
+    rows.append(make_row(51, 1_000_000, 20.0, 0, latitude=None, longitude=None))
+    return rows
+
+
+@pytest.fixture
+def clusterer(index_rows, lookups):
+    index = PropertyIndex()
+    index.load(index_rows, lookups)
+    return MapClusterer(index)
+
+
+@pytest.fixture
+def few_points(monkeypatch):
+    monkeypatch.setattr(map_clusters, 'MAX_POINTS', 5)
+
+
+class TestMapClusterer:
+
+    def test_low_zoom_returns_clusters_with_counts(self, clusterer, few_points):
+        result = clusterer.query({}, zoom=8)
+        assert result['mode'] == 'clusters'
+        assert result['total'] == 50
+        by_count = sorted(result['clusters'], key=lambda c: c['count'])
+        assert [c['count'] for c in by_count] == [10, 40]
+        assert by_count[1]['min_price'] == 5_010_000
+        assert by_count[0]['min_price'] == 8_000_041
+
+    def test_properties_without_coordinates_are_skipped(self, clusterer):
+        result = clusterer.query({}, zoom=8)
+        assert 51 not in result['ids']
+        assert result['total'] == 50
+
+    def test_bbox_limits_clusters(self, clusterer, few_points):
+        bbox = parse_bbox('44.9,38.8,45.2,39.1')
+        result = clusterer.query({}, bbox=bbox, zoom=10)
+        assert result['total'] == 40
+        assert sum(c['count'] for c in result['clusters']) == 40
+        # Границы всей выборки не зависят от окна
+        assert result['bounds'][0][0] == pytest.approx(NOVOROSSIYSK[0])
+
+    def test_high_zoom_returns_points(self, clusterer, few_points):
+        result = clusterer.query({'min_price': 8_000_000}, zoom=17)
+        assert result['mode'] == 'points'
+        assert result['truncated'] is True
+        assert result['ids'] == [41, 42, 43, 44, 45]
+
+    def test_filters_and_restrict_ids(self, clusterer):
+        assert clusterer.query({'rooms': [2]}, zoom=8)['total'] == 10
+        result = clusterer.query({}, zoom=8, restrict_ids=[1, 2, 45])
+        assert sorted(result['ids']) == [1, 2, 45]
+
+    def test_finer_zoom_splits_clusters(self, clusterer, few_points):
+        coarse = clusterer.query({}, zoom=6)
+        fine = clusterer.query({}, zoom=15)
+        assert len(fine['clusters']) > len(coarse['clusters'])
+        assert sum(c['count'] for c in fine['clusters']) == 50
+
+    def test_complex_layer(self, clusterer):
+        result = clusterer.query({}, zoom=12, layer='complexes')
+        assert result['mode'] == 'points'
+        complexes = {c['id']: c for c in result['complexes']}
+        assert complexes[1]['count'] == 40
+        assert complexes[1]['buildings'] == 3
+        assert complexes[2]['min_price'] == 8_000_041
+
+    def test_sql_rows_match_index(self, clusterer, index_rows, few_points):
+        """Без индекса (отключён или не собран) строки SQL дают те же кластеры и точки"""
+        rows = [SimpleNamespace(id=row[0], price=row[1], complex_id=row[6], complex_building_name=row[9],
+                                latitude=row[16], longitude=row[17]) for row in index_rows]
+        for kwargs in ({'zoom': 8}, {'zoom': 17}, {'zoom': 12, 'layer': 'complexes'},
+                       {'zoom': 10, 'bbox': parse_bbox('44.9,38.8,45.2,39.1')}):
+            assert clusterer.query_rows(rows, **kwargs) == clusterer.query({}, **kwargs)
+
+    def test_search_filter_is_not_supported(self, clusterer):
+        assert clusterer.query({'search': 'Солнечный'}) is None
+
+    def test_parse_bbox(self):
+        assert parse_bbox('45.2,38.8,44.9,39.1') == (44.9, 38.8, 45.2, 39.1)
+        assert parse_bbox('bad') is None
+        assert parse_bbox(None) is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
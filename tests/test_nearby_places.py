@@ -0,0 +1,38 @@
+"""
+Unit tests for nearby_places batch distance API
+"""
+
+import numpy as np
+import pytest
+from nearby_places import calculate_distance, haversine_matrix, distances_from, select_nearest
+
+
+class TestBatchDistances:
+
+    def test_matrix_matches_scalar(self):
+        origins = np.array([[45.0, 39.0], [45.1, 38.9]])
+        targets = np.array([[45.01, 39.0], [45.0, 39.01], [44.9, 38.8]])
+        matrix = haversine_matrix(origins[:, 0], origins[:, 1], targets[:, 0], targets[:, 1])
+        assert matrix.shape == (2, 3)
+        for i, (lat1, lon1) in enumerate(origins):
+            for j, (lat2, lon2) in enumerate(targets):
+                assert int(matrix[i, j]) == calculate_distance(lat1, lon1, lat2, lon2)
+
+    def test_distances_from_point(self):
+        distances = distances_from(45.0, 39.0, [45.0, 45.01], [39.0, 39.0])
+        assert distances[0] == 0
+        assert distances[1] == pytest.approx(1112, abs=1)
+
+    def test_select_nearest_dedups_by_name(self):
+        names = ['Аптека', 'Школа', 'Аптека', 'Парк', 'Сад']
+        distances = np.array([500, 300, 100, 2500, 900])
+        assert select_nearest(names, distances, k=5) == [2, 1, 4, 3]
+        assert select_nearest(names, distances, k=2) == [2, 1]
+        assert select_nearest(names, distances, k=5, radius_meters=1000) == [2, 1, 4]
+
+    def test_select_nearest_empty(self):
+        assert select_nearest([], np.array([]), k=5) == []
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
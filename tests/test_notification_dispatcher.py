@@ -0,0 +1,274 @@
+"""
+Unit tests for NotificationDispatcher
+Outbox, пул SMTP-соединений, пачки SendGrid и ограничение частоты Telegram
+"""
+
+import socket
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from models import db, NotificationOutbox
+from services.notification_dispatcher import (
+    CHANNEL_EMAIL, CHANNEL_TELEGRAM, MAX_ATTEMPTS, STATUS_FAILED, STATUS_PENDING, STATUS_SENT,
+    DeliveryError, LogEmailBackend, NotificationDispatcher, SendGridEmailBackend, SMTPConnectionPool,
+    SMTPEmailBackend, TelegramSender, TemplateRenderCache, retry_delay,
+)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[db.metadata.tables['notification_outbox']])
+    return engine
+
+
+def rows(engine):
+    table = NotificationOutbox.__table__
+    with engine.connect() as conn:
+        return [dict(r) for r in conn.execute(select(table).order_by(table.c.id)).mappings()]
+
+
+class FlakyBackend:
+    """Отказывает first_failures раз, затем отправляет"""
+
+    def __init__(self, first_failures=0, error=None):
+        self.failures_left = first_failures
+        self.error = error or DeliveryError('temporary')
+        self.sent = []
+
+    def send_batch(self, messages):
+        results = {}
+        for message in messages:
+            if self.failures_left:
+                self.failures_left -= 1
+                results[message['id']] = self.error
+            else:
+                self.sent.append(message['recipient'])
+                results[message['id']] = None
+        return results
+
+
+class TestDispatcher:
+
+    def test_enqueue_then_deliver(self, engine):
+        backend = FlakyBackend()
+        dispatcher = NotificationDispatcher(engine, {CHANNEL_EMAIL: backend})
+        assert dispatcher.enqueue_many([
+            {'channel': CHANNEL_EMAIL, 'recipient': 'a@x.ru', 'subject': 'S', 'body': '<p>1</p>'},
+            {'channel': CHANNEL_EMAIL, 'recipient': 'b@x.ru', 'subject': 'S', 'body': '<p>2</p>'},
+            {'channel': CHANNEL_EMAIL, 'recipient': '', 'body': 'skipped'},
+        ]) == 2
+        assert backend.sent == []  # enqueue ничего не отправляет
+
+        now = datetime.utcnow() + timedelta(seconds=1)
+        assert dispatcher.process_once(now) == {'sent': 2, 'retried': 0, 'failed': 0}
+        assert backend.sent == ['a@x.ru', 'b@x.ru']
+        assert {r['status'] for r in rows(engine)} == {STATUS_SENT}
+        # Повторно не отправляется
+        assert dispatcher.process_once(now)['sent'] == 0
+
+    def test_backoff_then_failed(self, engine):
+        backend = FlakyBackend(first_failures=100)
+        dispatcher = NotificationDispatcher(engine, {CHANNEL_EMAIL: backend})
+        dispatcher.enqueue(CHANNEL_EMAIL, 'a@x.ru', 'body', subject='S')
+
+        now = datetime.utcnow() + timedelta(seconds=1)
+        for attempt in range(1, MAX_ATTEMPTS):
+            assert dispatcher.process_once(now)['retried'] == 1
+            row = rows(engine)[0]
+            assert row['status'] == STATUS_PENDING and row['attempts'] == attempt
+            assert row['next_attempt_at'] == now + timedelta(seconds=retry_delay(attempt))
+            # До срока повтора не берётся
+            assert dispatcher.process_once(now)['retried'] == 0
+            now = row['next_attempt_at']
+
+        assert dispatcher.process_once(now)['failed'] == 1
+        row = rows(engine)[0]
+        assert row['status'] == STATUS_FAILED and row['attempts'] == MAX_ATTEMPTS
+        assert row['last_error'] == 'temporary'
+
+    def test_permanent_error_and_unconfigured_channel(self, engine):
+        backend = FlakyBackend(first_failures=1, error=DeliveryError('no such user', permanent=True))
+        dispatcher = NotificationDispatcher(engine, {CHANNEL_EMAIL: backend})
+        dispatcher.enqueue(CHANNEL_EMAIL, 'a@x.ru', 'body')
+        dispatcher.enqueue(CHANNEL_TELEGRAM, '123', 'text')
+        assert dispatcher.process_once(datetime.utcnow() + timedelta(seconds=1))['failed'] == 2
+        assert [r['attempts'] for r in rows(engine)] == [1, 1]
+
+    def test_claimed_rows_are_not_taken_twice(self, engine):
+        dispatcher = NotificationDispatcher(engine, {CHANNEL_EMAIL: FlakyBackend()}, batch_size=2)
+        for i in range(3):
+            dispatcher.enqueue(CHANNEL_EMAIL, f'{i}@x.ru', 'body')
+        now = datetime.utcnow() + timedelta(seconds=1)
+        first = dispatcher._claim(now)
+        second = dispatcher._claim(now)
+        assert len(first) == 2 and len(second) == 1
+        assert {m['id'] for m in first}.isdisjoint(m['id'] for m in second)
+        # Зависший claim возвращается в очередь
+        assert len(dispatcher._claim(now + timedelta(hours=1))) == 2
+
+    def test_expired_claims_count_as_attempts(self, engine):
+        dispatcher = NotificationDispatcher(engine, {CHANNEL_EMAIL: FlakyBackend()})
+        dispatcher.enqueue(CHANNEL_EMAIL, 'a@x.ru', 'body')
+        now = datetime.utcnow() + timedelta(seconds=1)
+        assert len(dispatcher._claim(now)) == 1
+        for attempt in range(1, MAX_ATTEMPTS):
+            now += timedelta(hours=1)
+            # Воркер падал на каждой попытке — сообщение возвращается с учётом попытки
+            assert len(dispatcher._claim(now)) == 1
+            assert rows(engine)[0]['attempts'] == attempt
+
+        now += timedelta(hours=1)
+        assert dispatcher._claim(now) == []
+        row = rows(engine)[0]
+        assert row['status'] == STATUS_FAILED and row['attempts'] == MAX_ATTEMPTS
+        assert row['claim_token'] is None and dispatcher.stats['failed'] == 1
+
+
+class FakeSendGridClient:
+    def __init__(self):
+        self.mails = []
+
+    def send(self, mail):
+        self.mails.append(mail.get())
+        return SimpleNamespace(status_code=202)
+
+
+class TestEmailBackends:
+
+    def test_sendgrid_groups_identical_messages(self):
+        client = FakeSendGridClient()
+        backend = SendGridEmailBackend(client, 'noreply@inback.ru')
+        messages = [{'id': i, 'recipient': f'{i}@x.ru', 'subject': 'Подборка', 'body': '<p>same</p>'}
+                    for i in range(3)]
+        messages.append({'id': 9, 'recipient': 'z@x.ru', 'subject': 'Другое', 'body': '<p>other</p>'})
+        results = backend.send_batch(messages)
+        assert results == {0: None, 1: None, 2: None, 9: None}
+        assert len(client.mails) == 2
+        assert [p['to'][0]['email'] for p in client.mails[0]['personalizations']] == ['0@x.ru', '1@x.ru', '2@x.ru']
+
+    def test_smtp_pool_reuses_connection(self):
+        aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+        class Handler:
+            def __init__(self):
+                self.envelopes = []
+                self.sessions = set()
+
+            async def handle_DATA(self, server, session, envelope):
+                self.envelopes.append(envelope)
+                self.sessions.add(id(session))
+                return '250 OK'
+
+        handler = Handler()
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        try:
+            pool = SMTPConnectionPool('127.0.0.1', port, size=1)
+            backend = SMTPEmailBackend(pool, 'InBack <noreply@inback.ru>')
+            messages = [{'id': i, 'recipient': f'{i}@x.ru', 'subject': 'Тема', 'body': '<b>привет</b>'}
+                        for i in range(4)]
+            assert backend.send_batch(messages) == {i: None for i in range(4)}
+            pool.close()
+        finally:
+            controller.stop()
+
+        assert len(handler.envelopes) == 4
+        assert len(handler.sessions) == 1
+        assert pool.stats == {'connects': 1, 'reuses': 3, 'messages': 4}
+
+    def test_log_backend(self, capsys):
+        assert LogEmailBackend().send_batch([{'id': 1, 'recipient': 'a@x.ru', 'subject': 'S', 'body': 'b'}]) == {1: None}
+        assert 'Email would be sent to a@x.ru' in capsys.readouterr().out
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.text = str(self._payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    def post(self, url, data=None, timeout=None):
+        self.posts.append(data)
+        return self.responses.pop(0) if self.responses else FakeResponse(200, {'ok': True})
+
+
+class TestTelegram:
+
+    def make_sender(self, responses=()):
+        clock = SimpleNamespace(now=0.0, sleeps=[])
+
+        def sleep(seconds):
+            clock.sleeps.append(round(seconds, 3))
+            clock.now += seconds
+
+        sender = TelegramSender('token', session=FakeSession(responses), clock=lambda: clock.now, sleep=sleep)
+        return sender, clock
+
+    def test_rate_limits(self):
+        sender, clock = self.make_sender()
+        messages = [{'id': 1, 'recipient': '1', 'body': 'a'},
+                    {'id': 2, 'recipient': '2', 'body': 'b'},
+                    {'id': 3, 'recipient': '1', 'body': 'c'}]
+        assert sender.send_batch(messages) == {1: None, 2: None, 3: None}
+        # Глобально 1/25 с между сообщениями, в один чат — не чаще раза в секунду
+        assert clock.sleeps == [0.04, 0.96]
+        assert sender.session.posts[0]['parse_mode'] == 'HTML'
+
+    def test_429_schedules_retry_after(self, engine):
+        sender, _ = self.make_sender([FakeResponse(429, {'ok': False, 'parameters': {'retry_after': 42}})])
+        dispatcher = NotificationDispatcher(engine, {CHANNEL_TELEGRAM: sender})
+        dispatcher.enqueue(CHANNEL_TELEGRAM, '100', 'text')
+        now = datetime.utcnow() + timedelta(seconds=1)
+        assert dispatcher.process_once(now)['retried'] == 1
+        assert rows(engine)[0]['next_attempt_at'] == now + timedelta(seconds=42)
+
+    def test_blocked_chat_is_permanent(self):
+        sender, _ = self.make_sender([FakeResponse(403, {'ok': False})])
+        error = sender.send_batch([{'id': 1, 'recipient': '1', 'body': 'a'}])[1]
+        assert error.permanent
+
+
+class TestTemplateRenderCache:
+
+    def test_renders_once_per_payload(self):
+        calls = []
+
+        def renderer(template_name, **data):
+            calls.append(template_name)
+            return f"{template_name}:{data['user']}:{data['n']}"
+
+        cache = TemplateRenderCache(renderer=renderer)
+        user = SimpleNamespace(__table__=None, id=7)
+        assert cache.render('emails/a.html', user=user, n=1) == cache.render('emails/a.html', user=user, n=1)
+        cache.render('emails/a.html', user=user, n=2)
+        assert len(calls) == 2
+        # Объект без id не превращается в ключ — рендерится каждый раз
+        cache.render('emails/a.html', user=object(), n=1)
+        cache.render('emails/a.html', user=object(), n=1)
+        assert cache.stats == {'hits': 1, 'misses': 2, 'uncacheable': 2}
+
+    def test_ttl_and_size(self):
+        cache = TemplateRenderCache(max_entries=1, ttl=0, renderer=lambda name, **data: name)
+        cache.render('a')
+        cache.render('a')
+        assert cache.stats['misses'] == 2
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
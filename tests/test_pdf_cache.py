@@ -0,0 +1,109 @@
+"""
+Unit tests for PdfRenderCache
+"""
+
+import os
+import threading
+import pytest
+from flask import Flask
+from jinja2 import DictLoader, FileSystemLoader
+from services.pdf_cache import PdfRenderCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PdfRenderCache(str(tmp_path / 'pdf'), max_bytes=10 * 1024 ** 2)
+
+
+class TestPdfRenderCache:
+
+    def test_renders_once_per_key(self, cache):
+        calls = []
+
+        def render():
+            calls.append(1)
+            return b'%PDF-1.7 test'
+
+        key = cache.make_key('print_property.html', 'v1', '42', 1, 'note', ('2025-01-01', None))
+        first = cache.get_or_render(key, render)
+        second = cache.get_or_render(key, render)
+        assert first == second
+        assert len(calls) == 1
+        with open(first, 'rb') as f:
+            assert f.read() == b'%PDF-1.7 test'
+
+    def test_key_changes_with_inputs(self, cache):
+        base = ('print_property.html', 'v1', '42', 1, 'note', ('2025-01-01', None))
+        assert cache.make_key(*base) == cache.make_key(*base)
+        assert cache.make_key(*base) != cache.make_key(*base[:4], 'other note', base[5])
+        assert cache.make_key(*base) != cache.make_key(*base[:5], ('2025-01-02', None))
+
+    def test_concurrent_misses_render_once(self, cache):
+        gate = threading.Event()
+        calls = []
+
+        def render():
+            calls.append(1)
+            gate.wait(2)
+            return b'%PDF'
+
+        key = cache.make_key('concurrent')
+        threads = [threading.Thread(target=cache.get_or_render, args=(key, render)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        gate.set()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+
+    def test_failed_render_is_not_cached(self, cache):
+        key = cache.make_key('broken')
+
+        def render():
+            raise LookupError('missing')
+
+        with pytest.raises(LookupError):
+            cache.get_or_render(key, render)
+        assert cache.get(key) is None
+
+    def test_eviction_removes_oldest(self, cache):
+        old = cache.put(cache.make_key('old'), b'x' * 1000)
+        new = cache.put(cache.make_key('new'), b'y' * 1000)
+        os.utime(old, (1, 1))
+        cache.max_bytes = 1500
+        cache.evict(target_ratio=1.0)
+        assert not os.path.exists(old)
+        assert os.path.exists(new)
+
+    def test_template_version_follows_source(self, cache):
+        templates = {'print_property.html': '<h1>{{ property.id }}</h1>'}
+        app = Flask(__name__)
+        app.jinja_loader = DictLoader(templates)
+        with app.app_context():
+            first = cache.template_version('print_property.html')
+            templates['print_property.html'] = '<h2>{{ property.id }}</h2>'
+            assert cache.template_version('print_property.html') != first
+
+    def test_template_version_follows_included_templates(self, cache, tmp_path):
+        (tmp_path / 'base.html').write_text('<html>{% block body %}{% endblock %}</html>')
+        (tmp_path / 'photos.html').write_text('<img>')
+        (tmp_path / 'print_property.html').write_text(
+            '{% extends "base.html" %}{% block body %}{% include "photos.html" %}{% endblock %}')
+        app = Flask(__name__)
+        app.jinja_loader = FileSystemLoader(str(tmp_path))
+        with app.app_context():
+            first = cache.template_version('print_property.html')
+            assert cache.template_version('print_property.html') == first
+            photos = tmp_path / 'photos.html'
+            photos.write_text('<img class="photo">')
+            os.utime(photos, (os.path.getmtime(photos) + 5,) * 2)
+            second = cache.template_version('print_property.html')
+            assert second != first
+            base = tmp_path / 'base.html'
+            base.write_text('<html lang="ru">{% block body %}{% endblock %}</html>')
+            os.utime(base, (os.path.getmtime(base) + 5,) * 2)
+            assert cache.template_version('print_property.html') not in (first, second)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
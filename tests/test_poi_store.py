@@ -0,0 +1,116 @@
+"""
+Unit tests for PoiStore
+Локальная выгрузка POI вместо запросов Overpass по каждому ЖК
+"""
+
+import json
+import pytest
+import nearby_places
+from services.poi_store import PoiStore, build_region_query, region_bbox
+
+
+CENTER = (45.0355, 38.9753)
+
+
+def node(osm_id, lat, lon, **tags):
+    return {'type': 'node', 'id': osm_id, 'lat': lat, 'lon': lon, 'tags': tags}
+
+
+def way(osm_id, lat, lon, **tags):
+    return {'type': 'way', 'id': osm_id, 'center': {'lat': lat, 'lon': lon}, 'tags': tags}
+
+
+def relation(osm_id, lat, lon, **tags):
+    return {'type': 'relation', 'id': osm_id, 'center': {'lat': lat, 'lon': lon}, 'tags': tags}
+
+
+ELEMENTS = [
+    node(1, 45.0360, 38.9753, highway='bus_stop', name='Остановка 1'),
+    node(2, 45.0400, 38.9753, highway='bus_stop', name='Остановка 1'),   # дубль дальше
+    node(3, 45.0370, 38.9760, highway='bus_stop'),                      # без названия
+    way(4, 45.0300, 38.9700, amenity='school', name='Школа 5'),
+    way(5, 45.0310, 38.9710, leisure='park', amenity='school', name='Парк при школе'),
+    node(6, 45.0320, 38.9800, leisure='park', name='Парк Победы'),
+    node(7, 45.2000, 38.9753, shop='supermarket', name='Далеко'),        # ~18 км
+    node(8, 45.0356, 38.9754, **{'sport': 'swimming', 'name:ru': 'Бассейн Дельфин'}),
+    relation(9, 45.0330, 38.9790, shop='mall', name='ТЦ Галерея'),
+    {'type': 'relation', 'id': 10, 'tags': {'shop': 'mall', 'name': 'Без центра'}},
+] + [
+    node(100 + i, 45.0355 + i * 0.001, 38.9753, amenity='pharmacy', name=f'Аптека {i}') for i in range(8)
+]
+
+
+@pytest.fixture
+def extract_path(tmp_path):
+    path = tmp_path / 'poi_extract.json'
+    path.write_text(json.dumps({'elements': ELEMENTS}, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def store(extract_path):
+    return PoiStore.load(extract_path)
+
+
+class TestPoiStore:
+
+    def test_categories_and_dedup(self, store):
+        nearby = store.nearby(*CENTER, radius_meters=3000)
+        assert [p['name'] for p in nearby['transport']] == ['Остановка 1']
+        assert nearby['transport'][0]['distance'] < 100
+        assert sorted(p['name'] for p in nearby['education']) == ['Парк при школе', 'Школа 5']
+        # Школьный парк не попадает в «Досуг»
+        assert [p['name'] for p in nearby['leisure']] == ['Парк Победы']
+        assert nearby['sport'][0]['name'] == 'Бассейн Дельфин'
+        assert [p['name'] for p in nearby['shopping']] == ['ТЦ Галерея']
+        assert 'updated_at' in nearby
+
+    def test_top_five_nearest(self, store):
+        pharmacies = store.nearby(*CENTER, radius_meters=3000)['healthcare']
+        assert [p['name'] for p in pharmacies] == [f'Аптека {i}' for i in range(5)]
+        assert [p['distance'] for p in pharmacies] == sorted(p['distance'] for p in pharmacies)
+
+    def test_radius_is_respected(self, store):
+        assert store.nearby(*CENTER, radius_meters=50)['healthcare'][0]['name'] == 'Аптека 0'
+        assert len(store.nearby(*CENTER, radius_meters=50)['healthcare']) == 1
+
+    def test_matches_overpass_path(self, store, monkeypatch):
+        def fake_batch(lat, lon, radius, tags_list):
+            return nearby_places.parse_overpass_elements(ELEMENTS, tags_list)
+
+        monkeypatch.setattr(nearby_places, '_query_overpass_batch', fake_batch)
+        remote = nearby_places.fetch_nearby_places(*CENTER, radius_meters=3000)
+        local = store.nearby(*CENTER, radius_meters=3000)
+        for category in PoiStore.CATEGORIES:
+            assert [(p['name'], p['type']) for p in local[category]] == \
+                [(p['name'], p['type']) for p in remote[category]]
+            assert all(abs(a['distance'] - b['distance']) <= 1
+                       for a, b in zip(local[category], remote[category]))
+
+    def test_nearby_many(self, store):
+        result = store.nearby_many([(1, *CENTER), (2, 45.2, 38.9753)], radius_meters=1000)
+        assert result[1]['transport'] and not result[2]['transport']
+        assert result[2]['shopping'][0]['name'] == 'Далеко'
+
+    def test_nearby_many_matches_nearby(self, store):
+        points = [(i, 45.0355 + i * 0.002, 38.9753 - i * 0.001) for i in range(-3, 4)]
+        points += [('far', 45.2, 38.9753), ('empty', 50.0, 30.0)]
+        for radius in (50, 1000, 3000):
+            many = store.nearby_many(points, radius_meters=radius)
+            assert list(many) == [key for key, _, _ in points]
+            for key, lat, lon in points:
+                single = store.nearby(lat, lon, radius_meters=radius)
+                for category in PoiStore.CATEGORIES:
+                    assert many[key][category] == single[category]
+        assert store.nearby_many([]) == {}
+
+    def test_region_query_and_bbox(self):
+        bbox = region_bbox([(45.0, 39.0), (45.1, 39.2), (None, None)], pad_meters=1000)
+        assert bbox[0] < 45.0 and bbox[2] > 45.1 and bbox[1] < 39.0 and bbox[3] > 39.2
+        query = build_region_query(bbox)
+        assert 'nwr["amenity"~"^(' in query and 'out center' in query
+        assert region_bbox([]) is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,128 @@
+"""
+Unit tests for PresentationJobQueue
+Статус в общем хранилище, сборка ZIP, переиспользование готовых PDF
+"""
+
+import os
+import threading
+import time
+import zipfile
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from services.presentation_jobs import (
+    JobStore, PresentationJobQueue, presentation_fingerprint, STAGE_COMPLETE, STAGE_ERROR
+)
+
+
+def fake_pdf(html, base_url, out_path):
+    with open(out_path, 'wb') as f:
+        f.write(b'%PDF-1.7\n' + html.encode('utf-8'))
+    return out_path
+
+
+def render_html(item):
+    if item.get('missing'):
+        return None
+    return f"property_{item['property_id']}.pdf", f"<h1>Квартира {item['property_id']}</h1>"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs'))
+
+
+@pytest.fixture
+def queue(store):
+    return PresentationJobQueue(store, executor=ThreadPoolExecutor(max_workers=2), renderer=fake_pdf)
+
+
+def run(queue, items, fingerprint='v1'):
+    queue.submit('presentation_1', fingerprint, items, render_html, 'http://localhost/')
+    return queue.wait('presentation_1', timeout=60, interval=0.05)
+
+
+class TestPresentationJobQueue:
+
+    def test_builds_zip_with_all_properties(self, queue):
+        items = [{'property_id': 1}, {'property_id': 2}, {'property_id': 3, 'missing': True}]
+        status = run(queue, items)
+
+        assert status['stage'] == STAGE_COMPLETE
+        assert status['progress'] == 100
+        path, _ = queue.artifact('presentation_1')
+        with zipfile.ZipFile(path) as zipf:
+            assert sorted(zipf.namelist()) == ['property_1.pdf', 'property_2.pdf']
+            assert zipf.read('property_1.pdf').startswith(b'%PDF')
+
+    def test_status_is_shared_between_instances(self, queue, store):
+        run(queue, [{'property_id': 1}])
+        other_worker = PresentationJobQueue(JobStore(store.root), executor=ThreadPoolExecutor(max_workers=1),
+                                            renderer=fake_pdf)
+        assert other_worker.status('presentation_1')['stage'] == STAGE_COMPLETE
+        assert other_worker.artifact('presentation_1') is not None
+
+    def test_same_fingerprint_reuses_archive(self, queue):
+        first = run(queue, [{'property_id': 1}])
+        again = queue.submit('presentation_1', 'v1', [{'property_id': 1}], render_html, 'http://localhost/')
+        assert again['updated_at'] == first['updated_at']
+
+    def test_new_fingerprint_reuses_rendered_parts(self, queue, store):
+        run(queue, [{'property_id': 1}, {'property_id': 2}])
+        parts_before = sorted(os.listdir(store.parts_dir))
+
+        status = run(queue, [{'property_id': 1}, {'property_id': 2}, {'property_id': 4}], fingerprint='v2')
+        assert status['stage'] == STAGE_COMPLETE
+        parts_after = sorted(os.listdir(store.parts_dir))
+        assert set(parts_before) <= set(parts_after)
+        assert len(parts_after) == 3
+
+    def test_no_renderable_items_is_error(self, queue):
+        status = run(queue, [{'property_id': 1, 'missing': True}])
+        assert status['stage'] == STAGE_ERROR
+        assert queue.artifact('presentation_1') is None
+
+    def test_fingerprint_depends_on_notes(self):
+        assert presentation_fingerprint([{'property_id': 1, 'manager_note': 'a'}]) != \
+            presentation_fingerprint([{'property_id': 1, 'manager_note': 'b'}])
+
+
+class TestDownloadAllEndpoint:
+
+    def test_returns_202_without_waiting_for_render(self, store, monkeypatch):
+        import app as app_module
+        from types import SimpleNamespace
+        from services import presentation_jobs
+
+        release = threading.Event()
+
+        def slow_pdf(html, base_url, out_path):
+            release.wait(10)
+            return fake_pdf(html, base_url, out_path)
+
+        queue = PresentationJobQueue(store, executor=ThreadPoolExecutor(max_workers=1), renderer=slow_pdf)
+        presentation = SimpleNamespace(id=1, title='Тест')
+        monkeypatch.setattr(presentation_jobs, '_presentation_jobs', queue)
+        monkeypatch.setattr(app_module, '_find_public_presentation', lambda unique_id: presentation)
+        monkeypatch.setattr(app_module, '_submit_presentation_job', lambda presentation, base_url: queue.submit(
+            'presentation_1', 'v1', [{'property_id': 1}], render_html, base_url, download_name='p.zip'))
+
+        client = app_module.app.test_client()
+        started = time.time()
+        response = client.get('/presentation/view/abc/download-all')
+        assert time.time() - started < 5
+        assert response.status_code == 202
+        job = response.get_json()
+        assert job['job_id'] == 'presentation_1'
+        assert response.headers['Location'].endswith(job['status_url'])
+        assert client.get(job['download_url']).status_code == 404
+
+        release.set()
+        assert queue.wait('presentation_1', timeout=30, interval=0.05)['stage'] == STAGE_COMPLETE
+        response = client.get('/presentation/view/abc/download-all')
+        assert response.status_code == 200 and response.get_json()['stage'] == STAGE_COMPLETE
+        download = client.get(job['download_url'])
+        assert download.status_code == 200 and download.mimetype == 'application/zip'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
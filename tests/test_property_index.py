@@ -0,0 +1,170 @@
+"""
+Unit tests for PropertyIndex
+Проверка векторных фильтров, сортировки и инкрементального обновления
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from services.property_index import PropertyIndex
+
+
+BASE_TIME = datetime(2025, 1, 1, 12, 0, 0)
+
+
+def make_row(pid, price, area, rooms, floor=3, total_floors=10, complex_id=1, developer_id=1,
+             district_id=1, building='Литер 1', building_type='монолит', renovation='no_renovation',
+             deal_type='Первичка', is_active=True, created_offset=0, updated_offset=0,
+             latitude=45.035, longitude=38.975):
+    return (
+        pid, price, area, rooms, floor, total_floors,
+        complex_id, developer_id, district_id,
+        building, building_type, renovation, deal_type,
+        is_active,
+        BASE_TIME + timedelta(days=created_offset),
+        BASE_TIME + timedelta(minutes=updated_offset),
+        latitude, longitude,
+    )
+
+
+@pytest.fixture
+def lookups():
+    return {
+        'complexes': [
+            (1, 'ЖК Солнечный', 2024, 5.0, 'Комфорт'),
+            (2, 'ЖК Морской', 2027, 0.0, 'Бизнес'),
+        ],
+        'developers': [(1, 'ССК'), (2, 'Неометрия')],
+        'districts': [(1, 'Центральный'), (2, 'Прикубанский')],
+    }
+
+
+@pytest.fixture
+def index(lookups):
+    rows = [
+        make_row(1, 5_000_000, 35.0, 1, floor=1, created_offset=1),
+        make_row(2, 7_500_000, 55.0, 2, floor=10, total_floors=10, created_offset=2),
+        make_row(3, 4_000_000, 25.0, 0, complex_id=2, developer_id=2, district_id=2,
+                 renovation='fine_finish', created_offset=3),
+        make_row(4, 12_000_000, 90.0, 3, complex_id=2, developer_id=2, district_id=2,
+                 building='Литер 2', created_offset=4),
+        make_row(5, None, 40.0, 1, created_offset=5),
+        make_row(6, 6_000_000, 45.0, 1, is_active=False),
+    ]
+    idx = PropertyIndex()
+    idx.load(rows, lookups)
+    return idx
+
+
+class TestPropertyIndexFilters:
+    """Фильтры должны совпадать с PropertyRepository.get_all_active()"""
+
+    def test_no_filters_excludes_inactive(self, index):
+        ids, total = index.query({}, limit=50)
+        assert total == 5
+        assert 6 not in ids
+
+    def test_price_range(self, index):
+        assert index.count({'min_price': 4_500_000, 'max_price': 8_000_000}) == 2
+
+    def test_rooms_accept_strings(self, index):
+        ids, total = index.query({'rooms': ['0', 3, 'x']})
+        assert sorted(ids) == [3, 4]
+        assert total == 2
+
+    def test_floor_options(self, index):
+        ids, _ = index.query({'floor_options': ['not_first', 'not_last']})
+        assert sorted(ids) == [3, 4, 5]
+
+    def test_relations_by_name(self, index):
+        assert index.count({'developer': 'Неометрия'}) == 2
+        assert index.count({'developers': ['1']}) == 3
+        assert index.count({'developers': ['ССК', 'Неометрия']}) == 5
+        assert index.count({'districts': ['Прикубанский']}) == 2
+        assert index.count({'residential_complex': 'ЖК Солнечный'}) == 3
+        assert index.count({'building': 'Литер 2'}) == 1
+        assert index.count({'district': 'Несуществующий'}) == 0
+
+    def test_complex_attributes(self, index):
+        assert index.count({'cashback_only': True}) == 3
+        assert index.count({'build_year_min': 2025}) == 2
+        assert index.count({'delivery_years': [2024]}) == 3
+        assert index.count({'object_classes': ['Бизнес']}) == 2
+        assert index.count({'building_released': ['в строительстве']}) == 2
+
+    def test_renovation_and_unknown_values(self, index):
+        assert index.count({'renovation': ['fine_finish']}) == 1
+        assert index.count({'renovation': ['unknown']}) == 0
+
+    def test_search_falls_back_to_sql(self, index):
+        assert index.query({'search': 'Солнечный'}) is None
+        assert index.count({'search': 'Солнечный'}) is None
+
+
+class TestPropertyIndexSorting:
+
+    def test_price_asc_nulls_last(self, index):
+        ids, _ = index.query({}, sort_by='price', sort_order='asc')
+        assert ids == [3, 1, 2, 4, 5]
+
+    def test_price_desc_nulls_first(self, index):
+        ids, _ = index.query({}, sort_by='price', sort_order='desc')
+        assert ids == [5, 4, 2, 1, 3]
+
+    def test_pagination(self, index):
+        ids, total = index.query({}, sort_by='area', sort_order='asc', limit=2, offset=2)
+        assert ids == [5, 2]
+        assert total == 5
+
+    def test_date_desc(self, index):
+        ids, _ = index.query({}, sort_by='date', sort_order='desc', limit=2)
+        assert ids == [5, 4]
+
+
+class TestPropertyIndexIncremental:
+
+    def test_apply_changes_updates_and_appends(self, index):
+        index.apply_changes([
+            make_row(1, 9_000_000, 35.0, 1, updated_offset=10),
+            make_row(7, 3_000_000, 20.0, 0, updated_offset=11),
+            make_row(4, 12_000_000, 90.0, 3, complex_id=2, is_active=False, updated_offset=12),
+        ])
+        ids, total = index.query({}, sort_by='price', sort_order='asc')
+        assert total == 5
+        assert ids == [7, 3, 2, 1, 5]
+        assert index._snapshot.watermark == BASE_TIME + timedelta(minutes=12)
+
+    def test_new_categorical_values_are_encoded(self, index):
+        index.apply_changes([make_row(8, 3_500_000, 30.0, 1, renovation='design_repair', updated_offset=5)])
+        assert index.count({'renovation': ['design_repair']}) == 1
+        assert index.count({'renovation': ['fine_finish']}) == 1
+
+    def test_refresh_skips_fetch_when_signature_is_unchanged(self, lookups):
+        rows = [make_row(1, 5_000_000, 35.0, 1), make_row(2, 7_500_000, 55.0, 2, updated_offset=1)]
+        fetches = []
+
+        def fetch_rows(since=None):
+            fetches.append(since)
+            return [row for row in rows if since is None or row[15] >= since]
+
+        def signature():
+            return (len(rows), max(row[15] for row in rows), 2, None, 2, 2)
+
+        idx = PropertyIndex()
+        idx._fetch_property_rows = fetch_rows
+        idx._fetch_lookups = lambda: lookups
+        idx._fetch_signature = signature
+
+        idx.refresh()
+        idx.refresh()
+        idx.refresh()
+        assert fetches == [None]
+
+        rows[0] = make_row(1, 4_000_000, 35.0, 1, updated_offset=2)
+        idx.refresh()
+        idx.refresh()
+        assert fetches == [None, BASE_TIME + timedelta(minutes=1)]
+        assert idx.count({'max_price': 4_500_000}) == 1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,136 @@
+"""
+Unit tests for keyset pagination
+Курсорные страницы каталога: полный порядок (колонка, id) с повторами и NULL,
+одинаковый порядок в SQL и PropertyIndex, устойчивость к смене цен между страницами
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+import app  # noqa: F401 — репозиторий берёт db из app, app импортирует репозиторий
+from models import db, Property
+from repositories.property_repository import (InvalidCursor, PropertyRepository, decode_cursor, encode_cursor,
+                                              normalize_sort)
+from services.property_index import PropertyIndex
+
+BASE_TIME = datetime(2025, 1, 1, 12, 0, 0)
+# Повторяющиеся цены и площади, NULL — всё, на чём OFFSET терял и дублировал строки
+PRICES = [5_000_000, 4_000_000, None, 5_000_000, 7_000_000, 5_000_000, None, 4_000_000, 9_000_000, 5_000_000,
+          6_000_000]
+AREAS = [35.0, 35.0, 50.0, None, 35.0, 42.0, 42.0, None, 60.0, 35.0, 50.0]
+SORTS = [(sort_by, sort_order) for sort_by in ('price', 'area', 'date') for sort_order in ('asc', 'desc')]
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[db.metadata.tables['properties']])
+    with Session(engine) as session:
+        for pid, (price, area) in enumerate(zip(PRICES, AREAS), start=1):
+            session.add(Property(id=pid, title=f'#{pid}', price=price, area=area, is_active=True,
+                                 created_at=BASE_TIME + timedelta(days=pid % 4)))
+        session.add(Property(id=99, title='снята', price=1, area=1.0, is_active=False, created_at=BASE_TIME))
+        session.commit()
+        yield session
+
+
+@pytest.fixture
+def index():
+    rows = [
+        (pid, price, area, 1, 3, 10, 1, 1, 1, 'Литер 1', 'монолит', 'no_renovation', 'Первичка', True,
+         BASE_TIME + timedelta(days=pid % 4), BASE_TIME, 45.0, 38.9)
+        for pid, (price, area) in enumerate(zip(PRICES, AREAS), start=1)
+    ]
+    idx = PropertyIndex()
+    idx.load(rows, {'complexes': [], 'developers': [], 'districts': []})
+    return idx
+
+
+def sql_pages(session, sort_by, sort_order, limit, mutate=None):
+    """Пролистать каталог курсорами, как это делает get_active_keyset() без PropertyIndex"""
+    seen, cursor = [], None
+    while True:
+        query = session.query(Property).filter(Property.is_active == True).order_by(
+            *PropertyRepository.sort_clause(sort_by, sort_order))
+        if cursor:
+            after = decode_cursor(cursor, sort_by, sort_order)
+            page = PropertyRepository.keyset_page(query, sort_by, sort_order, after, limit + 1)
+        else:
+            page = query.limit(limit + 1).all()
+        seen += [prop.id for prop in page[:limit]]
+        if len(page) <= limit:
+            return seen
+        cursor = PropertyRepository.cursor_for(page[limit - 1], sort_by, sort_order)
+        if mutate:
+            mutate(session)
+
+
+def index_pages(index, session, sort_by, sort_order, limit):
+    seen, after = [], None
+    while True:
+        ids = index.query_after({}, sort_by=sort_by, sort_order=sort_order, limit=limit, after=after)
+        if not ids:
+            return seen
+        seen += ids
+        last = session.get(Property, ids[-1])
+        after = decode_cursor(PropertyRepository.cursor_for(last, sort_by, sort_order), sort_by, sort_order)
+
+
+class TestKeysetPagination:
+
+    @pytest.mark.parametrize('sort_by,sort_order', SORTS)
+    def test_cursor_pages_cover_catalogue_once(self, session, sort_by, sort_order):
+        full = [prop.id for prop in session.query(Property).filter(Property.is_active == True).order_by(
+            *PropertyRepository.sort_clause(sort_by, sort_order))]
+        assert sorted(full) == list(range(1, len(PRICES) + 1))
+        for limit in (1, 2, 3, 5):
+            assert sql_pages(session, sort_by, sort_order, limit) == full
+
+    @pytest.mark.parametrize('sort_by,sort_order', SORTS)
+    def test_index_matches_sql_order(self, session, index, sort_by, sort_order):
+        full = sql_pages(session, sort_by, sort_order, limit=100)
+        assert index.query({}, sort_by=sort_by, sort_order=sort_order, limit=100)[0] == full
+        assert index_pages(index, session, sort_by, sort_order, limit=3) == full
+
+    def test_price_changes_between_pages_do_not_skip(self, session):
+        """
+        Показанные квартиры подешевели между страницами: OFFSET сдвинулся бы
+        и пропустил строки, курсор продолжает с того же места
+        """
+        before = sql_pages(session, 'price', 'asc', limit=100)
+
+        def reprice(session):
+            for prop in session.query(Property).filter(Property.id.in_(before[:3])):
+                prop.price = 1
+            session.commit()
+
+        assert sql_pages(session, 'price', 'asc', limit=3, mutate=reprice) == before
+
+    @pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+    def test_deep_page_is_an_index_range(self, session, sort_order):
+        """Страница после курсора — SEARCH по (колонка, id) без SCAN индекса и сортировки остатка"""
+        query = session.query(Property.id).filter(Property.is_active == True).filter(
+            PropertyRepository.keyset_condition('price', sort_order, (5_000_000, 4))).order_by(
+            *PropertyRepository.sort_clause('price', sort_order)).limit(3)
+        sql = str(query.statement.compile(session.get_bind(), compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(row[-1] for row in session.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+        assert 'SEARCH' in plan and 'SCAN' not in plan and 'TEMP B-TREE' not in plan
+
+    def test_cursor_validation(self):
+        cursor = encode_cursor('date', 'desc', BASE_TIME, 7)
+        assert decode_cursor(cursor, 'date', 'desc') == (BASE_TIME, 7)
+        assert decode_cursor(encode_cursor('price', 'asc', None, 3), 'price', 'asc') == (None, 3)
+        with pytest.raises(InvalidCursor):
+            decode_cursor(cursor, 'price', 'desc')
+        for broken in ('!!!', 'e30', encode_cursor('price', 'asc', 'abc', 1)):
+            with pytest.raises(InvalidCursor):
+                decode_cursor(broken, 'price', 'asc')
+        assert normalize_sort('rooms', 'desc') == ('price', 'asc')
+        assert normalize_sort('area', 'DESC') == ('area', 'asc')
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,130 @@
+"""
+Unit tests for PropertySnapshot / PropertySnapshotStore
+"""
+
+import copy
+import json
+import pytest
+from services import property_snapshot
+from services.property_snapshot import PropertySnapshot, PropertySnapshotStore
+
+
+@pytest.fixture
+def records():
+    return [
+        {'id': 'A1', 'price': 5_000_000, 'district': 'Центральный', 'coordinates': {'lat': 45.0, 'lng': 38.9}},
+        {'id': 'B2', 'price': 7_000_000, 'district': 'Центральный', 'coordinates': {'lat': 45.1, 'lng': 39.0}},
+    ]
+
+
+class TestPropertySnapshot:
+
+    def test_behaves_like_list_of_dicts(self, records):
+        snapshot = PropertySnapshot(records, version=1)
+        assert len(snapshot) == 2
+        assert snapshot[0] == records[0]
+        assert snapshot[-1]['id'] == 'B2'
+        assert [p['price'] for p in snapshot] == [5_000_000, 7_000_000]
+        assert snapshot[:1] == [records[0]]
+        assert snapshot.copy() == records
+
+    def test_records_are_shared_and_read_only(self, records):
+        snapshot = PropertySnapshot(records)
+        prop = snapshot[0]
+        assert snapshot[0] is prop and next(iter(snapshot)) is prop and snapshot.get_by_id('A1') is prop
+        with pytest.raises(TypeError):
+            prop['cashback'] = 1
+        with pytest.raises(TypeError):
+            prop['coordinates']['lat'] = 0
+        assert snapshot[0] == records[0]
+
+        # Дописать поля можно только в копию отобранной записи
+        own = dict(prop)
+        own['cashback'] = 1
+        assert 'cashback' not in snapshot[0]
+        assert copy.deepcopy(prop) == records[0] and type(copy.deepcopy(prop)) is dict
+
+    def test_repeated_strings_are_shared(self, records):
+        snapshot = PropertySnapshot(records)
+        assert snapshot[0]['district'] is snapshot[1]['district']
+
+    def test_get_by_id(self, records):
+        snapshot = PropertySnapshot(records)
+        assert snapshot.get_by_id('B2')['price'] == 7_000_000
+        assert snapshot.get_by_id('missing') is None
+
+    def test_json_blob_and_etag_are_stable(self, records):
+        snapshot = PropertySnapshot(records)
+        assert json.loads(snapshot.to_json_bytes()) == records
+        assert snapshot.to_json_bytes() is snapshot.to_json_bytes()
+        assert snapshot.etag == PropertySnapshot(records).etag
+
+
+class TestPropertySnapshotStore:
+
+    def test_rebuilds_only_when_version_changes(self, records):
+        version = {'value': 1}
+        builds = []
+
+        def builder():
+            builds.append(1)
+            return records
+
+        store = PropertySnapshotStore(builder, version_fetcher=lambda: version['value'], check_interval=0)
+        first = store.get()
+        assert store.get() is first
+        assert len(builds) == 1
+
+        version['value'] = 2
+        second = store.get()
+        assert second is not first
+        assert len(builds) == 2
+
+    def test_invalidate(self, records):
+        store = PropertySnapshotStore(lambda: records, version_fetcher=lambda: 1, check_interval=60)
+        first = store.get()
+        store.invalidate()
+        assert store.get() is not first
+
+    def test_failed_refresh_keeps_previous_snapshot(self, records, monkeypatch):
+        state = {'version': 1, 'fail': False}
+        calls = []
+
+        def version_fetcher():
+            calls.append(1)
+            if state['fail']:
+                raise RuntimeError('database is down')
+            return state['version']
+
+        clock = {'now': 1000.0}
+        monkeypatch.setattr(property_snapshot.time, 'time', lambda: clock['now'])
+        store = PropertySnapshotStore(lambda: records, version_fetcher=version_fetcher, check_interval=30)
+        first = store.get()
+        state['fail'] = True
+        clock['now'] += 31
+        assert store.get() is first
+        # Следующая попытка — не раньше check_interval
+        clock['now'] += 10
+        assert store.get() is first
+        assert (len(calls), store.stats['errors']) == (2, 1)
+
+        state.update(fail=False, version=2)
+        clock['now'] += 31
+        assert store.get() is not first and store.stats['builds'] == 2
+
+    def test_failed_first_build_returns_empty_snapshot(self, records):
+        outcome = {'fail': True}
+
+        def builder():
+            if outcome['fail']:
+                raise RuntimeError('database is down')
+            return records
+
+        store = PropertySnapshotStore(builder, version_fetcher=lambda: 1, check_interval=60)
+        assert len(store.get()) == 0
+        outcome['fail'] = False
+        assert len(store.get()) == 2
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
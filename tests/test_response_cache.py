@@ -0,0 +1,179 @@
+"""
+Unit tests for response_cache
+Общий кэш ответов: SQLite-backend между процессами, теги, stale-while-revalidate,
+склейка одновременных промахов и сброс тегов после commit
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify, request
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import db, Developer, Property, ResidentialComplex
+from services import response_cache
+from services.response_cache import (TAG_CATALOGUE, SQLiteCache, TaggedCache, complex_tag, property_tag,
+                                     setup_response_cache_tracking, tags_for)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'response_cache.sqlite')
+
+
+class TestSQLiteCache:
+
+    def test_shared_between_instances(self, cache_path):
+        first, second = SQLiteCache(cache_path), SQLiteCache(cache_path)
+        first.set('k', {'a': 1}, timeout=60)
+        assert second.get('k') == {'a': 1}
+        assert second.get_many('k', 'missing') == [{'a': 1}, None]
+
+        assert first.add('lock', 1, timeout=60) is True
+        assert second.add('lock', 1, timeout=60) is False
+        first.set('old', 1, timeout=-1)  # уже истёк — add его перезаписывает
+        assert second.add('old', 2) is True and first.get('old') == 2
+
+        assert second.inc('counter') == 1 and first.inc('counter', 5) == 6
+        assert first.delete('k') and second.get('k') is None
+
+
+class TestTaggedCache:
+
+    def test_tags_and_stale_while_revalidate(self, cache_path):
+        cache = TaggedCache(SQLiteCache(cache_path))
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        assert cache.fetch('list', compute, ttl=60, tags=[TAG_CATALOGUE]) == (1, 'miss')
+        assert cache.fetch('list', compute, ttl=60, tags=[TAG_CATALOGUE]) == (1, 'hit')
+        assert cache.fetch('one', compute, ttl=60, tags=[property_tag(5)]) == (2, 'miss')
+
+        # Другой процесс сбрасывает тег — запись становится промахом, соседняя живёт
+        TaggedCache(SQLiteCache(cache_path)).invalidate(TAG_CATALOGUE)
+        assert cache.fetch('list', compute, ttl=60, tags=[TAG_CATALOGUE]) == (3, 'miss')
+        assert cache.fetch('one', compute, ttl=60, tags=[property_tag(5)]) == (2, 'hit')
+
+        # Истёкший ttl: пока кто-то пересчитывает, остальным — старое значение
+        assert cache.fetch('swr', compute, ttl=0.01, stale_ttl=60) == (4, 'miss')
+        time.sleep(0.02)
+        assert cache.backend.add('rc:swr:lock', 1, timeout=30)
+        assert cache.fetch('swr', compute, ttl=60) == (4, 'stale')
+        cache.backend.delete('rc:swr:lock')
+        assert cache.fetch('swr', compute, ttl=60) == (5, 'refresh')
+        assert cache.fetch('swr', compute, ttl=60) == (5, 'hit')
+
+    def test_concurrent_misses_are_coalesced(self, cache_path):
+        cache = TaggedCache(SQLiteCache(cache_path), poll_interval=0.01)
+        calls, states = [], []
+        start = threading.Barrier(5)
+
+        def slow_compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'result'
+
+        def worker():
+            start.wait()
+            states.append(cache.fetch('heavy', slow_compute, ttl=60))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert sorted(state for _, state in states) == ['coalesced'] * 4 + ['miss']
+        assert {value for value, _ in states} == {'result'}
+
+    def test_cached_view(self, cache_path):
+        cache = TaggedCache(SQLiteCache(cache_path))
+        app = Flask(__name__)
+        calls = []
+
+        @app.route('/api/item/<int:item_id>')
+        @cache.cached_view(ttl=60, tags=lambda item_id: [property_tag(item_id)])
+        def item(item_id):
+            calls.append(item_id)
+            if item_id == 0:
+                return jsonify({'error': 'not found'}), 404
+            return jsonify({'id': item_id, 'q': request.args.get('q')})
+
+        client = app.test_client()
+        assert client.get('/api/item/1?q=a').headers['X-Cache'] == 'MISS'
+        response = client.get('/api/item/1?q=a')
+        assert response.headers['X-Cache'] == 'HIT' and response.get_json() == {'id': 1, 'q': 'a'}
+        assert client.get('/api/item/1?q=b').get_json()['q'] == 'b'
+        assert client.get('/api/item/0').status_code == 404
+        assert client.get('/api/item/0').status_code == 404
+        assert calls == [1, 1, 0, 0]
+
+        cache.invalidate(property_tag(1))
+        assert client.get('/api/item/1?q=a').headers['X-Cache'] == 'MISS'
+
+
+class TestInvalidationTracking:
+
+    def test_commit_purges_model_tags(self, cache_path, monkeypatch):
+        cache = TaggedCache(SQLiteCache(cache_path))
+        monkeypatch.setattr(response_cache, '_response_cache', cache)
+        setup_response_cache_tracking()
+        invalidated = []
+        monkeypatch.setattr(cache, 'invalidate', lambda *tags: invalidated.append(set(tags)))
+
+        engine = create_engine('sqlite://')
+        # Все таблицы: на те же события подписаны трекеры complex_stats, slug_registry и др.
+        db.metadata.create_all(engine)
+        with Session(engine) as session:
+            developer = Developer(name='ССК', slug='ssk')
+            session.add(developer)
+            session.flush()
+            first = ResidentialComplex(name='ЖК 1', slug='zhk-1', developer_id=developer.id)
+            second = ResidentialComplex(name='ЖК 2', slug='zhk-2', developer_id=developer.id)
+            session.add_all([first, second])
+            session.flush()
+            flat = Property(title='1-комн', complex_id=first.id, price=5_000_000)
+            session.add(flat)
+            session.commit()
+            assert invalidated.pop() == {TAG_CATALOGUE, complex_tag(first.id), complex_tag(second.id),
+                                         property_tag(flat.id)}
+
+            flat.complex_id = second.id
+            session.commit()
+            assert invalidated.pop() == {TAG_CATALOGUE, property_tag(flat.id), complex_tag(first.id),
+                                         complex_tag(second.id)}
+
+            flat.price = 1
+            session.rollback()
+            session.query(Property).all()
+            session.commit()
+            assert invalidated == []
+
+
+class TestCachedRoutes:
+
+    def test_property_detail_follows_complex_edits(self, monkeypatch):
+        import app as app_module
+
+        data = {'price': 1_000_000, 'cashback_rate': 5.0, 'residential_complex': 'ЖК 1', 'complex_id': 1}
+        monkeypatch.setattr(app_module, 'get_property_by_id', lambda property_id: dict(data))
+        cache, client = app_module.response_cache, app_module.app.test_client()
+        cache.invalidate(property_tag(777))
+
+        assert client.get('/api/property/777').get_json()['cashback'] == 50_000
+        data['cashback_rate'] = 10.0
+        assert client.get('/api/property/777').headers['X-Cache'] == 'HIT'
+
+        # Кэшбек и название — поля ЖК: его commit сбрасывает эти теги, а не property:<id>
+        cache.invalidate(*tags_for(ResidentialComplex(id=1)))
+        response = client.get('/api/property/777')
+        assert response.headers['X-Cache'] == 'MISS' and response.get_json()['cashback'] == 100_000
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
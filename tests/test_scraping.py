@@ -0,0 +1,137 @@
+"""
+Unit tests for scraping
+Асинхронный движок парсеров: условные запросы и offline-кэш, продолжение
+по контрольной точке, ретраи и лимиты на хост
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from services.scraping import AsyncScraper, Checkpoint, HostPolicy, HttpCache, ScrapeRequest, TokenBucket
+
+API = 'https://api.example.test/flats'
+
+
+def page(number):
+    return ScrapeRequest(API, {'page': number}, meta={'page': number})
+
+
+def parse_pages(request, response):
+    data = response.json()
+    for item in data['items']:
+        yield {'inner_id': item, 'price': 1_000_000}
+    if data['next']:
+        yield page(data['next'])
+
+
+def pages_handler(calls, last_page=3):
+    def handler(request):
+        number = int(request.url.params['page'])
+        calls.append(number)
+        body = {'items': [f'{number}-a', f'{number}-b'], 'next': number + 1 if number < last_page else None}
+        return httpx.Response(200, json=body)
+    return handler
+
+
+class TestHttpCache:
+
+    def test_conditional_requests_and_offline_replay(self, tmp_path):
+        seen_headers = []
+
+        def handler(request):
+            seen_headers.append(request.headers.get('if-none-match'))
+            if request.headers.get('if-none-match') == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, json={'items': ['x'], 'next': None}, headers={'ETag': '"v1"'})
+
+        cache = HttpCache(str(tmp_path / 'cache'))
+        first = AsyncScraper(parse_pages, cache=cache, transport=httpx.MockTransport(handler))
+        assert first.run_sync([page(1)])['fetched'] == 1
+        second = AsyncScraper(parse_pages, cache=cache, transport=httpx.MockTransport(handler))
+        assert second.run_sync([page(1)])['not_modified'] == 1
+        assert seen_headers == [None, '"v1"']
+        assert second.records == first.records == [{'inner_id': 'x', 'price': 1_000_000}]
+
+        def offline_handler(request):
+            raise AssertionError('offline run must not touch the network')
+
+        replay = AsyncScraper(parse_pages, cache=cache, offline=True, transport=httpx.MockTransport(offline_handler))
+        stats = replay.run_sync([page(1), page(2)])
+        assert (stats['cached'], stats['failed']) == (1, 1)
+        assert replay.records == first.records
+
+
+class TestAsyncScraper:
+
+    def test_pagination_streams_batches_and_resumes_from_checkpoint(self, tmp_path):
+        calls, batches = [], []
+        crashed = []
+
+        def flaky_sink(records):
+            if len(batches) == 1 and not crashed:
+                crashed.append(True)
+                raise RuntimeError('db is down')
+            batches.append([record['inner_id'] for record in records])
+
+        checkpoint_path = str(tmp_path / 'state.json')
+        scraper = AsyncScraper(parse_pages, sink=flaky_sink, checkpoint=Checkpoint(checkpoint_path),
+                               batch_size=2, transport=httpx.MockTransport(pages_handler(calls)))
+        stats = scraper.run_sync([page(1)])
+        assert sorted(calls) == [1, 2, 3] and stats['failed'] == 1
+        assert batches == [['1-a', '1-b'], ['3-a', '3-b']]
+        with open(checkpoint_path, encoding='utf-8') as f:
+            assert [item['params'] for item in json.load(f)['pending']] == [{'page': 2}]
+
+        calls.clear()
+        resumed = AsyncScraper(parse_pages, sink=flaky_sink, checkpoint=Checkpoint(checkpoint_path),
+                               batch_size=2, transport=httpx.MockTransport(pages_handler(calls)))
+        stats = resumed.run_sync([page(1)])
+        assert calls == [2] and stats['resumed'] == 1
+        assert batches[-1] == ['2-a', '2-b']
+        assert Checkpoint(checkpoint_path).pending == {}
+
+        # Завершённый проход сбрасывает контрольную точку — следующий запуск начинает с seeds
+        calls.clear()
+        again = AsyncScraper(parse_pages, sink=flaky_sink, checkpoint=Checkpoint(checkpoint_path),
+                             batch_size=2, transport=httpx.MockTransport(pages_handler(calls)))
+        stats = again.run_sync([page(1)])
+        assert sorted(calls) == [1, 2, 3] and stats['records'] == 6
+        assert Checkpoint(checkpoint_path).done == set()
+
+    def test_retries_and_per_host_concurrency(self):
+        active, peak, attempts = [0], [0], {}
+
+        async def handler(request):
+            number = int(request.url.params['page'])
+            attempts[number] = attempts.get(number, 0) + 1
+            if number == 1 and attempts[number] == 1:
+                return httpx.Response(503, headers={'Retry-After': '0'})
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.01)
+            active[0] -= 1
+            return httpx.Response(200, json={'items': [str(number)], 'next': None})
+
+        scraper = AsyncScraper(parse_pages, transport=httpx.MockTransport(handler),
+                               policies={'api.example.test': HostPolicy(concurrency=2, rate=None)})
+        stats = scraper.run_sync([page(n) for n in range(1, 9)])
+        assert (stats['retries'], stats['failed'], len(scraper.records)) == (1, 0, 8)
+        assert peak[0] == 2
+
+    def test_token_bucket_spaces_requests(self):
+        async def take(count):
+            bucket = TokenBucket(rate=50, burst=1)
+            started = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time.monotonic() - started
+
+        assert asyncio.run(take(6)) >= 0.09
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,91 @@
+"""
+Unit tests for slug_registry
+Реестр slug'ов: канонические и старые варианты, 301-кандидаты, промах и
+перестроение после commit
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import db, Developer, District, ResidentialComplex, Street
+from services import slug_registry
+from services.slug_registry import (KIND_COMPLEX, KIND_DEVELOPER, KIND_DISTRICT, KIND_STREET, SlugRegistry,
+                                    normalize_slug)
+
+TABLES = ('developers', 'districts', 'residential_complexes', 'streets')
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in TABLES])
+    with Session(engine) as session:
+        developer = Developer(name='ГК Неометрия', slug='neometriya')
+        district = District(name='Центральный', slug='tsentralnyy')
+        session.add_all([developer, district])
+        session.flush()
+        session.add_all([
+            ResidentialComplex(name='ЖК Кислород', slug='kislorod', developer_id=developer.id),
+            ResidentialComplex(name='Хорошая погода', slug='khoroshaya-pogoda', developer_id=developer.id),
+            Street(name='Красная ул.', slug='krasnaya-ul', district_id=district.id),
+        ])
+        session.commit()
+        yield session
+
+
+class TestSlugRegistry:
+
+    def test_normalize(self):
+        assert normalize_slug('ЖК%20Кислород ') == 'жк-кислород'
+        assert normalize_slug('Krasnaya_ul.') == 'krasnaya-ul'
+
+    def test_canonical_and_legacy_slugs(self, session):
+        registry = SlugRegistry()
+        kislorod = session.query(ResidentialComplex.id).filter_by(slug='kislorod').scalar()
+        assert registry.resolve(KIND_COMPLEX, 'kislorod', session) == (kislorod, 'kislorod')
+        for legacy in ('zhk-kislorod', 'ЖК Кислород', 'жк-кислород', 'KISLOROD', 'ЖК%20Кислород'):
+            assert registry.resolve(KIND_COMPLEX, legacy, session) == (kislorod, 'kislorod')
+        weather = registry.resolve(KIND_COMPLEX, 'horoshaya-pogoda', session)
+        assert weather[1] == 'khoroshaya-pogoda'
+
+        developer_id = session.query(Developer.id).scalar()
+        for legacy in ('neometriya', 'gk-neometriya', 'ГК Неометрия', 'гк-неометрия'):
+            assert registry.resolve(KIND_DEVELOPER, legacy, session) == (developer_id, 'neometriya')
+        street_id = session.query(Street.id).scalar()
+        for legacy in ('krasnaya-ul', 'Красная ул.', 'krasnaya', 'красная'):
+            assert registry.resolve(KIND_STREET, legacy, session) == (street_id, 'krasnaya-ul')
+        assert registry.resolve(KIND_DISTRICT, 'центральный', session)[1] == 'tsentralnyy'
+
+        assert registry.resolve(KIND_COMPLEX, 'net-takogo', session) is None
+        stats = registry.get_stats()
+        assert stats['builds'] == 1 and stats['misses'] == 1 and stats['redirects'] > stats['hits']
+
+    def test_miss_falls_back_to_database_and_rebuilds(self, session):
+        registry = SlugRegistry()
+        registry.build(session)
+        added = ResidentialComplex(name='Новый', slug='novyy', developer_id=None)
+        session.add(added)
+        session.commit()  # изменения из «другого процесса» — трекер сбрасывает только глобальный реестр
+
+        assert registry.resolve(KIND_COMPLEX, 'novyy', session) == (added.id, 'novyy')
+        assert registry.get_stats()['fallback_hits'] == 1
+        assert registry.resolve(KIND_COMPLEX, 'новый', session) == (added.id, 'novyy')
+        assert registry.get_stats()['builds'] == 2
+
+    def test_commit_invalidates_process_registry(self, session, monkeypatch):
+        registry = SlugRegistry()
+        monkeypatch.setattr(slug_registry, '_registry', registry)
+        registry.build(session)
+        session.query(Developer).one().name = 'Неометрия'
+        session.commit()
+        assert registry._built_at is None
+
+        registry.build(session)
+        session.query(Developer).one()  # чтение без изменений не сбрасывает
+        session.commit()
+        assert registry._built_at is not None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
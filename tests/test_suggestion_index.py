@@ -0,0 +1,105 @@
+"""
+Unit tests for SuggestionIndex
+Нормализация, префиксы, транслит, раскладка и опечатки
+"""
+
+import time
+import pytest
+from services.suggestion_index import (
+    SuggestionIndex, SuggestionEntry, normalize_text, to_search_key, swap_layout
+)
+
+
+@pytest.fixture
+def index():
+    idx = SuggestionIndex()
+    idx.load([
+        SuggestionEntry('complex', 1, 'ЖК «Солнечный»', 120),
+        SuggestionEntry('complex', 2, 'ЖК Солнечный город', 40),
+        SuggestionEntry('complex', 3, 'Ёлки Парк', 15),
+        SuggestionEntry('developer', 10, 'ССК', 900),
+        SuggestionEntry('developer', 11, 'Неометрия', 300),
+        SuggestionEntry('district', 20, 'Прикубанский', 500),
+        SuggestionEntry('street', 'Красная улица', 'Красная улица', 30),
+    ], room_counts={0: 5, 1: 10})
+    return idx
+
+
+class TestNormalization:
+
+    def test_normalize_text(self):
+        assert normalize_text('  ЖК «Ёлки-Парк»! ') == 'жк елки парк'
+
+    def test_search_key_is_latin(self):
+        assert to_search_key('Солнечный') == 'solnechnyi'
+        assert to_search_key('Ёлки') == to_search_key('елки')
+
+    def test_swap_layout(self):
+        assert swap_layout('ccr') == 'сск'
+
+
+class TestSuggestionSearch:
+
+    def test_word_prefix(self, index):
+        names = [entry.name for entry, _ in index.search('солн')]
+        assert names == ['ЖК «Солнечный»', 'ЖК Солнечный город']
+
+    def test_exact_match_ranks_first(self, index):
+        entry, score = index.search('ССК')[0]
+        assert entry.entity_id == 10
+        assert score == SuggestionIndex.SCORE_EXACT
+
+    def test_yo_and_transliteration(self, index):
+        assert index.search('елки')[0][0].entity_id == 3
+        assert index.search('solnech')[0][0].entity_id == 1
+
+    def test_wrong_keyboard_layout(self, index):
+        assert index.search('ytjvtnh')[0][0].entity_id == 11
+
+    def test_substring(self, index):
+        assert index.search('кубан')[0][0].entity_id == 20
+
+    def test_typo_tolerance(self, index):
+        assert index.search('Неометрея')[0][0].entity_id == 11
+
+    def test_kinds_and_per_kind(self, index):
+        results = index.search('солн', kinds=('complex',), per_kind={'complex': 1})
+        assert len(results) == 1
+        assert index.search('солн', kinds=('developer',)) == []
+
+    def test_empty_query(self, index):
+        assert index.search('  !! ') == []
+
+    def test_search_is_fast(self, index):
+        entries = [SuggestionEntry('street', i, f'улица Номер {i}', i) for i in range(5000)]
+        index.load(entries)
+        started = time.perf_counter()
+        for _ in range(20):
+            index.search('улица номер 42')
+        assert (time.perf_counter() - started) / 20 < 0.05
+
+
+class TestSuggestionsRoute:
+
+    def test_streets_and_buildings_are_returned(self, index, monkeypatch):
+        import app as app_module
+        from services import suggestion_index
+
+        index.load(list(index.entries) + [SuggestionEntry(
+            'building', '1:Литер 7', 'ЖК «Солнечный» Литер 7', 12,
+            {'complex_id': 1, 'complex_name': 'ЖК «Солнечный»', 'building': 'Литер 7'})])
+        monkeypatch.setattr(index, 'ensure_fresh', lambda: None)
+        monkeypatch.setattr(suggestion_index, 'get_suggestion_index', lambda: index)
+        client = app_module.app.test_client()
+
+        street = client.get('/api/search/suggestions?q=красная').get_json()
+        assert [(s['type'], s['text']) for s in street] == [('street', 'Красная улица')]
+        assert 'search=' in street[0]['url']
+
+        building = {s['type']: s for s in client.get('/api/search/suggestions?q=литер').get_json()}
+        assert building['building']['text'] == 'ЖК «Солнечный» Литер 7'
+        assert 'building=' in building['building']['url'] and 'residential_complex=' in building['building']['url']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
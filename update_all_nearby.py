@@ -14,6 +14,16 @@ def main():
     print("="*70)
     print()
     
+    # Региональная выгрузка POI: все ЖК считаются локально за один проход
+    try:
+        nearby_auto_updater.refresh_region_extract()
+    except Exception as e:
+        print(f"⚠️  Не удалось загрузить выгрузку POI, используем Overpass по каждому ЖК: {e}")
+    if nearby_auto_updater.get_poi_store() is not None:
+        stats = nearby_auto_updater.update_from_store()
+        print(f"✅ Успешно обновлено: {stats['success']} из {stats['total']}")
+        return
+    
     with app.app_context():
         # Найти ВСЕ ЖК требующие обновления (без лимита)
         complexes = nearby_auto_updater.find_complexes_needing_update(limit=1000)